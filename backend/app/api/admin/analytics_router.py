@@ -5,14 +5,11 @@ from fastapi import APIRouter, Depends, Query
 from sqlalchemy.orm import Session
 from typing import Optional
 from datetime import date
-from app.db.session import get_db
+from app.core.cache import cache_manager
+from app.db.session import get_read_db
 from app.middleware.auth import verify_api_key
 from app.services.analytics_service import (
-    total_conversations,
-    conversations_by_channel,
-    avg_satisfaction,
-    count_unrecognized,
-    count_handoffs,
+    analytics_summary,
     get_all_channels_analytics,
     get_channel_analytics
 )
@@ -24,7 +21,7 @@ router = APIRouter(prefix="/admin/analytics", tags=["Admin - Analytics"])
 async def get_analytics_summary(
     from_date: Optional[date] = Query(None, alias="from", description="تاريخ البداية (YYYY-MM-DD)"),
     to_date: Optional[date] = Query(None, alias="to", description="تاريخ النهاية (YYYY-MM-DD)"),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     api_key: str = Depends(verify_api_key)
 ):
     """
@@ -37,19 +34,8 @@ async def get_analytics_summary(
         - unrecognized_count: عدد الرسائل غير المفهومة
         - handoffs_count: عدد التحويلات
     """
-    total = total_conversations(db, from_date, to_date)
-    by_channel = conversations_by_channel(db, from_date, to_date)
-    avg_sat = avg_satisfaction(db, from_date, to_date)
-    unrecognized = count_unrecognized(db, from_date, to_date)
-    handoffs = count_handoffs(db, from_date, to_date)
-    
-    return {
-        "total_conversations": total,
-        "conversations_by_channel": by_channel,
-        "avg_satisfaction": avg_sat,
-        "unrecognized_count": unrecognized,
-        "handoffs_count": handoffs
-    }
+    # جميع المقاييس من استعلام مجمّع واحد (مع cache لكل نطاق زمني)
+    return analytics_summary(db, from_date, to_date)
 
 
 @router.get("/by-channel")
@@ -57,7 +43,7 @@ async def get_analytics_by_channel(
     from_date: Optional[date] = Query(None, alias="from", description="تاريخ البداية (YYYY-MM-DD)"),
     to_date: Optional[date] = Query(None, alias="to", description="تاريخ النهاية (YYYY-MM-DD)"),
     channel: Optional[str] = Query(None, description="اسم القناة (whatsapp, instagram, tiktok, google_maps) - اختياري"),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     api_key: str = Depends(verify_api_key)
 ):
     """
@@ -88,3 +74,14 @@ async def get_analytics_by_channel(
             "channels": analytics
         }
 
+
+@router.get("/cache")
+async def get_cache_stats(
+    api_key: str = Depends(verify_api_key)
+):
+    """
+    إحصائيات الـ cache المستخدم لنتائج التحليلات
+
+    بدون Redis: الإصابات والإخفاقات والمفاتيح المحذوفة والذاكرة المستخدمة في هذه العملية
+    """
+    return cache_manager.stats()
@@ -1,15 +1,22 @@
 """
 Appointments admin router
 """
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from typing import Optional
 from uuid import UUID
 from datetime import datetime
 from app.db.session import get_db
-from app.db.models import Appointment
+from app.db.models import Appointment, Branch, Doctor
 from app.middleware.auth import verify_api_key
+from app.core.serialization import APPOINTMENTS
+from app.core.listing import list_response, search_filter
+from app.core.catalog import get_catalog_version
+from app.services.availability_service import (
+    get_availability_engine, lock_booking, is_foreign_key_violation, is_slot_conflict, INACTIVE_STATUSES
+)
 
 
 router = APIRouter(prefix="/admin/appointments", tags=["Admin - Appointments"])
@@ -27,32 +34,49 @@ class AppointmentCreate(BaseModel):
     notes: Optional[str] = None
 
 
+# الحقول الافتراضية لقائمة المواعيد (باقي الحقول عبر fields=)
+_LIST_FIELDS = [
+    "id", "patient_name", "phone", "branch_id", "branch_name", "doctor_id", "doctor_name",
+    "service_id", "service_name", "datetime", "channel", "status", "notes", "created_at", "updated_at"
+]
+
+
 @router.get("/")
 async def list_appointments(
+    request: Request,
+    status: Optional[str] = Query(None),
+    channel: Optional[str] = Query(None),
+    branch_id: Optional[UUID] = Query(None),
+    doctor_id: Optional[UUID] = Query(None),
+    service_id: Optional[UUID] = Query(None),
+    from_date: Optional[datetime] = Query(None, description="من تاريخ (datetime >=)"),
+    to_date: Optional[datetime] = Query(None, description="إلى تاريخ (datetime <=)"),
+    page: Optional[int] = Query(None, ge=1, description="رقم الصفحة (بدونه تُرجع كل النتائج)"),
+    page_size: int = Query(50, ge=1, le=500, description="حجم الصفحة"),
+    sort: Optional[str] = Query(None, description="حقل الترتيب (-حقل للترتيب التنازلي)"),
+    q: Optional[str] = Query(None, description="بحث نصي"),
+    fields: Optional[str] = Query(None, description="الحقول المطلوبة مفصولة بفواصل"),
     db: Session = Depends(get_db),
     api_key: str = Depends(verify_api_key)
 ):
-    """قائمة بجميع المواعيد"""
-    appointments = db.query(Appointment).all()
-    return {
-        "appointments": [
-            {
-                "id": str(appointment.id),
-                "patient_name": appointment.patient_name,
-                "phone": appointment.phone,
-                "branch_id": str(appointment.branch_id),
-                "doctor_id": str(appointment.doctor_id) if appointment.doctor_id else None,
-                "service_id": str(appointment.service_id),
-                "datetime": appointment.datetime.isoformat(),
-                "channel": appointment.channel,
-                "status": appointment.status,
-                "notes": appointment.notes,
-                "created_at": appointment.created_at.isoformat(),
-                "updated_at": appointment.updated_at.isoformat()
-            }
-            for appointment in appointments
-        ]
-    }
+    """قائمة المواعيد (مع أسماء الفرع والطبيب والخدمة من نفس الاستعلام، ترقيم صفحات + ETag)"""
+    selected = APPOINTMENTS.parse_fields(fields, _LIST_FIELDS)
+    filters = [
+        Appointment.status == status if status else None,
+        Appointment.channel == channel if channel else None,
+        Appointment.branch_id == branch_id if branch_id else None,
+        Appointment.doctor_id == doctor_id if doctor_id else None,
+        Appointment.service_id == service_id if service_id else None,
+        Appointment.datetime >= from_date if from_date else None,
+        Appointment.datetime <= to_date if to_date else None,
+        search_filter(q, [Appointment.patient_name, Appointment.phone])
+    ]
+    # أسماء الفرع/الطبيب/الخدمة تتغير مع الكتالوج وليس مع updated_at للمواعيد
+    return list_response(
+        request, db, APPOINTMENTS, "appointments", selected, filters,
+        sort=sort, default_sort="-datetime", page=page, page_size=page_size,
+        version=get_catalog_version(db)
+    )
 
 
 @router.post("/")
@@ -61,11 +85,61 @@ async def create_appointment(
     db: Session = Depends(get_db),
     api_key: str = Depends(verify_api_key)
 ):
-    """إنشاء موعد جديد"""
+    """إنشاء موعد جديد (يُرفض إذا تعارض مع موعد آخر للطبيب أو تجاوز سعة الفرع)"""
+    if appointment_data.status not in INACTIVE_STATUSES:
+        # القفل حتى الـ commit: لا يحجز worker آخر نفس الوقت بين التحقق والإدراج
+        lock_booking(db, appointment_data.branch_id, appointment_data.doctor_id)
+        engine = get_availability_engine(db, force_refresh=True)
+        conflict = engine.conflict(
+            appointment_data.datetime,
+            branch_id=appointment_data.branch_id,
+            doctor_id=appointment_data.doctor_id
+        )
+        if conflict:
+            branch_hours = db.query(Branch.working_hours).filter(Branch.id == appointment_data.branch_id).scalar()
+            doctor_hours = db.query(Doctor.working_hours).filter(Doctor.id == appointment_data.doctor_id).scalar() \
+                if appointment_data.doctor_id else None
+            suggestions = engine.next_free_slots(
+                appointment_data.branch_id,
+                doctor_id=appointment_data.doctor_id,
+                branch_hours=branch_hours,
+                doctor_hours=doctor_hours,
+                after=appointment_data.datetime,
+                count=3
+            )
+            reason = "الطبيب لديه موعد آخر في هذا الوقت" if conflict == "doctor" else "الفرع ممتلئ في هذا الوقت"
+            # تحرير قفل الحجز فوراً
+            db.rollback()
+            raise HTTPException(
+                status_code=409,
+                detail={
+                    "message": f"الوقت غير متاح: {reason}",
+                    "conflict": conflict,
+                    "next_available": [slot.isoformat() for slot in suggestions]
+                }
+            )
+    
     appointment = Appointment(**appointment_data.model_dump())
     db.add(appointment)
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        if is_slot_conflict(e):
+            # uq_appointments_doctor_datetime_active: حجز متزامن لنفس وقت الطبيب
+            raise HTTPException(
+                status_code=409,
+                detail={
+                    "message": "الوقت غير متاح: الطبيب لديه موعد آخر في هذا الوقت",
+                    "conflict": "doctor",
+                    "next_available": []
+                }
+            )
+        if is_foreign_key_violation(e):
+            raise HTTPException(status_code=404, detail="الفرع أو الطبيب أو الخدمة أو المريض غير موجود")
+        raise HTTPException(status_code=400, detail="بيانات الموعد غير صالحة")
     db.refresh(appointment)
+    get_availability_engine().apply(appointment)
     return {
         "id": str(appointment.id),
         "patient_name": appointment.patient_name,
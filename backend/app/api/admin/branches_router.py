@@ -1,15 +1,19 @@
 """
 Branches admin router
 """
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, List
 from uuid import UUID
 from datetime import datetime
 from app.db.session import get_db
 from app.db.models import Branch
 from app.middleware.auth import verify_api_key
+from app.core.catalog import bump_catalog_version, get_catalog_version
+from app.core.serialization import BRANCHES
+from app.core.listing import list_response, search_filter
+from app.services.catalog_batch_service import BRANCH_BATCH, batch_response
 
 
 router = APIRouter(prefix="/admin/branches", tags=["Admin - Branches"])
@@ -35,39 +39,41 @@ class BranchUpdate(BaseModel):
     is_active: Optional[bool] = None
 
 
+class BranchBatchUpdate(BranchUpdate):
+    id: UUID
+
+
+class BranchBatch(BaseModel):
+    """عمليات مجمّعة: تُطبق في transaction واحدة"""
+    create: List[BranchCreate] = []
+    update: List[BranchBatchUpdate] = []
+    delete: List[UUID] = []
+
+
 @router.get("/")
 async def list_branches(
+    request: Request,
+    active_only: bool = True,
+    page: Optional[int] = Query(None, ge=1, description="رقم الصفحة (بدونه تُرجع كل النتائج)"),
+    page_size: int = Query(50, ge=1, le=500, description="حجم الصفحة"),
+    sort: Optional[str] = Query(None, description="حقل الترتيب (-حقل للترتيب التنازلي)"),
+    q: Optional[str] = Query(None, description="بحث نصي"),
+    fields: Optional[str] = Query(None, description="الحقول المطلوبة مفصولة بفواصل"),
     db: Session = Depends(get_db),
-    api_key: str = Depends(verify_api_key),
-    active_only: bool = True
+    api_key: str = Depends(verify_api_key)
 ):
-    """قائمة بجميع الفروع"""
-    query = db.query(Branch)
-    
+    """قائمة الفروع (ترقيم صفحات وفلترة وترتيب + ETag)"""
+    selected = BRANCHES.parse_fields(fields, list(BRANCHES.columns))
     # إذا كان active_only=True، نعرض فقط الفروع النشطة
-    if active_only:
-        query = query.filter(Branch.is_active == True)
-    
-    branches = query.order_by(Branch.created_at.desc()).all()
-    
-    return {
-        "branches": [
-            {
-                "id": str(branch.id),
-                "name": branch.name,
-                "city": branch.city,
-                "address": branch.address,
-                "location_url": branch.location_url,
-                "phone": branch.phone,
-                "working_hours": branch.working_hours,
-                "is_active": branch.is_active,
-                "created_at": branch.created_at.isoformat() if branch.created_at else None,
-                "updated_at": branch.updated_at.isoformat() if branch.updated_at else None
-            }
-            for branch in branches
-        ],
-        "total": len(branches)
-    }
+    filters = [
+        Branch.is_active == True if active_only else None,
+        search_filter(q, [Branch.name, Branch.city, Branch.address])
+    ]
+    return list_response(
+        request, db, BRANCHES, "branches", selected, filters,
+        sort=sort, default_sort="-created_at", page=page, page_size=page_size,
+        version=get_catalog_version(db)
+    )
 
 
 @router.post("/")
@@ -80,6 +86,7 @@ async def create_branch(
     branch = Branch(**branch_data.model_dump())
     db.add(branch)
     db.commit()
+    bump_catalog_version()
     db.refresh(branch)
     return {
         "id": str(branch.id),
@@ -111,6 +118,7 @@ async def update_branch(
     
     branch.updated_at = datetime.now()
     db.commit()
+    bump_catalog_version()
     db.refresh(branch)
     
     return {
@@ -148,6 +156,22 @@ async def delete_branch(
     
     db.delete(branch)
     db.commit()
+    bump_catalog_version()
     
     return {"message": "تم حذف الفرع بنجاح", "id": str(branch_id)}
 
+
+@router.post("/batch")
+async def batch_branches(
+    batch: BranchBatch,
+    atomic: bool = Query(False, description="إلغاء الدفعة كاملة إذا فشل أي عنصر"),
+    db: Session = Depends(get_db),
+    api_key: str = Depends(verify_api_key)
+):
+    """
+    إنشاء وتعديل وحذف الفروع دفعة واحدة
+
+    - التعديل: id + الحقول المعدلة فقط
+    - النتيجة لكل عنصر (created / updated / deleted / not_found / conflict / blocked)
+    """
+    return batch_response(db, BRANCH_BATCH, batch, atomic)
@@ -1,20 +1,24 @@
 """
 CSV Import Router - استيراد البيانات من ملفات CSV
+(المنطق في app/services/csv_import_service.py)
+
+- import-local-csv / import-from-csv: استيراد مباشر داخل الطلب (للملفات الصغيرة)
+- jobs: استيراد في الخلفية (app/services/import_jobs.py) مع متابعة التقدم عبر GET /jobs/{id}
 """
+import asyncio
 import logging
-import csv
-import io
-from typing import List, Dict, Any
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Any, Dict
+from uuid import UUID
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query
 from sqlalchemy.orm import Session
-from sqlalchemy import inspect as sqlalchemy_inspect
-from sqlalchemy import create_engine
-from datetime import datetime
-import uuid
 from app.db.session import get_db
 from app.middleware.auth import verify_api_key
 from app.config import get_settings
-from app.db.models import Branch, Doctor, Service
+from app.db.models import ImportJob
+from app.services.csv_import_service import import_catalog, iter_csv_rows, missing_tables
+from app.services.import_jobs import get_import_job_runner, job_status
 
 logger = logging.getLogger(__name__)
 
@@ -22,47 +26,57 @@ router = APIRouter(prefix="/admin/csv-import", tags=["Admin - CSV Import"])
 
 settings = get_settings()
 
+_MODE_DESCRIPTION = "skip: تجاهل الموجود (افتراضي)، update: تحديث الموجود"
 
-def parse_working_hours(work_hours_str: str) -> Dict[str, Any]:
-    """
-    تحليل ساعات العمل من النص العربي إلى JSON
-    مثال: "من 8ص حتى 1ص والجمعة من 1م-1ص"
+
+def _check_tables():
+    """التحقق من وجود الجداول"""
+    missing = missing_tables()
+    if missing:
+        raise HTTPException(
+            status_code=400,
+            detail=f"الجداول التالية غير موجودة: {', '.join(missing)}. يرجى إنشاء الجداول أولاً."
+        )
+
+
+def _local_csv_dir() -> Path:
+    """مجلد ملفات CSV المحلية"""
+    # تحديد مسار المشروع
+    project_root = Path(__file__).parent.parent.parent.parent.parent
+    csv_dir = project_root / "clinic-ai-bot"
+
+    # إذا لم يكن موجود، جرب المسار الحالي
+    if not csv_dir.exists():
+        csv_dir = project_root
+    return csv_dir
+
+
+def _summary(title: str, report: Dict[str, Any]) -> Dict[str, Any]:
+    """استجابة الاستيراد (counts بنفس الشكل السابق: عدد الصفوف المضافة لكل جدول)"""
+    inserted = {entity: report["counts"].get(entity, {}).get("inserted", 0) for entity in ("branches", "doctors", "services")}
+    updated = {entity: report["counts"].get(entity, {}).get("updated", 0) for entity in ("branches", "doctors", "services")}
+    summary = f"""
+✅ {title}
+
+📊 الملخص:
+- الفروع المضافة: {inserted['branches']} (المحدّثة: {updated['branches']})
+- الأطباء المضافون: {inserted['doctors']} (المحدّثون: {updated['doctors']})
+- الخدمات المضافة: {inserted['services']} (المحدّثة: {updated['services']})
     """
-    if not work_hours_str or work_hours_str.strip() == "":
-        return {
-            "sunday": {"from": "08:00", "to": "01:00"},
-            "monday": {"from": "08:00", "to": "01:00"},
-            "tuesday": {"from": "08:00", "to": "01:00"},
-            "wednesday": {"from": "08:00", "to": "01:00"},
-            "thursday": {"from": "08:00", "to": "01:00"},
-            "friday": {"from": "13:00", "to": "01:00"},
-            "saturday": {"from": "08:00", "to": "01:00"}
+    return {
+        "success": True,
+        "message": summary.strip(),
+        "details": {
+            "counts": inserted,
+            "entities": report["counts"],
+            "timings_ms": report["timings_ms"]
         }
-    
-    # تحليل بسيط - يمكن تحسينه لاحقاً
-    work_hours_str = work_hours_str.strip()
-    
-    # افتراضي: من 8 صباحاً حتى 1 صباحاً
-    default_hours = {
-        "sunday": {"from": "08:00", "to": "01:00"},
-        "monday": {"from": "08:00", "to": "01:00"},
-        "tuesday": {"from": "08:00", "to": "01:00"},
-        "wednesday": {"from": "08:00", "to": "01:00"},
-        "thursday": {"from": "08:00", "to": "01:00"},
-        "friday": {"from": "13:00", "to": "01:00"},  # الجمعة من 1 ظهراً
-        "saturday": {"from": "08:00", "to": "01:00"}
     }
-    
-    # إذا كان النص يحتوي على "الجمعة"
-    if "الجمعة" in work_hours_str:
-        if "1م" in work_hours_str or "1 ظهراً" in work_hours_str:
-            default_hours["friday"] = {"from": "13:00", "to": "01:00"}
-    
-    return default_hours
 
 
 @router.post("/import-local-csv")
 async def import_local_csv(
+    mode: str = Query("skip", pattern="^(skip|update)$", description=_MODE_DESCRIPTION),
     db: Session = Depends(get_db),
     api_key: str = Depends(verify_api_key)
 ):
@@ -71,202 +85,27 @@ async def import_local_csv(
     يقرأ الملفات من: branches_import.csv, doctors_import.csv, services_import.csv
     """
     logger.info("بدء استيراد البيانات من ملفات CSV المحلية...")
-    
+
     try:
-        from pathlib import Path
-        import os
-        
-        # تحديد مسار المشروع
-        project_root = Path(__file__).parent.parent.parent.parent.parent
-        csv_dir = project_root / "clinic-ai-bot"
-        
-        # إذا لم يكن موجود، جرب المسار الحالي
-        if not csv_dir.exists():
-            csv_dir = project_root
-        
-        details = {}
-        counts = {"branches": 0, "doctors": 0, "services": 0}
-        now = datetime.now()
-        
-        # التحقق من وجود الجداول
-        engine = create_engine(settings.DATABASE_URL, isolation_level="AUTOCOMMIT")
-        inspector = sqlalchemy_inspect(engine)
-        existing_tables = inspector.get_table_names()
-        
-        required_tables = ["branches", "doctors", "services"]
-        missing_tables = [table for table in required_tables if table not in existing_tables]
-        
-        if missing_tables:
-            raise HTTPException(
-                status_code=400,
-                detail=f"الجداول التالية غير موجودة: {', '.join(missing_tables)}. يرجى إنشاء الجداول أولاً."
-            )
-        
-        # 1. استيراد الفروع
-        branches_file_path = csv_dir / "branches_import.csv"
-        if branches_file_path.exists():
-            logger.info(f"📂 قراءة ملف الفروع: {branches_file_path}")
-            with open(branches_file_path, 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                branches_added = 0
-                for row in reader:
-                    branch_name = row.get('name_ar', '').strip()
-                    if not branch_name:
-                        continue
-                    
-                    existing = db.query(Branch).filter(Branch.name == branch_name).first()
-                    if not existing:
-                        branch = Branch(
-                            id=uuid.uuid4(),
-                            name=branch_name,
-                            city=row.get('district_ar', '').strip() or "الرياض",
-                            address=row.get('address_ar', '').strip() or row.get('district_ar', '').strip(),
-                            phone=row.get('phone', '').strip(),
-                            location_url=row.get('map_url', '').strip(),
-                            working_hours=parse_working_hours(row.get('work_hours_ar', '')),
-                            is_active=True,
-                            created_at=now,
-                            updated_at=now
-                        )
-                        db.add(branch)
-                        branches_added += 1
-                
-                db.commit()
-                counts["branches"] = branches_added
-                logger.info(f"✅ تم إضافة {branches_added} فرع")
-        else:
-            logger.warning(f"⚠️  ملف branches_import.csv غير موجود في: {branches_file_path}")
-        
-        # 2. استيراد الأطباء
-        doctors_file_path = csv_dir / "doctors_import.csv"
-        if doctors_file_path.exists():
-            logger.info(f"📂 قراءة ملف الأطباء: {doctors_file_path}")
-            with open(doctors_file_path, 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                doctors_added = 0
-                for row in reader:
-                    doctor_name = row.get('doctor_name_ar', '').strip()
-                    if not doctor_name:
-                        continue
-                    
-                    # البحث عن الفرع
-                    branch_code = row.get('branch_code', '').strip()
-                    branch_id = None
-                    if branch_code:
-                        # البحث بالكود أولاً
-                        branch = db.query(Branch).filter(Branch.name.like(f'%{branch_code}%')).first()
-                        if not branch:
-                            # البحث بالاسم
-                            if branch_code == 'north_hazm':
-                                branch = db.query(Branch).filter(Branch.name.like('%شمال%')).first()
-                        if branch:
-                            branch_id = branch.id
-                    
-                    # التحقق من وجود الطبيب
-                    existing = db.query(Doctor).filter(
-                        Doctor.name == doctor_name,
-                        Doctor.branch_id == branch_id
-                    ).first()
-                    
-                    if not existing:
-                        # تحليل سنوات الخبرة
-                        experience_years = None
-                        exp_str = row.get('experience_years', '').strip() or row.get('experience_ar', '').strip()
-                        if exp_str:
-                            # استخراج الأرقام
-                            import re
-                            numbers = re.findall(r'\d+', exp_str)
-                            if numbers:
-                                try:
-                                    experience_years = int(numbers[0])
-                                except:
-                                    pass
-                        
-                        doctor = Doctor(
-                            id=uuid.uuid4(),
-                            name=doctor_name,
-                            specialty=row.get('specialty_ar', '').strip() or row.get('department_ar', '').strip(),
-                            license_number=f"LIC-{uuid.uuid4().hex[:8].upper()}",
-                            branch_id=branch_id,
-                            working_hours=parse_working_hours(row.get('work_hours_ar', '')),
-                            experience_years=str(experience_years) if experience_years else None,
-                            bio=row.get('cases_ar', '').strip() or row.get('notes_ar', '').strip(),
-                            is_active=row.get('status_ar', '').strip() == 'على رأس العمل',
-                            created_at=now,
-                            updated_at=now
-                        )
-                        db.add(doctor)
-                        doctors_added += 1
-                
-                db.commit()
-                counts["doctors"] = doctors_added
-                logger.info(f"✅ تم إضافة {doctors_added} طبيب")
-        else:
-            logger.warning(f"⚠️  ملف doctors_import.csv غير موجود في: {doctors_file_path}")
-        
-        # 3. استيراد الخدمات
-        services_file_path = csv_dir / "services_import.csv"
-        if services_file_path.exists():
-            logger.info(f"📂 قراءة ملف الخدمات: {services_file_path}")
-            with open(services_file_path, 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                services_added = 0
-                for row in reader:
-                    service_name = row.get('name_ar', '').strip()
-                    if not service_name:
-                        continue
-                    
-                    existing = db.query(Service).filter(Service.name == service_name).first()
-                    if not existing:
-                        price_str = row.get('price_sar', '').strip()
-                        base_price = None
-                        if price_str:
-                            try:
-                                base_price = float(price_str)
-                            except ValueError:
-                                pass
-                        
-                        description = row.get('description_ar', '').strip() or row.get('notes', '').strip()
-                        if not description and row.get('category_ar', '').strip():
-                            description = f"({row.get('category_ar', '').strip()})"
-                        
-                        service = Service(
-                            id=uuid.uuid4(),
-                            name=service_name,
-                            description=description,
-                            base_price=base_price,
-                            is_active=True,
-                            created_at=now,
-                            updated_at=now
-                        )
-                        db.add(service)
-                        services_added += 1
-                
-                db.commit()
-                counts["services"] = services_added
-                logger.info(f"✅ تم إضافة {services_added} خدمة")
-        else:
-            logger.warning(f"⚠️  ملف services_import.csv غير موجود في: {services_file_path}")
-        
-        summary = f"""
-✅ تم استيراد البيانات من ملفات CSV المحلية بنجاح!
+        csv_dir = _local_csv_dir()
+        _check_tables()
+
+        with ExitStack() as stack:
+            sources = {}
+            for entity in ("branches", "doctors", "services"):
+                path = csv_dir / f"{entity}_import.csv"
+                if path.exists():
+                    logger.info(f"📂 قراءة ملف: {path}")
+                    sources[entity] = iter_csv_rows(stack.enter_context(open(path, "rb")))
+                else:
+                    logger.warning(f"⚠️  ملف {path.name} غير موجود في: {path}")
+            report = await asyncio.to_thread(import_catalog, db, sources, mode)
+
+        return _summary("تم استيراد البيانات من ملفات CSV المحلية بنجاح!", report)
 
-📊 الملخص:
-- الفروع المضافة: {counts.get('branches', 0)}
-- الأطباء المضافون: {counts.get('doctors', 0)}
-- الخدمات المضافة: {counts.get('services', 0)}
-        """
-        
-        return {
-            "success": True,
-            "message": summary.strip(),
-            "details": {"counts": counts}
-        }
-        
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
         error_msg = str(e)
         logger.error(f"❌ فشل استيراد البيانات من CSV المحلية: {error_msg}", exc_info=True)
         raise HTTPException(
@@ -280,183 +119,33 @@ async def import_from_csv(
     branches_file: UploadFile = File(None),
     doctors_file: UploadFile = File(None),
     services_file: UploadFile = File(None),
+    mode: str = Query("skip", pattern="^(skip|update)$", description=_MODE_DESCRIPTION),
     db: Session = Depends(get_db),
     api_key: str = Depends(verify_api_key)
 ):
     """
     استيراد البيانات من ملفات CSV
-    
+
     يقبل 3 ملفات:
     - branches_file: ملف CSV للفروع
     - doctors_file: ملف CSV للأطباء
     - services_file: ملف CSV للخدمات
     """
     logger.info("بدء استيراد البيانات من ملفات CSV...")
-    
+
     try:
-        from app.db.base import Base
-        
-        # التحقق من وجود الجداول
-        engine = create_engine(settings.DATABASE_URL, isolation_level="AUTOCOMMIT")
-        inspector = sqlalchemy_inspect(engine)
-        existing_tables = inspector.get_table_names()
-        
-        required_tables = ["branches", "doctors", "services"]
-        missing_tables = [table for table in required_tables if table not in existing_tables]
-        
-        if missing_tables:
-            raise HTTPException(
-                status_code=400,
-                detail=f"الجداول التالية غير موجودة: {', '.join(missing_tables)}. يرجى إنشاء الجداول أولاً."
-            )
-        
-        details = {}
-        counts = {"branches": 0, "doctors": 0, "services": 0}
-        now = datetime.now()
-        
-        # 1. استيراد الفروع
-        if branches_file:
-            logger.info("📂 جاري قراءة ملف الفروع...")
-            content = await branches_file.read()
-            csv_content = content.decode('utf-8-sig')  # دعم BOM
-            reader = csv.DictReader(io.StringIO(csv_content))
-            
-            branches_added = 0
-            for row in reader:
-                branch_name = row.get('name_ar', '').strip()
-                if not branch_name:
-                    continue
-                
-                existing = db.query(Branch).filter(Branch.name == branch_name).first()
-                if not existing:
-                    branch = Branch(
-                        id=uuid.uuid4(),
-                        name=branch_name,
-                        city=row.get('district_ar', '').strip() or "الرياض",
-                        address=row.get('address_ar', '').strip() or row.get('district_ar', '').strip(),
-                        phone=row.get('phone', '').strip(),
-                        location_url=row.get('map_url', '').strip(),
-                        working_hours=parse_working_hours(row.get('work_hours_ar', '')),
-                        is_active=True,
-                        created_at=now,
-                        updated_at=now
-                    )
-                    db.add(branch)
-                    branches_added += 1
-            
-            db.commit()
-            counts["branches"] = branches_added
-            logger.info(f"✅ تم إضافة {branches_added} فرع")
-        
-        # 2. استيراد الأطباء
-        if doctors_file:
-            logger.info("📂 جاري قراءة ملف الأطباء...")
-            content = await doctors_file.read()
-            csv_content = content.decode('utf-8-sig')
-            reader = csv.DictReader(io.StringIO(csv_content))
-            
-            doctors_added = 0
-            for row in reader:
-                doctor_name = row.get('doctor_name_ar', '').strip()
-                if not doctor_name:
-                    continue
-                
-                # البحث عن الفرع
-                branch_code = row.get('branch_code', '').strip()
-                branch_id = None
-                if branch_code:
-                    branch = db.query(Branch).filter(Branch.name.like(f'%{branch_code}%')).first()
-                    if not branch:
-                        # البحث بالاسم الكامل
-                        if branch_code == 'north_hazm':
-                            branch = db.query(Branch).filter(Branch.name.like('%شمال%')).first()
-                    if branch:
-                        branch_id = branch.id
-                
-                # التحقق من وجود الطبيب
-                existing = db.query(Doctor).filter(
-                    Doctor.name == doctor_name,
-                    Doctor.branch_id == branch_id
-                ).first()
-                
-                if not existing:
-                    doctor = Doctor(
-                        id=uuid.uuid4(),
-                        name=doctor_name,
-                        specialty=row.get('specialty_ar', '').strip() or row.get('department_ar', '').strip(),
-                        license_number=f"LIC-{uuid.uuid4().hex[:8].upper()}",
-                        branch_id=branch_id,
-                        working_hours=parse_working_hours(row.get('work_hours_ar', '')),
-                        experience_years=row.get('experience_years', '').strip() or row.get('experience_ar', '').strip(),
-                        is_active=row.get('status_ar', '').strip() == 'على رأس العمل',
-                        created_at=now,
-                        updated_at=now
-                    )
-                    db.add(doctor)
-                    doctors_added += 1
-            
-            db.commit()
-            counts["doctors"] = doctors_added
-            logger.info(f"✅ تم إضافة {doctors_added} طبيب")
-        
-        # 3. استيراد الخدمات
-        if services_file:
-            logger.info("📂 جاري قراءة ملف الخدمات...")
-            content = await services_file.read()
-            csv_content = content.decode('utf-8-sig')
-            reader = csv.DictReader(io.StringIO(csv_content))
-            
-            services_added = 0
-            for row in reader:
-                service_name = row.get('name_ar', '').strip()
-                if not service_name:
-                    continue
-                
-                existing = db.query(Service).filter(Service.name == service_name).first()
-                if not existing:
-                    price_str = row.get('price_sar', '').strip()
-                    base_price = None
-                    if price_str:
-                        try:
-                            base_price = float(price_str)
-                        except ValueError:
-                            pass
-                    
-                    service = Service(
-                        id=uuid.uuid4(),
-                        name=service_name,
-                        description=row.get('description_ar', '').strip() or row.get('notes', '').strip(),
-                        base_price=base_price,
-                        is_active=True,
-                        created_at=now,
-                        updated_at=now
-                    )
-                    db.add(service)
-                    services_added += 1
-            
-            db.commit()
-            counts["services"] = services_added
-            logger.info(f"✅ تم إضافة {services_added} خدمة")
-        
-        summary = f"""
-✅ تم استيراد البيانات من ملفات CSV بنجاح!
+        _check_tables()
+
+        uploads = {"branches": branches_file, "doctors": doctors_file, "services": services_file}
+        # الملفات تُقرأ صفاً بصف من الملف المؤقت للرفع (بدون تحميلها كاملة كنص)
+        sources = {entity: iter_csv_rows(upload.file) for entity, upload in uploads.items() if upload}
+        report = await asyncio.to_thread(import_catalog, db, sources, mode)
+
+        return _summary("تم استيراد البيانات من ملفات CSV بنجاح!", report)
 
-📊 الملخص:
-- الفروع المضافة: {counts.get('branches', 0)}
-- الأطباء المضافون: {counts.get('doctors', 0)}
-- الخدمات المضافة: {counts.get('services', 0)}
-        """
-        
-        return {
-            "success": True,
-            "message": summary.strip(),
-            "details": {"counts": counts}
-        }
-        
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
         error_msg = str(e)
         logger.error(f"❌ فشل استيراد البيانات من CSV: {error_msg}", exc_info=True)
         raise HTTPException(
@@ -464,3 +153,101 @@ async def import_from_csv(
             detail=f"فشل استيراد البيانات: {error_msg[:200]}"
         )
 
+
+# ==================== مهام الاستيراد في الخلفية ====================
+
+def _job_response(job: ImportJob) -> Dict[str, Any]:
+    """حالة المهمة (+ message و details بنفس شكل الاستيراد المباشر عند اكتمالها)"""
+    status = job_status(job)
+    if job.status == "completed" and job.result:
+        summary = _summary("تم استيراد البيانات من ملفات CSV بنجاح!", job.result)
+        status.update({"message": summary["message"], "details": summary["details"]})
+    return status
+
+
+@router.post("/jobs", status_code=202)
+async def create_import_job(
+    branches_file: UploadFile = File(None),
+    doctors_file: UploadFile = File(None),
+    services_file: UploadFile = File(None),
+    mode: str = Query("skip", pattern="^(skip|update)$", description=_MODE_DESCRIPTION),
+    db: Session = Depends(get_db),
+    api_key: str = Depends(verify_api_key)
+):
+    """
+    استيراد ملفات CSV في الخلفية
+
+    يرد فوراً بمعرف المهمة؛ التقدم والنتيجة عبر GET /admin/csv-import/jobs/{job_id}
+    """
+    uploads = {"branches": branches_file, "doctors": doctors_file, "services": services_file}
+    uploads = {entity: upload for entity, upload in uploads.items() if upload}
+    if not uploads:
+        raise HTTPException(status_code=400, detail="لم يتم إرسال أي ملف")
+    _check_tables()
+
+    runner = get_import_job_runner()
+    paths = {}
+    for entity, upload in uploads.items():
+        paths[entity] = await asyncio.to_thread(runner.stage_upload, entity, upload.file)
+    names = {entity: upload.filename for entity, upload in uploads.items()}
+    job = await asyncio.to_thread(runner.submit, db, paths, names, mode)
+
+    return {
+        "success": True,
+        "job_id": str(job.id),
+        "status": job.status,
+        "status_url": f"/admin/csv-import/jobs/{job.id}"
+    }
+
+
+@router.post("/jobs/local", status_code=202)
+async def create_local_import_job(
+    mode: str = Query("skip", pattern="^(skip|update)$", description=_MODE_DESCRIPTION),
+    db: Session = Depends(get_db),
+    api_key: str = Depends(verify_api_key)
+):
+    """استيراد ملفات CSV المحلية في الخلفية"""
+    csv_dir = _local_csv_dir()
+    paths = {}
+    for entity in ("branches", "doctors", "services"):
+        path = csv_dir / f"{entity}_import.csv"
+        if path.exists():
+            paths[entity] = str(path)
+    if not paths:
+        raise HTTPException(status_code=404, detail="لا توجد ملفات CSV محلية")
+    _check_tables()
+
+    names = {entity: Path(path).name for entity, path in paths.items()}
+    job = await asyncio.to_thread(get_import_job_runner().submit, db, paths, names, mode, False)
+
+    return {
+        "success": True,
+        "job_id": str(job.id),
+        "status": job.status,
+        "status_url": f"/admin/csv-import/jobs/{job.id}"
+    }
+
+
+@router.get("/jobs")
+async def list_import_jobs(
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db),
+    api_key: str = Depends(verify_api_key)
+):
+    """آخر مهام الاستيراد"""
+    runner = get_import_job_runner()
+    jobs = db.query(ImportJob).order_by(ImportJob.created_at.desc()).limit(limit).all()
+    return {"jobs": [job_status(runner.refresh_stale(db, job)) for job in jobs]}
+
+
+@router.get("/jobs/{job_id}")
+async def get_import_job(
+    job_id: UUID,
+    db: Session = Depends(get_db),
+    api_key: str = Depends(verify_api_key)
+):
+    """حالة مهمة استيراد: الصفوف المقروءة، السرعة، الأخطاء، والوقت المتبقي"""
+    job = db.get(ImportJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="المهمة غير موجودة")
+    return _job_response(get_import_job_runner().refresh_stale(db, job))
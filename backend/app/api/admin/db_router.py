@@ -1,16 +1,19 @@
 """
 Database Management Router - إدارة قاعدة البيانات
 """
+import asyncio
 import logging
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from sqlalchemy import create_engine, text, inspect as sqlalchemy_inspect
 from pydantic import BaseModel
-from typing import Dict, Any, List
-from app.db.session import get_db
+from typing import Dict, Any, List, Optional
+from app.db.session import engine as primary_engine, get_db, replica_engine, replica_status
+from app.db.pool import pool_sizing, pool_stats
 from app.middleware.auth import verify_api_key
 from app.config import get_settings
 from app.db.base import Base
+from app.db.migrations import migration_status, upgrade as upgrade_database
 
 logger = logging.getLogger(__name__)
 
@@ -51,343 +54,28 @@ class AddSampleDataResponse(BaseModel):
 
 @router.post("/init", response_model=InitDBResponse)
 async def init_database(
-    db: Session = Depends(get_db),
     api_key: str = Depends(verify_api_key)
 ):
     """
-    تهيئة قاعدة البيانات: إنشاء جميع الجداول والـ indexes
+    تهيئة قاعدة البيانات: تطبيق الترحيلات الناقصة (app/db/migrations)
+
+    إذا كانت قاعدة البيانات على آخر إصدار يكتفي باستعلام واحد بدون فحص الجداول
     """
     logger.info("بدء تهيئة قاعدة البيانات...")
-    
+
     try:
-        details = {}
-        
-        # 1. تثبيت pgvector extension (اختياري - لم نعد نستخدمه بعد إزالة RAG)
-        logger.info("جاري التحقق من pgvector extension (اختياري)...")
-        pgvector_engine = create_engine(
-            settings.DATABASE_URL,
-            isolation_level="AUTOCOMMIT"
-        )
-        
-        try:
-            with pgvector_engine.connect() as conn:
-                # التحقق من وجود extension
-                check_query = text("""
-                    SELECT EXISTS(
-                        SELECT 1 FROM pg_extension WHERE extname = 'vector'
-                    )
-                """)
-                result = conn.execute(check_query)
-                exists = result.scalar()
-                
-                if not exists:
-                    install_query = text("CREATE EXTENSION IF NOT EXISTS vector")
-                    conn.execute(install_query)
-                    details["pgvector"] = "تم التثبيت"
-                    logger.info("✅ تم تثبيت pgvector extension")
-                else:
-                    details["pgvector"] = "موجود بالفعل"
-                    logger.info("✅ pgvector extension موجود بالفعل")
-        except Exception as e:
-            # pgvector غير متوفر - هذا مقبول لأننا لا نستخدمه بعد الآن
-            details["pgvector"] = f"غير متوفر (هذا مقبول): {str(e)[:100]}"
-            logger.warning(f"⚠️  تحذير: pgvector غير متوفر (هذا مقبول - لم نعد نستخدمه): {str(e)[:100]}")
-        
-        # 2. إنشاء جميع الجداول
-        logger.info("جاري إنشاء الجداول...")
-        Base.metadata.create_all(bind=pgvector_engine)
-        details["tables"] = "تم إنشاء جميع الجداول"
-        logger.info("✅ تم إنشاء جميع الجداول بنجاح")
-        
-        # 2.5. تحديث الجداول الموجودة بإضافة الأعمدة المفقودة
-        logger.info("جاري تحديث الجداول الموجودة...")
-        inspector = sqlalchemy_inspect(pgvector_engine)
-        migration_results = []
-        
-        with pgvector_engine.connect() as conn:
-            # تحديث جدول conversations
-            if "conversations" in inspector.get_table_names():
-                conv_columns = [col["name"] for col in inspector.get_columns("conversations")]
-                logger.info(f"📋 أعمدة conversations الحالية: {', '.join(conv_columns)}")
-                
-                if "user_message" not in conv_columns:
-                    logger.info("➕ إضافة عمود user_message لجدول conversations...")
-                    try:
-                        conn.execute(text("ALTER TABLE conversations ADD COLUMN user_message TEXT"))
-                        migration_results.append("تم إضافة user_message لـ conversations")
-                        logger.info("✅ تم إضافة user_message")
-                    except Exception as e:
-                        error_msg = str(e)
-                        if "already exists" in error_msg.lower() or "duplicate" in error_msg.lower():
-                            logger.info("ℹ️  العمود user_message موجود بالفعل")
-                        else:
-                            logger.warning(f"⚠️  لم يتم إضافة user_message: {error_msg[:100]}")
-                
-                if "bot_reply" not in conv_columns:
-                    logger.info("➕ إضافة عمود bot_reply لجدول conversations...")
-                    try:
-                        conn.execute(text("ALTER TABLE conversations ADD COLUMN bot_reply TEXT"))
-                        migration_results.append("تم إضافة bot_reply لـ conversations")
-                        logger.info("✅ تم إضافة bot_reply")
-                    except Exception as e:
-                        error_msg = str(e)
-                        if "already exists" in error_msg.lower() or "duplicate" in error_msg.lower():
-                            logger.info("ℹ️  العمود bot_reply موجود بالفعل")
-                        else:
-                            logger.warning(f"⚠️  لم يتم إضافة bot_reply: {error_msg[:100]}")
-            
-            # تحديث جدول doctors
-            if "doctors" in inspector.get_table_names():
-                doctors_columns = [col["name"] for col in inspector.get_columns("doctors")]
-                logger.info(f"📋 أعمدة doctors الحالية: {', '.join(doctors_columns)}")
-                
-                new_doctor_columns = {
-                    "license_number": "VARCHAR",
-                    "phone_number": "VARCHAR",
-                    "email": "VARCHAR",
-                    "qualifications": "TEXT",
-                    "experience_years": "VARCHAR",
-                    "working_hours": "JSONB"
-                }
-                
-                for col_name, col_type in new_doctor_columns.items():
-                    if col_name not in doctors_columns:
-                        logger.info(f"➕ إضافة عمود {col_name} لجدول doctors...")
-                        try:
-                            conn.execute(text(f"ALTER TABLE doctors ADD COLUMN {col_name} {col_type}"))
-                            migration_results.append(f"تم إضافة {col_name} لـ doctors")
-                            logger.info(f"✅ تم إضافة {col_name}")
-                        except Exception as e:
-                            error_msg = str(e)
-                            # إذا كان العمود موجود بالفعل، نتجاهل الخطأ
-                            if "already exists" in error_msg.lower() or "duplicate" in error_msg.lower():
-                                logger.info(f"ℹ️  العمود {col_name} موجود بالفعل")
-                            else:
-                                logger.warning(f"⚠️  لم يتم إضافة {col_name}: {error_msg[:100]}")
-            
-            # تحديث جدول appointments
-            if "appointments" in inspector.get_table_names():
-                appointments_columns = [col["name"] for col in inspector.get_columns("appointments")]
-                logger.info(f"📋 أعمدة appointments الحالية: {', '.join(appointments_columns)}")
-                
-                if "patient_id" not in appointments_columns:
-                    logger.info("➕ إضافة عمود patient_id لجدول appointments...")
-                    try:
-                        conn.execute(text("ALTER TABLE appointments ADD COLUMN patient_id UUID"))
-                        migration_results.append("تم إضافة patient_id لـ appointments")
-                        logger.info("✅ تم إضافة patient_id")
-                    except Exception as e:
-                        error_msg = str(e)
-                        if "already exists" in error_msg.lower() or "duplicate" in error_msg.lower():
-                            logger.info("ℹ️  العمود patient_id موجود بالفعل")
-                        else:
-                            logger.warning(f"⚠️  لم يتم إضافة patient_id: {error_msg[:100]}")
-                
-                if "appointment_type" not in appointments_columns:
-                    logger.info("➕ إضافة عمود appointment_type لجدول appointments...")
-                    try:
-                        conn.execute(text("ALTER TABLE appointments ADD COLUMN appointment_type VARCHAR"))
-                        migration_results.append("تم إضافة appointment_type لـ appointments")
-                        logger.info("✅ تم إضافة appointment_type")
-                    except Exception as e:
-                        error_msg = str(e)
-                        if "already exists" in error_msg.lower() or "duplicate" in error_msg.lower():
-                            logger.info("ℹ️  العمود appointment_type موجود بالفعل")
-                        else:
-                            logger.warning(f"⚠️  لم يتم إضافة appointment_type: {error_msg[:100]}")
-        
-        if migration_results:
-            details["migrations"] = migration_results
-            logger.info(f"✅ تم تحديث {len(migration_results)} جدول/عمود")
+        result = await asyncio.to_thread(upgrade_database)
+        if result["applied"]:
+            message = f"تم تطبيق {len(result['applied'])} ترحيل (الإصدار {result['current']})"
         else:
-            details["migrations"] = "لا توجد تحديثات مطلوبة"
-            logger.info("✅ جميع الجداول محدثة")
-        
-        # 3. إنشاء indexes لتحسين الأداء
-        logger.info("جاري إنشاء indexes...")
-        index_results = []
-        with pgvector_engine.connect() as conn:
-            indexes = [
-                {
-                    "name": "idx_conversations_user_channel_created",
-                    "sql": """
-                    CREATE INDEX IF NOT EXISTS idx_conversations_user_channel_created 
-                    ON conversations(user_id, channel, created_at DESC)
-                    """
-                },
-                {
-                    "name": "idx_branches_is_active",
-                    "sql": """
-                    CREATE INDEX IF NOT EXISTS idx_branches_is_active 
-                    ON branches(is_active) WHERE is_active = true
-                    """
-                },
-                {
-                    "name": "idx_services_is_active",
-                    "sql": """
-                    CREATE INDEX IF NOT EXISTS idx_services_is_active 
-                    ON services(is_active) WHERE is_active = true
-                    """
-                },
-                {
-                    "name": "idx_doctors_is_active",
-                    "sql": """
-                    CREATE INDEX IF NOT EXISTS idx_doctors_is_active 
-                    ON doctors(is_active) WHERE is_active = true
-                    """
-                },
-                {
-                    "name": "idx_faqs_is_active",
-                    "sql": """
-                    CREATE INDEX IF NOT EXISTS idx_faqs_is_active 
-                    ON faqs(is_active) WHERE is_active = true
-                    """
-                },
-                {
-                    "name": "idx_offers_is_active",
-                    "sql": """
-                    CREATE INDEX IF NOT EXISTS idx_offers_is_active 
-                    ON offers(is_active) WHERE is_active = true
-                    """
-                },
-                {
-                    "name": "idx_document_chunks_document_id",
-                    "sql": """
-                    CREATE INDEX IF NOT EXISTS idx_document_chunks_document_id 
-                    ON document_chunks(document_id)
-                    """
-                },
-                # Indexes للإحصائيات والتقارير
-                {
-                    "name": "idx_conversations_created_at",
-                    "sql": """
-                    CREATE INDEX IF NOT EXISTS idx_conversations_created_at 
-                    ON conversations(created_at DESC)
-                    """
-                },
-                {
-                    "name": "idx_conversations_channel",
-                    "sql": """
-                    CREATE INDEX IF NOT EXISTS idx_conversations_channel 
-                    ON conversations(channel)
-                    """
-                },
-                {
-                    "name": "idx_conversations_intent",
-                    "sql": """
-                    CREATE INDEX IF NOT EXISTS idx_conversations_intent 
-                    ON conversations(intent)
-                    """
-                },
-                {
-                    "name": "idx_conversations_satisfaction",
-                    "sql": """
-                    CREATE INDEX IF NOT EXISTS idx_conversations_satisfaction 
-                    ON conversations(satisfaction_score) WHERE satisfaction_score IS NOT NULL
-                    """
-                },
-                {
-                    "name": "idx_appointments_datetime",
-                    "sql": """
-                    CREATE INDEX IF NOT EXISTS idx_appointments_datetime 
-                    ON appointments(datetime)
-                    """
-                },
-                {
-                    "name": "idx_appointments_status",
-                    "sql": """
-                    CREATE INDEX IF NOT EXISTS idx_appointments_status 
-                    ON appointments(status)
-                    """
-                },
-                {
-                    "name": "idx_appointments_patient_id",
-                    "sql": """
-                    CREATE INDEX IF NOT EXISTS idx_appointments_patient_id 
-                    ON appointments(patient_id) WHERE patient_id IS NOT NULL
-                    """
-                },
-                {
-                    "name": "idx_patients_phone_number",
-                    "sql": """
-                    CREATE INDEX IF NOT EXISTS idx_patients_phone_number 
-                    ON patients(phone_number)
-                    """
-                },
-                {
-                    "name": "idx_treatments_patient_id",
-                    "sql": """
-                    CREATE INDEX IF NOT EXISTS idx_treatments_patient_id 
-                    ON treatments(patient_id)
-                    """
-                },
-                {
-                    "name": "idx_treatments_treatment_date",
-                    "sql": """
-                    CREATE INDEX IF NOT EXISTS idx_treatments_treatment_date 
-                    ON treatments(treatment_date DESC)
-                    """
-                },
-                {
-                    "name": "idx_invoices_patient_id",
-                    "sql": """
-                    CREATE INDEX IF NOT EXISTS idx_invoices_patient_id 
-                    ON invoices(patient_id)
-                    """
-                },
-                {
-                    "name": "idx_invoices_payment_status",
-                    "sql": """
-                    CREATE INDEX IF NOT EXISTS idx_invoices_payment_status 
-                    ON invoices(payment_status)
-                    """
-                },
-                {
-                    "name": "idx_invoices_invoice_date",
-                    "sql": """
-                    CREATE INDEX IF NOT EXISTS idx_invoices_invoice_date 
-                    ON invoices(invoice_date DESC)
-                    """
-                },
-                {
-                    "name": "idx_employees_position",
-                    "sql": """
-                    CREATE INDEX IF NOT EXISTS idx_employees_position 
-                    ON employees(position)
-                    """
-                },
-                {
-                    "name": "idx_doctors_license_number",
-                    "sql": """
-                    CREATE INDEX IF NOT EXISTS idx_doctors_license_number 
-                    ON doctors(license_number) WHERE license_number IS NOT NULL
-                    """
-                },
-            ]
-            
-            created_count = 0
-            for index in indexes:
-                try:
-                    conn.execute(text(index["sql"]))
-                    index_results.append({"name": index["name"], "status": "تم الإنشاء"})
-                    created_count += 1
-                except Exception as e:
-                    index_results.append({"name": index["name"], "status": f"خطأ: {str(e)[:100]}"})
-                    logger.warning(f"⚠️  تحذير في إنشاء index {index['name']}: {str(e)[:100]}")
-            
-            details["indexes"] = {
-                "total": len(indexes),
-                "created": created_count,
-                "results": index_results
-            }
-            logger.info(f"✅ تم إنشاء {created_count} من أصل {len(indexes)} indexes")
-        
+            message = f"قاعدة البيانات محدثة بالفعل (الإصدار {result['current']})"
+        logger.info(f"✅ {message}")
         return InitDBResponse(
             success=True,
-            message="تم تهيئة قاعدة البيانات بنجاح",
-            details=details
+            message=message,
+            details={"migrations": result}
         )
-        
+
     except Exception as e:
         error_msg = str(e)
         logger.error(f"❌ فشل تهيئة قاعدة البيانات: {error_msg}", exc_info=True)
@@ -397,6 +85,42 @@ async def init_database(
         )
 
 
+@router.get("/migrations")
+async def migrations_status(
+    api_key: str = Depends(verify_api_key)
+):
+    """الإصدار الحالي والترحيلات المطبقة والناقصة"""
+    return await asyncio.to_thread(migration_status)
+
+
+@router.get("/replica")
+async def replica_info(
+    api_key: str = Depends(verify_api_key)
+):
+    """حالة الـ replica المستخدمة للقراءات الثقيلة (REPLICA_DATABASE_URL)"""
+    return replica_status()
+
+
+@router.get("/pool")
+async def pool_info(
+    api_key: str = Depends(verify_api_key)
+):
+    """
+    مقاييس connection pool في هذه العملية (كل worker له pool خاص)
+
+    الاتصالات المستخدمة والـ overflow ومرات انتهاء المهلة و histogram مدة انتظار الاتصال
+    """
+    primary_size, primary_overflow = pool_sizing()
+    return {
+        "workers": settings.WEB_CONCURRENCY,
+        "connection_budget": settings.DB_CONNECTION_BUDGET or None,
+        "max_connections_per_worker": primary_size + primary_overflow,
+        "pgbouncer": settings.DB_PGBOUNCER,
+        "primary": pool_stats(primary_engine),
+        "replica": pool_stats(replica_engine),
+    }
+
+
 @router.post("/clean", response_model=CleanDBResponse)
 async def clean_database(
     db: Session = Depends(get_db),
@@ -1540,3 +1264,38 @@ async def add_custom_data(
             detail=f"فشل إضافة البيانات المخصصة: {error_msg[:200]}"
         )
 
+
+
+# ==================== مستشار الاستعلامات والفهارس ====================
+
+@router.get("/query-plans")
+async def query_plans(
+    name: Optional[str] = Query(None, description="أسماء الاستعلامات مفصولة بفواصل (افتراضياً الكل)"),
+    db: Session = Depends(get_db),
+    api_key: str = Depends(verify_api_key)
+):
+    """
+    EXPLAIN (ANALYZE, BUFFERS) على الاستعلامات الساخنة في التطبيق
+
+    يعلّم القراءة الكاملة (Seq Scan) على الجداول الكبيرة ويقترح الفهارس الناقصة
+    (راجع app/services/query_advisor.py)
+    """
+    from app.services.query_advisor import explain_hot_queries
+    names = [item.strip() for item in name.split(",") if item.strip()] if name else None
+    return await asyncio.to_thread(explain_hot_queries, db, names)
+
+
+@router.post("/indexes/apply")
+async def apply_missing_indexes(
+    name: Optional[str] = Query(None, description="أسماء الفهارس مفصولة بفواصل (افتراضياً كل الناقصة)"),
+    api_key: str = Depends(verify_api_key)
+):
+    """إنشاء الفهارس المعرّفة في النماذج والناقصة في قاعدة البيانات (CONCURRENTLY في PostgreSQL)"""
+    from app.services.query_advisor import apply_indexes
+    names = [item.strip() for item in name.split(",") if item.strip()] if name else None
+    results = await asyncio.to_thread(apply_indexes, names)
+    return {
+        "success": all(result["status"] != "failed" for result in results),
+        "created": [result["name"] for result in results if result["status"] == "created"],
+        "results": results
+    }
@@ -1,15 +1,19 @@
 """
 Doctors admin router
 """
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, List
 from uuid import UUID
 from datetime import datetime
 from app.db.session import get_db
 from app.db.models import Doctor
 from app.middleware.auth import verify_api_key
+from app.core.serialization import DOCTORS
+from app.core.listing import list_response, search_filter
+from app.services.catalog_batch_service import DOCTOR_BATCH, batch_response
+from app.core.catalog import bump_catalog_version, get_catalog_version
 
 
 router = APIRouter(prefix="/admin/doctors", tags=["Admin - Doctors"])
@@ -43,27 +47,48 @@ class DoctorUpdate(BaseModel):
     is_active: Optional[bool] = None
 
 
+class DoctorBatchUpdate(DoctorUpdate):
+    id: UUID
+
+
+class DoctorBatch(BaseModel):
+    """عمليات مجمّعة: تُطبق في transaction واحدة"""
+    create: List[DoctorCreate] = []
+    update: List[DoctorBatchUpdate] = []
+    delete: List[UUID] = []
+
+
+# الحقول الافتراضية لقائمة الأطباء (باقي الحقول عبر fields=)
+_LIST_FIELDS = ["id", "name", "specialty", "bio", "is_active", "created_at", "updated_at"]
+
+
 @router.get("/")
 async def list_doctors(
+    request: Request,
+    is_active: Optional[bool] = Query(None),
+    specialty: Optional[str] = Query(None),
+    branch_id: Optional[UUID] = Query(None),
+    page: Optional[int] = Query(None, ge=1, description="رقم الصفحة (بدونه تُرجع كل النتائج)"),
+    page_size: int = Query(50, ge=1, le=500, description="حجم الصفحة"),
+    sort: Optional[str] = Query(None, description="حقل الترتيب (-حقل للترتيب التنازلي)"),
+    q: Optional[str] = Query(None, description="بحث نصي"),
+    fields: Optional[str] = Query(None, description="الحقول المطلوبة مفصولة بفواصل"),
     db: Session = Depends(get_db),
     api_key: str = Depends(verify_api_key)
 ):
-    """قائمة بجميع الأطباء"""
-    doctors = db.query(Doctor).all()
-    return {
-        "doctors": [
-            {
-                "id": str(doctor.id),
-                "name": doctor.name,
-                "specialty": doctor.specialty,
-                "bio": doctor.bio,
-                "is_active": doctor.is_active,
-                "created_at": doctor.created_at.isoformat(),
-                "updated_at": doctor.updated_at.isoformat()
-            }
-            for doctor in doctors
-        ]
-    }
+    """قائمة الأطباء (ترقيم صفحات وفلترة وترتيب + ETag)"""
+    selected = DOCTORS.parse_fields(fields, _LIST_FIELDS)
+    filters = [
+        Doctor.is_active == is_active if is_active is not None else None,
+        Doctor.specialty == specialty if specialty else None,
+        Doctor.branch_id == branch_id if branch_id else None,
+        search_filter(q, [Doctor.name, Doctor.specialty])
+    ]
+    return list_response(
+        request, db, DOCTORS, "doctors", selected, filters,
+        sort=sort, default_sort="name", page=page, page_size=page_size,
+        version=get_catalog_version(db)
+    )
 
 
 @router.post("/")
@@ -76,6 +101,7 @@ async def create_doctor(
     doctor = Doctor(**doctor_data.model_dump())
     db.add(doctor)
     db.commit()
+    bump_catalog_version()
     db.refresh(doctor)
     return {
         "id": str(doctor.id),
@@ -111,6 +137,7 @@ async def update_doctor(
     
     doctor.updated_at = datetime.now()
     db.commit()
+    bump_catalog_version()
     db.refresh(doctor)
     
     return {
@@ -152,6 +179,22 @@ async def delete_doctor(
     
     db.delete(doctor)
     db.commit()
+    bump_catalog_version()
     
     return {"message": "تم حذف الطبيب بنجاح", "id": str(doctor_id)}
 
+
+@router.post("/batch")
+async def batch_doctors(
+    batch: DoctorBatch,
+    atomic: bool = Query(False, description="إلغاء الدفعة كاملة إذا فشل أي عنصر"),
+    db: Session = Depends(get_db),
+    api_key: str = Depends(verify_api_key)
+):
+    """
+    إنشاء وتعديل وحذف الأطباء دفعة واحدة
+
+    - التعديل: id + الحقول المعدلة فقط
+    - النتيجة لكل عنصر (created / updated / deleted / not_found / conflict / blocked)
+    """
+    return batch_response(db, DOCTOR_BATCH, batch, atomic)
@@ -1,161 +1,232 @@
 """
-Data Export Router - تصدير البيانات (CSV, JSON)
+Data Export Router - تصدير البيانات (CSV, JSON, NDJSON)
+
+التصدير يُبث صفاً بصف: الاستعلام يُقرأ على دفعات (yield_per - server-side cursor في PostgreSQL)
+وكل دفعة تُحوّل وتُرسل مباشرة، فيبقى استهلاك الذاكرة ثابتاً مهما كان حجم التصدير.
+الخيار gzip=true يضغط البيانات أثناء البث (ملف .gz).
 """
 import csv
 import json
+import zlib
 from io import StringIO
-from fastapi import APIRouter, Depends, Query, Response
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+from fastapi import APIRouter, Depends, Query
 from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session
-from typing import Optional
-from datetime import date
-from app.db.session import get_db
+from sqlalchemy import select
+from sqlalchemy.sql import Select
+from app.config import get_settings
+from app.db.session import read_session
 from app.middleware.auth import verify_api_key
 from app.db.models import Conversation, Appointment, Branch, Doctor, Service
 
 router = APIRouter(prefix="/admin/export", tags=["Admin - Export"])
+settings = get_settings()
+
+_MEDIA_TYPES = {
+    "csv": "text/csv",
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def _day_bounds(from_date: Optional[date], to_date: Optional[date]):
+    """نطاق نصف مفتوح [بداية from_date، بداية اليوم التالي لـ to_date)"""
+    start = datetime.combine(from_date, datetime.min.time()) if from_date else None
+    end = datetime.combine(to_date + timedelta(days=1), datetime.min.time()) if to_date else None
+    return start, end
+
+
+def _plain(value: Any) -> Any:
+    """تحويل القيم لأنواع قابلة للتسلسل (UUID, datetime)"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+def _iter_batches(statement: Select) -> Iterator[Sequence]:
+    """
+    قراءة نتائج الاستعلام على دفعات بجلسة خاصة بالتصدير
+
+    جلسة get_db تُغلق قبل انتهاء البث، لذلك يفتح المولّد جلسته (من الـ replica إن وُجدت)
+    ويغلقها عند انتهاء البث أو انقطاع الاتصال
+    """
+    db = read_session()
+    try:
+        result = db.execute(statement.execution_options(yield_per=settings.EXPORT_BATCH_SIZE))
+        for batch in result.partitions():
+            yield batch
+    finally:
+        db.close()
+
+
+def _encode(
+    batches: Iterator[Sequence],
+    format: str,
+    header: List[str],
+    to_record: Callable[[Any], Dict[str, Any]]
+) -> Iterator[str]:
+    """تحويل الدفعات إلى نص CSV أو JSON أو NDJSON (قطعة لكل دفعة)"""
+    if format == "csv":
+        buffer = StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(header)
+        for batch in batches:
+            for row in batch:
+                writer.writerow(["" if value is None else value for value in to_record(row).values()])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+    elif format == "ndjson":
+        for batch in batches:
+            yield "".join(json.dumps(to_record(row), ensure_ascii=False) + "\n" for row in batch)
+    else:  # JSON array
+        yield "["
+        separator = "\n"
+        for batch in batches:
+            chunk = []
+            for row in batch:
+                chunk.append(separator + json.dumps(to_record(row), ensure_ascii=False))
+                separator = ",\n"
+            yield "".join(chunk)
+        yield "\n]"
+
+
+def _gzip(chunks: Iterator[str]) -> Iterator[bytes]:
+    """ضغط gzip أثناء البث"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _export_response(
+    statement: Select,
+    name: str,
+    format: str,
+    gzip: bool,
+    header: List[str],
+    to_record: Callable[[Any], Dict[str, Any]]
+) -> StreamingResponse:
+    chunks = _encode(_iter_batches(statement), format, header, to_record)
+    filename = f"{name}.{format}"
+    media_type = _MEDIA_TYPES[format]
+    if gzip:
+        chunks = _gzip(chunks)
+        filename += ".gz"
+        media_type = "application/gzip"
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
 
 
 @router.get("/conversations")
 async def export_conversations(
     from_date: Optional[date] = Query(None, alias="from"),
     to_date: Optional[date] = Query(None, alias="to"),
-    format: str = Query("csv", regex="^(csv|json)$"),
-    db: Session = Depends(get_db),
+    format: str = Query("csv", pattern="^(csv|json|ndjson)$"),
+    gzip: bool = Query(False, description="ضغط الملف (gzip)"),
     api_key: str = Depends(verify_api_key)
 ):
     """تصدير المحادثات"""
-    from datetime import datetime
-    
-    query = db.query(Conversation)
-    
-    if from_date:
-        query = query.filter(Conversation.created_at >= datetime.combine(from_date, datetime.min.time()))
-    if to_date:
-        query = query.filter(Conversation.created_at <= datetime.combine(to_date, datetime.max.time()))
-    
-    conversations = query.order_by(Conversation.created_at.desc()).all()
-    
-    if format == "csv":
-        output = StringIO()
-        writer = csv.writer(output)
-        writer.writerow([
-            "ID", "User ID", "Channel", "Message", "Reply", "Intent",
-            "DB Context Used", "Unrecognized", "Needs Handoff", "Created At"
-        ])
-        
-        for conv in conversations:
-            writer.writerow([
-                str(conv.id),
-                conv.user_id,
-                conv.channel,
-                conv.user_message,
-                conv.bot_reply or "",
-                conv.intent or "",
-                conv.db_context_used,
-                conv.unrecognized,
-                conv.needs_handoff,
-                conv.created_at.isoformat()
-            ])
-        
-        output.seek(0)
-        return StreamingResponse(
-            iter([output.getvalue()]),
-            media_type="text/csv",
-            headers={"Content-Disposition": "attachment; filename=conversations.csv"}
-        )
-    else:  # JSON
-        data = [
-            {
-                "id": str(conv.id),
-                "user_id": conv.user_id,
-                "channel": conv.channel,
-                "message": conv.user_message,
-                "reply": conv.bot_reply,
-                "intent": conv.intent,
-                "db_context_used": conv.db_context_used,
-                "unrecognized": conv.unrecognized,
-                "needs_handoff": conv.needs_handoff,
-                "created_at": conv.created_at.isoformat()
-            }
-            for conv in conversations
-        ]
-        return Response(
-            content=json.dumps(data, ensure_ascii=False, indent=2),
-            media_type="application/json",
-            headers={"Content-Disposition": "attachment; filename=conversations.json"}
-        )
+    statement = select(
+        Conversation.id,
+        Conversation.user_id,
+        Conversation.channel,
+        Conversation.user_message,
+        Conversation.bot_reply,
+        Conversation.intent,
+        Conversation.db_context_used,
+        Conversation.unrecognized,
+        Conversation.needs_handoff,
+        Conversation.created_at
+    )
+
+    start, end = _day_bounds(from_date, to_date)
+    if start:
+        statement = statement.where(Conversation.created_at >= start)
+    if end:
+        statement = statement.where(Conversation.created_at < end)
+    statement = statement.order_by(Conversation.created_at.desc())
+
+    def to_record(row) -> Dict[str, Any]:
+        return {
+            "id": _plain(row.id),
+            "user_id": row.user_id,
+            "channel": row.channel,
+            "message": row.user_message,
+            "reply": row.bot_reply,
+            "intent": row.intent,
+            "db_context_used": row.db_context_used,
+            "unrecognized": row.unrecognized,
+            "needs_handoff": row.needs_handoff,
+            "created_at": _plain(row.created_at)
+        }
+
+    return _export_response(
+        statement, "conversations", format, gzip,
+        ["ID", "User ID", "Channel", "Message", "Reply", "Intent",
+         "DB Context Used", "Unrecognized", "Needs Handoff", "Created At"],
+        to_record
+    )
 
 
 @router.get("/appointments")
 async def export_appointments(
     from_date: Optional[date] = Query(None, alias="from"),
     to_date: Optional[date] = Query(None, alias="to"),
-    format: str = Query("csv", regex="^(csv|json)$"),
-    db: Session = Depends(get_db),
+    format: str = Query("csv", pattern="^(csv|json|ndjson)$"),
+    gzip: bool = Query(False, description="ضغط الملف (gzip)"),
     api_key: str = Depends(verify_api_key)
 ):
     """تصدير المواعيد"""
-    from datetime import datetime
-    
-    query = db.query(Appointment)
-    
-    if from_date:
-        query = query.filter(Appointment.datetime >= datetime.combine(from_date, datetime.min.time()))
-    if to_date:
-        query = query.filter(Appointment.datetime <= datetime.combine(to_date, datetime.max.time()))
-    
-    appointments = query.order_by(Appointment.datetime.desc()).all()
-    
-    if format == "csv":
-        output = StringIO()
-        writer = csv.writer(output)
-        writer.writerow([
-            "ID", "Patient Name", "Phone", "Branch", "Doctor", "Service",
-            "DateTime", "Channel", "Status", "Notes", "Created At"
-        ])
-        
-        for apt in appointments:
-            writer.writerow([
-                str(apt.id),
-                apt.patient_name,
-                apt.phone,
-                apt.branch.name if apt.branch else "",
-                apt.doctor.name if apt.doctor else "",
-                apt.service.name if apt.service else "",
-                apt.datetime.isoformat(),
-                apt.channel,
-                apt.status,
-                apt.notes or "",
-                apt.created_at.isoformat()
-            ])
-        
-        output.seek(0)
-        return StreamingResponse(
-            iter([output.getvalue()]),
-            media_type="text/csv",
-            headers={"Content-Disposition": "attachment; filename=appointments.csv"}
-        )
-    else:  # JSON
-        data = [
-            {
-                "id": str(apt.id),
-                "patient_name": apt.patient_name,
-                "phone": apt.phone,
-                "branch": apt.branch.name if apt.branch else None,
-                "doctor": apt.doctor.name if apt.doctor else None,
-                "service": apt.service.name if apt.service else None,
-                "datetime": apt.datetime.isoformat(),
-                "channel": apt.channel,
-                "status": apt.status,
-                "notes": apt.notes,
-                "created_at": apt.created_at.isoformat()
-            }
-            for apt in appointments
-        ]
-        return Response(
-            content=json.dumps(data, ensure_ascii=False, indent=2),
-            media_type="application/json",
-            headers={"Content-Disposition": "attachment; filename=appointments.json"}
-        )
+    # أسماء الفرع والطبيب والخدمة من نفس الاستعلام (بدون استعلام لكل صف)
+    statement = select(
+        Appointment.id,
+        Appointment.patient_name,
+        Appointment.phone,
+        Branch.name.label("branch_name"),
+        Doctor.name.label("doctor_name"),
+        Service.name.label("service_name"),
+        Appointment.datetime,
+        Appointment.channel,
+        Appointment.status,
+        Appointment.notes,
+        Appointment.created_at
+    ).outerjoin(Appointment.branch).outerjoin(Appointment.doctor).outerjoin(Appointment.service)
+
+    start, end = _day_bounds(from_date, to_date)
+    if start:
+        statement = statement.where(Appointment.datetime >= start)
+    if end:
+        statement = statement.where(Appointment.datetime < end)
+    statement = statement.order_by(Appointment.datetime.desc())
+
+    def to_record(row) -> Dict[str, Any]:
+        return {
+            "id": _plain(row.id),
+            "patient_name": row.patient_name,
+            "phone": row.phone,
+            "branch": row.branch_name,
+            "doctor": row.doctor_name,
+            "service": row.service_name,
+            "datetime": _plain(row.datetime),
+            "channel": row.channel,
+            "status": row.status,
+            "notes": row.notes,
+            "created_at": _plain(row.created_at)
+        }
 
+    return _export_response(
+        statement, "appointments", format, gzip,
+        ["ID", "Patient Name", "Phone", "Branch", "Doctor", "Service",
+         "DateTime", "Channel", "Status", "Notes", "Created At"],
+        to_record
+    )
@@ -1,13 +1,15 @@
 """
 FAQ admin router
 """
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query, Request
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from typing import Optional, List
 from app.db.session import get_db
 from app.db.models import FAQ
 from app.middleware.auth import verify_api_key
+from app.core.serialization import FAQS
+from app.core.listing import list_response, search_filter
 
 
 router = APIRouter(prefix="/admin/faqs", tags=["Admin - FAQs"])
@@ -22,25 +24,26 @@ class FAQCreate(BaseModel):
 
 @router.get("/")
 async def list_faqs(
+    request: Request,
+    is_active: Optional[bool] = Query(None),
+    page: Optional[int] = Query(None, ge=1, description="رقم الصفحة (بدونه تُرجع كل النتائج)"),
+    page_size: int = Query(50, ge=1, le=500, description="حجم الصفحة"),
+    sort: Optional[str] = Query(None, description="حقل الترتيب (-حقل للترتيب التنازلي)"),
+    q: Optional[str] = Query(None, description="بحث نصي"),
+    fields: Optional[str] = Query(None, description="الحقول المطلوبة مفصولة بفواصل"),
     db: Session = Depends(get_db),
     api_key: str = Depends(verify_api_key)
 ):
-    """قائمة بجميع الأسئلة الشائعة"""
-    faqs = db.query(FAQ).all()
-    return {
-        "faqs": [
-            {
-                "id": str(faq.id),
-                "question": faq.question,
-                "answer": faq.answer,
-                "tags": faq.tags if isinstance(faq.tags, list) else [],
-                "is_active": faq.is_active,
-                "created_at": faq.created_at.isoformat(),
-                "updated_at": faq.updated_at.isoformat()
-            }
-            for faq in faqs
-        ]
-    }
+    """قائمة الأسئلة الشائعة (ترقيم صفحات وفلترة وترتيب + ETag)"""
+    selected = FAQS.parse_fields(fields, list(FAQS.columns))
+    filters = [
+        FAQ.is_active == is_active if is_active is not None else None,
+        search_filter(q, [FAQ.question, FAQ.answer])
+    ]
+    return list_response(
+        request, db, FAQS, "faqs", selected, filters,
+        sort=sort, default_sort="-created_at", page=page, page_size=page_size
+    )
 
 
 @router.post("/")
@@ -1,7 +1,7 @@
 """
 Offers admin router
 """
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query, Request
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from typing import Optional
@@ -11,6 +11,8 @@ from decimal import Decimal
 from app.db.session import get_db
 from app.db.models import Offer
 from app.middleware.auth import verify_api_key
+from app.core.serialization import OFFERS
+from app.core.listing import list_response, search_filter
 
 
 router = APIRouter(prefix="/admin/offers", tags=["Admin - Offers"])
@@ -29,29 +31,28 @@ class OfferCreate(BaseModel):
 
 @router.get("/")
 async def list_offers(
+    request: Request,
+    is_active: Optional[bool] = Query(None),
+    related_service_id: Optional[UUID] = Query(None),
+    page: Optional[int] = Query(None, ge=1, description="رقم الصفحة (بدونه تُرجع كل النتائج)"),
+    page_size: int = Query(50, ge=1, le=500, description="حجم الصفحة"),
+    sort: Optional[str] = Query(None, description="حقل الترتيب (-حقل للترتيب التنازلي)"),
+    q: Optional[str] = Query(None, description="بحث نصي"),
+    fields: Optional[str] = Query(None, description="الحقول المطلوبة مفصولة بفواصل"),
     db: Session = Depends(get_db),
     api_key: str = Depends(verify_api_key)
 ):
-    """قائمة بجميع العروض"""
-    offers = db.query(Offer).all()
-    return {
-        "offers": [
-            {
-                "id": str(offer.id),
-                "title": offer.title,
-                "description": offer.description,
-                "discount_type": offer.discount_type,
-                "discount_value": float(offer.discount_value),
-                "start_date": offer.start_date.isoformat() if offer.start_date else None,
-                "end_date": offer.end_date.isoformat() if offer.end_date else None,
-                "related_service_id": str(offer.related_service_id) if offer.related_service_id else None,
-                "is_active": offer.is_active,
-                "created_at": offer.created_at.isoformat(),
-                "updated_at": offer.updated_at.isoformat()
-            }
-            for offer in offers
-        ]
-    }
+    """قائمة العروض (ترقيم صفحات وفلترة وترتيب + ETag)"""
+    selected = OFFERS.parse_fields(fields, list(OFFERS.columns))
+    filters = [
+        Offer.is_active == is_active if is_active is not None else None,
+        Offer.related_service_id == related_service_id if related_service_id else None,
+        search_filter(q, [Offer.title, Offer.description])
+    ]
+    return list_response(
+        request, db, OFFERS, "offers", selected, filters,
+        sort=sort, default_sort="-created_at", page=page, page_size=page_size
+    )
 
 
 @router.post("/")
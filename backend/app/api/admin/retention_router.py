@@ -0,0 +1,66 @@
+"""
+Retention Router - الاحتفاظ بالبيانات
+(المنطق في app/services/retention_service.py)
+"""
+import asyncio
+import logging
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from app.db.session import get_db
+from app.middleware.auth import verify_api_key
+from app.services.partition_service import partition_status
+from app.services.retention_service import get_retention_engine
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/admin/retention", tags=["Admin - Retention"])
+
+
+def _tables(table: Optional[str]):
+    return [name.strip() for name in table.split(",") if name.strip()] if table else None
+
+
+@router.get("/")
+async def retention_status(
+    api_key: str = Depends(verify_api_key)
+):
+    """السياسات لكل جدول وتقدم آخر تشغيل (الصفوف المحذوفة، الدفعات، الصفوف في الثانية)"""
+    return get_retention_engine().status()
+
+
+@router.get("/pending")
+async def retention_pending(
+    table: Optional[str] = Query(None, description="الجداول مفصولة بفواصل (افتراضياً الكل)"),
+    db: Session = Depends(get_db),
+    api_key: str = Depends(verify_api_key)
+):
+    """عدد الصفوف التي سيحذفها التشغيل التالي (بدون حذف)"""
+    try:
+        return await asyncio.to_thread(get_retention_engine().pending_counts, db, _tables(table))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/partitions")
+async def retention_partitions(
+    api_key: str = Depends(verify_api_key)
+):
+    """أقسام conversations الشهرية (إذا كان الجدول مقسماً)"""
+    return await asyncio.to_thread(partition_status)
+
+
+@router.post("/run", status_code=202)
+async def run_retention(
+    table: Optional[str] = Query(None, description="الجداول مفصولة بفواصل (افتراضياً الكل)"),
+    api_key: str = Depends(verify_api_key)
+):
+    """تشغيل سياسات الاحتفاظ الآن في الخلفية (التقدم عبر GET /admin/retention)"""
+    engine = get_retention_engine()
+    try:
+        started = engine.start(_tables(table))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not started:
+        raise HTTPException(status_code=409, detail="يوجد تشغيل قيد التنفيذ")
+    return {"success": True, "status_url": "/admin/retention/"}
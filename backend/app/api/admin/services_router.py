@@ -1,16 +1,20 @@
 """
 Services admin router
 """
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, List
 from decimal import Decimal
 from uuid import UUID
 from datetime import datetime
 from app.db.session import get_db
 from app.db.models import Service
 from app.middleware.auth import verify_api_key
+from app.core.serialization import SERVICES
+from app.core.listing import list_response, search_filter
+from app.services.catalog_batch_service import SERVICE_BATCH, batch_response
+from app.core.catalog import bump_catalog_version, get_catalog_version
 
 
 router = APIRouter(prefix="/admin/services", tags=["Admin - Services"])
@@ -32,27 +36,40 @@ class ServiceUpdate(BaseModel):
     is_active: Optional[bool] = None
 
 
+class ServiceBatchUpdate(ServiceUpdate):
+    id: UUID
+
+
+class ServiceBatch(BaseModel):
+    """عمليات مجمّعة: تُطبق في transaction واحدة"""
+    create: List[ServiceCreate] = []
+    update: List[ServiceBatchUpdate] = []
+    delete: List[UUID] = []
+
+
 @router.get("/")
 async def list_services(
+    request: Request,
+    is_active: Optional[bool] = Query(None),
+    page: Optional[int] = Query(None, ge=1, description="رقم الصفحة (بدونه تُرجع كل النتائج)"),
+    page_size: int = Query(50, ge=1, le=500, description="حجم الصفحة"),
+    sort: Optional[str] = Query(None, description="حقل الترتيب (-حقل للترتيب التنازلي)"),
+    q: Optional[str] = Query(None, description="بحث نصي"),
+    fields: Optional[str] = Query(None, description="الحقول المطلوبة مفصولة بفواصل"),
     db: Session = Depends(get_db),
     api_key: str = Depends(verify_api_key)
 ):
-    """قائمة بجميع الخدمات"""
-    services = db.query(Service).all()
-    return {
-        "services": [
-            {
-                "id": str(service.id),
-                "name": service.name,
-                "description": service.description,
-                "base_price": float(service.base_price) if service.base_price is not None else None,
-                "is_active": service.is_active,
-                "created_at": service.created_at.isoformat(),
-                "updated_at": service.updated_at.isoformat()
-            }
-            for service in services
-        ]
-    }
+    """قائمة الخدمات (ترقيم صفحات وفلترة وترتيب + ETag)"""
+    selected = SERVICES.parse_fields(fields, list(SERVICES.columns))
+    filters = [
+        Service.is_active == is_active if is_active is not None else None,
+        search_filter(q, [Service.name, Service.description])
+    ]
+    return list_response(
+        request, db, SERVICES, "services", selected, filters,
+        sort=sort, default_sort="name", page=page, page_size=page_size,
+        version=get_catalog_version(db)
+    )
 
 
 @router.post("/")
@@ -65,6 +82,7 @@ async def create_service(
     service = Service(**service_data.model_dump())
     db.add(service)
     db.commit()
+    bump_catalog_version()
     db.refresh(service)
     return {
         "id": str(service.id),
@@ -94,6 +112,7 @@ async def update_service(
     
     service.updated_at = datetime.now()
     db.commit()
+    bump_catalog_version()
     db.refresh(service)
     
     return {
@@ -129,6 +148,22 @@ async def delete_service(
     
     db.delete(service)
     db.commit()
+    bump_catalog_version()
     
     return {"message": "تم حذف الخدمة بنجاح", "id": str(service_id)}
 
+
+@router.post("/batch")
+async def batch_services(
+    batch: ServiceBatch,
+    atomic: bool = Query(False, description="إلغاء الدفعة كاملة إذا فشل أي عنصر"),
+    db: Session = Depends(get_db),
+    api_key: str = Depends(verify_api_key)
+):
+    """
+    إنشاء وتعديل وحذف الخدمات دفعة واحدة
+
+    - التعديل: id + الحقول المعدلة فقط
+    - النتيجة لكل عنصر (created / updated / deleted / not_found / conflict / blocked)
+    """
+    return batch_response(db, SERVICE_BATCH, batch, atomic)
@@ -2,21 +2,30 @@
 N8N Integration Router - تكامل مع n8n
 يوفر endpoints للوصول إلى البيانات من n8n
 """
+import asyncio
 import logging
+import time
 from fastapi import APIRouter, Depends, Query, HTTPException
 from sqlalchemy.orm import Session
 from sqlalchemy import desc, func
-from typing import Optional, List, Dict, Any
-from datetime import datetime, date
+from typing import Optional, List, Dict, Any, Tuple
+from datetime import datetime, date, timedelta
 from pydantic import BaseModel
-from app.db.session import get_db
+from app.config import get_settings
+from app.db.session import get_read_db
 from app.middleware.auth import verify_api_key
+from app.core.pagination import keyset_page
+from app.core.serialization import (
+    Projection, APPOINTMENTS, PATIENTS, DOCTORS, INVOICES, CONVERSATIONS
+)
+from app.services.outbox_service import get_outbox_dispatcher
 from app.db.models import (
     Appointment, Doctor, Service, Branch, Offer, FAQ, 
     Patient, Treatment, Invoice, Employee, Conversation
 )
 
 logger = logging.getLogger(__name__)
+settings = get_settings()
 
 router = APIRouter(prefix="/n8n", tags=["N8N Integration"])
 
@@ -27,322 +36,380 @@ class N8NResponse(BaseModel):
     data: Any
     count: Optional[int] = None
     message: Optional[str] = None
+    next_cursor: Optional[str] = None  # للمزامنة التدريجية (cursor / updated_since)
+    has_more: Optional[bool] = None
+
+
+def _fetch_page(
+    db: Session,
+    projection: Projection,
+    model,
+    statement,
+    selected: List[str],
+    limit: int,
+    cursor: Optional[str],
+    updated_since: Optional[datetime],
+    order_by
+) -> Tuple[List[Dict[str, Any]], Optional[str], Optional[bool]]:
+    """
+    تنفيذ استعلام الـ projection: keyset pagination عند تمرير cursor أو updated_since،
+    وإلا الترتيب الافتراضي للـ endpoint مع limit
+
+    Returns:
+        (الصفوف كقواميس، next_cursor، has_more)
+    """
+    execute = lambda stmt: db.execute(stmt).all()
+    if cursor or updated_since:
+        rows, next_cursor, has_more = keyset_page(statement, model, limit, cursor, updated_since, execute=execute)
+    else:
+        order = order_by if isinstance(order_by, (list, tuple)) else [order_by]
+        rows, next_cursor, has_more = execute(statement.order_by(*order).limit(limit)), None, None
+    return projection.to_dicts(rows, selected), next_cursor, has_more
 
 
 # ==================== المواعيد ====================
+_APPOINTMENT_FIELDS = [
+    "id", "patient_name", "phone", "patient_id", "branch_id", "branch_name", "doctor_id", "doctor_name",
+    "service_id", "service_name", "datetime", "channel", "status", "appointment_type", "notes",
+    "created_at", "updated_at"
+]
+
+
 @router.get("/appointments", response_model=N8NResponse)
 async def get_appointments_n8n(
     status: Optional[str] = Query(None, description="حالة الموعد (pending, confirmed, completed, cancelled)"),
     from_date: Optional[str] = Query(None, description="من تاريخ (YYYY-MM-DD)"),
     to_date: Optional[str] = Query(None, description="إلى تاريخ (YYYY-MM-DD)"),
     limit: int = Query(100, ge=1, le=1000, description="عدد النتائج"),
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = Query(None, description="cursor الصفحة السابقة (next_cursor) للمزامنة التدريجية"),
+    updated_since: Optional[datetime] = Query(None, description="الصفوف المعدلة منذ هذا الوقت فقط (ISO 8601)"),
+    fields: Optional[str] = Query(None, description="الحقول المطلوبة مفصولة بفواصل (افتراضياً: كل الحقول الأساسية)"),
+    db: Session = Depends(get_read_db),
     api_key: str = Depends(verify_api_key)
 ):
-    """جلب المواعيد لـ n8n"""
+    """جلب المواعيد لـ n8n (أسماء الفرع والطبيب والخدمة من نفس الاستعلام)"""
     try:
-        query = db.query(Appointment)
+        selected = APPOINTMENTS.parse_fields(fields, _APPOINTMENT_FIELDS)
+        statement = APPOINTMENTS.select(selected, include=("id", "updated_at"))
         
         if status:
-            query = query.filter(Appointment.status == status)
+            statement = statement.where(Appointment.status == status)
         
         if from_date:
             try:
-                from_dt = datetime.fromisoformat(from_date)
-                query = query.filter(Appointment.datetime >= from_dt)
-            except:
+                statement = statement.where(Appointment.datetime >= datetime.fromisoformat(from_date))
+            except ValueError:
                 pass
         
         if to_date:
             try:
-                to_dt = datetime.fromisoformat(to_date)
-                query = query.filter(Appointment.datetime <= to_dt)
-            except:
+                statement = statement.where(Appointment.datetime <= datetime.fromisoformat(to_date))
+            except ValueError:
                 pass
         
-        appointments = query.order_by(desc(Appointment.datetime)).limit(limit).all()
-        
-        data = []
-        for apt in appointments:
-            data.append({
-                "id": str(apt.id),
-                "patient_name": apt.patient_name,
-                "phone": apt.phone,
-                "patient_id": str(apt.patient_id) if apt.patient_id else None,
-                "branch_id": str(apt.branch_id),
-                "doctor_id": str(apt.doctor_id) if apt.doctor_id else None,
-                "service_id": str(apt.service_id),
-                "datetime": apt.datetime.isoformat(),
-                "channel": apt.channel,
-                "status": apt.status,
-                "appointment_type": apt.appointment_type,
-                "notes": apt.notes,
-                "created_at": apt.created_at.isoformat(),
-                "updated_at": apt.updated_at.isoformat()
-            })
+        data, next_cursor, has_more = _fetch_page(
+            db, APPOINTMENTS, Appointment, statement, selected, limit, cursor, updated_since, desc(Appointment.datetime)
+        )
         
         return N8NResponse(
             success=True,
             data=data,
-            count=len(data)
+            count=len(data),
+            next_cursor=next_cursor,
+            has_more=has_more
         )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"خطأ في جلب المواعيد: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
 # ==================== المرضى ====================
+_PATIENT_FIELDS = [
+    "id", "full_name", "date_of_birth", "gender", "phone_number", "email", "address",
+    "is_active", "created_at", "updated_at"
+]
+
+
 @router.get("/patients", response_model=N8NResponse)
 async def get_patients_n8n(
     is_active: Optional[bool] = Query(None, description="المرضى النشطين فقط"),
     limit: int = Query(100, ge=1, le=1000),
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = Query(None, description="cursor الصفحة السابقة (next_cursor) للمزامنة التدريجية"),
+    updated_since: Optional[datetime] = Query(None, description="الصفوف المعدلة منذ هذا الوقت فقط (ISO 8601)"),
+    fields: Optional[str] = Query(None, description="الحقول المطلوبة مفصولة بفواصل (افتراضياً: كل الحقول الأساسية)"),
+    db: Session = Depends(get_read_db),
     api_key: str = Depends(verify_api_key)
 ):
-    """جلب المرضى لـ n8n"""
+    """جلب المرضى لـ n8n (medical_history وباقي الحقول الطويلة عبر fields= فقط)"""
     try:
-        query = db.query(Patient)
+        selected = PATIENTS.parse_fields(fields, _PATIENT_FIELDS)
+        statement = PATIENTS.select(selected, include=("id", "updated_at"))
         
         if is_active is not None:
-            query = query.filter(Patient.is_active == is_active)
+            statement = statement.where(Patient.is_active == is_active)
         
-        patients = query.order_by(desc(Patient.created_at)).limit(limit).all()
-        
-        data = []
-        for patient in patients:
-            data.append({
-                "id": str(patient.id),
-                "full_name": patient.full_name,
-                "date_of_birth": patient.date_of_birth.isoformat() if patient.date_of_birth else None,
-                "gender": patient.gender,
-                "phone_number": patient.phone_number,
-                "email": patient.email,
-                "address": patient.address,
-                "is_active": patient.is_active,
-                "created_at": patient.created_at.isoformat(),
-                "updated_at": patient.updated_at.isoformat()
-            })
+        data, next_cursor, has_more = _fetch_page(
+            db, PATIENTS, Patient, statement, selected, limit, cursor, updated_since, desc(Patient.created_at)
+        )
         
         return N8NResponse(
             success=True,
             data=data,
-            count=len(data)
+            count=len(data),
+            next_cursor=next_cursor,
+            has_more=has_more
         )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"خطأ في جلب المرضى: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
 # ==================== الأطباء ====================
+_DOCTOR_FIELDS = [
+    "id", "name", "specialty", "license_number", "phone_number", "email", "bio", "qualifications",
+    "experience_years", "working_hours", "branch_id", "is_active", "created_at", "updated_at"
+]
+
+
 @router.get("/doctors", response_model=N8NResponse)
 async def get_doctors_n8n(
     is_active: Optional[bool] = Query(None),
     limit: int = Query(100, ge=1, le=1000),
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = Query(None, description="cursor الصفحة السابقة (next_cursor) للمزامنة التدريجية"),
+    updated_since: Optional[datetime] = Query(None, description="الصفوف المعدلة منذ هذا الوقت فقط (ISO 8601)"),
+    fields: Optional[str] = Query(None, description="الحقول المطلوبة مفصولة بفواصل (افتراضياً: كل الحقول الأساسية)"),
+    db: Session = Depends(get_read_db),
     api_key: str = Depends(verify_api_key)
 ):
     """جلب الأطباء لـ n8n"""
     try:
-        query = db.query(Doctor)
+        selected = DOCTORS.parse_fields(fields, _DOCTOR_FIELDS)
+        statement = DOCTORS.select(selected, include=("id", "updated_at"))
         
         if is_active is not None:
-            query = query.filter(Doctor.is_active == is_active)
-        
-        doctors = query.limit(limit).all()
+            statement = statement.where(Doctor.is_active == is_active)
         
-        data = []
-        for doctor in doctors:
-            data.append({
-                "id": str(doctor.id),
-                "name": doctor.name,
-                "specialty": doctor.specialty,
-                "license_number": doctor.license_number,
-                "phone_number": doctor.phone_number,
-                "email": doctor.email,
-                "bio": doctor.bio,
-                "qualifications": doctor.qualifications,
-                "experience_years": doctor.experience_years,
-                "working_hours": doctor.working_hours,
-                "branch_id": str(doctor.branch_id) if doctor.branch_id else None,
-                "is_active": doctor.is_active,
-                "created_at": doctor.created_at.isoformat(),
-                "updated_at": doctor.updated_at.isoformat()
-            })
+        data, next_cursor, has_more = _fetch_page(
+            db, DOCTORS, Doctor, statement, selected, limit, cursor, updated_since, Doctor.created_at
+        )
         
         return N8NResponse(
             success=True,
             data=data,
-            count=len(data)
+            count=len(data),
+            next_cursor=next_cursor,
+            has_more=has_more
         )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"خطأ في جلب الأطباء: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
 # ==================== الفواتير ====================
+_INVOICE_FIELDS = [
+    "id", "invoice_number", "patient_id", "appointment_id", "invoice_date", "sub_total", "discount_amount",
+    "tax_amount", "total_amount", "payment_status", "payment_method", "notes", "created_at", "updated_at"
+]
+
+
 @router.get("/invoices", response_model=N8NResponse)
 async def get_invoices_n8n(
     payment_status: Optional[str] = Query(None, description="حالة الدفع (pending, paid, partially_paid, cancelled)"),
     from_date: Optional[str] = Query(None),
     to_date: Optional[str] = Query(None),
     limit: int = Query(100, ge=1, le=1000),
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = Query(None, description="cursor الصفحة السابقة (next_cursor) للمزامنة التدريجية"),
+    updated_since: Optional[datetime] = Query(None, description="الصفوف المعدلة منذ هذا الوقت فقط (ISO 8601)"),
+    fields: Optional[str] = Query(None, description="الحقول المطلوبة مفصولة بفواصل (افتراضياً: كل الحقول الأساسية)"),
+    db: Session = Depends(get_read_db),
     api_key: str = Depends(verify_api_key)
 ):
     """جلب الفواتير لـ n8n"""
     try:
-        query = db.query(Invoice)
+        selected = INVOICES.parse_fields(fields, _INVOICE_FIELDS)
+        statement = INVOICES.select(selected, include=("id", "updated_at"))
         
         if payment_status:
-            query = query.filter(Invoice.payment_status == payment_status)
+            statement = statement.where(Invoice.payment_status == payment_status)
         
         if from_date:
             try:
-                from_dt = datetime.fromisoformat(from_date)
-                query = query.filter(Invoice.invoice_date >= from_dt)
-            except:
+                statement = statement.where(Invoice.invoice_date >= datetime.fromisoformat(from_date))
+            except ValueError:
                 pass
         
         if to_date:
             try:
-                to_dt = datetime.fromisoformat(to_date)
-                query = query.filter(Invoice.invoice_date <= to_dt)
-            except:
+                statement = statement.where(Invoice.invoice_date <= datetime.fromisoformat(to_date))
+            except ValueError:
                 pass
         
-        invoices = query.order_by(desc(Invoice.invoice_date)).limit(limit).all()
-        
-        data = []
-        for invoice in invoices:
-            data.append({
-                "id": str(invoice.id),
-                "invoice_number": invoice.invoice_number,
-                "patient_id": str(invoice.patient_id),
-                "appointment_id": str(invoice.appointment_id) if invoice.appointment_id else None,
-                "invoice_date": invoice.invoice_date.isoformat(),
-                "sub_total": invoice.sub_total,
-                "discount_amount": invoice.discount_amount,
-                "tax_amount": invoice.tax_amount,
-                "total_amount": invoice.total_amount,
-                "payment_status": invoice.payment_status,
-                "payment_method": invoice.payment_method,
-                "notes": invoice.notes,
-                "created_at": invoice.created_at.isoformat(),
-                "updated_at": invoice.updated_at.isoformat()
-            })
+        data, next_cursor, has_more = _fetch_page(
+            db, INVOICES, Invoice, statement, selected, limit, cursor, updated_since, desc(Invoice.invoice_date)
+        )
         
         return N8NResponse(
             success=True,
             data=data,
-            count=len(data)
+            count=len(data),
+            next_cursor=next_cursor,
+            has_more=has_more
         )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"خطأ في جلب الفواتير: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
 # ==================== المحادثات ====================
+_CONVERSATION_FIELDS = [
+    "id", "user_id", "channel", "user_message", "bot_reply", "intent", "db_context_used",
+    "unrecognized", "needs_handoff", "created_at", "updated_at"
+]
+
+
 @router.get("/conversations", response_model=N8NResponse)
 async def get_conversations_n8n(
     channel: Optional[str] = Query(None, description="القناة (whatsapp, instagram, etc.)"),
     from_date: Optional[str] = Query(None),
     to_date: Optional[str] = Query(None),
     limit: int = Query(100, ge=1, le=1000),
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = Query(None, description="cursor الصفحة السابقة (next_cursor) للمزامنة التدريجية"),
+    updated_since: Optional[datetime] = Query(None, description="الصفوف المعدلة منذ هذا الوقت فقط (ISO 8601)"),
+    fields: Optional[str] = Query(None, description="الحقول المطلوبة مفصولة بفواصل (افتراضياً: كل الحقول الأساسية)"),
+    db: Session = Depends(get_read_db),
     api_key: str = Depends(verify_api_key)
 ):
     """جلب المحادثات لـ n8n"""
     try:
-        query = db.query(Conversation)
+        selected = CONVERSATIONS.parse_fields(fields, _CONVERSATION_FIELDS)
+        statement = CONVERSATIONS.select(selected, include=("id", "updated_at"))
         
         if channel:
-            query = query.filter(Conversation.channel == channel)
+            statement = statement.where(Conversation.channel == channel)
         
         if from_date:
             try:
-                from_dt = datetime.fromisoformat(from_date)
-                query = query.filter(Conversation.created_at >= from_dt)
-            except:
+                statement = statement.where(Conversation.created_at >= datetime.fromisoformat(from_date))
+            except ValueError:
                 pass
         
         if to_date:
             try:
-                to_dt = datetime.fromisoformat(to_date)
-                query = query.filter(Conversation.created_at <= to_dt)
-            except:
+                statement = statement.where(Conversation.created_at <= datetime.fromisoformat(to_date))
+            except ValueError:
                 pass
         
-        conversations = query.order_by(desc(Conversation.created_at)).limit(limit).all()
-        
-        data = []
-        for conv in conversations:
-            data.append({
-                "id": str(conv.id),
-                "user_id": conv.user_id,
-                "channel": conv.channel,
-                "user_message": conv.user_message,
-                "bot_reply": conv.bot_reply,
-                "intent": conv.intent,
-                "db_context_used": conv.db_context_used,
-                "unrecognized": conv.unrecognized,
-                "needs_handoff": conv.needs_handoff,
-                "created_at": conv.created_at.isoformat(),
-                "updated_at": conv.updated_at.isoformat()
-            })
+        data, next_cursor, has_more = _fetch_page(
+            db, CONVERSATIONS, Conversation, statement, selected, limit, cursor, updated_since, desc(Conversation.created_at)
+        )
         
         return N8NResponse(
             success=True,
             data=data,
-            count=len(data)
+            count=len(data),
+            next_cursor=next_cursor,
+            has_more=has_more
         )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"خطأ في جلب المحادثات: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# ==================== أحداث التغييرات (push) ====================
+@router.get("/outbox", response_model=N8NResponse)
+async def get_outbox_stats_n8n(
+    api_key: str = Depends(verify_api_key)
+):
+    """حالة إرسال التغييرات إلى webhooks الخاصة بـ n8n (راجع app/services/outbox_service.py)"""
+    try:
+        stats = await asyncio.to_thread(get_outbox_dispatcher().stats)
+        return N8NResponse(success=True, data=stats)
+    except Exception as e:
+        logger.error(f"خطأ في جلب حالة الـ outbox: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 # ==================== إحصائيات سريعة ====================
+# n8n يستعلم عن الإحصائيات باستمرار: استعلام مجمّع واحد لكل جدول، والنتيجة تُخزن في الذاكرة
+# لمدة N8N_STATS_CACHE_SECONDS، وطلب واحد فقط يحسبها عند انتهاء صلاحيتها (الباقي ينتظر نفس النتيجة)
+_stats_cache: Dict[str, Any] = {"data": None, "expires_at": 0.0}
+_stats_lock = asyncio.Lock()
+
+
+def compute_stats(db: Session) -> Dict[str, Any]:
+    """حساب الإحصائيات: عدّ مشروط (COUNT ... FILTER) في استعلام واحد لكل جدول"""
+    appointments = db.query(
+        func.count(Appointment.id),
+        func.count(Appointment.id).filter(Appointment.status == "pending"),
+        func.count(Appointment.id).filter(Appointment.status == "confirmed"),
+        func.count(Appointment.id).filter(Appointment.status == "completed"),
+    ).one()
+    patients = db.query(
+        func.count(Patient.id),
+        func.count(Patient.id).filter(Patient.is_active == True),
+    ).one()
+    doctors = db.query(
+        func.count(Doctor.id),
+        func.count(Doctor.id).filter(Doctor.is_active == True),
+    ).one()
+    invoices = db.query(
+        func.count(Invoice.id),
+        func.count(Invoice.id).filter(Invoice.payment_status == "paid"),
+        func.count(Invoice.id).filter(Invoice.payment_status == "pending"),
+        func.sum(Invoice.total_amount),
+    ).one()
+
+    # العدد الفعلي للصفوف (وليس daily_metrics: التجميعات تبقى بعد حذف المحادثات القديمة بسياسة الاحتفاظ)؛
+    # "اليوم" نطاق [بداية اليوم، بداية الغد) بدلاً من func.date حتى يكون الشرط على العمود مباشرة
+    today_start = datetime.combine(date.today(), datetime.min.time())
+    conversations = db.query(
+        func.count(Conversation.id),
+        func.count(Conversation.id).filter(
+            Conversation.created_at >= today_start, Conversation.created_at < today_start + timedelta(days=1)
+        ),
+    ).one()
+    return {
+        "appointments": dict(zip(("total", "pending", "confirmed", "completed"), appointments)),
+        "patients": dict(zip(("total", "active"), patients)),
+        "doctors": dict(zip(("total", "active"), doctors)),
+        "invoices": {
+            "total": invoices[0],
+            "paid": invoices[1],
+            "pending": invoices[2],
+            "total_amount": invoices[3] or 0,
+        },
+        "conversations": dict(zip(("total", "today"), conversations)),
+    }
+
+
 @router.get("/stats", response_model=N8NResponse)
 async def get_stats_n8n(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     api_key: str = Depends(verify_api_key)
 ):
     """إحصائيات سريعة لـ n8n"""
     try:
-        stats = {
-            "appointments": {
-                "total": db.query(func.count(Appointment.id)).scalar(),
-                "pending": db.query(func.count(Appointment.id)).filter(Appointment.status == "pending").scalar(),
-                "confirmed": db.query(func.count(Appointment.id)).filter(Appointment.status == "confirmed").scalar(),
-                "completed": db.query(func.count(Appointment.id)).filter(Appointment.status == "completed").scalar(),
-            },
-            "patients": {
-                "total": db.query(func.count(Patient.id)).scalar(),
-                "active": db.query(func.count(Patient.id)).filter(Patient.is_active == True).scalar(),
-            },
-            "doctors": {
-                "total": db.query(func.count(Doctor.id)).scalar(),
-                "active": db.query(func.count(Doctor.id)).filter(Doctor.is_active == True).scalar(),
-            },
-            "invoices": {
-                "total": db.query(func.count(Invoice.id)).scalar(),
-                "paid": db.query(func.count(Invoice.id)).filter(Invoice.payment_status == "paid").scalar(),
-                "pending": db.query(func.count(Invoice.id)).filter(Invoice.payment_status == "pending").scalar(),
-                "total_amount": db.query(func.sum(Invoice.total_amount)).scalar() or 0,
-            },
-            "conversations": {
-                "total": db.query(func.count(Conversation.id)).scalar(),
-                "today": db.query(func.count(Conversation.id)).filter(
-                    func.date(Conversation.created_at) == date.today()
-                ).scalar(),
-            }
-        }
-        
+        if _stats_cache["expires_at"] <= time.monotonic():
+            async with _stats_lock:
+                # طلب آخر ربما حدّث الـ cache أثناء الانتظار
+                if _stats_cache["expires_at"] <= time.monotonic():
+                    _stats_cache["data"] = await asyncio.to_thread(compute_stats, db)
+                    _stats_cache["expires_at"] = time.monotonic() + settings.N8N_STATS_CACHE_SECONDS
+
         return N8NResponse(
             success=True,
-            data=stats
+            data=_stats_cache["data"]
         )
     except Exception as e:
         logger.error(f"خطأ في جلب الإحصائيات: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
-
-
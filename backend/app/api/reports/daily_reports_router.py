@@ -0,0 +1,35 @@
+"""
+Daily reports router
+"""
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+from typing import Optional
+from datetime import date
+from app.db.session import get_read_db
+from app.middleware.auth import verify_api_key
+from app.services.rollup_service import daily_report
+
+router = APIRouter(prefix="/reports", tags=["Reports"])
+
+
+@router.get("/daily/")
+async def get_daily_report(
+    report_date: Optional[date] = Query(None, alias="date", description="تاريخ التقرير (YYYY-MM-DD) - افتراضياً اليوم"),
+    db: Session = Depends(get_read_db),
+    api_key: str = Depends(verify_api_key)
+):
+    """
+    التقرير اليومي
+
+    الأيام المكتملة تُقرأ من جدول daily_metrics، واليوم الحالي يُحسب من الجداول مباشرة
+
+    Returns:
+        - total_conversations: إجمالي المحادثات
+        - total_appointments: إجمالي المواعيد المحجوزة
+        - channels: المحادثات حسب القناة
+        - top_intents: أكثر النوايا تكراراً
+        - unrecognized_count / handoffs_count
+        - appointments_by_status / appointments_by_branch
+        - invoices: عدد الفواتير والمدفوع والإجمالي
+    """
+    return daily_report(db, report_date or date.today())
@@ -6,9 +6,7 @@ from typing import Optional
 from fastapi import APIRouter, Request, Response, Depends
 from fastapi.responses import PlainTextResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import desc
 from app.db.session import get_db
-from app.db.models import Conversation, UnansweredQuestion, PendingHandoff
 from app.core.llm_client import LLMClient
 from app.core.agent import ChatAgent
 from app.integrations import whatsapp as whatsapp_integration
@@ -98,42 +96,11 @@ async def handle_webhook(
             logger.error(f"❌ Failed to send message: {error_msg} (code: {error_code})")
             # لا نعيد الخطأ للعميل، فقط نسجله
         
-        # المحادثة تم حفظها بالفعل في agent.handle_message
-        # نحتاج فقط للحصول على آخر محادثة للـ ID
-        conversation = db.query(Conversation)\
-            .filter(
-                Conversation.user_id == conv_input.user_id,
-                Conversation.channel == conv_input.channel
-            )\
-            .order_by(desc(Conversation.created_at))\
-            .first()
-        
-        if conversation:
-            # إذا كانت الرسالة غير مفهومة، نسجلها في UnansweredQuestion
-            if agent_output.unrecognized:
-                unanswered = UnansweredQuestion(
-                    user_id=conv_input.user_id,
-                    channel=conv_input.channel,
-                    message_text=conv_input.message,
-                    conversation_id=conversation.id
-                )
-                db.add(unanswered)
-            
-            # إذا كانت المحادثة تحتاج تحويل لموظف، نسجلها في PendingHandoff
-            if agent_output.needs_handoff:
-                handoff = PendingHandoff(
-                    user_id=conv_input.user_id,
-                    channel=conv_input.channel,
-                    conversation_id=conversation.id,
-                    last_message=conv_input.message,
-                    status="open"
-                )
-                db.add(handoff)
-            
-            db.commit()
-            return {"status": "ok", "message_id": str(conversation.id)}
-        else:
-            return {"status": "ok", "message": "conversation saved"}
+        # المحادثة (والسؤال غير المُجاب والتحويل لموظف إن وُجدا) حُفظت في agent.handle_message
+        # كوحدة عمل واحدة، ومعرفاتها في agent_output - لا حاجة لأي استعلام إضافي هنا
+        if agent_output.conversation_id:
+            return {"status": "ok", "message_id": agent_output.conversation_id}
+        return {"status": "ok", "message": "conversation saved"}
         
     except Exception as e:
         logger.error(f"خطأ في معالجة رسالة WhatsApp: {str(e)}", exc_info=True)
@@ -4,13 +4,20 @@ Agent مبسط مع الوعي بالسياق وردود مختلفة حسب ا
 """
 import logging
 from typing import Optional, List, Dict, Any
-from datetime import datetime, timedelta
+from datetime import datetime
+from uuid import UUID
 import re
 from sqlalchemy.orm import Session
 from sqlalchemy import desc
+from sqlalchemy.exc import IntegrityError
 from app.core.models import ConversationInput, AgentOutput, ConversationMessage, ConversationHistory
 from app.core.llm_client import LLMClient
 from app.core.prompts import build_system_prompt
+from app.core.intent_classifier import classify_intent, keyword_intent
+from app.core.entity_index import get_entity_index
+from app.core.booking_session import get_booking_sessions, extract_booking_details
+from app.core.conversation_buffer import get_conversation_buffer
+from app.services.availability_service import get_availability_engine, is_slot_conflict, lock_booking
 from app.db.models import Conversation, Service, Doctor, Branch, Offer, Appointment, Patient
 
 logger = logging.getLogger(__name__)
@@ -64,6 +71,21 @@ class ChatAgent:
             # 2. كشف نية حجز موعد
             appointment_intent = self._detect_appointment_intent(conv_input.message, conversation_history)
             
+            # 2.1 متابعة جلسة حجز مفتوحة (مثال: المستخدم يرد باسمه أو رقمه فقط)
+            # النية كُشفت أولاً: سؤال أثناء الجلسة ("كم السعر") يُجاب ولا يُؤخذ اسماً
+            booking_session = get_booking_sessions().get(conv_input.user_id, conv_input.channel)
+            if booking_session:
+                appointment_intent["booking_session"] = booking_session
+                if not appointment_intent["wants_to_book"]:
+                    matches = get_entity_index(self.db).match(conv_input.message)
+                    details = extract_booking_details(conv_input.message, matches, booking_session)
+                    if appointment_intent["intent"] != "other":
+                        details.pop("patient_name", None)
+                    if details.get("patient_name") or details.get("phone"):
+                        appointment_intent["wants_to_book"] = True
+                        appointment_intent["intent"] = "appointment_booking"
+                        appointment_intent["entity_matches"] = matches
+            
             # 3. جلب معلومات من قاعدة البيانات (فهم ذكي من السياق)
             try:
                 db_context = self._load_db_context(conv_input.message, conversation_history, appointment_intent)
@@ -105,6 +127,8 @@ class ChatAgent:
                         "error_message": str(e)
                     }
                     logger.error(f"❌ خطأ في حجز الموعد: {str(e)}", exc_info=True)
+                    # تحرير قفل الحجز (pg_advisory_xact_lock) إن أُخذ قبل الخطأ
+                    self.db.rollback()
                     reply_text = "عذراً، حدث خطأ في حجز الموعد. تبي أحوّلك للاستقبال يساعدونك؟"
             else:
                 # 5. بناء System Prompt
@@ -150,9 +174,18 @@ class ChatAgent:
                     logger.error(f"❌ خطأ في توليد الرد من LLM: {str(e)}", exc_info=True)
                     raise
             
+            detected_intent = appointment_intent.get("intent")
+            
             # 8. حفظ المحادثة
+            saved_ids = {}
             try:
-                self._save_conversation(conv_input, reply_text, db_context_used)
+                saved_ids = self._save_conversation(
+                    conv_input,
+                    reply_text,
+                    db_context_used,
+                    intent=detected_intent if detected_intent != "other" else None,
+                    intent_source=appointment_intent.get("source") if detected_intent != "other" else None
+                )
                 logger.debug("✅ تم حفظ المحادثة بنجاح")
             except Exception as e:
                 error_details["save_conversation"] = {
@@ -164,10 +197,11 @@ class ChatAgent:
             
             return AgentOutput(
                 reply_text=reply_text,
-                intent="appointment_booking" if appointment_intent.get("wants_to_book") else None,
+                intent=detected_intent if detected_intent != "other" else None,
                 needs_handoff=False,
                 unrecognized=False,
-                db_context_used=db_context_used
+                db_context_used=db_context_used,
+                **saved_ids
             )
             
         except Exception as e:
@@ -200,8 +234,11 @@ class ChatAgent:
             else:
                 fallback_reply = "عذراً، حدث خطأ. تبي أحوّلك للاستقبال يساعدونك؟"
             
+            saved_ids = {}
             try:
-                self._save_conversation(conv_input, fallback_reply, False)
+                saved_ids = self._save_conversation(
+                    conv_input, fallback_reply, False, needs_handoff=True, unrecognized=True
+                )
             except Exception as save_error:
                 logger.error(f"❌ فشل حفظ المحادثة بعد الخطأ: {str(save_error)}")
             
@@ -210,7 +247,8 @@ class ChatAgent:
                 intent=None,
                 needs_handoff=True,
                 unrecognized=True,
-                db_context_used=False
+                db_context_used=False,
+                **saved_ids
             )
     
     def _detect_appointment_intent(self, message: str, conversation_history: ConversationHistory) -> Dict[str, Any]:
@@ -222,17 +260,9 @@ class ChatAgent:
         """
         message_lower = message.lower()
         
-        # كلمات مفتاحية لحجز الموعد
-        booking_keywords = [
-            "احجز", "حجز", "حجزي", "احجزي", "أحجز", "أحجزي",
-            "موعد", "موعدي", "موعدك", "موعدنا",
-            "ابي احجز", "أبي أحجز", "أبي احجز", "ابي أحجز",
-            "عندي موعد", "عندنا موعد", "عندك موعد",
-            "بكرا", "بكرة", "غداً", "بعد بكرا", "بعد غد",
-            "يوم", "تاريخ", "وقت"
-        ]
-        
-        wants_to_book = any(kw in message_lower for kw in booking_keywords)
+        # تصنيف النية والأقسام المطلوبة (المصنف المحلي أو الكلمات المفتاحية كبديل)
+        prediction = classify_intent(message)
+        wants_to_book = prediction["intent"] == "appointment_booking"
         
         # محاولة استخراج معلومات الحجز
         extracted_info = {}
@@ -265,6 +295,10 @@ class ChatAgent:
         
         return {
             "wants_to_book": wants_to_book,
+            "intent": prediction["intent"],
+            "confidence": prediction["confidence"],
+            "sections": prediction["sections"],
+            "source": prediction["source"],
             "extracted_info": extracted_info
         }
     
@@ -283,87 +317,36 @@ class ChatAgent:
         """
         try:
             message = conv_input.message
-            message_lower = message.lower()
             
-            # استخراج معلومات الحجز من الرسالة وتاريخ المحادثة
-            # جمع جميع المعلومات من المحادثة
-            full_context = message
-            for msg in conversation_history.messages[-5:]:
-                if msg.role == "user":
-                    full_context += " " + msg.content
-            
-            # استخراج الاسم
-            patient_name = None
-            name_patterns = [
-                r"اسمي (\w+)",
-                r"اسمي (\w+ \w+)",
-                r"أنا (\w+)",
-                r"(\w+) (\w+)",  # اسم عربي مكون من كلمتين
-            ]
-            
-            for pattern in name_patterns:
-                match = re.search(pattern, full_context)
-                if match:
-                    patient_name = match.group(1) if len(match.groups()) == 1 else match.group(0)
-                    break
-            
-            # استخراج رقم الهاتف
-            phone = None
-            phone_patterns = [
-                r"(\d{10})",  # 10 أرقام
-                r"(\d{9})",   # 9 أرقام
-                r"05\d{8}",  # رقم سعودي
-            ]
-            
-            for pattern in phone_patterns:
-                match = re.search(pattern, full_context)
-                if match:
-                    phone = match.group(0)
-                    break
+            # جلسة الحجز: البيانات المجمعة من الرسائل السابقة + ما في الرسالة الجديدة فقط
+            sessions = get_booking_sessions()
+            session = appointment_intent.get("booking_session") or sessions.start(conv_input.user_id, conv_input.channel)
+            matches = appointment_intent.get("entity_matches")
+            if matches is None:
+                matches = get_entity_index(self.db).match(message)
+            session.merge(extract_booking_details(message, matches, session))
             
             # إذا لم نجد رقم هاتف، نستخدم user_id (قد يكون رقم هاتف)
-            if not phone and conv_input.user_id and conv_input.user_id.isdigit():
-                phone = conv_input.user_id
+            if not session.phone and conv_input.user_id and conv_input.user_id.isdigit():
+                session.phone = conv_input.user_id
             
-            # استخراج الخدمة
-            service_id = None
-            services = self.db.query(Service).filter(Service.is_active == True).all()
-            for service in services:
-                if service.name.lower() in message_lower:
-                    service_id = service.id
-                    break
+            patient_name = session.patient_name
+            phone = session.phone
             
+            service_id = UUID(session.service_id) if session.service_id else None
             # إذا لم نجد خدمة محددة، نستخدم أول خدمة متاحة
-            if not service_id and services:
-                service_id = services[0].id
-            
-            # استخراج الفرع
-            branch_id = None
-            branches = self.db.query(Branch).filter(Branch.is_active == True).all()
-            for branch in branches:
-                if branch.name.lower() in message_lower or branch.city.lower() in message_lower:
-                    branch_id = branch.id
-                    break
+            if not service_id:
+                first_service = self.db.query(Service.id).filter(Service.is_active == True).first()
+                service_id = first_service.id if first_service else None
             
+            branch_id = UUID(session.branch_id) if session.branch_id else None
             # إذا لم نجد فرع محدد، نستخدم أول فرع متاح
-            if not branch_id and branches:
-                branch_id = branches[0].id
-            
-            # استخراج الطبيب (اختياري)
-            doctor_id = None
-            doctors = self.db.query(Doctor).filter(Doctor.is_active == True).all()
-            for doctor in doctors:
-                if doctor.name.lower() in message_lower:
-                    doctor_id = doctor.id
-                    break
-            
-            # استخراج التاريخ والوقت
-            appointment_datetime = None
+            if not branch_id:
+                first_branch = self.db.query(Branch.id).filter(Branch.is_active == True).first()
+                branch_id = first_branch.id if first_branch else None
             
-            # محاولة استخراج التاريخ من الرسالة
-            # إذا لم نجد تاريخ محدد، نستخدم بعد 3 أيام كتاريخ افتراضي
-            appointment_datetime = datetime.now() + timedelta(days=3)
-            appointment_datetime = appointment_datetime.replace(hour=10, minute=0, second=0, microsecond=0)
+            # الطبيب (اختياري)
+            doctor_id = UUID(session.doctor_id) if session.doctor_id else None
             
             # التحقق من المعلومات المطلوبة
             missing_info = []
@@ -377,7 +360,8 @@ class ChatAgent:
                 missing_info.append("الفرع")
             
             if missing_info:
-                # نحتاج معلومات إضافية
+                # نحتاج معلومات إضافية - نحفظ ما جمعناه حتى الرسالة القادمة
+                sessions.save(session)
                 missing_str = "، ".join(missing_info)
                 reply = f"عشان أحجز لك موعد، أحتاج: {missing_str}. ممكن تعطيني هالمعلومات؟"
                 return {
@@ -387,6 +371,32 @@ class ChatAgent:
                     "missing_info": missing_info
                 }
             
+            # أقرب موعد متاح ضمن ساعات عمل الفرع والطبيب (بدون مسح جدول المواعيد)
+            branch = self.db.query(Branch).filter(Branch.id == branch_id).first()
+            doctor = self.db.query(Doctor).filter(Doctor.id == doctor_id).first() if doctor_id else None
+            
+            # القفل حتى الـ commit: لا يحجز worker آخر نفس الوقت بين اختيار الموعد والإدراج
+            lock_booking(self.db, branch_id, doctor_id)
+            engine = get_availability_engine(self.db, force_refresh=True)
+            free_slots = engine.next_free_slots(
+                branch_id,
+                doctor_id=doctor_id,
+                branch_hours=branch.working_hours if branch else None,
+                doctor_hours=doctor.working_hours if doctor else None,
+                count=3
+            )
+            
+            if not free_slots:
+                # إنهاء الـ transaction يحرر قفل الحجز (وإلا يبقى حتى نهاية الطلب ويوقف حجوزات الفرع)
+                self.db.rollback()
+                return {
+                    "success": False,
+                    "reply": "عذراً، لا توجد مواعيد متاحة حالياً في الأيام القادمة. سيتواصل معك فريقنا لترتيب موعد مناسب.",
+                    "reason": "No free slots"
+                }
+            
+            appointment_datetime = free_slots[0]
+            
             # إنشاء الموعد
             appointment = Appointment(
                 patient_name=patient_name,
@@ -402,13 +412,25 @@ class ChatAgent:
             )
             
             self.db.add(appointment)
-            self.db.commit()
+            try:
+                self.db.commit()
+            except IntegrityError as e:
+                self.db.rollback()
+                if not is_slot_conflict(e):
+                    raise
+                # uq_appointments_doctor_datetime_active: حُجز نفس الوقت للتو - الجلسة باقية لإعادة المحاولة
+                sessions.save(session)
+                return {
+                    "success": False,
+                    "reply": "عذراً، تم حجز هذا الموعد للتو. أرسل رسالة أخرى وسأبحث لك عن أقرب موعد متاح.",
+                    "reason": "Slot taken concurrently"
+                }
             self.db.refresh(appointment)
+            engine.apply(appointment)
+            sessions.clear(conv_input.user_id, conv_input.channel)
             
             # جلب معلومات الموعد للرد
-            branch = self.db.query(Branch).filter(Branch.id == branch_id).first()
             service = self.db.query(Service).filter(Service.id == service_id).first()
-            doctor = self.db.query(Doctor).filter(Doctor.id == doctor_id).first() if doctor_id else None
             
             # بناء رد تأكيد
             reply_parts = [
@@ -421,6 +443,10 @@ class ChatAgent:
             if doctor:
                 reply_parts.append(f"👨‍⚕️ الطبيب: {doctor.name}")
             
+            if len(free_slots) > 1:
+                alternatives = "، ".join(slot.strftime('%Y-%m-%d %I:%M %p') for slot in free_slots[1:])
+                reply_parts.append(f"🕐 مواعيد بديلة متاحة: {alternatives}")
+            
             reply_parts.append(f"📞 سنتواصل معك على {phone} لتأكيد الموعد")
             reply_parts.append("شكراً لثقتك في عيادات عادل كير! 😊")
             
@@ -464,28 +490,23 @@ class ChatAgent:
                     context_text += " " + msg.content.lower()
             
             # تحديد البيانات المطلوبة بشكل ذكي
-            need_doctors = any(kw in context_text for kw in [
-                "دكتور", "طبيب", "الاطباء", "اطباء", "الأطباء", "عندكم أطباء", 
-                "هل عندكم أطباء", "عندكم دكتور", "هل عندكم دكتور", "أطباء", "تخصص"
-            ])
-            need_services = any(kw in context_text for kw in [
-                "خدم", "خدمات", "استشارة", "فحص", "علاج", "تطعيم",
-                "عندكم خدمات", "وش الخدمات", "أي خدمات", "بكم", "كم يكلف", "سعر", "تكلفة"
-            ])
-            need_branches = any(kw in context_text for kw in [
-                "فرع", "فروع", "عنوان", "موقع", "وينكم", "وين", "عنوانكم",
-                "ساعات العمل", "ساعات", "وقت العمل", "متى تفتحون", "متى تغلقون",
-                "رقم", "هاتف", "تواصل", "اتصال", "كيف أتواصل", "رقمكم"
-            ])
-            need_offers = any(kw in context_text for kw in [
-                "عرض", "عروض", "خصم", "عندكم عروض", "هل عندكم عروض"
-            ])
-            
-            # إذا كان هناك نية لحجز موعد، نجلب جميع المعلومات المطلوبة
+            if appointment_intent and appointment_intent.get("source") == "model":
+                # المصنف يتنبأ بالأقسام المطلوبة للرسالة الحالية مباشرة
+                sections = appointment_intent.get("sections", {})
+            else:
+                sections = keyword_intent(context_text)["sections"]
+            need_doctors = sections.get("doctors", False)
+            need_services = sections.get("services", False)
+            need_branches = sections.get("branches", False)
+            need_offers = sections.get("offers", False)
+            
+            # إذا كان هناك نية لحجز موعد (بالكلمات المفتاحية)، نجلب جميع المعلومات المطلوبة
+            # أما المصنف فيحدد بنفسه ما يحتاجه الحجز فلا داعي لجلب كل شيء
             if appointment_intent and appointment_intent.get("wants_to_book"):
-                need_doctors = True
-                need_services = True
-                need_branches = True
+                if appointment_intent.get("source") != "model":
+                    need_doctors = True
+                    need_services = True
+                    need_branches = True
             # إذا لم يكن هناك إشارة واضحة، نجلب البيانات الأساسية (أطباء وخدمات وفروع)
             elif not (need_doctors or need_services or need_branches or need_offers):
                 need_doctors = True
@@ -543,29 +564,33 @@ class ChatAgent:
             return ""
     
     def _get_doctors_smart(self, message_lower: str) -> List[Doctor]:
-        """جلب الأطباء بشكل ذكي - البحث عن أسماء محددة أو جلب الجميع"""
-        # البحث عن أسماء محددة في الرسالة
-        all_doctors = self.db.query(Doctor).filter(Doctor.is_active == True).all()
-        if not all_doctors:
-            return []
-        
-        # محاولة العثور على أسماء محددة
-        matched_doctors = []
-        for doctor in all_doctors:
-            # البحث عن الاسم في الرسالة (بدون "د." أو "دكتور")
-            doctor_name_simple = doctor.name.replace("د.", "").replace("دكتور", "").strip().lower()
-            if doctor_name_simple in message_lower:
-                matched_doctors.append(doctor)
-        
-        # إذا وُجد أطباء محددون، أرجعهم فقط
-        if matched_doctors:
-            return matched_doctors[:5]
+        """جلب الأطباء بشكل ذكي - البحث عن أسماء أو تخصصات محددة أو جلب الجميع"""
+        # البحث عن أسماء أو تخصصات محددة في الرسالة عبر فهرس الكيانات
+        matches = get_entity_index(self.db).match(message_lower)
+        name_ids = [m["id"] for m in matches if m["type"] == "doctor" and m["field"] == "name"]
+        specialty_ids = [m["id"] for m in matches if m["type"] == "doctor" and m["field"] == "specialty"]
+        
+        # إذا وُجد أطباء محددون بالاسم (أو بالتخصص)، أرجعهم فقط
+        matched_ids = name_ids or specialty_ids
+        if matched_ids:
+            return self.db.query(Doctor).filter(
+                Doctor.id.in_(matched_ids),
+                Doctor.is_active == True
+            ).limit(5).all()
         
         # وإلا أرجع جميع الأطباء (حتى 10)
-        return all_doctors[:10]
+        return self.db.query(Doctor).filter(Doctor.is_active == True).limit(10).all()
     
     def _get_services_smart(self, message_lower: str) -> List[Service]:
         """جلب الخدمات بشكل ذكي - البحث عن أسماء محددة أو جلب الجميع"""
+        # البحث عن أسماء خدمات محددة عبر فهرس الكيانات
+        service_ids = [m["id"] for m in get_entity_index(self.db).match(message_lower) if m["type"] == "service"]
+        if service_ids:
+            return self.db.query(Service).filter(
+                Service.id.in_(service_ids),
+                Service.is_active == True
+            ).limit(5).all()
+        
         all_services = self.db.query(Service).filter(Service.is_active == True).all()
         if not all_services:
             return []
@@ -766,18 +791,29 @@ class ChatAgent:
                 .limit(limit)\
                 .all()
             
+            # دمج المحادثات التي لم تُكتب بعد في قاعدة البيانات (buffer الكتابة المؤجلة)
+            turns = [
+                (conv.created_at, conv.id, conv.user_message, conv.bot_reply)
+                for conv in conversations
+            ]
+            stored_ids = {conv.id for conv in conversations}
+            for row in get_conversation_buffer().pending_for(user_id, channel):
+                if row["id"] not in stored_ids:
+                    turns.append((row["created_at"], row["id"], row["user_message"], row["bot_reply"]))
+            # الترتيب من الأقدم للأحدث، مع الاحتفاظ بآخر limit فقط
+            turns = sorted(turns, key=lambda turn: turn[0])[-limit:]
+            
             messages = []
-            # عكس الترتيب للحصول على الترتيب الصحيح (من الأقدم للأحدث)
-            for conv in reversed(conversations):
-                if conv.user_message:
+            for _, _, user_message, bot_reply in turns:
+                if user_message:
                     messages.append(ConversationMessage(
                         role="user",
-                        content=conv.user_message
+                        content=user_message
                     ))
-                if conv.bot_reply:
+                if bot_reply:
                     messages.append(ConversationMessage(
                         role="assistant",
-                        content=conv.bot_reply
+                        content=bot_reply
                     ))
             
             return ConversationHistory(
@@ -830,36 +866,62 @@ class ChatAgent:
         self,
         conv_input: ConversationInput,
         reply_text: str,
-        db_context_used: bool
-    ):
+        db_context_used: bool,
+        intent: Optional[str] = None,
+        intent_source: Optional[str] = None,
+        needs_handoff: bool = False,
+        unrecognized: bool = False
+    ) -> Dict[str, str]:
         """
-        حفظ المحادثة في قاعدة البيانات
+        حفظ سجلات الرسالة كوحدة عمل واحدة: المحادثة، وسؤال غير مُجاب (إذا لم تُفهم الرسالة)،
+        وتحويل لموظف (إذا احتاجت المحادثة) - عبر buffer الكتابة المؤجلة (راجع app/core/conversation_buffer.py)
         
         Args:
             conv_input: إدخال المحادثة
             reply_text: نص الرد
             db_context_used: هل تم استخدام معلومات من قاعدة البيانات
+            intent: النية المكتشفة
+            intent_source: مصدر النية (keywords أو model) - تنبؤات المصنف لا تُستخدم كتسميات للتدريب
+            needs_handoff: هل تحتاج المحادثة تحويلاً لموظف
+            unrecognized: هل الرسالة غير مفهومة
+        
+        Returns:
+            المعرفات المولدة: conversation_id و unanswered_question_id و handoff_id (الموجودة فقط)
         """
         try:
-            from datetime import datetime
-            now = datetime.now()
-            conversation = Conversation(
-                user_id=conv_input.user_id,
-                channel=conv_input.channel,
-                user_message=conv_input.message,
-                bot_reply=reply_text,
-                intent=None,
-                db_context_used=db_context_used,
-                unrecognized=False,
-                needs_handoff=False,
-                created_at=now,
-                updated_at=now
+            unanswered = None
+            if unrecognized:
+                unanswered = {
+                    "user_id": conv_input.user_id,
+                    "channel": conv_input.channel,
+                    "message_text": conv_input.message
+                }
+            
+            handoff = None
+            if needs_handoff:
+                handoff = {
+                    "user_id": conv_input.user_id,
+                    "channel": conv_input.channel,
+                    "last_message": conv_input.message,
+                    "status": "open"
+                }
+            
+            ids = get_conversation_buffer().add_turn(
+                {
+                    "user_id": conv_input.user_id,
+                    "channel": conv_input.channel,
+                    "user_message": conv_input.message,
+                    "bot_reply": reply_text,
+                    "intent": intent,
+                    "intent_source": intent_source,
+                    "db_context_used": db_context_used,
+                    "unrecognized": unrecognized,
+                    "needs_handoff": needs_handoff
+                },
+                unanswered=unanswered,
+                handoff=handoff
             )
-            self.db.add(conversation)
-            self.db.commit()
+            return {key: str(value) for key, value in ids.items() if value is not None}
         except Exception as e:
             logger.error(f"خطأ في حفظ المحادثة: {str(e)}", exc_info=True)
-            try:
-                self.db.rollback()
-            except:
-                pass
+            return {}
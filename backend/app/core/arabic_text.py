@@ -0,0 +1,59 @@
+"""
+أدوات توحيد النص العربي (Normalization)
+تُستخدم قبل المطابقة والتصنيف حتى لا تؤثر الفروق الإملائية (أ/ا، ة/ه، التشكيل) على النتائج
+"""
+import re
+from typing import List, Tuple
+
+# التشكيل وعلامات القرآن
+_DIACRITICS_RE = re.compile(r"[\u0610-\u061A\u064B-\u065F\u0670\u06D6-\u06ED]")
+_TATWEEL = "\u0640"
+_WHITESPACE_RE = re.compile(r"\s+")
+_TOKEN_RE = re.compile(r"\w+")
+
+_CHAR_MAP = str.maketrans({
+    "أ": "ا",
+    "إ": "ا",
+    "آ": "ا",
+    "ٱ": "ا",
+    "ة": "ه",
+    "ى": "ي",
+    "ؤ": "و",
+    "ئ": "ي",
+    # الأرقام العربية الهندية → أرقام لاتينية
+    "٠": "0", "١": "1", "٢": "2", "٣": "3", "٤": "4",
+    "٥": "5", "٦": "6", "٧": "7", "٨": "8", "٩": "9",
+})
+
+
+def normalize_arabic(text: str) -> str:
+    """
+    توحيد النص العربي: حذف التشكيل والتطويل، توحيد الألف والتاء المربوطة والياء،
+    تحويل الأرقام إلى لاتينية، وتحويل الأحرف اللاتينية إلى أحرف صغيرة
+
+    Args:
+        text: النص الأصلي
+
+    Returns:
+        النص بعد التوحيد
+    """
+    if not text:
+        return ""
+    text = _DIACRITICS_RE.sub("", text).replace(_TATWEEL, "")
+    text = text.translate(_CHAR_MAP).lower()
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+def tokenize_with_spans(text: str) -> List[Tuple[str, int, int]]:
+    """
+    تقسيم النص إلى كلمات موحّدة مع مواقعها في النص الأصلي
+
+    Returns:
+        قائمة (الكلمة بعد التوحيد، بداية، نهاية)
+    """
+    tokens = []
+    for match in _TOKEN_RE.finditer(text or ""):
+        normalized = normalize_arabic(match.group(0))
+        if normalized:
+            tokens.append((normalized, match.start(), match.end()))
+    return tokens
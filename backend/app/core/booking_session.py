@@ -0,0 +1,221 @@
+"""
+جلسات الحجز متعددة الرسائل - تجميع بيانات الحجز (الاسم، الجوال، الخدمة، الفرع، الطبيب) عبر الرسائل
+
+- كل رسالة جديدة تُحلل وحدها وتُضاف نتائجها للجلسة (بدون إعادة تحليل الرسائل السابقة)
+- الجلسات محفوظة في Redis (إن وُجد) ليستكملها أي worker، وإلا في ذاكرة العملية
+- تنتهي صلاحية الجلسة بعد BOOKING_SESSION_TTL_SECONDS من آخر تحديث
+"""
+import logging
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from pydantic import BaseModel, Field
+from app.config import get_settings
+from app.core.arabic_text import normalize_arabic
+from app.core.cache import cache_manager
+from app.core.intent_classifier import keyword_intent
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# كلمات لا تكون جزءاً من الاسم (تُوقف التقاط الاسم)
+_NAME_STOP_WORDS = {
+    "جوالي", "جوال", "رقمي", "رقم", "الرقم", "تلفوني", "هاتفي", "ابي", "ابغي", "ابغا", "اريد",
+    "احجز", "حجز", "موعد", "عند", "في", "من", "مع", "الي", "علي", "بكره", "بكرا", "اليوم",
+    "دكتور", "الدكتور", "فرع", "الفرع", "خدمه", "الخدمه", "شكرا", "لو", "سمحت",
+}
+# ردود قصيرة لا تُعتبر اسماً
+_NOT_NAMES = {"نعم", "لا", "اي", "ايه", "اوك", "تمام", "طيب", "شكرا", "مرحبا", "السلام", "هلا", "ok"}
+# كلمات سؤال وحالة: "وين موقعكم" و"انا تعبان" ليست أسماء
+_NOT_NAME_WORDS = {
+    "وين", "فين", "اين", "كم", "متي", "ليش", "ليه", "لماذا", "كيف", "هل", "ايش", "وش", "شو", "مين",
+    "ماذا", "ما", "عندكم", "تفتحون", "تقفلون", "موقعكم", "السعر", "سعر", "الاسعار", "ممكن", "ابغى",
+    "تعبان", "تعبانه", "مريض", "مريضه", "موجود", "موجوده", "جاي", "جايه", "هنا", "بخير", "زين", "مشغول",
+    "انام", "نايم", "صاحي", "متاخر", "متاخره", "مستعجل", "بعدين", "لاحقا", "الحين", "شوي", "دقيقه",
+}
+
+# اسمي/الاسم/باسم: الاسم بعدها دائماً؛ انا/أنا: فقط عند انتظار الاسم ("أنا سارة" وليس "أنا تعبان")
+_NAME_RE = re.compile(r"(?<!\w)(اسمي|الاسم|باسم|انا|أنا)(?!\w)\s*[:：]?\s*((?:[^\W\d_]+\s*){1,3})")
+_WEAK_NAME_CUES = {"انا", "أنا"}
+_PHONE_RE = re.compile(r"(?<!\d)(?:\+?966|00966|0)?(5\d{8})(?!\d)")
+_LETTERS_ONLY_RE = re.compile(r"^[^\W\d_]+(?:\s+[^\W\d_]+){0,2}$")
+
+
+class BookingSession(BaseModel):
+    """بيانات حجز قيد التجميع لمستخدم واحد على قناة واحدة"""
+    user_id: str
+    channel: str
+    patient_name: Optional[str] = None
+    phone: Optional[str] = None
+    service_id: Optional[str] = None
+    branch_id: Optional[str] = None
+    doctor_id: Optional[str] = None
+    turns: int = Field(default=0, description="عدد الرسائل التي ساهمت في الجلسة")
+    expires_at: float = Field(default=0.0, description="وقت انتهاء الصلاحية (epoch seconds)")
+
+    def missing(self) -> List[str]:
+        """الحقول المطلوبة الناقصة (الخدمة والفرع لهما قيم افتراضية عند الحجز)"""
+        missing = []
+        if not self.patient_name:
+            missing.append("patient_name")
+        if not self.phone:
+            missing.append("phone")
+        return missing
+
+    def merge(self, details: Dict[str, Any]) -> bool:
+        """
+        إضافة بيانات جديدة للجلسة
+
+        Returns:
+            True إذا تغيرت الجلسة
+        """
+        changed = False
+        for field, value in details.items():
+            if value and getattr(self, field, None) != value:
+                setattr(self, field, value)
+                changed = True
+        if changed:
+            self.turns += 1
+        return changed
+
+
+def _looks_like_name(text: str) -> bool:
+    """اسم محتمل: بدون علامة سؤال، ولا كلمات سؤال/حالة/توقف، ولا نية معروفة بالكلمات المفتاحية"""
+    if "?" in text or "؟" in text:
+        return False
+    words = normalize_arabic(text).split()
+    if not words or any(
+        word in _NAME_STOP_WORDS or word in _NOT_NAMES or word in _NOT_NAME_WORDS for word in words
+    ):
+        return False
+    return keyword_intent(text)["intent"] == "other"
+
+
+def _extract_name(message: str, awaiting_name: bool, has_entities: bool) -> Optional[str]:
+    match = _NAME_RE.search(message)
+    if match and (awaiting_name or match.group(1) not in _WEAK_NAME_CUES):
+        words = []
+        for word in match.group(2).split():
+            normalized = normalize_arabic(word)
+            # "وجوالي" / "ورقمي" ...
+            if normalized in _NAME_STOP_WORDS or (normalized.startswith("و") and normalized[1:] in _NAME_STOP_WORDS):
+                break
+            words.append(word)
+        if words and _looks_like_name(" ".join(words)):
+            return " ".join(words)
+
+    # رد قصير على سؤال "ما اسمك؟" (كلمة إلى ثلاث كلمات بدون أرقام ولا كيانات من الكتالوج ولا سؤال)
+    text = message.strip().strip(".!،,")
+    if awaiting_name and not has_entities and _LETTERS_ONLY_RE.match(text) and _looks_like_name(text):
+        return text
+    return None
+
+
+def extract_booking_details(
+    message: str,
+    matches: Optional[List[Dict[str, Any]]] = None,
+    session: Optional[BookingSession] = None
+) -> Dict[str, Any]:
+    """
+    استخراج بيانات الحجز من رسالة واحدة
+
+    Args:
+        message: نص الرسالة الجديدة
+        matches: مطابقات فهرس الكيانات للرسالة (راجع app/core/entity_index.py)
+        session: الجلسة الحالية (لقبول رد قصير كاسم عندما يكون الاسم هو المطلوب)
+
+    Returns:
+        الحقول المستخرجة فقط (patient_name, phone, service_id, branch_id, doctor_id)
+    """
+    matches = matches or []
+    details: Dict[str, Any] = {}
+
+    phone_match = _PHONE_RE.search(normalize_arabic(message).replace(" ", ""))
+    if phone_match:
+        details["phone"] = "0" + phone_match.group(1)
+
+    awaiting_name = session is not None and session.patient_name is None
+    name = _extract_name(message, awaiting_name, has_entities=bool(matches))
+    if name:
+        details["patient_name"] = name
+
+    for match in matches:
+        if match["type"] == "service" and "service_id" not in details:
+            details["service_id"] = str(match["id"])
+        elif match["type"] == "branch" and "branch_id" not in details:
+            details["branch_id"] = str(match["id"])
+        elif match["type"] == "doctor" and match["field"] == "name" and "doctor_id" not in details:
+            details["doctor_id"] = str(match["id"])
+    return details
+
+
+class BookingSessionStore:
+    """مخزن جلسات الحجز: Redis إن وُجد، وإلا ذاكرة محلية"""
+
+    def __init__(self, ttl_seconds: Optional[int] = None):
+        self.ttl_seconds = ttl_seconds or settings.BOOKING_SESSION_TTL_SECONDS
+        self._sessions: Dict[str, BookingSession] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(user_id: str, channel: str) -> str:
+        return f"booking_session:{channel}:{user_id}"
+
+    def get(self, user_id: str, channel: str) -> Optional[BookingSession]:
+        """الجلسة النشطة للمستخدم أو None"""
+        key = self._key(user_id, channel)
+        now = time.time()
+
+        # مع Redis: هو المصدر الموثوق حتى لو استقبل worker آخر الرسالة السابقة
+        if cache_manager.use_redis:
+            data = cache_manager.get(key)
+            if data:
+                session = BookingSession(**data)
+                if session.expires_at > now:
+                    return session
+            return None
+
+        with self._lock:
+            session = self._sessions.get(key)
+            if session and session.expires_at <= now:
+                self._sessions.pop(key, None)
+                session = None
+        return session
+
+    def start(self, user_id: str, channel: str) -> BookingSession:
+        """إنشاء جلسة جديدة"""
+        return BookingSession(user_id=user_id, channel=channel, expires_at=time.time() + self.ttl_seconds)
+
+    def save(self, session: BookingSession):
+        """حفظ الجلسة وتمديد صلاحيتها"""
+        session.expires_at = time.time() + self.ttl_seconds
+        key = self._key(session.user_id, session.channel)
+        if cache_manager.use_redis:
+            cache_manager.set(key, session.model_dump(), ttl=self.ttl_seconds)
+            return
+
+        with self._lock:
+            self._sessions[key] = session
+            # تنظيف الجلسات المنتهية عند امتلاء الذاكرة
+            if len(self._sessions) > settings.BOOKING_SESSION_MAX_LOCAL:
+                now = time.time()
+                for expired in [k for k, s in self._sessions.items() if s.expires_at <= now]:
+                    self._sessions.pop(expired, None)
+
+    def clear(self, user_id: str, channel: str):
+        """إنهاء الجلسة (بعد الحجز أو الإلغاء)"""
+        key = self._key(user_id, channel)
+        with self._lock:
+            self._sessions.pop(key, None)
+        if cache_manager.use_redis:
+            cache_manager.delete(key)
+
+
+# Global store instance
+booking_sessions = BookingSessionStore()
+
+
+def get_booking_sessions() -> BookingSessionStore:
+    """الحصول على مخزن جلسات الحجز"""
+    return booking_sessions
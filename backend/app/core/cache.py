@@ -3,10 +3,15 @@ Caching system - يدعم Redis أو in-memory cache
 """
 import logging
 import json
-from typing import Optional, Any
+import sys
+import threading
+from collections import OrderedDict
+from fnmatch import fnmatchcase
+from typing import Optional, Any, Dict, Tuple
 from functools import wraps
 from datetime import timedelta
 import hashlib
+import time
 from app.config import get_settings
 
 logger = logging.getLogger(__name__)
@@ -20,9 +25,110 @@ except ImportError:
     REDIS_AVAILABLE = False
     logger.warning("Redis not available - using in-memory cache")
 
-# In-memory cache fallback
-_memory_cache: dict = {}
-_cache_ttl: dict = {}
+
+class MemoryCacheBackend:
+    """
+    cache في ذاكرة العملية (بدون Redis): LRU محدود بعدد المفاتيح والحجم بالبايت مع انتهاء صلاحية
+
+    - OrderedDict: get/set/delete بـ O(1)، والأقل استخداماً يُحذف أولاً عند تجاوز الحدود
+    - القيم مخزنة كنص JSON (مثل Redis: كل get يعيد نسخة جديدة، وحجم القيمة معروف)
+    - الصلاحية تُفحص عند القراءة، وكل CACHE_MEMORY_SWEEP_SECONDS تُحذف المفاتيح المنتهية
+      التي لم تُقرأ (أثناء set، بدون thread إضافي)
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, sweep_seconds: float):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sweep_seconds = sweep_seconds
+        self._lock = threading.Lock()
+        # key -> (قيمة JSON، وقت انتهاء الصلاحية (monotonic)، الحجم بالبايت)
+        self._entries: "OrderedDict[str, Tuple[str, float, int]]" = OrderedDict()
+        self._bytes = 0
+        self._next_sweep = time.monotonic() + sweep_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _remove(self, key: str):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[1] <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: str, value: str, ttl: float) -> bool:
+        size = sys.getsizeof(key) + sys.getsizeof(value)
+        if size > self.max_bytes:
+            logger.debug(f"Cache value too large for memory cache: {key} ({size} bytes)")
+            # القيمة القديمة لم تعد صحيحة - لا تبقى في الـ cache
+            with self._lock:
+                if key in self._entries:
+                    self._remove(key)
+            return False
+        now = time.monotonic()
+        with self._lock:
+            if now >= self._next_sweep:
+                self._sweep(now)
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, now + ttl, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+        return True
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            if key not in self._entries:
+                return False
+            self._remove(key)
+            return True
+
+    def delete_pattern(self, pattern: str) -> int:
+        """حذف المفاتيح المطابقة لنمط glob (نفس صيغة Redis KEYS: * ? [abc])"""
+        with self._lock:
+            keys = [key for key in self._entries if fnmatchcase(key, pattern)]
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def _sweep(self, now: float):
+        expired = [key for key, (_, expires_at, _) in self._entries.items() if expires_at <= now]
+        for key in expired:
+            self._remove(key)
+        self.expirations += len(expired)
+        self._next_sweep = now + self.sweep_seconds
+
+    def stats(self) -> Dict[str, Any]:
+        """الإصابات والإخفاقات والحذف والذاكرة المستخدمة"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
 
 
 class CacheManager:
@@ -31,6 +137,11 @@ class CacheManager:
     def __init__(self):
         self.redis_client: Optional[redis.Redis] = None
         self.use_redis = False
+        self.memory = MemoryCacheBackend(
+            max_entries=settings.CACHE_MEMORY_MAX_ENTRIES,
+            max_bytes=settings.CACHE_MEMORY_MAX_BYTES,
+            sweep_seconds=settings.CACHE_MEMORY_SWEEP_SECONDS,
+        )
         
         # محاولة الاتصال بـ Redis
         if REDIS_AVAILABLE and settings.REDIS_URL:
@@ -60,9 +171,10 @@ class CacheManager:
                 logger.error(f"Redis get error: {str(e)}")
                 return None
         else:
-            # In-memory cache
-            if key in _memory_cache:
-                return _memory_cache[key]
+            # In-memory cache (مع احترام وقت انتهاء الصلاحية)
+            value = self.memory.get(key)
+            if value is not None:
+                return json.loads(value)
         return None
     
     def set(self, key: str, value: Any, ttl: int = 3600) -> bool:
@@ -89,9 +201,7 @@ class CacheManager:
                 return False
         else:
             # In-memory cache
-            _memory_cache[key] = value
-            _cache_ttl[key] = ttl
-            return True
+            return self.memory.set(key, serialized_value, ttl)
     
     def delete(self, key: str) -> bool:
         """حذف مفتاح من الـ cache"""
@@ -103,12 +213,11 @@ class CacheManager:
                 logger.error(f"Redis delete error: {str(e)}")
                 return False
         else:
-            _memory_cache.pop(key, None)
-            _cache_ttl.pop(key, None)
+            self.memory.delete(key)
             return True
     
     def clear_pattern(self, pattern: str) -> int:
-        """حذف جميع المفاتيح المطابقة للنمط (Redis only)"""
+        """حذف جميع المفاتيح المطابقة للنمط"""
         if self.use_redis and self.redis_client:
             try:
                 keys = self.redis_client.keys(pattern)
@@ -118,7 +227,13 @@ class CacheManager:
             except Exception as e:
                 logger.error(f"Redis clear_pattern error: {str(e)}")
                 return 0
-        return 0
+        return self.memory.delete_pattern(pattern)
+
+    def stats(self) -> Dict[str, Any]:
+        """إحصائيات الـ cache (للـ in-memory: الإصابات والحذف والذاكرة في هذه العملية)"""
+        if self.use_redis and self.redis_client:
+            return {"backend": "redis"}
+        return {"backend": "memory", **self.memory.stats()}
 
 
 # Global cache instance
@@ -0,0 +1,80 @@
+"""
+إصدار الكتالوج (الأطباء، الخدمات، الفروع)
+يُستخدم لمعرفة متى يجب إعادة بناء الفهارس المحلية المبنية على الكتالوج (مثل فهرس الكيانات)
+
+- الإصدار = SHA-1 لبصمة خفيفة من قاعدة البيانات (عدد الصفوف + آخر تحديث)، فهو متطابق بين كل
+  العمليات (workers) ويصلح لـ ETag؛ البصمة يتم التحقق منها مرة كل CATALOG_VERSION_CHECK_SECONDS كحد أقصى
+- أي تعديل من الـ Admin APIs يُجبر إعادة قراءة البصمة في الطلب التالي في نفس العملية (bump_catalog_version)
+"""
+import hashlib
+import logging
+import threading
+import time
+from typing import Optional, Tuple
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+from app.config import get_settings
+from app.db.models import Doctor, Service, Branch
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+_lock = threading.Lock()
+_fingerprint: Optional[Tuple] = None
+_checked_at = 0.0
+
+
+def bump_catalog_version():
+    """
+    تحديث إصدار الكتالوج بعد تعديل الأطباء أو الخدمات أو الفروع (بعد الـ commit)
+
+    لا يوجد عداد محلي: الإصدار يُحسب من البصمة فقط حتى يتطابق بين العمليات
+    """
+    global _checked_at
+    with _lock:
+        # إجبار التحقق من البصمة في الطلب التالي
+        _checked_at = 0.0
+
+
+def catalog_fingerprint(db: Session) -> Tuple:
+    """
+    بصمة الكتالوج من قاعدة البيانات في استعلام واحد (عدد الصفوف وآخر تحديث لكل جدول)
+    """
+    parts = []
+    for model in (Doctor, Service, Branch):
+        parts.append(select(func.count(model.id)).scalar_subquery())
+        parts.append(select(func.max(model.updated_at)).scalar_subquery())
+    row = db.execute(select(*parts)).one()
+    return tuple(row)
+
+
+def get_catalog_version(db: Session) -> str:
+    """
+    الحصول على إصدار الكتالوج الحالي
+
+    Returns:
+        نص يتغير عند أي تعديل في الكتالوج (نفس القيمة في كل العمليات لنفس حالة قاعدة البيانات)
+    """
+    global _fingerprint, _checked_at
+    now = time.monotonic()
+    with _lock:
+        needs_check = _fingerprint is None or now - _checked_at >= settings.CATALOG_VERSION_CHECK_SECONDS
+
+    if needs_check:
+        try:
+            fingerprint = catalog_fingerprint(db)
+        except Exception as e:
+            logger.warning(f"Failed to read catalog fingerprint: {str(e)}")
+            try:
+                db.rollback()
+            except:
+                pass
+            fingerprint = _fingerprint
+        with _lock:
+            _fingerprint = fingerprint
+            _checked_at = now
+
+    with _lock:
+        fingerprint = _fingerprint
+    # hash() عشوائي لكل عملية (PYTHONHASHSEED)، لذلك SHA-1 لتمثيل البصمة
+    return hashlib.sha1(repr(fingerprint).encode("utf-8")).hexdigest()[:16]
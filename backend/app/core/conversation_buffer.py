@@ -0,0 +1,517 @@
+"""
+تخزين المحادثات المؤجل (Write-behind) - تجميع سجلات المحادثات وكتابتها دفعة واحدة
+
+- كل سجل يحصل على معرف (UUID) عند الإضافة، فيمكن ربط السجلات التابعة به قبل الكتابة
+- الكتابة: INSERT متعدد الصفوف لكل جدول في transaction واحدة عند امتلاء الـ buffer
+  (CONVERSATION_BUFFER_MAX_ROWS) أو كل CONVERSATION_BUFFER_FLUSH_SECONDS (مهمة في الـ scheduler)
+- عند إيقاف التطبيق: كتابة ما تبقى، وإذا فشلت (قاعدة البيانات غير متاحة) تُحفظ السجلات في ملف
+  spool (JSON lines) يُعاد إدخاله عند التشغيل التالي (راجع replay_spool)؛ المسار يجب أن يكون مطلقاً
+  على قرص دائم - قرص Render المؤقت يُمسح عند كل نشر
+- فشل الكتابة: قاعدة البيانات غير متاحة (OperationalError) → إعادة الدفعة للمحاولة لاحقاً؛
+  أي خطأ آخر (بيانات سجل غير صالحة) → كتابة السجلات واحداً واحداً وعزل الفاشل في {spool}.failed
+- created_at = وقت الرسالة، و updated_at = وقت الكتابة الفعلي (المزامنة والتجميعات تعتمد عليه)
+- سجلات الرسالة الواحدة (المحادثة + UnansweredQuestion + PendingHandoff) تُضاف معاً عبر add_turn()
+  وتُكتب في نفس الـ transaction؛ وإذا وُجد تحويل لموظف تُكتب فوراً بدون انتظار الدفعة
+
+ملاحظة: السجلات غير المكتوبة مرئية فقط داخل نفس العملية (راجع pending_for)
+"""
+import glob
+import json
+import logging
+import os
+import threading
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from sqlalchemy import Table, select
+from sqlalchemy.exc import OperationalError
+from app.config import get_settings
+from app.db.session import engine
+from app.db.models import Conversation, UnansweredQuestion, PendingHandoff, OutboxEvent
+from app.services.outbox_service import outbox_rows
+from app.services.partition_service import PARTITIONED_TABLE, is_partitioned
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# ترتيب الكتابة (الجداول التابعة بعد conversations بسبب الـ foreign keys)
+_TABLES: Dict[str, Table] = {
+    model.__tablename__: model.__table__
+    for model in (Conversation, UnansweredQuestion, PendingHandoff)
+}
+
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, uuid.UUID):
+        return {"$uuid": str(value)}
+    if isinstance(value, datetime):
+        return {"$dt": value.isoformat()}
+    return value
+
+
+def _decode(value: Any) -> Any:
+    if isinstance(value, dict):
+        if "$uuid" in value:
+            return uuid.UUID(value["$uuid"])
+        if "$dt" in value:
+            return datetime.fromisoformat(value["$dt"])
+    return value
+
+
+def _stamp_updated_at(batch: Dict[str, List[Dict[str, Any]]]):
+    """
+    updated_at = وقت الكتابة الفعلي (وليس وقت الإضافة للـ buffer)
+
+    دفعة أُعيدت للمحاولة أو spool أُعيد عند التشغيل قد تُكتب بعد دقائق أو ساعات؛ بوقت الإضافة
+    تقع السجلات خلف cursors المزامنة (PAGINATION_SAFETY_SECONDS) وخلف high-water التجميعات
+    (ROLLUP_LAG_SECONDS) فلا تُقرأ أبداً. created_at يبقى وقت الرسالة
+    """
+    now = datetime.now()
+    for table_name, rows in batch.items():
+        table = _TABLES.get(table_name)
+        if table is not None and "updated_at" in table.c:
+            for row in rows:
+                row["updated_at"] = now
+
+
+def _dialect_insert(connection):
+    """insert() الخاص بالـ dialect (يدعم ON CONFLICT)"""
+    dialect = connection.dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise RuntimeError(f"إعادة الـ spool غير مدعومة لـ {dialect}")
+    return insert
+
+
+def _key_groups(rows: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """
+    تجميع الصفوف حسب أعمدتها (INSERT متعدد الصفوف يتطلب نفس المفاتيح)
+
+    ملفات spool من إصدار أقدم قد تنقصها أعمدة جديدة؛ لا تُملأ بـ NULL حتى تبقى القيم الافتراضية للأعمدة
+    """
+    groups: Dict[tuple, List[Dict[str, Any]]] = defaultdict(list)
+    for row in rows:
+        groups[tuple(sorted(row))].append(row)
+    return list(groups.values())
+
+
+def _conflict_columns(connection, table_name: str) -> List[str]:
+    """
+    هدف ON CONFLICT: المفتاح الأساسي الفعلي للجدول
+
+    بعد تقسيم conversations (app/services/partition_service.py) المفتاح هو (id, created_at)
+    ولا يوجد قيد فريد على id وحده
+    """
+    if table_name == PARTITIONED_TABLE and is_partitioned(connection):
+        return ["id", "created_at"]
+    return ["id"]
+
+
+def _append_records(path: str, batch: Dict[str, List[Dict[str, Any]]]) -> int:
+    """إضافة سجلات لملف JSON lines (مع fsync)"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    count = 0
+    with open(path, "a", encoding="utf-8") as spool_file:
+        for table_name, rows in batch.items():
+            for row in rows:
+                record = {"table": table_name, "row": {k: _encode(v) for k, v in row.items()}}
+                spool_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+                count += 1
+        spool_file.flush()
+        os.fsync(spool_file.fileno())
+    return count
+
+
+def _read_records(path: str) -> Dict[str, List[Dict[str, Any]]]:
+    batch: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    try:
+        spool_file = open(path, "r", encoding="utf-8")
+    except FileNotFoundError:
+        # حجزته عملية أخرى بعد الحجز (ملف متبقٍ)
+        return batch
+    with spool_file:
+        for line in spool_file:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record.get("table") in _TABLES:
+                batch[record["table"]].append({k: _decode(v) for k, v in record["row"].items()})
+    return batch
+
+
+def _remove(paths: List[str]):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class ConversationBuffer:
+    """Buffer لسجلات المحادثات والسجلات التابعة لها"""
+
+    def __init__(
+        self,
+        max_rows: Optional[int] = None,
+        spool_path: Optional[str] = None,
+        enabled: Optional[bool] = None
+    ):
+        self.max_rows = max_rows or settings.CONVERSATION_BUFFER_MAX_ROWS
+        self.spool_path = spool_path or settings.CONVERSATION_BUFFER_SPOOL_PATH
+        self.enabled = settings.CONVERSATION_WRITE_BEHIND if enabled is None else enabled
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._rows: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        # (user_id, channel) → سجلات المحادثات غير المكتوبة (لتاريخ المحادثة)
+        self._pending_by_user: Dict[tuple, List[Dict[str, Any]]] = defaultdict(list)
+        self.flushed_rows = 0
+        self.flush_count = 0
+        self.failed_flushes = 0
+        self.quarantined_rows = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(len(rows) for rows in self._rows.values())
+
+    # ------------------------------------------------------------------
+    # الإضافة
+    # ------------------------------------------------------------------
+
+    def add_conversation(self, **values) -> uuid.UUID:
+        """
+        إضافة سجل محادثة
+
+        Returns:
+            معرف المحادثة (يُولد مسبقاً)
+        """
+        return self.add_turn(values)["conversation_id"]
+
+    def add_turn(
+        self,
+        conversation: Dict[str, Any],
+        unanswered: Optional[Dict[str, Any]] = None,
+        handoff: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Optional[uuid.UUID]]:
+        """
+        إضافة سجلات رسالة واحدة كوحدة عمل واحدة: المحادثة + سؤال غير مُجاب + تحويل لموظف (اختياريان)
+
+        السجلات تُكتب معاً في نفس الـ transaction: مع الدفعة القادمة، أو فوراً إذا وُجد تحويل لموظف
+
+        Returns:
+            {"conversation_id", "unanswered_question_id", "handoff_id"}
+        """
+        now = datetime.now()
+        conversation_row = {"id": uuid.uuid4(), "created_at": now, "updated_at": now, **conversation}
+        batch: Dict[str, List[Dict[str, Any]]] = {"conversations": [conversation_row]}
+        ids = {"conversation_id": conversation_row["id"], "unanswered_question_id": None, "handoff_id": None}
+
+        if unanswered is not None:
+            row = {"id": uuid.uuid4(), "conversation_id": conversation_row["id"], "created_at": now, **unanswered}
+            batch[UnansweredQuestion.__tablename__] = [row]
+            ids["unanswered_question_id"] = row["id"]
+        if handoff is not None:
+            row = {
+                "id": uuid.uuid4(), "conversation_id": conversation_row["id"],
+                "created_at": now, "updated_at": now, **handoff
+            }
+            batch[PendingHandoff.__tablename__] = [row]
+            ids["handoff_id"] = row["id"]
+
+        # التحويل لموظف يجب أن يظهر فوراً - لا ننتظر الدفعة
+        if not self.enabled or handoff is not None:
+            try:
+                self._write(batch)
+                return ids
+            except Exception as e:
+                if not self.enabled:
+                    raise
+                logger.error(f"Immediate turn write failed, buffering instead: {str(e)}")
+
+        with self._lock:
+            for table_name, rows in batch.items():
+                self._rows[table_name].extend(rows)
+            self._pending_by_user[(conversation_row["user_id"], conversation_row["channel"])].append(conversation_row)
+            size = sum(len(rows) for rows in self._rows.values())
+        if size >= self.max_rows:
+            self._flush_in_background()
+        return ids
+
+    def pending_for(self, user_id: str, channel: str) -> List[Dict[str, Any]]:
+        """سجلات المحادثات غير المكتوبة لمستخدم (في هذه العملية)"""
+        with self._lock:
+            return list(self._pending_by_user.get((user_id, channel), ()))
+
+    def _forget_pending(self, rows: List[Dict[str, Any]]):
+        for row in rows:
+            key = (row["user_id"], row["channel"])
+            pending = self._pending_by_user.get(key)
+            if pending is None:
+                continue
+            pending[:] = [r for r in pending if r["id"] != row["id"]]
+            if not pending:
+                self._pending_by_user.pop(key, None)
+
+    # ------------------------------------------------------------------
+    # الكتابة
+    # ------------------------------------------------------------------
+
+    def _write(self, batch: Dict[str, List[Dict[str, Any]]]):
+        """كتابة دفعة في transaction واحدة (INSERT متعدد الصفوف لكل جدول + أحداث الـ outbox)"""
+        _stamp_updated_at(batch)
+        with engine.begin() as connection:
+            for table_name, table in _TABLES.items():
+                rows = batch.get(table_name)
+                if rows:
+                    connection.execute(table.insert(), rows)
+            events = outbox_rows(batch)
+            if events:
+                connection.execute(OutboxEvent.__table__.insert(), events)
+
+    def _requeue(self, batch: Dict[str, List[Dict[str, Any]]]):
+        with self._lock:
+            for table_name, rows in batch.items():
+                self._rows[table_name][:0] = rows
+            for row in batch.get("conversations", ()):
+                self._pending_by_user[(row["user_id"], row["channel"])].insert(0, row)
+
+    def _take(self) -> Dict[str, List[Dict[str, Any]]]:
+        with self._lock:
+            batch = {name: rows for name, rows in self._rows.items() if rows}
+            self._rows = defaultdict(list)
+            return batch
+
+    def flush(self) -> int:
+        """
+        كتابة جميع السجلات المعلقة
+
+        Returns:
+            عدد السجلات المكتوبة
+        """
+        with self._flush_lock:
+            batch = self._take()
+            count = sum(len(rows) for rows in batch.values())
+            if not count:
+                return 0
+            try:
+                self._write(batch)
+            except OperationalError as e:
+                # قاعدة البيانات غير متاحة: المحاولة لاحقاً بنفس الدفعة
+                self.failed_flushes += 1
+                logger.error(f"Conversation buffer flush failed ({count} rows): {str(e)}")
+                self._requeue(batch)
+                # حماية الذاكرة عند تعطل قاعدة البيانات لفترة طويلة
+                if len(self) >= self.max_rows * 10:
+                    self.spool()
+                return 0
+            except Exception as e:
+                # خطأ في بيانات سجل (مثل NUL في نص الرسالة): إعادة الدفعة كاملة ستفشل دائماً،
+                # فتُكتب السجلات واحداً واحداً ويُعزل الفاشل منها في ملف {spool}.failed
+                self.failed_flushes += 1
+                logger.error(f"Conversation buffer flush failed ({count} rows), retrying row by row: {str(e)}")
+                try:
+                    count, failed = self._insert_each(batch)
+                except OperationalError as retry_error:
+                    logger.error(f"Conversation buffer row-by-row flush failed: {str(retry_error)}")
+                    self._requeue(batch)
+                    return 0
+                if failed:
+                    self._quarantine(failed)
+
+            with self._lock:
+                self._forget_pending(batch.get("conversations", []))
+            self.flushed_rows += count
+            self.flush_count += 1
+            logger.debug(f"Conversation buffer flushed {count} rows")
+            return count
+
+    def _flush_in_background(self):
+        """كتابة غير متزامنة عند امتلاء الـ buffer (لا تُوقف معالجة الرسائل)"""
+        if self._flush_lock.locked():
+            return
+        threading.Thread(target=self.flush, name="conversation-buffer-flush", daemon=True).start()
+
+    # ------------------------------------------------------------------
+    # ملف الـ spool (الاحتياطي الدائم)
+    # ------------------------------------------------------------------
+
+    def spool(self) -> int:
+        """حفظ السجلات المعلقة في ملف spool (عند تعذر الكتابة في قاعدة البيانات)"""
+        batch = self._take()
+        if not batch:
+            return 0
+        count = _append_records(self.spool_path, batch)
+        with self._lock:
+            self._forget_pending(batch.get("conversations", []))
+        logger.warning(f"Spooled {count} conversation rows to {self.spool_path}")
+        return count
+
+    def _claim_spool(self) -> List[str]:
+        """
+        حجز ملفات الـ spool بإعادة تسمية ذرية (rename) - عملية واحدة فقط تحصل على كل ملف
+
+        يشمل ملفات محجوزة متبقية من عملية توقفت أثناء الإعادة (الإدخال idempotent، فلا ضرر من التكرار)
+        """
+        claim_prefix = f"{self.spool_path}.replay-"
+        candidates = [self.spool_path] + sorted(glob.glob(glob.escape(claim_prefix) + "*"))
+        claimed = []
+        for path in candidates:
+            target = f"{claim_prefix}{os.getpid()}-{uuid.uuid4().hex[:8]}"
+            try:
+                os.rename(path, target)
+            except FileNotFoundError:
+                # حجزته عملية أخرى
+                continue
+            claimed.append(target)
+        return claimed
+
+    def replay_spool(self) -> int:
+        """
+        إعادة إدخال السجلات المحفوظة في ملف الـ spool (عند بدء التشغيل، في كل worker)
+
+        - الملف يُحجز أولاً بـ rename ذري، فلا يعيده أكثر من worker
+        - INSERT ... ON CONFLICT (المفتاح الأساسي) DO NOTHING: السجلات المكتوبة سابقاً (إعادة بعد توقف) لا تتكرر
+        - إذا فشلت الدفعة تُعاد السجلات واحداً واحداً، وما يفشل منها (بيانات غير صالحة) يُحفظ في
+          ملف {spool}.failed للمراجعة اليدوية؛ وإذا كانت قاعدة البيانات غير متاحة تُعاد للـ spool
+        """
+        if not os.path.isabs(self.spool_path):
+            logger.warning(
+                f"⚠️  CONVERSATION_BUFFER_SPOOL_PATH is relative ({self.spool_path}) - "
+                f"use an absolute path on a persistent disk, the spool is lost on redeploy otherwise"
+            )
+        claimed = self._claim_spool()
+        if not claimed:
+            return 0
+
+        batch: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for path in claimed:
+            batch_part = _read_records(path)
+            for table_name, rows in batch_part.items():
+                batch[table_name].extend(rows)
+        count = sum(len(rows) for rows in batch.values())
+
+        try:
+            inserted, failed = self._replay(batch)
+        except OperationalError:
+            _append_records(self.spool_path, batch)
+            _remove(claimed)
+            raise
+        if failed:
+            self._quarantine(failed)
+        _remove(claimed)
+        logger.info(f"Replayed {inserted} of {count} spooled conversation rows")
+        return inserted
+
+    def _replay(self, batch: Dict[str, List[Dict[str, Any]]]):
+        """
+        إدخال السجلات المعادة: دفعة واحدة، أو سجلاً سجلاً إذا فشلت الدفعة
+
+        Returns:
+            (عدد السجلات المدخلة، السجلات الفاشلة {table_name: [row, ...]})
+        """
+        try:
+            return self._insert_new(batch), {}
+        except OperationalError:
+            raise
+        except Exception as e:
+            logger.warning(f"Spool replay batch failed, retrying row by row: {str(e)}")
+        return self._insert_each(batch)
+
+    def _insert_each(self, batch: Dict[str, List[Dict[str, Any]]]):
+        """
+        إدخال السجلات واحداً واحداً (كل سجل في transaction) - عزل السجلات غير الصالحة
+
+        Returns:
+            (عدد السجلات المدخلة، السجلات الفاشلة {table_name: [row, ...]})
+        """
+        inserted = 0
+        failed: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        failed_conversations = set()
+        for table_name in _TABLES:
+            for row in batch.get(table_name, ()):
+                # السجلات التابعة لمحادثة فاشلة تُحفظ معها (الـ foreign keys محذوفة بعد تقسيم conversations)
+                if row.get("conversation_id") in failed_conversations:
+                    failed[table_name].append(row)
+                    continue
+                try:
+                    inserted += self._insert_new({table_name: [row]})
+                except OperationalError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Conversation buffer {table_name} row {row.get('id')} failed: {str(e)}")
+                    failed[table_name].append(row)
+                    if table_name == PARTITIONED_TABLE:
+                        failed_conversations.add(row["id"])
+        return inserted, failed
+
+    def _quarantine(self, failed: Dict[str, List[Dict[str, Any]]]):
+        """حفظ السجلات التي لا يمكن كتابتها في ملف {spool}.failed للمراجعة اليدوية"""
+        failed_path = f"{self.spool_path}.failed"
+        count = _append_records(failed_path, failed)
+        self.quarantined_rows += count
+        logger.error(f"❌ {count} conversation rows failed, kept in {failed_path}")
+
+    def _insert_new(self, batch: Dict[str, List[Dict[str, Any]]]) -> int:
+        """
+        INSERT ... ON CONFLICT (المفتاح الأساسي) DO NOTHING في transaction واحدة
+
+        السجلات الموجودة مسبقاً تُستبعد قبل الإدخال (ON CONFLICT يحمي من إعادة متزامنة فقط)،
+        فأحداث الـ outbox تُكتب فقط للسجلات الجديدة (لا أحداث مكررة عند الإعادة)
+        """
+        _stamp_updated_at(batch)
+        with engine.begin() as connection:
+            insert = _dialect_insert(connection)
+            new_batch = {}
+            for table_name, table in _TABLES.items():
+                rows = batch.get(table_name)
+                if not rows:
+                    continue
+                existing = set(connection.execute(
+                    select(table.c.id).where(table.c.id.in_([row["id"] for row in rows]))
+                ).scalars())
+                # نفس السجل قد يتكرر في أكثر من ملف محجوز
+                rows = list({row["id"]: row for row in rows if row["id"] not in existing}.values())
+                if rows:
+                    statement = insert(table).on_conflict_do_nothing(
+                        index_elements=_conflict_columns(connection, table_name)
+                    )
+                    for group in _key_groups(rows):
+                        connection.execute(statement, group)
+                    new_batch[table_name] = rows
+            events = outbox_rows(new_batch)
+            if events:
+                connection.execute(OutboxEvent.__table__.insert(), events)
+        return sum(len(rows) for rows in new_batch.values())
+
+    def close(self):
+        """كتابة ما تبقى عند الإيقاف، أو حفظه في ملف spool إذا فشلت الكتابة"""
+        self.flush()
+        if len(self):
+            self.spool()
+
+    def stats(self) -> Dict[str, Any]:
+        """إحصائيات الـ buffer"""
+        with self._lock:
+            pending = {name: len(rows) for name, rows in self._rows.items() if rows}
+        return {
+            "enabled": self.enabled,
+            "pending": pending,
+            "flushed_rows": self.flushed_rows,
+            "flush_count": self.flush_count,
+            "failed_flushes": self.failed_flushes,
+            "quarantined_rows": self.quarantined_rows,
+        }
+
+
+# Global buffer instance
+conversation_buffer = ConversationBuffer()
+
+
+def get_conversation_buffer() -> ConversationBuffer:
+    """الحصول على buffer المحادثات"""
+    return conversation_buffer
@@ -0,0 +1,249 @@
+"""
+فهرس كيانات الكتالوج - مطابقة أسماء الأطباء والخدمات والفروع والمدن والتخصصات في رسالة المستخدم
+
+- Trie على مستوى الكلمات للأسماء بعد التوحيد (أ/ا، ة/ه، حذف "د." و "دكتور" و "ال")
+- فهرس trigrams للكلمات لمطابقة الأخطاء الإملائية (fuzzy)
+- مرور واحد على الرسالة يعيد جميع الكيانات المطابقة مع مواقعها (spans)
+- يُعاد بناؤه تلقائياً عند تغير إصدار الكتالوج (راجع app/core/catalog.py)
+"""
+import logging
+import threading
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy.orm import Session
+from app.config import get_settings
+from app.core.arabic_text import tokenize_with_spans
+from app.core.catalog import get_catalog_version
+from app.db.models import Doctor, Service, Branch
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# ألقاب تُحذف من بداية أسماء الأطباء
+_DOCTOR_TITLES = {"د", "دكتور", "الدكتور", "دكتوره", "الدكتوره", "طبيب", "الطبيب"}
+# كلمات عامة تُحذف من بداية أسماء الفروع كاسم بديل (مثال: "فرع الحزم" → "الحزم")
+_BRANCH_PREFIXES = {"فرع", "عياده", "عيادات", "مجمع"}
+
+_ENTRY_KEY = "$"
+
+
+def _match_key(token: str) -> str:
+    """مفتاح المطابقة للكلمة: حذف "ال" التعريف من الكلمات الطويلة"""
+    if token.startswith("ال") and len(token) > 4:
+        return token[2:]
+    return token
+
+
+def _trigrams(token: str) -> List[str]:
+    padded = f"#{token}#"
+    return [padded[i:i + 3] for i in range(len(padded) - 2)]
+
+
+def _aliases(entity_type: str, field: str, value: str) -> List[List[str]]:
+    """الأسماء البديلة (كقوائم كلمات) لكيان واحد"""
+    tokens = [_match_key(token) for token, _, _ in tokenize_with_spans(value)]
+    if not tokens:
+        return []
+
+    aliases = [tokens]
+    if entity_type == "doctor" and field == "name":
+        stripped = list(tokens)
+        while stripped and stripped[0] in _DOCTOR_TITLES:
+            stripped = stripped[1:]
+        if stripped and stripped != tokens:
+            aliases = [stripped]
+        # الاسم الأول أو الأخير وحده (مثال: "عند احمد")
+        if len(stripped) > 1:
+            aliases.extend([token] for token in (stripped[0], stripped[-1]) if len(token) >= 3)
+    elif entity_type == "service" and field == "name":
+        # الكلمة الأولى وحدها (مثال: "تبييض" → "تبييض الأسنان")
+        if len(tokens) > 1 and len(tokens[0]) >= 4:
+            aliases.append(tokens[:1])
+    elif entity_type == "branch" and field == "name":
+        if len(tokens) > 1 and tokens[0] in _BRANCH_PREFIXES:
+            aliases.append(tokens[1:])
+    return aliases
+
+
+class CatalogEntityIndex:
+    """فهرس الكيانات: Trie للأسماء + فهرس trigrams للمطابقة التقريبية"""
+
+    def __init__(self, fuzzy_threshold: Optional[float] = None):
+        """
+        Args:
+            fuzzy_threshold: أقل تشابه (Dice على trigrams) لقبول مطابقة تقريبية لكلمة
+        """
+        self.fuzzy_threshold = fuzzy_threshold if fuzzy_threshold is not None else settings.ENTITY_FUZZY_THRESHOLD
+        self.version: Optional[str] = None
+        self._trie: Dict[str, Any] = {}
+        self._vocab: Dict[str, int] = {}
+        self._trigram_index: Dict[str, set] = defaultdict(set)
+        self.entity_count = 0
+
+    def build(self, entities: Iterable[Dict[str, Any]], version: Optional[str] = None):
+        """
+        بناء الفهرس
+
+        Args:
+            entities: قائمة كيانات {"type", "id", "name", "field", "value"}
+                      field: الحقل المطابق (name, city, specialty) و value نصه
+            version: إصدار الكتالوج الذي بُني منه الفهرس
+        """
+        trie: Dict[str, Any] = {}
+        vocab: Dict[str, int] = {}
+        trigram_index: Dict[str, set] = defaultdict(set)
+        count = 0
+
+        for entity in entities:
+            value = entity.get("value")
+            if not value:
+                continue
+            count += 1
+            for alias in _aliases(entity["type"], entity["field"], value):
+                node = trie
+                for token in alias:
+                    node = node.setdefault(token, {})
+                    if token not in vocab:
+                        grams = _trigrams(token)
+                        vocab[token] = len(grams)
+                        for gram in grams:
+                            trigram_index[gram].add(token)
+                node.setdefault(_ENTRY_KEY, []).append(entity)
+
+        self._trie = trie
+        self._vocab = vocab
+        self._trigram_index = trigram_index
+        self.entity_count = count
+        self.version = version
+
+    def _canonical(self, token: str) -> Tuple[Optional[str], float]:
+        """
+        أقرب كلمة في المفردات للكلمة المعطاة
+
+        Returns:
+            (الكلمة، درجة التشابه) أو (None, 0) إذا لم توجد مطابقة كافية
+        """
+        if token in self._vocab:
+            return token, 1.0
+        if len(token) < 3:
+            return None, 0.0
+
+        grams = _trigrams(token)
+        shared = Counter()
+        for gram in set(grams):
+            for candidate in self._trigram_index.get(gram, ()):
+                shared[candidate] += 1
+
+        best, best_score = None, 0.0
+        for candidate, overlap in shared.items():
+            score = 2.0 * overlap / (len(grams) + self._vocab[candidate])
+            if score > best_score:
+                best, best_score = candidate, score
+        if best_score >= self.fuzzy_threshold:
+            return best, best_score
+        return None, 0.0
+
+    def match(self, message: str) -> List[Dict[str, Any]]:
+        """
+        مطابقة جميع الكيانات في الرسالة في مرور واحد
+
+        Returns:
+            قائمة مطابقات مرتبة حسب الموقع:
+            {"type", "id", "name", "field", "span": (start, end), "text", "score"}
+        """
+        if not self._trie or not message:
+            return []
+
+        tokens = tokenize_with_spans(message)
+        canonical = [self._canonical(_match_key(token)) for token, _, _ in tokens]
+
+        matches = []
+        start = 0
+        while start < len(tokens):
+            node = self._trie
+            score = 1.0
+            longest = None
+            for position in range(start, len(tokens)):
+                token, token_score = canonical[position]
+                if token is None or token not in node:
+                    break
+                node = node[token]
+                score = min(score, token_score)
+                if _ENTRY_KEY in node:
+                    longest = (position, score, node[_ENTRY_KEY])
+
+            if longest is None:
+                start += 1
+                continue
+            end, score, entities = longest
+            span = (tokens[start][1], tokens[end][2])
+            # أطول مطابقة فقط بدون تداخل
+            start = end + 1
+            seen = set()
+            for entity in entities:
+                key = (entity["type"], entity["id"], entity["field"])
+                if key in seen:
+                    continue
+                seen.add(key)
+                matches.append({
+                    "type": entity["type"],
+                    "id": entity["id"],
+                    "name": entity["name"],
+                    "field": entity["field"],
+                    "span": span,
+                    "text": message[span[0]:span[1]],
+                    "score": round(score, 3),
+                })
+
+        return matches
+
+
+def load_catalog_entities(db: Session) -> List[Dict[str, Any]]:
+    """تحميل كيانات الكتالوج النشطة (الأعمدة المطلوبة فقط)"""
+    entities = []
+    for doctor_id, name, specialty in db.query(Doctor.id, Doctor.name, Doctor.specialty)\
+            .filter(Doctor.is_active == True).all():
+        entities.append({"type": "doctor", "id": doctor_id, "name": name, "field": "name", "value": name})
+        if specialty:
+            entities.append({"type": "doctor", "id": doctor_id, "name": name, "field": "specialty", "value": specialty})
+
+    for service_id, name in db.query(Service.id, Service.name).filter(Service.is_active == True).all():
+        entities.append({"type": "service", "id": service_id, "name": name, "field": "name", "value": name})
+
+    for branch_id, name, city in db.query(Branch.id, Branch.name, Branch.city)\
+            .filter(Branch.is_active == True).all():
+        entities.append({"type": "branch", "id": branch_id, "name": name, "field": "name", "value": name})
+        if city:
+            entities.append({"type": "branch", "id": branch_id, "name": name, "field": "city", "value": city})
+    return entities
+
+
+# Global index instance
+_index = CatalogEntityIndex()
+_build_lock = threading.Lock()
+
+
+def get_entity_index(db: Session) -> CatalogEntityIndex:
+    """
+    الحصول على فهرس الكيانات، مع إعادة بنائه إذا تغير إصدار الكتالوج
+    """
+    global _index
+    version = get_catalog_version(db)
+    if _index.version == version:
+        return _index
+
+    with _build_lock:
+        if _index.version != version:
+            index = CatalogEntityIndex()
+            index.build(load_catalog_entities(db), version=version)
+            _index = index
+            logger.info(f"Entity index rebuilt ({index.entity_count} entries, version {version})")
+    return _index
+
+
+def first_match(matches: List[Dict[str, Any]], entity_type: str, field: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """أول مطابقة من نوع معين (وحقل معين اختيارياً)"""
+    for match in matches:
+        if match["type"] == entity_type and (field is None or match["field"] == field):
+            return match
+    return None
@@ -0,0 +1,428 @@
+"""
+مصنف النوايا المحلي - Character n-gram hashing + نموذج خطي (NumPy فقط، CPU)
+
+- يُدرَّب offline من سجلات جدول conversations (راجع scripts/train_intent_classifier.py)
+- يُحمَّل مرة واحدة عند بدء التشغيل ويعطي تنبؤاً في أقل من ميلي ثانية
+- يتنبأ بالنية (intent) وبأقسام السياق المطلوبة من قاعدة البيانات (doctors, services, branches, offers)
+- إذا لم يكن النموذج متوفراً، يُستخدم التصنيف بالكلمات المفتاحية كبديل
+"""
+import json
+import logging
+import os
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from app.config import get_settings
+from app.core.arabic_text import normalize_arabic
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# محاولة استيراد NumPy
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+    logger.warning("numpy not installed - intent classifier disabled, using keyword rules")
+
+
+INTENTS = [
+    "appointment_booking",
+    "doctor_info",
+    "service_info",
+    "branch_info",
+    "offer_info",
+    "other",
+]
+
+SECTIONS = ["doctors", "services", "branches", "offers"]
+
+# كلمات مفتاحية لحجز الموعد
+# ملاحظة: كلمات مثل "يوم" أو "وقت" أو "تاريخ" وحدها لا تعني نية حجز
+BOOKING_KEYWORDS = [
+    "احجز", "حجز", "حجزي", "احجزي", "أحجز", "أحجزي",
+    "موعد", "موعدي", "موعدك", "موعدنا",
+    "ابي احجز", "أبي أحجز", "أبي احجز", "ابي أحجز",
+    "عندي موعد", "عندنا موعد", "عندك موعد",
+    "بكرا", "بكرة", "غداً", "بعد بكرا", "بعد غد",
+]
+
+# كلمات مفتاحية لأقسام السياق
+SECTION_KEYWORDS = {
+    "doctors": [
+        "دكتور", "طبيب", "الاطباء", "اطباء", "الأطباء", "عندكم أطباء",
+        "هل عندكم أطباء", "عندكم دكتور", "هل عندكم دكتور", "أطباء", "تخصص"
+    ],
+    "services": [
+        "خدم", "خدمات", "استشارة", "فحص", "علاج", "تطعيم",
+        "عندكم خدمات", "وش الخدمات", "أي خدمات", "بكم", "كم يكلف", "سعر", "تكلفة"
+    ],
+    "branches": [
+        "فرع", "فروع", "عنوان", "موقع", "وينكم", "وين", "عنوانكم",
+        "ساعات العمل", "ساعات", "وقت العمل", "متى تفتحون", "متى تغلقون",
+        "رقم", "هاتف", "تواصل", "اتصال", "كيف أتواصل", "رقمكم"
+    ],
+    "offers": [
+        "عرض", "عروض", "خصم", "عندكم عروض", "هل عندكم عروض"
+    ],
+}
+
+# النية المرتبطة بكل قسم (عند غياب نية الحجز)
+_SECTION_INTENTS = {
+    "doctors": "doctor_info",
+    "services": "service_info",
+    "branches": "branch_info",
+    "offers": "offer_info",
+}
+
+_NORMALIZED_BOOKING_KEYWORDS = [normalize_arabic(kw) for kw in BOOKING_KEYWORDS]
+_NORMALIZED_SECTION_KEYWORDS = {
+    section: [normalize_arabic(kw) for kw in keywords]
+    for section, keywords in SECTION_KEYWORDS.items()
+}
+
+
+def keyword_intent(text: str) -> Dict[str, Any]:
+    """
+    تصنيف النية والأقسام المطلوبة بالكلمات المفتاحية
+    يُستخدم كبديل عند عدم توفر النموذج، وكمصدر للتسميات الضعيفة (weak labels) عند التدريب
+
+    Returns:
+        Dict مع intent و confidence (None) و sections و source
+    """
+    normalized = normalize_arabic(text)
+    sections = {
+        section: any(kw in normalized for kw in keywords)
+        for section, keywords in _NORMALIZED_SECTION_KEYWORDS.items()
+    }
+
+    if any(kw in normalized for kw in _NORMALIZED_BOOKING_KEYWORDS):
+        intent = "appointment_booking"
+    else:
+        intent = next(
+            (_SECTION_INTENTS[section] for section in SECTIONS if sections[section]),
+            "other"
+        )
+
+    return {
+        "intent": intent,
+        "confidence": None,
+        "sections": sections,
+        "source": "keywords",
+    }
+
+
+def _hashed_features(text: str, n_features: int, ngram_range: Tuple[int, int]) -> Tuple["np.ndarray", "np.ndarray"]:
+    """
+    تحويل النص إلى features مجزأة (hashing trick): character n-grams لكل كلمة + الكلمات نفسها
+
+    Returns:
+        (indices, values) - قيم tf لوغاريتمية مطبّعة (L2)
+    """
+    mask = n_features - 1
+    low, high = ngram_range
+    hashes = []
+    for token in normalize_arabic(text).split():
+        hashes.append(zlib.crc32(("w:" + token).encode("utf-8")) & mask)
+        padded = f" {token} "
+        for n in range(low, high + 1):
+            for i in range(len(padded) - n + 1):
+                hashes.append(zlib.crc32(padded[i:i + n].encode("utf-8")) & mask)
+
+    if not hashes:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+    indices, counts = np.unique(np.asarray(hashes, dtype=np.int64), return_counts=True)
+    values = (1.0 + np.log(counts)).astype(np.float32)
+    values /= np.linalg.norm(values)
+    return indices, values
+
+
+def _softmax(logits: "np.ndarray") -> "np.ndarray":
+    shifted = logits - logits.max(axis=-1, keepdims=True)
+    exp = np.exp(shifted)
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+def _sigmoid(logits: "np.ndarray") -> "np.ndarray":
+    return 1.0 / (1.0 + np.exp(-logits))
+
+
+class IntentClassifier:
+    """مصنف خطي للنوايا (softmax) وللأقسام المطلوبة (sigmoid لكل قسم)"""
+
+    def __init__(
+        self,
+        n_features: int = 2 ** 15,
+        ngram_range: Tuple[int, int] = (2, 4),
+        intents: Optional[Sequence[str]] = None,
+        sections: Optional[Sequence[str]] = None
+    ):
+        """
+        تهيئة المصنف
+
+        Args:
+            n_features: حجم فضاء الـ hashing (يجب أن يكون من قوى 2)
+            ngram_range: أطوال الـ character n-grams
+            intents: قائمة النوايا
+            sections: قائمة أقسام السياق
+        """
+        if not NUMPY_AVAILABLE:
+            raise ValueError("numpy package must be installed. Run: pip install numpy")
+        if n_features & (n_features - 1):
+            raise ValueError("n_features must be a power of 2")
+
+        self.n_features = n_features
+        self.ngram_range = tuple(ngram_range)
+        self.intents = list(intents or INTENTS)
+        self.sections = list(sections or SECTIONS)
+        self.W_intent = np.zeros((n_features, len(self.intents)), dtype=np.float32)
+        self.b_intent = np.zeros(len(self.intents), dtype=np.float32)
+        self.W_sections = np.zeros((n_features, len(self.sections)), dtype=np.float32)
+        self.b_sections = np.zeros(len(self.sections), dtype=np.float32)
+        self.metadata: Dict[str, Any] = {}
+
+    def featurize(self, text: str) -> Tuple["np.ndarray", "np.ndarray"]:
+        """تحويل نص إلى features مجزأة"""
+        return _hashed_features(text, self.n_features, self.ngram_range)
+
+    def _dense_batch(self, features: Sequence[Tuple["np.ndarray", "np.ndarray"]]) -> "np.ndarray":
+        """بناء مصفوفة كثيفة لدفعة صغيرة من العينات"""
+        X = np.zeros((len(features), self.n_features), dtype=np.float32)
+        for row, (indices, values) in enumerate(features):
+            X[row, indices] = values
+        return X
+
+    def fit(
+        self,
+        texts: Sequence[str],
+        intent_labels: Sequence[str],
+        section_labels: Sequence[Dict[str, bool]],
+        epochs: int = 10,
+        batch_size: int = 256,
+        learning_rate: float = 2.0,
+        l2: float = 1e-6,
+        seed: int = 42
+    ) -> Dict[str, Any]:
+        """
+        تدريب النموذج بـ mini-batch gradient descent
+
+        Args:
+            texts: الرسائل
+            intent_labels: النية لكل رسالة
+            section_labels: الأقسام المطلوبة لكل رسالة {section: bool}
+            epochs: عدد مرات المرور على البيانات
+            batch_size: حجم الدفعة
+            learning_rate: معدل التعلم
+            l2: معامل الـ regularization
+            seed: بذرة العشوائية
+
+        Returns:
+            إحصائيات التدريب (loss لكل epoch، المدة)
+        """
+        started = time.perf_counter()
+        intent_index = {intent: i for i, intent in enumerate(self.intents)}
+        features = [self.featurize(text) for text in texts]
+        y_intent = np.array([intent_index.get(label, intent_index["other"]) for label in intent_labels])
+        Y_sections = np.array(
+            [[1.0 if labels.get(section) else 0.0 for section in self.sections] for labels in section_labels],
+            dtype=np.float32
+        )
+
+        # أوزان الفئات - لتعويض هيمنة "other" على السجلات
+        class_counts = np.bincount(y_intent, minlength=len(self.intents)).astype(np.float32)
+        class_weights = np.where(class_counts > 0, len(y_intent) / (len(self.intents) * np.maximum(class_counts, 1)), 0.0)
+        class_weights = class_weights.astype(np.float32)
+
+        rng = np.random.default_rng(seed)
+        history = []
+        for epoch in range(epochs):
+            order = rng.permutation(len(features))
+            epoch_loss = 0.0
+            for start in range(0, len(order), batch_size):
+                batch = order[start:start + batch_size]
+                X = self._dense_batch([features[i] for i in batch])
+                Y = np.zeros((len(batch), len(self.intents)), dtype=np.float32)
+                Y[np.arange(len(batch)), y_intent[batch]] = 1.0
+                weights = class_weights[y_intent[batch]][:, None]
+
+                P = _softmax(X @ self.W_intent + self.b_intent)
+                grad_intent = (P - Y) * weights / len(batch)
+                S = _sigmoid(X @ self.W_sections + self.b_sections)
+                grad_sections = (S - Y_sections[batch]) / len(batch)
+
+                self.W_intent -= learning_rate * (X.T @ grad_intent + l2 * self.W_intent)
+                self.b_intent -= learning_rate * grad_intent.sum(axis=0)
+                self.W_sections -= learning_rate * (X.T @ grad_sections + l2 * self.W_sections)
+                self.b_sections -= learning_rate * grad_sections.sum(axis=0)
+
+                epoch_loss += float(-(weights[:, 0] * np.log(P[np.arange(len(batch)), y_intent[batch]] + 1e-9)).sum())
+            history.append(epoch_loss / max(len(order), 1))
+            logger.info(f"Intent classifier epoch {epoch + 1}/{epochs} - loss={history[-1]:.4f}")
+
+        self.metadata = {
+            "trained_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "samples": len(features),
+            "class_counts": {intent: int(count) for intent, count in zip(self.intents, class_counts)},
+            "epochs": epochs,
+        }
+        return {
+            "loss_history": history,
+            "duration_seconds": round(time.perf_counter() - started, 3),
+        }
+
+    def predict(self, text: str) -> Dict[str, Any]:
+        """
+        التنبؤ بالنية والأقسام المطلوبة لرسالة واحدة
+
+        Returns:
+            Dict مع intent و confidence و sections و source
+        """
+        indices, values = self.featurize(text)
+        intent_probs = _softmax(values @ self.W_intent[indices] + self.b_intent)
+        section_probs = _sigmoid(values @ self.W_sections[indices] + self.b_sections)
+        best = int(intent_probs.argmax())
+        return {
+            "intent": self.intents[best],
+            "confidence": float(intent_probs[best]),
+            "sections": {section: bool(prob >= 0.5) for section, prob in zip(self.sections, section_probs)},
+            "source": "model",
+        }
+
+    def evaluate(
+        self,
+        texts: Sequence[str],
+        intent_labels: Sequence[str],
+        section_labels: Sequence[Dict[str, bool]]
+    ) -> Dict[str, Any]:
+        """
+        تقييم النموذج: accuracy و precision/recall/F1 لكل نية و micro-F1 للأقسام
+        """
+        predictions = [self.predict(text) for text in texts]
+
+        correct = sum(1 for pred, label in zip(predictions, intent_labels) if pred["intent"] == label)
+        per_intent = {}
+        for intent in self.intents:
+            tp = sum(1 for p, l in zip(predictions, intent_labels) if p["intent"] == intent and l == intent)
+            fp = sum(1 for p, l in zip(predictions, intent_labels) if p["intent"] == intent and l != intent)
+            fn = sum(1 for p, l in zip(predictions, intent_labels) if p["intent"] != intent and l == intent)
+            precision = tp / (tp + fp) if tp + fp else 0.0
+            recall = tp / (tp + fn) if tp + fn else 0.0
+            f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+            per_intent[intent] = {
+                "precision": round(precision, 4),
+                "recall": round(recall, 4),
+                "f1": round(f1, 4),
+                "support": tp + fn,
+            }
+
+        tp = fp = fn = 0
+        for pred, labels in zip(predictions, section_labels):
+            for section in self.sections:
+                predicted, expected = pred["sections"][section], bool(labels.get(section))
+                tp += predicted and expected
+                fp += predicted and not expected
+                fn += expected and not predicted
+        sections_f1 = 2 * tp / (2 * tp + fp + fn) if tp + fp + fn else 0.0
+
+        return {
+            "samples": len(texts),
+            "accuracy": round(correct / len(texts), 4) if texts else 0.0,
+            "per_intent": per_intent,
+            "sections_micro_f1": round(sections_f1, 4),
+        }
+
+    def save(self, path: str):
+        """حفظ النموذج في ملف .npz"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        meta = {
+            "n_features": self.n_features,
+            "ngram_range": list(self.ngram_range),
+            "intents": self.intents,
+            "sections": self.sections,
+            "metadata": self.metadata,
+        }
+        np.savez_compressed(
+            path,
+            W_intent=self.W_intent,
+            b_intent=self.b_intent,
+            W_sections=self.W_sections,
+            b_sections=self.b_sections,
+            meta=np.array(json.dumps(meta, ensure_ascii=False))
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "IntentClassifier":
+        """تحميل نموذج محفوظ من ملف .npz"""
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            classifier = cls(
+                n_features=meta["n_features"],
+                ngram_range=tuple(meta["ngram_range"]),
+                intents=meta["intents"],
+                sections=meta["sections"]
+            )
+            classifier.W_intent = data["W_intent"].astype(np.float32)
+            classifier.b_intent = data["b_intent"].astype(np.float32)
+            classifier.W_sections = data["W_sections"].astype(np.float32)
+            classifier.b_sections = data["b_sections"].astype(np.float32)
+        classifier.metadata = meta.get("metadata", {})
+        return classifier
+
+
+# Global classifier instance (يُحمَّل عند بدء التشغيل)
+_classifier: Optional[IntentClassifier] = None
+
+
+def load_intent_classifier(path: Optional[str] = None) -> Optional[IntentClassifier]:
+    """
+    تحميل المصنف من الملف المحدد في الإعدادات (INTENT_MODEL_PATH)
+
+    Returns:
+        المصنف أو None إذا لم يكن الملف أو NumPy متوفراً
+    """
+    global _classifier
+    path = path or settings.INTENT_MODEL_PATH
+    if not NUMPY_AVAILABLE:
+        return None
+    if not path or not os.path.exists(path):
+        logger.warning(f"Intent model not found at {path} - using keyword rules")
+        return None
+
+    try:
+        _classifier = IntentClassifier.load(path)
+        logger.info(
+            f"Intent classifier loaded from {path} "
+            f"({_classifier.metadata.get('samples', '?')} training samples)"
+        )
+    except Exception as e:
+        logger.error(f"Failed to load intent classifier: {str(e)}", exc_info=True)
+        _classifier = None
+    return _classifier
+
+
+def get_intent_classifier() -> Optional[IntentClassifier]:
+    """الحصول على المصنف المحمّل (أو None)"""
+    return _classifier
+
+
+def classify_intent(text: str) -> Dict[str, Any]:
+    """
+    تصنيف رسالة: يستخدم النموذج إذا كان محمّلاً، وإلا الكلمات المفتاحية
+    التنبؤات ذات الثقة الأقل من INTENT_CONFIDENCE_THRESHOLD تُعامل كـ "other"
+    """
+    if _classifier is None:
+        return keyword_intent(text)
+
+    try:
+        prediction = _classifier.predict(text)
+    except Exception as e:
+        logger.error(f"Intent classifier error: {str(e)} - falling back to keywords")
+        return keyword_intent(text)
+
+    if prediction["confidence"] < settings.INTENT_CONFIDENCE_THRESHOLD:
+        prediction["intent"] = "other"
+    return prediction
@@ -0,0 +1,121 @@
+"""
+قوائم لوحة التحكم: ترقيم صفحات وفلترة وترتيب من الخادم + ETag
+
+- بدون page تُرجع كل الصفوف (التوافق مع الواجهة الحالية)؛ مع page تُرجع صفحة بحجم page_size
+- sort: اسم حقل (تصاعدي) أو -اسم حقل (تنازلي)، والـ id يُضاف دائماً لترتيب ثابت بين الصفحات
+- q: بحث نصي (ILIKE) في أعمدة يحددها كل endpoint
+- ETag يُحسب من استعلام واحد خفيف (عدد الصفوف المطابقة + أقصى updated_at) ومعاملات الطلب؛
+  إذا طابق If-None-Match يُرجع 304 بدون قراءة الصفحة أو تحويلها
+"""
+import hashlib
+from typing import Any, Dict, List, Optional, Sequence
+from fastapi import HTTPException, Request, Response
+from fastapi.responses import JSONResponse
+from sqlalchemy import func, or_, select
+from sqlalchemy.orm import Session
+from app.core.serialization import Projection, to_json_value
+
+
+def search_filter(q: Optional[str], columns: Sequence[Any]):
+    """شرط بحث نصي في أي من الأعمدة (أو None إذا لم يُرسل q)"""
+    if not q or not q.strip():
+        return None
+    pattern = f"%{q.strip()}%"
+    return or_(*[column.ilike(pattern) for column in columns])
+
+
+def _order_by(projection: Projection, sort: Optional[str], default_sort: str) -> List[Any]:
+    """تحويل sort إلى ORDER BY (HTTP 400 للحقول غير القابلة للترتيب)"""
+    value = (sort or default_sort).strip()
+    descending = value.startswith("-")
+    name = value.lstrip("-")
+    # حقول الجداول المرتبطة غير قابلة للترتيب (الـ join يُضاف فقط عند طلب الحقل)
+    if name not in projection.columns or name in projection.joins:
+        sortable = [field for field in projection.columns if field not in projection.joins]
+        raise HTTPException(
+            status_code=400,
+            detail=f"لا يمكن الترتيب حسب: {name} (المتاح: {', '.join(sortable)})"
+        )
+    column = projection.columns[name]
+    key = projection.model.id
+    return [column.desc(), key.desc()] if descending else [column.asc(), key.asc()]
+
+
+def _etag(request: Request, key: str, total: int, last_updated: Any, version: str) -> str:
+    """ETag ضعيف من حالة الجدول ومعاملات الطلب (كل صفحة/فلتر له ETag مختلف)"""
+    params = "&".join(f"{name}={value}" for name, value in sorted(request.query_params.multi_items()))
+    raw = f"{key}|{total}|{to_json_value(last_updated)}|{version}|{params}"
+    return 'W/"' + hashlib.sha1(raw.encode("utf-8")).hexdigest() + '"'
+
+
+def _not_modified(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [candidate.strip() for candidate in header.split(",")]
+    # المقارنة الضعيفة: W/"x" يطابق "x"
+    return "*" in candidates or etag in candidates or etag[2:] in candidates
+
+
+def list_response(
+    request: Request,
+    db: Session,
+    projection: Projection,
+    key: str,
+    selected: List[str],
+    filters: Sequence[Any] = (),
+    sort: Optional[str] = None,
+    default_sort: str = "-created_at",
+    page: Optional[int] = None,
+    page_size: int = 50,
+    version: str = ""
+) -> Response:
+    """
+    استجابة قائمة من projection مع ترقيم صفحات و ETag
+
+    Args:
+        request: الطلب (If-None-Match ومعاملات الـ ETag)
+        db: جلسة قاعدة البيانات
+        projection: projection المورد
+        key: اسم القائمة في الاستجابة (مثال: "doctors")
+        selected: الحقول المطلوبة (من parse_fields)
+        filters: شروط WHERE (None يُتجاهل)
+        sort: الترتيب المطلوب من العميل
+        default_sort: الترتيب الافتراضي
+        page: رقم الصفحة (بدءاً من 1) أو None لكل الصفوف
+        page_size: حجم الصفحة
+        version: جزء إضافي للـ ETag (مثال: إصدار الكتالوج للأسماء المرتبطة)
+
+    Returns:
+        JSONResponse مع ETag، أو 304
+    """
+    conditions = [condition for condition in filters if condition is not None]
+    order = _order_by(projection, sort, default_sort)
+    model = projection.model
+
+    summary = select(func.count(model.id), func.max(model.updated_at)).select_from(model)
+    if conditions:
+        summary = summary.where(*conditions)
+    total, last_updated = db.execute(summary).one()
+
+    etag = _etag(request, key, total, last_updated, version)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    statement = projection.select(selected)
+    if conditions:
+        statement = statement.where(*conditions)
+    statement = statement.order_by(*order)
+    if page is not None:
+        statement = statement.offset((page - 1) * page_size).limit(page_size)
+
+    items = projection.to_dicts(db.execute(statement).all(), selected)
+    body: Dict[str, Any] = {key: items, "total": total}
+    if page is not None:
+        body.update({
+            "page": page,
+            "page_size": page_size,
+            "pages": (total + page_size - 1) // page_size
+        })
+    return JSONResponse(content=body, headers=headers)
@@ -33,6 +33,18 @@ class AgentOutput(BaseModel):
         default=False,
         description="هل تم استخدام معلومات من قاعدة البيانات"
     )
+    conversation_id: Optional[str] = Field(
+        default=None,
+        description="معرف سجل المحادثة (قد لا يكون مكتوباً في قاعدة البيانات بعد - راجع conversation_buffer)"
+    )
+    unanswered_question_id: Optional[str] = Field(
+        default=None,
+        description="معرف سجل السؤال غير المُجاب (إذا كانت الرسالة غير مفهومة)"
+    )
+    handoff_id: Optional[str] = Field(
+        default=None,
+        description="معرف سجل التحويل لموظف (إذا احتاجت المحادثة تحويلاً)"
+    )
 
 
 class ConversationMessage(BaseModel):
@@ -0,0 +1,78 @@
+"""
+Keyset pagination على (updated_at, id) - للمزامنة التدريجية (n8n)
+
+- الترتيب ثابت: updated_at ثم id تصاعدياً، فكل صفحة تبدأ بعد آخر صف في الصفحة السابقة
+  (بدون OFFSET، وتكلفة الصفحة لا تعتمد على حجم الجدول مع فهرس (updated_at, id))
+- الـ cursor نص base64 يحوي (updated_at, id) لآخر صف مُرسل؛ يُرجع دائماً حتى في الصفحة الأخيرة
+  ليحفظه العميل ويكمل منه في المزامنة التالية (has_more يوضح إذا كانت هناك صفحات أخرى الآن)
+- updated_since: جلب الصفوف المعدلة بعد وقت معين فقط (أول مزامنة: تاريخ قديم)
+- الصفوف المعدلة خلال آخر PAGINATION_SAFETY_SECONDS لا تُرسل بعد: transaction بدأت قبل
+  الصفحة الحالية قد تكتب updated_at أقدم من الـ cursor بعد قراءته
+"""
+import base64
+import json
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Callable, List, Optional, Tuple
+from fastapi import HTTPException
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Query
+from app.config import get_settings
+
+settings = get_settings()
+
+
+def encode_cursor(updated_at: datetime, row_id: Any) -> str:
+    """إنشاء cursor من آخر صف"""
+    payload = json.dumps([updated_at.isoformat(), str(row_id)])
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, uuid.UUID]:
+    """قراءة cursor (HTTP 400 إذا كان غير صالح)"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        updated_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return datetime.fromisoformat(updated_at), uuid.UUID(row_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="قيمة cursor غير صالحة")
+
+
+def keyset_page(
+    query: Query,
+    model,
+    limit: int,
+    cursor: Optional[str] = None,
+    updated_since: Optional[datetime] = None,
+    execute: Optional[Callable[[Any], List[Any]]] = None
+) -> Tuple[List[Any], Optional[str], bool]:
+    """
+    جلب صفحة مرتبة حسب (updated_at, id)
+
+    Args:
+        query: الاستعلام بعد تطبيق الفلاتر (ORM Query، أو select() مع execute)
+        model: النموذج (يجب أن يحتوي على updated_at و id)
+        limit: عدد الصفوف في الصفحة
+        cursor: cursor الصفحة السابقة (يتقدم على updated_since)
+        updated_since: الصفوف المعدلة بعد هذا الوقت فقط
+        execute: تنفيذ استعلام select() (الصفوف يجب أن تحتوي على updated_at و id)
+
+    Returns:
+        (الصفوف، cursor آخر صف (أو نفس cursor المُرسل إذا لم توجد صفوف)، has_more)
+    """
+    if cursor:
+        last_updated_at, last_id = decode_cursor(cursor)
+        query = query.filter(tuple_(model.updated_at, model.id) > tuple_(last_updated_at, last_id))
+    elif updated_since is not None:
+        query = query.filter(model.updated_at >= updated_since)
+
+    safe_until = datetime.now() - timedelta(seconds=settings.PAGINATION_SAFETY_SECONDS)
+    query = query.filter(model.updated_at <= safe_until)\
+        .order_by(model.updated_at.asc(), model.id.asc())\
+        .limit(limit + 1)
+    rows = execute(query) if execute else query.all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = encode_cursor(rows[-1].updated_at, rows[-1].id) if rows else cursor
+    return rows, next_cursor, has_more
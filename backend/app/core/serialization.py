@@ -0,0 +1,246 @@
+"""
+تحويل الصفوف إلى JSON عبر projections (بدون كيانات ORM)
+
+- كل مورد يعرّف Projection: اسم الحقل في الـ API → عمود (أو عمود من جدول مرتبط عبر outerjoin)
+- الاستعلام يختار الأعمدة المطلوبة فقط بـ select() (لا تُقرأ أعمدة Text الكبيرة غير المطلوبة)
+  والصفوف تُحوّل مباشرة إلى قواميس جاهزة للـ JSON (بدون identity map)
+- المعامل fields= (مفصول بفواصل) يحدد الحقول المطلوبة؛ بدونه تُرجع الحقول الافتراضية للـ endpoint
+"""
+import uuid
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.sql import Select
+from app.db.models import Appointment, Branch, Doctor, FAQ, Service, Offer, Patient, Invoice, Conversation
+
+
+def to_json_value(value: Any) -> Any:
+    """تحويل قيمة من قاعدة البيانات إلى نوع JSON"""
+    if value is None or isinstance(value, (str, int, float, bool, list, dict)):
+        return value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return str(value)
+
+
+class Projection:
+    """الحقول المتاحة لمورد وطريقة قراءتها"""
+
+    def __init__(
+        self,
+        model,
+        columns: Dict[str, Any],
+        joins: Optional[Dict[str, Any]] = None,
+        converters: Optional[Dict[str, Callable[[Any], Any]]] = None
+    ):
+        """
+        Args:
+            model: النموذج الأساسي (FROM)
+            columns: {اسم الحقل: عمود}
+            joins: {اسم الحقل: relationship} للحقول من جداول مرتبطة (outerjoin عند طلبها فقط)
+            converters: {اسم الحقل: دالة تحويل} بدلاً من to_json_value
+        """
+        self.model = model
+        self.columns = columns
+        self.joins = joins or {}
+        self.converters = converters or {}
+
+    def parse_fields(self, fields: Optional[str], default: Sequence[str]) -> List[str]:
+        """
+        قراءة المعامل fields= (HTTP 400 للحقول غير المعروفة)
+
+        Returns:
+            قائمة الحقول المطلوبة بالترتيب (أو default)
+        """
+        if not fields:
+            return list(default)
+        requested = list(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+        unknown = [name for name in requested if name not in self.columns]
+        if unknown:
+            raise HTTPException(
+                status_code=400,
+                detail=f"حقول غير معروفة: {', '.join(unknown)} (المتاح: {', '.join(self.columns)})"
+            )
+        return requested
+
+    def select(self, fields: Sequence[str], include: Iterable[str] = ()) -> Select:
+        """
+        استعلام يختار الحقول المطلوبة فقط
+
+        Args:
+            fields: الحقول المطلوبة
+            include: حقول إضافية يحتاجها الـ endpoint (مثل مفاتيح الـ pagination) ولا تُرسل
+        """
+        names = list(dict.fromkeys([*fields, *include]))
+        statement = select(*[self.columns[name].label(name) for name in names]).select_from(self.model)
+        joined = set()
+        for name in names:
+            relation = self.joins.get(name)
+            # مقارنة relationship بـ == تُنشئ تعبير SQL، لذلك المقارنة بالمفتاح
+            if relation is not None and relation.key not in joined:
+                statement = statement.outerjoin(relation)
+                joined.add(relation.key)
+        return statement
+
+    def to_dict(self, row, fields: Sequence[str]) -> Dict[str, Any]:
+        mapping = row._mapping
+        return {
+            name: self.converters.get(name, to_json_value)(mapping[name])
+            for name in fields
+        }
+
+    def to_dicts(self, rows, fields: Sequence[str]) -> List[Dict[str, Any]]:
+        return [self.to_dict(row, fields) for row in rows]
+
+
+def _tags(value: Any) -> list:
+    return value if isinstance(value, list) else []
+
+
+def _optional_float(value: Any) -> Optional[float]:
+    return float(value) if value is not None else None
+
+
+# ==================== Projections ====================
+
+BRANCHES = Projection(Branch, {
+    "id": Branch.id,
+    "name": Branch.name,
+    "city": Branch.city,
+    "address": Branch.address,
+    "location_url": Branch.location_url,
+    "phone": Branch.phone,
+    "working_hours": Branch.working_hours,
+    "is_active": Branch.is_active,
+    "created_at": Branch.created_at,
+    "updated_at": Branch.updated_at,
+})
+
+DOCTORS = Projection(Doctor, {
+    "id": Doctor.id,
+    "name": Doctor.name,
+    "specialty": Doctor.specialty,
+    "license_number": Doctor.license_number,
+    "phone_number": Doctor.phone_number,
+    "email": Doctor.email,
+    "bio": Doctor.bio,
+    "qualifications": Doctor.qualifications,
+    "experience_years": Doctor.experience_years,
+    "working_hours": Doctor.working_hours,
+    "branch_id": Doctor.branch_id,
+    "is_active": Doctor.is_active,
+    "created_at": Doctor.created_at,
+    "updated_at": Doctor.updated_at,
+})
+
+SERVICES = Projection(Service, {
+    "id": Service.id,
+    "name": Service.name,
+    "description": Service.description,
+    "base_price": Service.base_price,
+    "is_active": Service.is_active,
+    "created_at": Service.created_at,
+    "updated_at": Service.updated_at,
+}, converters={"base_price": _optional_float})
+
+FAQS = Projection(FAQ, {
+    "id": FAQ.id,
+    "question": FAQ.question,
+    "answer": FAQ.answer,
+    "tags": FAQ.tags,
+    "is_active": FAQ.is_active,
+    "created_at": FAQ.created_at,
+    "updated_at": FAQ.updated_at,
+}, converters={"tags": _tags})
+
+OFFERS = Projection(Offer, {
+    "id": Offer.id,
+    "title": Offer.title,
+    "description": Offer.description,
+    "discount_type": Offer.discount_type,
+    "discount_value": Offer.discount_value,
+    "start_date": Offer.start_date,
+    "end_date": Offer.end_date,
+    "related_service_id": Offer.related_service_id,
+    "is_active": Offer.is_active,
+    "created_at": Offer.created_at,
+    "updated_at": Offer.updated_at,
+}, converters={"discount_value": _optional_float})
+
+APPOINTMENTS = Projection(Appointment, {
+    "id": Appointment.id,
+    "patient_name": Appointment.patient_name,
+    "phone": Appointment.phone,
+    "patient_id": Appointment.patient_id,
+    "branch_id": Appointment.branch_id,
+    "branch_name": Branch.name,
+    "doctor_id": Appointment.doctor_id,
+    "doctor_name": Doctor.name,
+    "service_id": Appointment.service_id,
+    "service_name": Service.name,
+    "datetime": Appointment.datetime,
+    "channel": Appointment.channel,
+    "status": Appointment.status,
+    "appointment_type": Appointment.appointment_type,
+    "notes": Appointment.notes,
+    "created_at": Appointment.created_at,
+    "updated_at": Appointment.updated_at,
+}, joins={
+    "branch_name": Appointment.branch,
+    "doctor_name": Appointment.doctor,
+    "service_name": Appointment.service,
+})
+
+PATIENTS = Projection(Patient, {
+    "id": Patient.id,
+    "full_name": Patient.full_name,
+    "date_of_birth": Patient.date_of_birth,
+    "gender": Patient.gender,
+    "phone_number": Patient.phone_number,
+    "email": Patient.email,
+    "address": Patient.address,
+    "medical_history": Patient.medical_history,
+    "emergency_contact_name": Patient.emergency_contact_name,
+    "emergency_contact_phone": Patient.emergency_contact_phone,
+    "notes": Patient.notes,
+    "is_active": Patient.is_active,
+    "created_at": Patient.created_at,
+    "updated_at": Patient.updated_at,
+})
+
+INVOICES = Projection(Invoice, {
+    "id": Invoice.id,
+    "invoice_number": Invoice.invoice_number,
+    "patient_id": Invoice.patient_id,
+    "appointment_id": Invoice.appointment_id,
+    "invoice_date": Invoice.invoice_date,
+    "sub_total": Invoice.subtotal,
+    "discount_amount": Invoice.discount,
+    "tax_amount": Invoice.tax,
+    "total_amount": Invoice.total_amount,
+    "payment_status": Invoice.payment_status,
+    "payment_method": Invoice.payment_method,
+    "notes": Invoice.notes,
+    "created_at": Invoice.created_at,
+    "updated_at": Invoice.updated_at,
+})
+
+CONVERSATIONS = Projection(Conversation, {
+    "id": Conversation.id,
+    "user_id": Conversation.user_id,
+    "channel": Conversation.channel,
+    "user_message": Conversation.user_message,
+    "bot_reply": Conversation.bot_reply,
+    "intent": Conversation.intent,
+    "db_context_used": Conversation.db_context_used,
+    "unrecognized": Conversation.unrecognized,
+    "needs_handoff": Conversation.needs_handoff,
+    "created_at": Conversation.created_at,
+    "updated_at": Conversation.updated_at,
+})
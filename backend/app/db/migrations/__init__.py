@@ -0,0 +1,265 @@
+"""
+ترحيلات قاعدة البيانات ذات الإصدارات (schema migrations)
+
+- كل ترحيل ملف في هذا المجلد باسم mNNNN_وصف.py يعرّف upgrade(connection)
+  (و TRANSACTIONAL = False للترحيلات التي تُنشئ فهارس CONCURRENTLY)
+- الإصدارات المطبقة محفوظة في جدول schema_migrations
+- upgrade(): استعلام واحد (max(version)) إذا كانت قاعدة البيانات على آخر إصدار - بدون فحص الجداول؛
+  وإلا advisory lock في PostgreSQL (عند تشغيل عدة workers معاً ينفذ واحد فقط والباقي ينتظر ثم يجد
+  قاعدة البيانات محدثة) ثم تطبيق الترحيلات الناقصة بالترتيب، كل ترحيل في transaction خاصة به
+- قاعدة بيانات جديدة تُنشأ جداولها من النماذج في الترحيل الأول (create_all)، لذلك الترحيلات اللاحقة
+  يجب أن تكون آمنة إذا كان التعديل موجوداً مسبقاً (add_column / create_index أدناه تتحقق من ذلك)
+
+الاستخدام: python scripts/migrate.py [status | upgrade]
+"""
+import importlib
+import logging
+import pkgutil
+import re
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Set
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, inspect, insert, select, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from app.config import get_settings
+from app.db.session import engine
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+# مفتاح advisory lock في PostgreSQL (ترحيل واحد فقط بين جميع الـ workers)
+_MIGRATION_LOCK_KEY = 7_310_047
+_MODULE_NAME = re.compile(r"^m(\d{4})_\w+$")
+
+# خارج Base.metadata: ليس جزءاً من نماذج التطبيق
+schema_migrations = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("version", Integer, primary_key=True, comment="رقم الترحيل"),
+    Column("name", String, nullable=False, comment="اسم ملف الترحيل"),
+    Column("applied_at", DateTime, nullable=False, server_default=func.now(), comment="وقت التطبيق"),
+    Column("duration_ms", Integer, nullable=True, comment="مدة التطبيق"),
+)
+
+
+@dataclass
+class Migration:
+    """ترحيل واحد"""
+    version: int
+    name: str
+    description: str
+    upgrade: Callable[[Connection], None]
+    transactional: bool = True
+
+
+@lru_cache()
+def load_migrations() -> List[Migration]:
+    """الترحيلات المعرّفة في هذا المجلد مرتبة بالإصدار"""
+    migrations = []
+    for module_info in pkgutil.iter_modules(__path__):
+        match = _MODULE_NAME.match(module_info.name)
+        if not match:
+            continue
+        module = importlib.import_module(f"{__name__}.{module_info.name}")
+        migrations.append(Migration(
+            version=int(match.group(1)),
+            name=module_info.name,
+            description=(module.__doc__ or "").strip().split("\n")[0],
+            upgrade=module.upgrade,
+            transactional=getattr(module, "TRANSACTIONAL", True),
+        ))
+    migrations.sort(key=lambda migration: migration.version)
+    versions = [migration.version for migration in migrations]
+    if len(versions) != len(set(versions)):
+        raise RuntimeError(f"أرقام ترحيلات مكررة: {versions}")
+    return migrations
+
+
+def head_version() -> int:
+    """آخر إصدار معرّف"""
+    migrations = load_migrations()
+    return migrations[-1].version if migrations else 0
+
+
+def current_version() -> int:
+    """آخر إصدار مطبق (0 إذا لم يوجد جدول schema_migrations) - استعلام واحد"""
+    try:
+        with engine.connect() as connection:
+            return connection.execute(select(func.max(schema_migrations.c.version))).scalar() or 0
+    except (OperationalError, ProgrammingError):
+        return 0
+
+
+def _applied(connection: Connection) -> Dict[int, Dict[str, Any]]:
+    rows = connection.execute(select(schema_migrations)).mappings().all()
+    return {row["version"]: dict(row) for row in rows}
+
+
+def _lock():
+    """advisory lock (ينتظر إذا كان worker آخر يطبق الترحيلات) - None خارج PostgreSQL"""
+    if engine.dialect.name != "postgresql":
+        return None
+    connection = engine.connect()
+    if not settings.DB_PGBOUNCER:
+        connection = connection.execution_options(isolation_level="AUTOCOMMIT")
+    # عبر PgBouncer (transaction pooling) transaction مفتوحة تُبقي القفل على نفس اتصال الخادم
+    connection.execute(text("SELECT pg_advisory_lock(:key)"), {"key": _MIGRATION_LOCK_KEY})
+    return connection
+
+
+def _unlock(connection):
+    if connection is not None:
+        connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": _MIGRATION_LOCK_KEY})
+        connection.close()
+
+
+def _apply(migration: Migration):
+    started = time.perf_counter()
+    if migration.transactional:
+        with engine.begin() as connection:
+            migration.upgrade(connection)
+            duration_ms = int((time.perf_counter() - started) * 1000)
+            connection.execute(insert(schema_migrations).values(
+                version=migration.version, name=migration.name, applied_at=datetime.now(), duration_ms=duration_ms
+            ))
+    else:
+        # CREATE INDEX CONCURRENTLY لا يعمل داخل transaction
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            migration.upgrade(connection)
+            duration_ms = int((time.perf_counter() - started) * 1000)
+            connection.execute(insert(schema_migrations).values(
+                version=migration.version, name=migration.name, applied_at=datetime.now(), duration_ms=duration_ms
+            ))
+    logger.info(f"✅ Migration {migration.name} applied in {duration_ms} ms")
+    return duration_ms
+
+
+def upgrade(target: Optional[int] = None) -> Dict[str, Any]:
+    """
+    تطبيق الترحيلات الناقصة حتى target (افتراضياً آخر إصدار)
+
+    Returns:
+        {"previous", "current", "head", "applied": [{"version", "name", "duration_ms"}]}
+    """
+    head = head_version()
+    target = head if target is None else min(target, head)
+    previous = current_version()
+    if previous >= target:
+        # المسار المعتاد عند التشغيل: استعلام واحد
+        return {"previous": previous, "current": previous, "head": head, "applied": []}
+
+    lock = _lock()
+    applied = []
+    try:
+        schema_migrations.create(engine, checkfirst=True)
+        with engine.connect() as connection:
+            done = _applied(connection)
+        for migration in load_migrations():
+            if migration.version > target or migration.version in done:
+                continue
+            logger.info(f"🔄 Applying migration {migration.name}...")
+            duration_ms = _apply(migration)
+            applied.append({"version": migration.version, "name": migration.name, "duration_ms": duration_ms})
+    finally:
+        _unlock(lock)
+
+    return {"previous": previous, "current": current_version(), "head": head, "applied": applied}
+
+
+def migration_status() -> Dict[str, Any]:
+    """الإصدار الحالي والترحيلات المطبقة والناقصة"""
+    try:
+        with engine.connect() as connection:
+            done = _applied(connection)
+    except (OperationalError, ProgrammingError):
+        done = {}
+    migrations = load_migrations()
+    return {
+        "current": max(done) if done else 0,
+        "head": head_version(),
+        "applied": [
+            {
+                "version": version,
+                "name": row["name"],
+                "applied_at": row["applied_at"].isoformat() if row["applied_at"] else None,
+                "duration_ms": row["duration_ms"],
+            }
+            for version, row in sorted(done.items())
+        ],
+        "pending": [
+            {"version": migration.version, "name": migration.name, "description": migration.description}
+            for migration in migrations if migration.version not in done
+        ],
+    }
+
+
+# ==================== أدوات للترحيلات ====================
+
+def has_table(connection: Connection, table: str) -> bool:
+    return inspect(connection).has_table(table)
+
+
+def column_names(connection: Connection, table: str) -> List[str]:
+    return [column["name"] for column in inspect(connection).get_columns(table)]
+
+
+def add_column(connection: Connection, table: str, column: Column):
+    """إضافة عمود (بنوعه في النموذج) إذا لم يكن موجوداً"""
+    if not has_table(connection, table) or column.name in column_names(connection, table):
+        return False
+    column_type = column.type.compile(dialect=connection.dialect)
+    connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {column.name} {column_type}"))
+    logger.info(f"➕ {table}.{column.name} added")
+    return True
+
+
+def invalid_indexes(connection: Connection) -> Set[str]:
+    """
+    أسماء الفهارس INVALID في PostgreSQL (CREATE INDEX CONCURRENTLY فشل أو توقف)
+
+    الفهرس INVALID موجود بالاسم لكن المخطط لا يستخدمه، و IF NOT EXISTS لا يعيد بناءه - يجب حذفه أولاً
+    """
+    if connection.dialect.name != "postgresql":
+        return set()
+    return set(connection.execute(text(
+        "SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE NOT i.indisvalid"
+    )).scalars())
+
+
+def _partitioned(connection: Connection, table: str) -> bool:
+    return connection.execute(
+        text("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table)"), {"table": table}
+    ).first() is not None
+
+
+def create_index(
+    connection: Connection, name: str, table: str, columns: str, where: Optional[str] = None, unique: bool = False
+):
+    """
+    إنشاء فهرس إذا لم يكن موجوداً
+
+    في PostgreSQL بـ CONCURRENTLY (بدون قفل الكتابة على الجدول؛ يتطلب ترحيلاً بـ TRANSACTIONAL = False)،
+    وفهرس INVALID متبقٍ من محاولة فاشلة سابقة يُحذف أولاً
+    """
+    if not has_table(connection, table):
+        return False
+    condition = f" WHERE {where}" if where else ""
+    kind = "UNIQUE INDEX" if unique else "INDEX"
+    if connection.dialect.name != "postgresql":
+        connection.execute(text(f"CREATE {kind} IF NOT EXISTS {name} ON {table} ({columns}){condition}"))
+        return True
+
+    invalid = name in invalid_indexes(connection)
+    autocommit = connection.get_execution_options().get("isolation_level") == "AUTOCOMMIT"
+    concurrently = " CONCURRENTLY" if autocommit else ""
+    if invalid:
+        connection.execute(text(f"DROP INDEX{concurrently} IF EXISTS {name}"))
+    # PostgreSQL لا يدعم CONCURRENTLY على الجدول الأب المقسم
+    if _partitioned(connection, table):
+        concurrently = ""
+    connection.execute(text(f"CREATE {kind}{concurrently} IF NOT EXISTS {name} ON {table} ({columns}){condition}"))
+    return True
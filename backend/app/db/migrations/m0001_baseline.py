@@ -0,0 +1,48 @@
+"""
+الجداول من النماذج + الأعمدة التي كانت تُضاف يدوياً في /admin/db/init و migrate_conversations_table.py
+
+قاعدة بيانات جديدة: create_all يُنشئ كل الجداول بشكلها الحالي والتعديلات أدناه لا تفعل شيئاً.
+قاعدة بيانات قديمة: الجداول الناقصة تُنشأ والأعمدة القديمة تُعاد تسميتها أو تُضاف أو تُحذف مرة واحدة.
+"""
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from app.db.base import Base
+from app.db.migrations import add_column, column_names, has_table
+import app.db.models  # noqa: F401 - تسجيل النماذج في Base.metadata
+from app.db.models import Appointment, Conversation, Doctor
+
+# أعمدة محادثات قديمة (قبل إزالة RAG والتقييمات)
+_OBSOLETE_CONVERSATION_COLUMNS = [
+    "rag_used",
+    "satisfaction_score",
+    "quality_score",
+    "relevance_score",
+    "accuracy_score",
+    "completeness_score",
+    "clarity_score",
+]
+
+
+def upgrade(connection: Connection):
+    Base.metadata.create_all(bind=connection)
+
+    if has_table(connection, "conversations"):
+        columns = column_names(connection, "conversations")
+        for old, new in (("last_message", "user_message"), ("reply_text", "bot_reply")):
+            if old in columns and new not in columns:
+                connection.execute(text(f"ALTER TABLE conversations RENAME COLUMN {old} TO {new}"))
+        for column in (Conversation.user_message, Conversation.bot_reply, Conversation.db_context_used):
+            add_column(connection, "conversations", column.property.columns[0])
+        columns = column_names(connection, "conversations")
+        for column in _OBSOLETE_CONVERSATION_COLUMNS:
+            if column in columns:
+                connection.execute(text(f"ALTER TABLE conversations DROP COLUMN {column}"))
+
+    for column in (
+        Doctor.license_number, Doctor.phone_number, Doctor.email,
+        Doctor.qualifications, Doctor.experience_years, Doctor.working_hours,
+    ):
+        add_column(connection, "doctors", column.property.columns[0])
+
+    for column in (Appointment.patient_id, Appointment.appointment_type):
+        add_column(connection, "appointments", column.property.columns[0])
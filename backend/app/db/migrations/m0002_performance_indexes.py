@@ -0,0 +1,47 @@
+"""
+فهارس الأداء (كانت تُنشأ في /admin/db/init) - CONCURRENTLY في PostgreSQL بدون قفل الكتابة
+
+الفهارس المعرّفة في النماذج (__table_args__) موجودة مسبقاً في قواعد البيانات الجديدة؛
+هنا تُضاف لقواعد البيانات القائمة.
+"""
+from sqlalchemy.engine import Connection
+from app.db.migrations import create_index
+
+TRANSACTIONAL = False
+
+# (الاسم، الجدول، الأعمدة، الشرط)
+INDEXES = [
+    ("idx_conversations_user_channel_created", "conversations", "user_id, channel, created_at DESC", None),
+    ("idx_conversations_channel_created", "conversations", "channel, created_at", None),
+    ("idx_conversations_created_at", "conversations", "created_at DESC", None),
+    ("idx_conversations_channel", "conversations", "channel", None),
+    ("idx_conversations_intent", "conversations", "intent", None),
+    ("idx_conversations_updated_at_id", "conversations", "updated_at, id", None),
+    ("idx_branches_is_active", "branches", "is_active", "is_active = true"),
+    ("idx_services_is_active", "services", "is_active", "is_active = true"),
+    ("idx_doctors_is_active", "doctors", "is_active", "is_active = true"),
+    ("idx_faqs_is_active", "faqs", "is_active", "is_active = true"),
+    ("idx_offers_is_active", "offers", "is_active", "is_active = true"),
+    ("idx_document_chunks_document_id", "document_chunks", "document_id", None),
+    ("idx_appointments_datetime", "appointments", "datetime", None),
+    ("idx_appointments_status", "appointments", "status", None),
+    ("idx_appointments_doctor_datetime", "appointments", "doctor_id, datetime", None),
+    ("idx_appointments_updated_at_id", "appointments", "updated_at, id", None),
+    ("idx_appointments_patient_id", "appointments", "patient_id", "patient_id IS NOT NULL"),
+    ("idx_invoices_updated_at_id", "invoices", "updated_at, id", None),
+    ("idx_invoices_patient_id", "invoices", "patient_id", None),
+    ("idx_invoices_payment_status", "invoices", "payment_status", None),
+    ("idx_invoices_invoice_date", "invoices", "invoice_date DESC", None),
+    ("idx_patients_updated_at_id", "patients", "updated_at, id", None),
+    ("idx_patients_phone_number", "patients", "phone_number", None),
+    ("idx_doctors_updated_at_id", "doctors", "updated_at, id", None),
+    ("idx_doctors_license_number", "doctors", "license_number", "license_number IS NOT NULL"),
+    ("idx_treatments_patient_id", "treatments", "patient_id", None),
+    ("idx_treatments_treatment_date", "treatments", "treatment_date DESC", None),
+    ("idx_employees_position", "employees", "position", None),
+]
+
+
+def upgrade(connection: Connection):
+    for name, table, columns, where in INDEXES:
+        create_index(connection, name, table, columns, where)
@@ -0,0 +1,34 @@
+"""
+فهرس فريد جزئي على (doctor_id, datetime) للمواعيد النشطة - منع حجز نفس وقت الطبيب مرتين
+
+إذا وُجدت مواعيد مكررة مسبقاً لا يُنشأ الفهرس (تحذير في السجل)؛ القفل في
+app/services/availability_service.py (lock_booking) يبقى يحمي الحجوزات الجديدة
+"""
+import logging
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from app.db.migrations import create_index, has_table
+from app.db.models.appointment import ACTIVE_DOCTOR_SLOT_INDEX, ACTIVE_DOCTOR_SLOT_WHERE
+
+logger = logging.getLogger(__name__)
+
+TRANSACTIONAL = False
+
+
+def upgrade(connection: Connection):
+    if not has_table(connection, "appointments"):
+        return
+    duplicates = connection.execute(text(
+        f"SELECT count(*) FROM (SELECT doctor_id, datetime FROM appointments WHERE {ACTIVE_DOCTOR_SLOT_WHERE} "
+        f"GROUP BY doctor_id, datetime HAVING count(*) > 1) AS duplicated"
+    )).scalar()
+    if duplicates:
+        logger.warning(
+            f"⚠️  {duplicates} doctor slots are booked more than once - "
+            f"{ACTIVE_DOCTOR_SLOT_INDEX} not created (resolve them and create it manually)"
+        )
+        return
+    create_index(
+        connection, ACTIVE_DOCTOR_SLOT_INDEX, "appointments", "doctor_id, datetime",
+        where=ACTIVE_DOCTOR_SLOT_WHERE, unique=True
+    )
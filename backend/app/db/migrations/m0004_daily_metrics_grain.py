@@ -0,0 +1,33 @@
+"""
+فهارس فريدة على مفتاح التجميع في daily_metrics (upsert بدلاً من الحذف ثم الإدراج)
+
+تحديثان متزامنان سابقاً قد يكونان كتبا صفوفاً مكررة؛ daily_metrics بيانات مشتقة، لذلك إذا وُجد تكرار
+تُحذف الجدول وحالة التجميع فيُعاد بناؤه بالكامل في التحديث التالي
+"""
+import logging
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from app.db.migrations import create_index, has_table
+
+logger = logging.getLogger(__name__)
+
+
+def upgrade(connection: Connection):
+    if not has_table(connection, "daily_metrics"):
+        return
+    duplicates = connection.execute(text(
+        "SELECT count(*) FROM (SELECT day, channel, branch_id FROM daily_metrics "
+        "GROUP BY day, channel, branch_id HAVING count(*) > 1) AS duplicated"
+    )).scalar()
+    if duplicates:
+        logger.warning(f"⚠️  {duplicates} duplicated daily_metrics keys - daily metrics will be rebuilt")
+        connection.execute(text("DELETE FROM daily_metrics"))
+        connection.execute(text("DELETE FROM rollup_state WHERE name LIKE 'daily_metrics:%'"))
+    create_index(
+        connection, "uq_daily_metrics_grain", "daily_metrics", "day, channel, branch_id",
+        where="branch_id IS NOT NULL", unique=True
+    )
+    create_index(
+        connection, "uq_daily_metrics_grain_no_branch", "daily_metrics", "day, channel",
+        where="branch_id IS NULL", unique=True
+    )
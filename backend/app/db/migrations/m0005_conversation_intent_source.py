@@ -0,0 +1,13 @@
+"""
+عمود conversations.intent_source - مصدر النية المحفوظة (keywords أو model أو human)
+
+تدريب المصنف (scripts/train_intent_classifier.py) لا يستخدم تنبؤات المصنف نفسه كتسميات؛
+السجلات السابقة (بدون مصدر) تُعامل كتنبؤات
+"""
+from sqlalchemy.engine import Connection
+from app.db.migrations import add_column
+from app.db.models import Conversation
+
+
+def upgrade(connection: Connection):
+    add_column(connection, "conversations", Conversation.intent_source.property.columns[0])
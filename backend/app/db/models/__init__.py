@@ -16,6 +16,10 @@ from .patient import Patient
 from .treatment import Treatment
 from .invoice import Invoice
 from .employee import Employee
+from .daily_metric import DailyMetric
+from .rollup_state import RollupState
+from .outbox_event import OutboxEvent
+from .import_job import ImportJob
 
 __all__ = [
     "Conversation",
@@ -33,6 +37,10 @@ __all__ = [
     "Treatment",
     "Invoice",
     "Employee",
+    "DailyMetric",
+    "RollupState",
+    "OutboxEvent",
+    "ImportJob",
 ]
 
 
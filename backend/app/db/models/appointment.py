@@ -1,15 +1,32 @@
 """
 نموذج المواعيد - جدول appointments
 """
-from sqlalchemy import Column, String, Text, Boolean, DateTime, ForeignKey, func
+from sqlalchemy import Column, String, Text, Boolean, DateTime, ForeignKey, Index, func, text
 from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import relationship
 import uuid
 from app.db.base import Base
 
+# المواعيد التي تحجز وقت الطبيب (راجع INACTIVE_STATUSES في app/services/availability_service.py)
+ACTIVE_DOCTOR_SLOT_WHERE = (
+    "doctor_id IS NOT NULL AND (status IS NULL OR status NOT IN ('cancelled', 'canceled', 'no_show'))"
+)
+# الفهرس الفريد على وقت الطبيب (اسمه يميز الحجز المتزامن عن أخطاء IntegrityError الأخرى)
+ACTIVE_DOCTOR_SLOT_INDEX = "uq_appointments_doctor_datetime_active"
+
 
 class Appointment(Base):
     """نموذج الموعد - يمثل موعداً في عيادات عادل كير"""
     __tablename__ = "appointments"
+    __table_args__ = (
+        # مواعيد الطبيب في فترة (التعارضات، قوائم المواعيد حسب الطبيب)
+        Index("idx_appointments_doctor_datetime", "doctor_id", "datetime"),
+        # حماية من حجز نفس وقت الطبيب مرتين من workers مختلفة
+        Index(
+            ACTIVE_DOCTOR_SLOT_INDEX, "doctor_id", "datetime", unique=True,
+            postgresql_where=text(ACTIVE_DOCTOR_SLOT_WHERE), sqlite_where=text(ACTIVE_DOCTOR_SLOT_WHERE)
+        ),
+    )
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, comment="معرف الموعد")
     patient_id = Column(UUID(as_uuid=True), ForeignKey("patients.id"), nullable=True, comment="معرف المريض")
@@ -25,3 +42,9 @@ class Appointment(Base):
     notes = Column(Text, nullable=True, comment="ملاحظات")
     created_at = Column(DateTime, server_default=func.now(), nullable=False, comment="تاريخ الإنشاء")
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now(), nullable=False, comment="تاريخ آخر تحديث")
+
+    # للقراءة مع joinedload / outerjoin (راجع قوائم المواعيد والتصدير) - تجنب التحميل لكل صف
+    patient = relationship("Patient")
+    branch = relationship("Branch")
+    doctor = relationship("Doctor")
+    service = relationship("Service")
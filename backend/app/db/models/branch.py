@@ -1,7 +1,7 @@
 """
 نموذج الفروع - جدول branches
 """
-from sqlalchemy import Column, String, Text, Boolean, DateTime, JSON, func
+from sqlalchemy import Column, String, Text, Boolean, DateTime, JSON, Index, text, func
 from sqlalchemy.dialects.postgresql import UUID
 import uuid
 from app.db.base import Base
@@ -10,6 +10,9 @@ from app.db.base import Base
 class Branch(Base):
     """نموذج الفرع - يمثل فرعاً للعيادة"""
     __tablename__ = "branches"
+    __table_args__ = (
+        Index("idx_branches_is_active", "is_active", postgresql_where=text("is_active = true")),
+    )
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, comment="معرف الفرع")
     name = Column(String, nullable=False, unique=True, index=True, comment="اسم الفرع")
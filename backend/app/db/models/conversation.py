@@ -1,7 +1,7 @@
 """
 نموذج المحادثات - جدول conversations
 """
-from sqlalchemy import Column, String, DateTime, Text, Boolean, Float, func
+from sqlalchemy import Column, String, DateTime, Text, Boolean, Float, Index, func
 from sqlalchemy.dialects.postgresql import UUID
 import uuid
 from app.db.base import Base
@@ -10,6 +10,14 @@ from app.db.base import Base
 class Conversation(Base):
     """نموذج المحادثة - يمثل سجل محادثة مع البوت"""
     __tablename__ = "conversations"
+    __table_args__ = (
+        # سجل المحادثة في agent._load_conversation_history
+        Index("idx_conversations_user_channel_created", "user_id", "channel", "created_at"),
+        # قوائم المحادثات لقناة مرتبة بالتاريخ (n8n ولوحة التحكم)
+        Index("idx_conversations_channel_created", "channel", "created_at"),
+        # نطاقات التاريخ (التحليلات، التجميعات اليومية، الاحتفاظ)
+        Index("idx_conversations_created_at", "created_at"),
+    )
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, comment="معرف المحادثة")
     user_id = Column(String, nullable=False, index=True, comment="معرف المستخدم")
@@ -17,6 +25,7 @@ class Conversation(Base):
     user_message = Column(Text, nullable=False, comment="رسالة المستخدم")
     bot_reply = Column(Text, nullable=False, comment="رد البوت")
     intent = Column(String, nullable=True, comment="النية المكتشفة")
+    intent_source = Column(String, nullable=True, comment="مصدر النية (keywords: قواعد الكلمات المفتاحية، model: المصنف، human: مراجعة موظف)")
     db_context_used = Column(Boolean, default=False, comment="هل تم استخدام معلومات من قاعدة البيانات")
     unrecognized = Column(Boolean, default=False, comment="هل الرسالة لم تُفهم؟")
     needs_handoff = Column(Boolean, default=False, comment="هل تحتاج المحادثة لتحويل لموظف بشري؟")
@@ -0,0 +1,42 @@
+"""
+نموذج المقاييس اليومية - جدول daily_metrics (تجميعات يومية محدثة تدريجياً)
+"""
+from sqlalchemy import Column, String, Integer, Float, Date, DateTime, JSON, Index, func, text
+from sqlalchemy.dialects.postgresql import UUID
+import uuid
+from app.db.base import Base
+
+
+class DailyMetric(Base):
+    """مقاييس يوم واحد لقناة وفرع (راجع app/services/rollup_service.py)"""
+    __tablename__ = "daily_metrics"
+    __table_args__ = (
+        Index("idx_daily_metrics_day_channel_branch", "day", "channel", "branch_id"),
+        # مفتاح التجميع فريد (upsert في rollup_service)؛ NULL لا يتعارض في الفهرس الفريد لذلك فهرسان جزئيان
+        Index(
+            "uq_daily_metrics_grain", "day", "channel", "branch_id", unique=True,
+            postgresql_where=text("branch_id IS NOT NULL"), sqlite_where=text("branch_id IS NOT NULL")
+        ),
+        Index(
+            "uq_daily_metrics_grain_no_branch", "day", "channel", unique=True,
+            postgresql_where=text("branch_id IS NULL"), sqlite_where=text("branch_id IS NULL")
+        ),
+    )
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, comment="معرف السجل")
+    day = Column(Date, nullable=False, comment="اليوم")
+    channel = Column(String, nullable=False, default="", comment="القناة (فارغ للفواتير غير المرتبطة بقناة)")
+    branch_id = Column(UUID(as_uuid=True), nullable=True, comment="معرف الفرع (فارغ للمحادثات)")
+    conversations = Column(Integer, nullable=False, default=0, comment="عدد المحادثات")
+    unrecognized = Column(Integer, nullable=False, default=0, comment="عدد الرسائل غير المفهومة")
+    handoffs = Column(Integer, nullable=False, default=0, comment="عدد التحويلات لموظفين")
+    intents = Column(JSON, nullable=True, comment="عدد المحادثات لكل نية (JSON)")
+    appointments_total = Column(Integer, nullable=False, default=0, comment="عدد المواعيد المحجوزة")
+    appointments_pending = Column(Integer, nullable=False, default=0, comment="المواعيد المعلقة")
+    appointments_confirmed = Column(Integer, nullable=False, default=0, comment="المواعيد المؤكدة")
+    appointments_completed = Column(Integer, nullable=False, default=0, comment="المواعيد المكتملة")
+    appointments_cancelled = Column(Integer, nullable=False, default=0, comment="المواعيد الملغاة")
+    invoices_count = Column(Integer, nullable=False, default=0, comment="عدد الفواتير")
+    invoices_paid = Column(Integer, nullable=False, default=0, comment="عدد الفواتير المدفوعة")
+    invoices_total_amount = Column(Float, nullable=False, default=0.0, comment="إجمالي مبالغ الفواتير")
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now(), nullable=False, comment="تاريخ آخر تحديث")
@@ -1,7 +1,7 @@
 """
 نموذج الأطباء - جدول doctors
 """
-from sqlalchemy import Column, String, Text, Boolean, DateTime, JSON, func
+from sqlalchemy import Column, String, Text, Boolean, DateTime, JSON, Index, text, func
 from sqlalchemy.dialects.postgresql import UUID
 import uuid
 from app.db.base import Base
@@ -10,6 +10,9 @@ from app.db.base import Base
 class Doctor(Base):
     """نموذج الطبيب - يمثل طبيباً في عيادات عادل كير"""
     __tablename__ = "doctors"
+    __table_args__ = (
+        Index("idx_doctors_is_active", "is_active", postgresql_where=text("is_active = true")),
+    )
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, comment="معرف الطبيب")
     name = Column(String, nullable=False, index=True, comment="اسم الطبيب")
@@ -1,7 +1,7 @@
 """
 نموذج الأسئلة الشائعة - جدول faqs
 """
-from sqlalchemy import Column, String, Text, Boolean, DateTime, func
+from sqlalchemy import Column, String, Text, Boolean, DateTime, Index, text, func
 from sqlalchemy.dialects.postgresql import JSON
 from sqlalchemy.dialects.postgresql import UUID
 import uuid
@@ -11,6 +11,9 @@ from app.db.base import Base
 class FAQ(Base):
     """نموذج السؤال الشائع"""
     __tablename__ = "faqs"
+    __table_args__ = (
+        Index("idx_faqs_is_active", "is_active", postgresql_where=text("is_active = true")),
+    )
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, comment="معرف السؤال")
     question = Column(Text, nullable=False, comment="السؤال")
@@ -0,0 +1,29 @@
+"""
+نموذج مهام الاستيراد - جدول import_jobs (استيراد CSV في الخلفية)
+"""
+from sqlalchemy import Column, String, Text, Integer, BigInteger, DateTime, JSON, func
+from sqlalchemy.dialects.postgresql import UUID
+import uuid
+from app.db.base import Base
+
+
+class ImportJob(Base):
+    """مهمة استيراد CSV تُنفذ في الخلفية (راجع app/services/import_jobs.py)"""
+    __tablename__ = "import_jobs"
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, comment="معرف المهمة")
+    status = Column(String, nullable=False, default="queued", index=True, comment="الحالة (queued, running, completed, failed)")
+    mode = Column(String, nullable=False, default="skip", comment="طريقة التعامل مع الموجود (skip, update)")
+    files = Column(JSON, nullable=True, comment="الملفات المرفوعة ({الجدول: اسم الملف})")
+    current_entity = Column(String, nullable=True, comment="الجدول الجاري استيراده")
+    total_bytes = Column(BigInteger, nullable=False, default=0, comment="حجم الملفات")
+    processed_bytes = Column(BigInteger, nullable=False, default=0, comment="الحجم المقروء حتى الآن")
+    rows_processed = Column(Integer, nullable=False, default=0, comment="عدد الصفوف المقروءة")
+    errors = Column(JSON, nullable=True, comment="أخطاء الصفوف (أول IMPORT_MAX_ERRORS)")
+    error_count = Column(Integer, nullable=False, default=0, comment="عدد أخطاء الصفوف")
+    result = Column(JSON, nullable=True, comment="تقرير الاستيراد (الأعداد والأزمنة)")
+    error = Column(Text, nullable=True, comment="سبب فشل المهمة")
+    created_at = Column(DateTime, server_default=func.now(), nullable=False, comment="تاريخ الإنشاء")
+    started_at = Column(DateTime, nullable=True, comment="بداية التنفيذ")
+    finished_at = Column(DateTime, nullable=True, comment="نهاية التنفيذ")
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now(), nullable=False, comment="آخر تحديث للتقدم")
@@ -1,7 +1,7 @@
 """
 نموذج العروض - جدول offers
 """
-from sqlalchemy import Column, String, Text, Boolean, Float, DateTime, func, ForeignKey
+from sqlalchemy import Column, String, Text, Boolean, Float, DateTime, Index, text, func, ForeignKey
 from sqlalchemy.dialects.postgresql import UUID
 import uuid
 from app.db.base import Base
@@ -10,6 +10,9 @@ from app.db.base import Base
 class Offer(Base):
     """نموذج العرض - يمثل عرضاً خاصاً تقدمه العيادة"""
     __tablename__ = "offers"
+    __table_args__ = (
+        Index("idx_offers_is_active", "is_active", postgresql_where=text("is_active = true")),
+    )
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, comment="معرف العرض")
     title = Column(String, nullable=False, index=True, comment="عنوان العرض")
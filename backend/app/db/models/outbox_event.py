@@ -0,0 +1,26 @@
+"""
+نموذج أحداث الـ outbox - جدول outbox_events (تغييرات تُرسل إلى n8n عبر webhooks)
+"""
+from sqlalchemy import Column, String, Text, Integer, BigInteger, DateTime, JSON, Index, func
+from app.db.base import Base
+
+
+class OutboxEvent(Base):
+    """حدث تغيير يُكتب في نفس transaction التعديل ثم يُرسل لاحقاً (راجع app/services/outbox_service.py)"""
+    __tablename__ = "outbox_events"
+    __table_args__ = (
+        Index("idx_outbox_events_status_id", "status", "id"),
+    )
+    
+    # رقم تسلسلي: ترتيب الإرسال هو ترتيب الكتابة
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True, comment="رقم الحدث")
+    event_type = Column(String, nullable=False, comment="نوع الحدث (مثال: appointment.created)")
+    aggregate_type = Column(String, nullable=False, comment="نوع الكيان (appointment, conversation, handoff, invoice)")
+    aggregate_id = Column(String, nullable=True, comment="معرف الكيان")
+    payload = Column(JSON, nullable=True, comment="بيانات الكيان (JSON)")
+    status = Column(String, nullable=False, default="pending", comment="الحالة (pending, delivered, failed)")
+    attempts = Column(Integer, nullable=False, default=0, comment="عدد محاولات الإرسال")
+    next_attempt_at = Column(DateTime, nullable=True, comment="وقت المحاولة التالية")
+    last_error = Column(Text, nullable=True, comment="آخر خطأ إرسال")
+    created_at = Column(DateTime, server_default=func.now(), nullable=False, comment="تاريخ الإنشاء")
+    delivered_at = Column(DateTime, nullable=True, comment="تاريخ الإرسال")
@@ -0,0 +1,14 @@
+"""
+نموذج حالة التجميعات - جدول rollup_state (high-water mark لكل مصدر)
+"""
+from sqlalchemy import Column, String, DateTime, func
+from app.db.base import Base
+
+
+class RollupState(Base):
+    """آخر نقطة تمت معالجتها لكل مصدر في التجميعات اليومية"""
+    __tablename__ = "rollup_state"
+    
+    name = Column(String, primary_key=True, comment="اسم المصدر (مثال: daily_metrics:conversations)")
+    high_water = Column(DateTime, nullable=True, comment="آخر updated_at تمت معالجته")
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now(), nullable=False, comment="تاريخ آخر تحديث")
@@ -1,7 +1,7 @@
 """
 نموذج الخدمات - جدول services
 """
-from sqlalchemy import Column, String, Text, Boolean, Float, DateTime, func
+from sqlalchemy import Column, String, Text, Boolean, Float, DateTime, Index, text, func
 from sqlalchemy.dialects.postgresql import UUID
 import uuid
 from app.db.base import Base
@@ -10,6 +10,9 @@ from app.db.base import Base
 class Service(Base):
     """نموذج الخدمة - يمثل خدمة تقدمها العيادة"""
     __tablename__ = "services"
+    __table_args__ = (
+        Index("idx_services_is_active", "is_active", postgresql_where=text("is_active = true")),
+    )
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, comment="معرف الخدمة")
     name = Column(String, nullable=False, unique=True, index=True, comment="اسم الخدمة")
@@ -0,0 +1,216 @@
+"""
+Connection pool: الحجم لكل worker، المقاييس، ووضع PgBouncer
+
+- الحجم: كل عملية (worker) لها pool خاص، لذلك DB_CONNECTION_BUDGET (أقصى اتصالات لكل العمليات معاً)
+  يُقسم على WEB_CONCURRENCY؛ بدون ميزانية يبقى الحجم الافتراضي 20 + 10 لكل عملية
+- المقاييس: الاتصالات المستخدمة والـ overflow وعدد مرات انتهاء المهلة من أحداث الـ pool،
+  ومدة انتظار الحصول على اتصال (histogram) من InstrumentedQueuePool
+- DB_PGBOUNCER: اتصالات عبر PgBouncer (transaction pooling) - تعطيل prepared statements في الـ driver
+  (psycopg2 لا يستخدمها؛ psycopg 3 و asyncpg يستخدمانها افتراضياً)
+"""
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+from app.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+# حدود الـ histogram لمدة انتظار الاتصال (ms)
+WAIT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+_DEFAULT_POOL_SIZE = 20
+_DEFAULT_MAX_OVERFLOW = 10
+
+
+def pool_sizing() -> Tuple[int, int]:
+    """(pool_size, max_overflow) لكل عملية"""
+    if settings.DB_POOL_SIZE is not None:
+        max_overflow = settings.DB_MAX_OVERFLOW if settings.DB_MAX_OVERFLOW is not None else _DEFAULT_MAX_OVERFLOW
+        return settings.DB_POOL_SIZE, max_overflow
+    if settings.DB_CONNECTION_BUDGET <= 0:
+        return _DEFAULT_POOL_SIZE, _DEFAULT_MAX_OVERFLOW
+
+    workers = max(1, settings.WEB_CONCURRENCY)
+    per_worker = settings.DB_CONNECTION_BUDGET // workers
+    if per_worker < 1:
+        logger.warning(
+            f"⚠️  DB_CONNECTION_BUDGET={settings.DB_CONNECTION_BUDGET} < WEB_CONCURRENCY={workers}: "
+            f"using 1 connection per worker"
+        )
+        return 1, 0
+    # ثلثا الاتصالات دائمة والباقي overflow للذروة
+    pool_size = max(1, per_worker * 2 // 3)
+    return pool_size, per_worker - pool_size
+
+
+def _connect_args(url: str) -> Dict[str, Any]:
+    if not settings.DB_PGBOUNCER:
+        return {}
+    # في transaction pooling كل transaction قد يصل لاتصال خادم مختلف، فلا يوجد prepared statement سابق
+    if url.startswith("postgresql+psycopg:"):
+        return {"prepare_threshold": None}
+    if url.startswith("postgresql+asyncpg:"):
+        return {"statement_cache_size": 0, "prepared_statement_cache_size": 0}
+    return {}
+
+
+def engine_options(url: str, pool_size: int, max_overflow: int, connect_args: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """وسائط create_engine المشتركة بين القاعدة الرئيسية والـ replica"""
+    return {
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_pre_ping": True,    # التحقق من الاتصال قبل الاستخدام
+        "pool_recycle": 3600,     # إعادة تدوير الاتصالات كل ساعة (تجنب connection timeout)
+        "connect_args": {**(connect_args or {}), **_connect_args(url)},
+    }
+
+
+class PoolMetrics:
+    """عدادات pool واحد (آمنة بين الـ threads)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.max_checked_out = 0
+        self.wait_count = 0
+        self.wait_total_ms = 0.0
+        self.wait_max_ms = 0.0
+        self.wait_buckets = [0] * (len(WAIT_BUCKETS_MS) + 1)
+
+    def record_wait(self, wait_ms: float, timed_out: bool = False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            self.wait_count += 1
+            self.wait_total_ms += wait_ms
+            self.wait_max_ms = max(self.wait_max_ms, wait_ms)
+            for index, bound in enumerate(WAIT_BUCKETS_MS):
+                if wait_ms <= bound:
+                    self.wait_buckets[index] += 1
+                    break
+            else:
+                self.wait_buckets[-1] += 1
+
+    def record_checkout(self, checked_out: int):
+        with self._lock:
+            self.checkouts += 1
+            self.max_checked_out = max(self.max_checked_out, checked_out)
+
+    def record_connect(self):
+        with self._lock:
+            self.connects += 1
+
+    def record_invalidation(self):
+        with self._lock:
+            self.invalidations += 1
+
+    def _percentile(self, buckets, fraction: float) -> Optional[float]:
+        """تقدير من الـ histogram: الحد الأعلى للفئة التي تصل إليها النسبة"""
+        if not self.wait_count:
+            return None
+        threshold = self.wait_count * fraction
+        cumulative = 0
+        for index, count in enumerate(buckets):
+            cumulative += count
+            if cumulative >= threshold:
+                if index < len(WAIT_BUCKETS_MS):
+                    return min(float(WAIT_BUCKETS_MS[index]), round(self.wait_max_ms, 1))
+                return round(self.wait_max_ms, 1)
+        return round(self.wait_max_ms, 1)
+
+    def snapshot(self, pool: QueuePool) -> Dict[str, Any]:
+        with self._lock:
+            buckets = list(self.wait_buckets)
+            histogram = {f"le_{bound}ms": count for bound, count in zip(WAIT_BUCKETS_MS, buckets)}
+            histogram[f"gt_{WAIT_BUCKETS_MS[-1]}ms"] = buckets[-1]
+            return {
+                "pool_size": pool.size(),
+                "max_overflow": pool._max_overflow,
+                "timeout_seconds": pool.timeout(),
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                "overflow": max(0, pool.overflow()),
+                "max_checked_out": self.max_checked_out,
+                "checkouts": self.checkouts,
+                "connects": self.connects,
+                "invalidations": self.invalidations,
+                "timeouts": self.timeouts,
+                "wait": {
+                    "count": self.wait_count,
+                    "avg_ms": round(self.wait_total_ms / self.wait_count, 2) if self.wait_count else None,
+                    "max_ms": round(self.wait_max_ms, 2),
+                    "p50_ms": self._percentile(buckets, 0.50),
+                    "p95_ms": self._percentile(buckets, 0.95),
+                    "p99_ms": self._percentile(buckets, 0.99),
+                    "histogram": histogram,
+                },
+            }
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    QueuePool يقيس مدة الحصول على اتصال (انتظار اتصال متاح أو فتح اتصال جديد)
+
+    أحداث الـ pool لا تتضمن بداية الانتظار، لذلك القياس حول _do_get
+    """
+    metrics: Optional[PoolMetrics] = None
+
+    def _do_get(self):
+        started = time.perf_counter()
+        timed_out = False
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            timed_out = True
+            raise
+        finally:
+            if self.metrics is not None:
+                self.metrics.record_wait((time.perf_counter() - started) * 1000, timed_out)
+
+    def recreate(self):
+        # engine.dispose() يُنشئ pool جديداً بنفس الإعدادات
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+
+def instrument(engine: Engine) -> PoolMetrics:
+    """ربط مقاييس بـ pool المحرك (الأحداث تُنقل تلقائياً عند إعادة إنشاء الـ pool)"""
+    metrics = PoolMetrics()
+    engine.pool.metrics = metrics
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        metrics.record_connect()
+
+    @event.listens_for(engine, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        metrics.record_checkout(engine.pool.checkedout())
+
+    @event.listens_for(engine, "invalidate")
+    def _on_invalidate(dbapi_connection, connection_record, exception):
+        metrics.record_invalidation()
+
+    return metrics
+
+
+def pool_stats(engine: Optional[Engine]) -> Optional[Dict[str, Any]]:
+    """مقاييس pool المحرك (None إذا لم يكن مُعدّاً أو غير مقاس)"""
+    if engine is None:
+        return None
+    pool = engine.pool
+    if not isinstance(pool, InstrumentedQueuePool) or pool.metrics is None:
+        return {"status": pool.status()}
+    return pool.metrics.snapshot(pool)
@@ -1,27 +1,65 @@
 """
 إعدادات قاعدة البيانات والجلسات
+
+- get_db: القاعدة الرئيسية (الكتابة والقراءات الحساسة للتأخير)
+- get_read_db: الـ replica للقراءات الثقيلة (التحليلات، التصدير، n8n) بـ pool منفصل؛
+  كل endpoint يختارها صراحة، وبدون REPLICA_DATABASE_URL أو عند تعذر الاتصال بها تُستخدم القاعدة الرئيسية
 """
+import logging
+import time
+from typing import Any, Dict, Optional
 from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.orm import sessionmaker, Session
 from fastapi import Depends
 from app.config import get_settings
+from app.db.pool import engine_options, instrument, pool_sizing
+
+logger = logging.getLogger(__name__)
 
 settings = get_settings()
 
-# إنشاء محرك قاعدة البيانات مع Connection Pooling محسّن
+# إنشاء محرك قاعدة البيانات - حجم الـ pool لكل worker من DB_CONNECTION_BUDGET (راجع app/db/pool.py)
+pool_size, max_overflow = pool_sizing()
 engine = create_engine(
     settings.DATABASE_URL,
-    pool_size=20,          # عدد الاتصالات في pool (افتراضي: 5)
-    max_overflow=10,       # إضافية عند الحاجة (افتراضي: 10)
-    pool_pre_ping=True,    # التحقق من الاتصال قبل الاستخدام
-    pool_recycle=3600,     # إعادة تدوير الاتصالات كل ساعة (تجنب connection timeout)
+    **engine_options(settings.DATABASE_URL, pool_size, max_overflow),
     echo=False  # ضبط على True للتطوير لرؤية استعلامات SQL
 )
+instrument(engine)
 
 # إنشاء جلسة محلية
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
+def _create_replica_engine() -> Optional[Engine]:
+    if not settings.REPLICA_DATABASE_URL:
+        return None
+    connect_args = {}
+    if settings.REPLICA_DATABASE_URL.startswith("postgresql"):
+        # replica متوقفة لا يجب أن تعلّق الطلب حتى timeout نظام التشغيل
+        connect_args["connect_timeout"] = settings.REPLICA_CONNECT_TIMEOUT
+    replica = create_engine(
+        settings.REPLICA_DATABASE_URL,
+        **engine_options(
+            settings.REPLICA_DATABASE_URL, settings.REPLICA_POOL_SIZE, settings.REPLICA_MAX_OVERFLOW, connect_args
+        ),
+        echo=False
+    )
+    instrument(replica)
+    return replica
+
+
+replica_engine = _create_replica_engine()
+ReplicaSessionLocal = (
+    sessionmaker(autocommit=False, autoflush=False, bind=replica_engine) if replica_engine is not None else None
+)
+
+# بعد فشل الاتصال بالـ replica تُستخدم القاعدة الرئيسية حتى retry_at (بدون محاولة اتصال في كل طلب)
+_replica_state: Dict[str, Any] = {"retry_at": 0.0, "last_error": None, "fallbacks": 0}
+
+
 def get_db() -> Session:
     """
     Dependency للحصول على جلسة قاعدة البيانات
@@ -33,3 +71,51 @@ def get_db() -> Session:
     finally:
         db.close()
 
+
+def read_session() -> Session:
+    """
+    جلسة للقراءة فقط: من الـ replica إذا كانت مُعدّة ومتاحة، وإلا من القاعدة الرئيسية
+
+    البيانات في الـ replica قد تتأخر قليلاً عن القاعدة الرئيسية - لا تُستخدم لقراءة ما كُتب للتو
+    """
+    if ReplicaSessionLocal is None or time.monotonic() < _replica_state["retry_at"]:
+        return SessionLocal()
+
+    db = ReplicaSessionLocal()
+    try:
+        # الاتصال الآن (pool_pre_ping) حتى يكون الرجوع للقاعدة الرئيسية قبل أول استعلام
+        db.connection()
+    except DBAPIError as e:
+        db.close()
+        _replica_state["retry_at"] = time.monotonic() + settings.REPLICA_RETRY_SECONDS
+        _replica_state["last_error"] = str(e)[:200]
+        _replica_state["fallbacks"] += 1
+        logger.warning(
+            f"⚠️  Replica unavailable, using primary for {settings.REPLICA_RETRY_SECONDS}s: {str(e)[:200]}"
+        )
+        return SessionLocal()
+    return db
+
+
+def get_read_db() -> Session:
+    """
+    Dependency لجلسة قراءة (راجع read_session)
+    يتم إغلاق الجلسة تلقائياً بعد الاستخدام
+    """
+    db = read_session()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def replica_status() -> Dict[str, Any]:
+    """حالة الـ replica: مُعدّة، متاحة (أو في فترة الرجوع للقاعدة الرئيسية)، آخر خطأ"""
+    retry_in = _replica_state["retry_at"] - time.monotonic()
+    return {
+        "configured": replica_engine is not None,
+        "using_replica": replica_engine is not None and retry_in <= 0,
+        "fallback_seconds_left": round(retry_in, 1) if retry_in > 0 else 0,
+        "fallbacks": _replica_state["fallbacks"],
+        "last_error": _replica_state["last_error"],
+    }
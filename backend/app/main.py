@@ -23,7 +23,7 @@ from app.api.admin import (
 )
 from app.api.admin.export_router import router as export_router
 from app.api.admin import db_router
-# from app.api.reports import daily_reports_router  # To be implemented
+from app.api.reports import daily_reports_router
 # from app.api.google import google_reviews_router  # To be implemented
 from app.api.test import chat_router as test_chat_router
 from app.logging_config import setup_logging
@@ -170,8 +170,12 @@ app.include_router(n8n_router.router)
 from app.api.admin import csv_import_router
 app.include_router(csv_import_router.router)
 
-# Reports - To be implemented
-# app.include_router(daily_reports_router.router)
+# Retention
+from app.api.admin import retention_router
+app.include_router(retention_router.router)
+
+# Reports
+app.include_router(daily_reports_router.router)
 
 # Google - To be implemented
 # app.include_router(google_reviews_router.router)
@@ -182,7 +186,35 @@ app.include_router(test_chat_router.router)
 # Start background scheduler
 @app.on_event("startup")
 async def startup_event():
-    """Startup event - start background scheduler"""
+    """Startup event - apply pending migrations, load intent classifier, replay spooled conversations and start background scheduler"""
+    try:
+        from app.config import get_settings
+        if get_settings().DB_AUTO_MIGRATE:
+            from app.db.migrations import upgrade
+            result = upgrade()
+            if result["applied"]:
+                logger.info(f"Database migrated to version {result['current']}")
+    except Exception as e:
+        logger.error(f"Failed to apply database migrations: {str(e)}", exc_info=True)
+    
+    try:
+        from app.services.outbox_service import install_outbox_listener
+        install_outbox_listener()
+    except Exception as e:
+        logger.error(f"Failed to install outbox listener: {str(e)}", exc_info=True)
+    
+    try:
+        from app.core.intent_classifier import load_intent_classifier
+        load_intent_classifier()
+    except Exception as e:
+        logger.error(f"Failed to load intent classifier: {str(e)}", exc_info=True)
+    
+    try:
+        from app.core.conversation_buffer import get_conversation_buffer
+        get_conversation_buffer().replay_spool()
+    except Exception as e:
+        logger.error(f"Failed to replay conversation spool: {str(e)}", exc_info=True)
+    
     try:
         from app.tasks.scheduler import start_scheduler
         start_scheduler()
@@ -193,7 +225,7 @@ async def startup_event():
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    """Shutdown event - stop background scheduler"""
+    """Shutdown event - stop background scheduler, flush buffered conversations and stop import and retention jobs"""
     try:
         from app.tasks.scheduler import stop_scheduler
         stop_scheduler()
@@ -201,6 +233,30 @@ async def shutdown_event():
         pass  # Scheduler not available
     except Exception as e:
         logger.error(f"Failed to stop scheduler: {str(e)}", exc_info=True)
+    
+    try:
+        from app.core.conversation_buffer import get_conversation_buffer
+        get_conversation_buffer().close()
+    except Exception as e:
+        logger.error(f"Failed to flush conversation buffer: {str(e)}", exc_info=True)
+    
+    try:
+        from app.services.outbox_service import get_outbox_dispatcher
+        await get_outbox_dispatcher().close()
+    except Exception as e:
+        logger.error(f"Failed to close outbox dispatcher: {str(e)}", exc_info=True)
+    
+    try:
+        from app.services.import_jobs import get_import_job_runner
+        get_import_job_runner().shutdown()
+    except Exception as e:
+        logger.error(f"Failed to stop import jobs: {str(e)}", exc_info=True)
+    
+    try:
+        from app.services.retention_service import get_retention_engine
+        get_retention_engine().shutdown()
+    except Exception as e:
+        logger.error(f"Failed to stop retention: {str(e)}", exc_info=True)
 
 # Exception handlers to ensure CORS headers are always sent
 @app.exception_handler(StarletteHTTPException)
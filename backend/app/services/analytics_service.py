@@ -1,71 +1,205 @@
 """
 خدمة التحليلات والإحصائيات
+
+جميع مقاييس المحادثات (الإجمالي، غير المفهومة، التحويلات) لكل القنوات تُحسب في استعلام واحد
+مجمّع حسب القناة مع عدّ مشروط (COUNT ... FILTER)، والنتيجة تُخزن في الـ cache لكل نطاق زمني
+
+الأيام المكتملة تُقرأ من جدول التجميعات اليومية (daily_metrics)، والأيام الأحدث فقط من conversations
 """
-from typing import Dict, List, Optional
-from datetime import date, datetime
+from typing import Dict, Optional, Tuple
+from datetime import date, datetime, timedelta
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_
-from app.db.models import Conversation, UnansweredQuestion, PendingHandoff
+from sqlalchemy import func
+from app.config import get_settings
+from app.core.cache import cache_manager
+from app.db.models import Conversation
+from app.services.rollup_service import rollup_covered_until, sum_daily_metrics
+
+settings = get_settings()
+
+
+def _date_bounds(date_from: Optional[date], date_to: Optional[date]) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """
+    تحويل نطاق الأيام إلى نطاق زمني نصف مفتوح [بداية يوم date_from، بداية اليوم التالي لـ date_to)
+    """
+    start = datetime.combine(date_from, datetime.min.time()) if date_from else None
+    end = datetime.combine(date_to + timedelta(days=1), datetime.min.time()) if date_to else None
+    return start, end
+
+
+def _metrics_ttl(date_to: Optional[date]) -> int:
+    """النطاقات المنتهية قبل اليوم لا تتغير تقريباً، فتُخزن لمدة أطول"""
+    if date_to is not None and date_to < date.today():
+        return settings.ANALYTICS_HISTORICAL_CACHE_SECONDS
+    return settings.ANALYTICS_CACHE_SECONDS
+
+
+def _empty_metrics() -> Dict:
+    return {
+        "total_conversations": 0,
+        "avg_satisfaction": None,
+        "unrecognized_count": 0,
+        "handoffs_count": 0,
+        "satisfaction_count": 0
+    }
+
+
+def compute_conversation_metrics(
+    db_session: Session,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None
+) -> Dict[str, Dict]:
+    """
+    حساب مقاييس المحادثات لكل قناة في استعلام واحد (بدون cache)
+
+    Returns:
+        قاموس {channel: {total_conversations, unrecognized_count, handoffs_count, ...}}
+    """
+    query = db_session.query(
+        Conversation.channel,
+        func.count().label("total"),
+        func.count().filter(Conversation.unrecognized == True).label("unrecognized"),
+        func.count().filter(Conversation.needs_handoff == True).label("handoffs")
+    )
+
+    start, end = _date_bounds(date_from, date_to)
+    if start:
+        query = query.filter(Conversation.created_at >= start)
+    if end:
+        query = query.filter(Conversation.created_at < end)
+
+    result = {}
+    for channel, total, unrecognized, handoffs in query.group_by(Conversation.channel).all():
+        metrics = _empty_metrics()
+        metrics["total_conversations"] = total
+        metrics["unrecognized_count"] = unrecognized
+        metrics["handoffs_count"] = handoffs
+        result[channel] = metrics
+    return result
+
+
+def hybrid_conversation_metrics(
+    db_session: Session,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None
+) -> Dict[str, Dict]:
+    """
+    مقاييس المحادثات لكل قناة: daily_metrics للأيام المكتملة + conversations للأيام الباقية
+
+    Returns:
+        نفس شكل compute_conversation_metrics
+    """
+    covered = rollup_covered_until(db_session, ("conversations",))
+    if covered is None or (date_from is not None and date_from >= covered):
+        return compute_conversation_metrics(db_session, date_from, date_to)
+
+    last_rolled = covered - timedelta(days=1)
+    rolled_to = min(date_to, last_rolled) if date_to is not None else last_rolled
+    result: Dict[str, Dict] = {}
+    if date_from is None or date_from <= rolled_to:
+        for (channel,), sums in sum_daily_metrics(db_session, date_from, rolled_to).items():
+            if not sums["conversations"]:
+                continue
+            metrics = _empty_metrics()
+            metrics["total_conversations"] = sums["conversations"]
+            metrics["unrecognized_count"] = sums["unrecognized"]
+            metrics["handoffs_count"] = sums["handoffs"]
+            result[channel] = metrics
+
+    if date_to is None or date_to >= covered:
+        for channel, tail in compute_conversation_metrics(db_session, covered, date_to).items():
+            metrics = result.setdefault(channel, _empty_metrics())
+            for field in ("total_conversations", "unrecognized_count", "handoffs_count"):
+                metrics[field] += tail[field]
+    return result
+
+
+def conversation_metrics(
+    db_session: Session,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    use_cache: bool = True
+) -> Dict[str, Dict]:
+    """
+    مقاييس المحادثات لكل قناة (مع cache لكل نطاق زمني)
+
+    Args:
+        db_session: جلسة قاعدة البيانات
+        date_from: تاريخ البداية
+        date_to: تاريخ النهاية
+        use_cache: استخدام الـ cache
+
+    Returns:
+        قاموس {channel: analytics_dict}
+    """
+    key = f"analytics:conversation_metrics:{date_from}:{date_to}"
+    if use_cache:
+        cached = cache_manager.get(key)
+        if cached is not None:
+            return cached
+
+    result = hybrid_conversation_metrics(db_session, date_from, date_to)
+    if use_cache:
+        cache_manager.set(key, result, ttl=_metrics_ttl(date_to))
+    return result
+
+
+def analytics_summary(db_session: Session, date_from: Optional[date] = None, date_to: Optional[date] = None) -> Dict:
+    """
+    ملخص التحليلات (الإجماليات + المحادثات حسب القناة) من نفس الاستعلام المجمّع
+
+    Returns:
+        total_conversations, conversations_by_channel, avg_satisfaction, unrecognized_count, handoffs_count
+    """
+    by_channel = conversation_metrics(db_session, date_from, date_to)
+    return {
+        "total_conversations": sum(m["total_conversations"] for m in by_channel.values()),
+        "conversations_by_channel": {channel: m["total_conversations"] for channel, m in by_channel.items()},
+        "avg_satisfaction": avg_satisfaction(db_session, date_from, date_to),
+        "unrecognized_count": sum(m["unrecognized_count"] for m in by_channel.values()),
+        "handoffs_count": sum(m["handoffs_count"] for m in by_channel.values())
+    }
 
 
 def total_conversations(db_session: Session, date_from: Optional[date] = None, date_to: Optional[date] = None) -> int:
     """
     إجمالي عدد المحادثات في نطاق زمني
-    
+
     Args:
         db_session: جلسة قاعدة البيانات
         date_from: تاريخ البداية
         date_to: تاريخ النهاية
-    
+
     Returns:
         عدد المحادثات
     """
-    query = db_session.query(Conversation)
-    
-    if date_from:
-        query = query.filter(Conversation.created_at >= datetime.combine(date_from, datetime.min.time()))
-    if date_to:
-        query = query.filter(Conversation.created_at <= datetime.combine(date_to, datetime.max.time()))
-    
-    return query.count()
+    return analytics_summary(db_session, date_from, date_to)["total_conversations"]
 
 
 def conversations_by_channel(db_session: Session, date_from: Optional[date] = None, date_to: Optional[date] = None) -> Dict[str, int]:
     """
     عدد المحادثات حسب القناة
-    
+
     Args:
         db_session: جلسة قاعدة البيانات
         date_from: تاريخ البداية
         date_to: تاريخ النهاية
-    
+
     Returns:
         قاموس {channel: count}
     """
-    query = db_session.query(
-        Conversation.channel,
-        func.count(Conversation.id).label('count')
-    )
-    
-    if date_from:
-        query = query.filter(Conversation.created_at >= datetime.combine(date_from, datetime.min.time()))
-    if date_to:
-        query = query.filter(Conversation.created_at <= datetime.combine(date_to, datetime.max.time()))
-    
-    results = query.group_by(Conversation.channel).all()
-    
-    return {channel: count for channel, count in results}
+    return analytics_summary(db_session, date_from, date_to)["conversations_by_channel"]
 
 
 def avg_satisfaction(db_session: Session, date_from: Optional[date] = None, date_to: Optional[date] = None) -> Optional[float]:
     """
     متوسط درجة الرضا (لم يعد موجوداً - إرجاع None)
-    
+
     Args:
         db_session: جلسة قاعدة البيانات
         date_from: تاريخ البداية
         date_to: تاريخ النهاية
-    
+
     Returns:
         None (satisfaction_score تم إزالته من النموذج)
     """
@@ -76,57 +210,43 @@ def avg_satisfaction(db_session: Session, date_from: Optional[date] = None, date
 def count_unrecognized(db_session: Session, date_from: Optional[date] = None, date_to: Optional[date] = None) -> int:
     """
     عدد الرسائل غير المفهومة
-    
+
     Args:
         db_session: جلسة قاعدة البيانات
         date_from: تاريخ البداية
         date_to: تاريخ النهاية
-    
+
     Returns:
         عدد الرسائل غير المفهومة
     """
-    query = db_session.query(Conversation).filter(Conversation.unrecognized == True)
-    
-    if date_from:
-        query = query.filter(Conversation.created_at >= datetime.combine(date_from, datetime.min.time()))
-    if date_to:
-        query = query.filter(Conversation.created_at <= datetime.combine(date_to, datetime.max.time()))
-    
-    return query.count()
+    return analytics_summary(db_session, date_from, date_to)["unrecognized_count"]
 
 
 def count_handoffs(db_session: Session, date_from: Optional[date] = None, date_to: Optional[date] = None) -> int:
     """
     عدد التحويلات لموظفين
-    
+
     Args:
         db_session: جلسة قاعدة البيانات
         date_from: تاريخ البداية
         date_to: تاريخ النهاية
-    
+
     Returns:
         عدد التحويلات
     """
-    query = db_session.query(Conversation).filter(Conversation.needs_handoff == True)
-    
-    if date_from:
-        query = query.filter(Conversation.created_at >= datetime.combine(date_from, datetime.min.time()))
-    if date_to:
-        query = query.filter(Conversation.created_at <= datetime.combine(date_to, datetime.max.time()))
-    
-    return query.count()
+    return analytics_summary(db_session, date_from, date_to)["handoffs_count"]
 
 
 def get_channel_analytics(db_session: Session, channel: str, date_from: Optional[date] = None, date_to: Optional[date] = None) -> Dict:
     """
     إحصائيات مفصلة لقناة معينة
-    
+
     Args:
         db_session: جلسة قاعدة البيانات
         channel: اسم القناة (whatsapp, instagram, tiktok, google_maps)
         date_from: تاريخ البداية
         date_to: تاريخ النهاية
-    
+
     Returns:
         قاموس يحتوي على:
         - total_conversations: إجمالي المحادثات
@@ -135,61 +255,19 @@ def get_channel_analytics(db_session: Session, channel: str, date_from: Optional
         - handoffs_count: عدد التحويلات
         - satisfaction_count: عدد التقييمات
     """
-    query = db_session.query(Conversation).filter(Conversation.channel == channel)
-    
-    if date_from:
-        query = query.filter(Conversation.created_at >= datetime.combine(date_from, datetime.min.time()))
-    if date_to:
-        query = query.filter(Conversation.created_at <= datetime.combine(date_to, datetime.max.time()))
-    
-    # إجمالي المحادثات
-    total = query.count()
-    
-    # متوسط الرضا (لم يعد موجوداً)
-    avg_sat = None
-    
-    # عدد الرسائل غير المفهومة
-    unrecognized = query.filter(Conversation.unrecognized == True).count()
-    
-    # عدد التحويلات
-    handoffs = query.filter(Conversation.needs_handoff == True).count()
-    
-    # عدد التقييمات (لم يعد موجوداً)
-    satisfaction_count = 0
-    
-    return {
-        "total_conversations": total,
-        "avg_satisfaction": avg_sat,
-        "unrecognized_count": unrecognized,
-        "handoffs_count": handoffs,
-        "satisfaction_count": satisfaction_count
-    }
+    return conversation_metrics(db_session, date_from, date_to).get(channel, _empty_metrics())
 
 
 def get_all_channels_analytics(db_session: Session, date_from: Optional[date] = None, date_to: Optional[date] = None) -> Dict[str, Dict]:
     """
     إحصائيات مفصلة لكل القنوات
-    
+
     Args:
         db_session: جلسة قاعدة البيانات
         date_from: تاريخ البداية
         date_to: تاريخ النهاية
-    
+
     Returns:
         قاموس {channel: analytics_dict}
     """
-    # الحصول على جميع القنوات الفريدة
-    channels_query = db_session.query(Conversation.channel).distinct()
-    if date_from:
-        channels_query = channels_query.filter(Conversation.created_at >= datetime.combine(date_from, datetime.min.time()))
-    if date_to:
-        channels_query = channels_query.filter(Conversation.created_at <= datetime.combine(date_to, datetime.max.time()))
-    
-    channels = [row[0] for row in channels_query.all()]
-    
-    result = {}
-    for channel in channels:
-        result[channel] = get_channel_analytics(db_session, channel, date_from, date_to)
-    
-    return result
-
+    return conversation_metrics(db_session, date_from, date_to)
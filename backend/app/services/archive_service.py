@@ -0,0 +1,112 @@
+"""
+ملفات الأرشيف للسجلات المحذوفة (الاحتفاظ بالبيانات وأرشفة أقسام conversations)
+
+- ndjson (افتراضي): سطر JSON لكل صف، مضغوط بـ gzip
+- parquet: عمودي ومضغوط (zstd)، يتطلب pyarrow (اختياري)؛ بدونه يُستخدم ndjson مع تحذير
+- الملف يُفتح عند أول دفعة ويُكتب دفعة بدفعة (بدون تحميل الجدول في الذاكرة)
+"""
+import gzip
+import json
+import logging
+import os
+import uuid
+from datetime import datetime
+from typing import Any, Optional, Sequence
+from sqlalchemy import Boolean, DateTime, Float, Integer, Numeric
+from app.config import get_settings
+from app.core.serialization import to_json_value
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+try:
+    import pyarrow
+    import pyarrow.parquet as parquet
+except ImportError:
+    pyarrow = None
+    parquet = None
+
+
+def archive_format() -> str:
+    """صيغة الأرشيف الفعلية (parquet فقط إذا كان pyarrow مثبتاً)"""
+    requested = (settings.RETENTION_ARCHIVE_FORMAT or "ndjson").lower()
+    if requested == "parquet" and pyarrow is None:
+        logger.warning("RETENTION_ARCHIVE_FORMAT=parquet requires pyarrow - falling back to ndjson")
+        return "ndjson"
+    return "parquet" if requested == "parquet" else "ndjson"
+
+
+def _arrow_type(column):
+    if isinstance(column.type, Boolean):
+        return pyarrow.bool_()
+    if isinstance(column.type, Integer):
+        return pyarrow.int64()
+    if isinstance(column.type, (Float, Numeric)):
+        return pyarrow.float64()
+    if isinstance(column.type, DateTime):
+        return pyarrow.timestamp("us")
+    # UUID والنصوص و JSON كنص
+    return pyarrow.string()
+
+
+def _arrow_value(value: Any, arrow_type) -> Any:
+    if value is None or arrow_type != pyarrow.string():
+        return value
+    if isinstance(value, str):
+        return value
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return json.dumps(to_json_value(value), ensure_ascii=False)
+
+
+class ArchiveWriter:
+    """ملف أرشيف لجدول (أو قسم منه)"""
+
+    def __init__(self, table, name: Optional[str] = None, directory: Optional[str] = None):
+        """
+        Args:
+            table: جدول SQLAlchemy (الأعمدة تحدد schema الـ parquet)
+            name: اسم الملف بدون الامتداد (افتراضياً اسم الجدول مع الوقت)
+            directory: مجلد الأرشيف (افتراضياً RETENTION_ARCHIVE_DIR)
+        """
+        self.table = table
+        self.format = archive_format()
+        extension = "parquet" if self.format == "parquet" else "ndjson.gz"
+        name = name or f"{table.name}-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+        self.path = os.path.join(directory or settings.RETENTION_ARCHIVE_DIR, f"{name}.{extension}")
+        self.rows = 0
+        self._file = None
+        self._schema = None
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        if self.format == "parquet":
+            self._schema = pyarrow.schema([(column.name, _arrow_type(column)) for column in self.table.columns])
+            self._file = parquet.ParquetWriter(self.path, self._schema, compression="zstd")
+        else:
+            self._file = gzip.open(self.path, "wt", encoding="utf-8")
+
+    def write(self, rows: Sequence[Any]):
+        """كتابة دفعة صفوف (نتائج select على الجدول)"""
+        if not rows:
+            return
+        if self._file is None:
+            self._open()
+        if self.format == "parquet":
+            columns = {
+                schema_field.name: [_arrow_value(row._mapping[schema_field.name], schema_field.type) for row in rows]
+                for schema_field in self._schema
+            }
+            self._file.write_table(pyarrow.Table.from_pydict(columns, schema=self._schema))
+        else:
+            for row in rows:
+                record = {key: to_json_value(value) for key, value in row._mapping.items()}
+                self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            # الصفوف تُحذف بعد هذه الدفعة: لا تبقى في buffer الملف فقط
+            self._file.flush()
+        self.rows += len(rows)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
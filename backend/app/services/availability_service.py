@@ -0,0 +1,373 @@
+"""
+خدمة توفر المواعيد - فهارس محلية للمواعيد المحجوزة لكل طبيب وفرع
+
+- كل فهرس قائمة مرتبة ببدايات المواعيد (بالدقائق) يُبحث فيها بـ bisect
+- التحميل الأولي للمواعيد القادمة فقط، ثم تحديث تدريجي بحسب updated_at (high-water mark)
+- المواعيد التي تُكتب في نفس العملية تُضاف فوراً عبر apply() بعد الـ commit
+- كل تحديث يعيد قراءة آخر AVAILABILITY_REFRESH_LAG_SECONDS (transaction أقدم قد يُنهي بعد قراءة صف أحدث)،
+  وإعادة تحميل كاملة كل AVAILABILITY_RELOAD_SECONDS لرؤية المواعيد المحذوفة نهائياً
+- الحجز: lock_booking() قبل التحقق والإدراج (advisory lock للطبيب والفرع حتى نهاية الـ transaction)،
+  والفهرس الفريد uq_appointments_doctor_datetime_active يرفض ما يفلت من ذلك (is_slot_conflict → 409)
+- التعارض: نفس الطبيب في نفس الوقت، أو تجاوز APPOINTMENT_BRANCH_CAPACITY في الفرع
+"""
+import logging
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+from sqlalchemy import func, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.config import get_settings
+from app.db.models import Appointment
+from app.db.models.appointment import ACTIVE_DOCTOR_SLOT_INDEX
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+# المواعيد بهذه الحالات لا تحجز وقتاً
+INACTIVE_STATUSES = {"cancelled", "canceled", "no_show"}
+
+_EPOCH = datetime(2000, 1, 1)
+
+# مفتاح advisory lock في PostgreSQL (التحقق من التعارض والإدراج لطبيب/فرع واحد في كل مرة بين الـ workers)
+_BOOKING_LOCK_KEY = 7_310_028
+
+
+def _to_minutes(value: datetime) -> int:
+    return int((value - _EPOCH).total_seconds() // 60)
+
+
+def _from_minutes(minutes: int) -> datetime:
+    return _EPOCH + timedelta(minutes=minutes)
+
+
+def _parse_time(value: Any) -> Optional[int]:
+    """تحويل "9:00" أو "21:30" إلى دقائق من بداية اليوم"""
+    try:
+        hours, minutes = str(value).strip().split(":")[:2]
+        return int(hours) * 60 + int(minutes)
+    except (ValueError, AttributeError):
+        return None
+
+
+def _default_hours() -> Dict[str, Dict[str, str]]:
+    opening, closing = settings.APPOINTMENT_DEFAULT_HOURS.split("-")
+    return {day: {"from": opening, "to": closing} for day in WEEKDAYS}
+
+
+def day_windows(working_hours: Optional[Dict[str, Any]], day: datetime) -> List[Tuple[int, int]]:
+    """
+    فترات العمل ليوم معين بالدقائق (بداية، نهاية)
+
+    Args:
+        working_hours: {"sunday": {"from": "9:00", "to": "21:00"}, ...}
+                       إذا كانت "to" قبل "from" فالدوام يمتد بعد منتصف الليل (مثال: 08:00 - 01:00)
+        day: اليوم (يُستخدم التاريخ فقط)
+
+    Returns:
+        قائمة فترات (فارغة إذا كان اليوم إجازة)
+    """
+    hours = (working_hours or {}).get(WEEKDAYS[day.weekday()])
+    if not isinstance(hours, dict):
+        return []
+
+    opening = _parse_time(hours.get("from"))
+    closing = _parse_time(hours.get("to"))
+    if opening is None or closing is None:
+        return []
+    if closing <= opening:
+        closing += 24 * 60
+
+    midnight = _to_minutes(datetime(day.year, day.month, day.day))
+    return [(midnight + opening, midnight + closing)]
+
+
+def _intersect(first: List[Tuple[int, int]], second: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    result = []
+    for start_a, end_a in first:
+        for start_b, end_b in second:
+            start, end = max(start_a, start_b), min(end_a, end_b)
+            if start < end:
+                result.append((start, end))
+    return sorted(result)
+
+
+class AvailabilityEngine:
+    """فهارس المواعيد المحجوزة لكل طبيب وفرع"""
+
+    def __init__(self, slot_minutes: Optional[int] = None, branch_capacity: Optional[int] = None):
+        self.slot_minutes = slot_minutes or settings.APPOINTMENT_SLOT_MINUTES
+        self.branch_capacity = branch_capacity or settings.APPOINTMENT_BRANCH_CAPACITY
+        self._lock = threading.RLock()
+        self._doctor_slots: Dict[UUID, List[int]] = {}
+        self._branch_slots: Dict[UUID, List[int]] = {}
+        # appointment_id → (doctor_id, branch_id, start)
+        self._entries: Dict[UUID, Tuple[Optional[UUID], UUID, int]] = {}
+        self._high_water: Optional[datetime] = None
+        self._refreshed_at = 0.0
+        self._loaded_at = 0.0
+        self.loaded = False
+
+    # ------------------------------------------------------------------
+    # تحديث الفهارس
+    # ------------------------------------------------------------------
+
+    def _remove(self, appointment_id: UUID):
+        entry = self._entries.pop(appointment_id, None)
+        if entry is None:
+            return
+        doctor_id, branch_id, start = entry
+        for index, key in ((self._doctor_slots, doctor_id), (self._branch_slots, branch_id)):
+            slots = index.get(key)
+            if slots is None:
+                continue
+            position = bisect_left(slots, start)
+            if position < len(slots) and slots[position] == start:
+                del slots[position]
+
+    def _add(self, appointment_id: UUID, doctor_id: Optional[UUID], branch_id: UUID, start: datetime):
+        minutes = _to_minutes(start)
+        self._entries[appointment_id] = (doctor_id, branch_id, minutes)
+        if doctor_id is not None:
+            insort(self._doctor_slots.setdefault(doctor_id, []), minutes)
+        insort(self._branch_slots.setdefault(branch_id, []), minutes)
+
+    def _apply_row(self, appointment_id, doctor_id, branch_id, start, status, updated_at=None):
+        self._remove(appointment_id)
+        if start is None or start < datetime.now() - timedelta(days=1):
+            pass  # المواعيد السابقة لا تؤثر على التوفر
+        elif (status or "pending") not in INACTIVE_STATUSES:
+            self._add(appointment_id, doctor_id, branch_id, start)
+        if updated_at is not None and (self._high_water is None or updated_at > self._high_water):
+            self._high_water = updated_at
+
+    def apply(self, appointment: Appointment):
+        """تطبيق موعد تم إنشاؤه أو تعديله في هذه العملية (يُستدعى بعد الـ commit)"""
+        with self._lock:
+            self._apply_row(
+                appointment.id, appointment.doctor_id, appointment.branch_id,
+                appointment.datetime, appointment.status
+            )
+
+    def _columns(self, db: Session):
+        return db.query(
+            Appointment.id, Appointment.doctor_id, Appointment.branch_id,
+            Appointment.datetime, Appointment.status, Appointment.updated_at
+        )
+
+    def load(self, db: Session):
+        """التحميل الأولي للمواعيد القادمة"""
+        since = datetime.now() - timedelta(days=1)
+        rows = self._columns(db).filter(Appointment.datetime >= since).all()
+        # آخر تحديث في الجدول كله (وليس فقط المواعيد القادمة) كنقطة بداية للتحديث التدريجي
+        high_water = db.query(func.max(Appointment.updated_at)).scalar()
+        with self._lock:
+            self._doctor_slots.clear()
+            self._branch_slots.clear()
+            self._entries.clear()
+            self._high_water = None
+            for row in rows:
+                self._apply_row(*row)
+            self._high_water = high_water
+            self._refreshed_at = self._loaded_at = time.monotonic()
+            self.loaded = True
+        logger.info(f"Availability index loaded ({len(self._entries)} upcoming appointments)")
+
+    def refresh(self, db: Session, force: bool = False):
+        """
+        جلب المواعيد المعدلة منذ آخر تحديث (تعديلات workers أخرى)
+
+        Args:
+            force: تجاهل فترة الانتظار (يُستخدم قبل الحجز مباشرة)
+        """
+        if not self.loaded or time.monotonic() - self._loaded_at >= settings.AVAILABILITY_RELOAD_SECONDS:
+            self.load(db)
+            return
+        if not force and time.monotonic() - self._refreshed_at < settings.AVAILABILITY_REFRESH_SECONDS:
+            return
+
+        query = self._columns(db)
+        if self._high_water is not None:
+            # نافذة تأخير: صف بطابع أقدم قد يظهر بعد قراءة صف أحدث (التطبيق idempotent)
+            since = self._high_water - timedelta(seconds=settings.AVAILABILITY_REFRESH_LAG_SECONDS)
+            query = query.filter(Appointment.updated_at >= since)
+        rows = query.all()
+        with self._lock:
+            for row in rows:
+                self._apply_row(*row)
+            self._refreshed_at = time.monotonic()
+
+    # ------------------------------------------------------------------
+    # الاستعلام
+    # ------------------------------------------------------------------
+
+    def _overlapping(self, slots: Optional[List[int]], start: int) -> int:
+        if not slots:
+            return 0
+        end = start + self.slot_minutes
+        return bisect_left(slots, end) - bisect_right(slots, start - self.slot_minutes)
+
+    def conflict(
+        self,
+        start: datetime,
+        branch_id: UUID,
+        doctor_id: Optional[UUID] = None,
+        exclude_id: Optional[UUID] = None
+    ) -> Optional[str]:
+        """
+        التحقق من تعارض موعد
+
+        Returns:
+            سبب التعارض ("doctor" أو "branch") أو None إذا كان الوقت متاحاً
+        """
+        minutes = _to_minutes(start)
+        with self._lock:
+            own = self._entries.get(exclude_id) if exclude_id else None
+            if doctor_id is not None:
+                count = self._overlapping(self._doctor_slots.get(doctor_id), minutes)
+                if own and own[0] == doctor_id and abs(own[2] - minutes) < self.slot_minutes:
+                    count -= 1
+                if count > 0:
+                    return "doctor"
+            count = self._overlapping(self._branch_slots.get(branch_id), minutes)
+            if own and own[1] == branch_id and abs(own[2] - minutes) < self.slot_minutes:
+                count -= 1
+            if count >= self.branch_capacity:
+                return "branch"
+        return None
+
+    def next_free_slots(
+        self,
+        branch_id: UUID,
+        doctor_id: Optional[UUID] = None,
+        branch_hours: Optional[Dict[str, Any]] = None,
+        doctor_hours: Optional[Dict[str, Any]] = None,
+        after: Optional[datetime] = None,
+        count: int = 3,
+        days: Optional[int] = None
+    ) -> List[datetime]:
+        """
+        أقرب N مواعيد متاحة ضمن ساعات عمل الفرع (وساعات الطبيب إن وُجدت)
+
+        Args:
+            branch_id: معرف الفرع
+            doctor_id: معرف الطبيب (اختياري)
+            branch_hours: ساعات عمل الفرع (الافتراضي APPOINTMENT_DEFAULT_HOURS)
+            doctor_hours: ساعات عمل الطبيب (اختياري)
+            after: أقرب وقت مسموح (الافتراضي الآن + APPOINTMENT_MIN_LEAD_MINUTES)
+            count: عدد المواعيد المطلوبة
+            days: عدد الأيام للبحث (الافتراضي APPOINTMENT_SEARCH_DAYS)
+
+        Returns:
+            قائمة أوقات متاحة مرتبة تصاعدياً
+        """
+        if after is None:
+            after = datetime.now() + timedelta(minutes=settings.APPOINTMENT_MIN_LEAD_MINUTES)
+        days = days or settings.APPOINTMENT_SEARCH_DAYS
+        branch_hours = branch_hours or _default_hours()
+        earliest = _to_minutes(after)
+        step = self.slot_minutes
+
+        slots = []
+        with self._lock:
+            doctor_slots = self._doctor_slots.get(doctor_id) if doctor_id is not None else None
+            branch_slots = self._branch_slots.get(branch_id)
+            # نبدأ من اليوم السابق لأن دوام الأمس قد يمتد بعد منتصف الليل
+            for offset in range(-1, days):
+                day = after + timedelta(days=offset)
+                windows = day_windows(branch_hours, day)
+                if doctor_hours:
+                    windows = _intersect(windows, day_windows(doctor_hours, day))
+                for window_start, window_end in windows:
+                    start = window_start
+                    if start < earliest:
+                        start += -(-(earliest - start) // step) * step
+                    while start + step <= window_end:
+                        if (self._overlapping(doctor_slots, start) == 0
+                                and self._overlapping(branch_slots, start) < self.branch_capacity):
+                            slots.append(start)
+                            if len(slots) >= count:
+                                return [_from_minutes(minutes) for minutes in slots]
+                        start += step
+        return [_from_minutes(minutes) for minutes in slots]
+
+    def stats(self) -> Dict[str, Any]:
+        """إحصائيات الفهرس"""
+        with self._lock:
+            return {
+                "appointments": len(self._entries),
+                "doctors": len(self._doctor_slots),
+                "branches": len(self._branch_slots),
+                "high_water": self._high_water.isoformat() if self._high_water else None,
+            }
+
+
+# Global engine instance
+availability_engine = AvailabilityEngine()
+
+
+def _lock_id(value: UUID) -> int:
+    return int.from_bytes(value.bytes[:4], "big", signed=True)
+
+
+def lock_booking(db: Session, branch_id: UUID, doctor_id: Optional[UUID] = None):
+    """
+    قفل الطبيب والفرع حتى نهاية الـ transaction (PostgreSQL فقط)
+
+    يُستدعى قبل get_availability_engine(db, force_refresh=True) والتحقق من التعارض، فلا يحجز worker
+    آخر نفس الوقت بين التحقق والـ commit
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        return
+    # ترتيب ثابت للأقفال لتجنب deadlock بين حجزين
+    for key in sorted({_lock_id(value) for value in (branch_id, doctor_id) if value is not None}):
+        db.execute(text("SELECT pg_advisory_xact_lock(:namespace, :key)"), {"namespace": _BOOKING_LOCK_KEY, "key": key})
+
+
+def _integrity_details(error: IntegrityError) -> Tuple[Optional[str], Optional[str]]:
+    """(SQLSTATE، اسم القيد) من خطأ الـ driver (psycopg2 و psycopg 3)؛ (None, None) في SQLite"""
+    diag = getattr(error.orig, "diag", None)
+    if diag is None:
+        return None, None
+    return getattr(diag, "sqlstate", None), getattr(diag, "constraint_name", None)
+
+
+def is_slot_conflict(error: IntegrityError) -> bool:
+    """هل رفض الفهرس الفريد على وقت الطبيب الإدراج (حجز متزامن)؟ - وليس مفتاحاً أجنبياً أو قيمة ناقصة"""
+    sqlstate, constraint = _integrity_details(error)
+    if sqlstate is not None:
+        return constraint == ACTIVE_DOCTOR_SLOT_INDEX
+    # SQLite لا يذكر اسم الفهرس: "UNIQUE constraint failed: appointments.doctor_id, appointments.datetime"
+    return "UNIQUE constraint failed: appointments.doctor_id, appointments.datetime" in str(error.orig)
+
+
+def is_foreign_key_violation(error: IntegrityError) -> bool:
+    """هل يشير الموعد إلى فرع أو طبيب أو خدمة أو مريض غير موجود؟"""
+    sqlstate, _ = _integrity_details(error)
+    if sqlstate is not None:
+        return sqlstate == "23503"
+    return "FOREIGN KEY constraint failed" in str(error.orig)
+
+
+def get_availability_engine(db: Optional[Session] = None, force_refresh: bool = False) -> AvailabilityEngine:
+    """
+    الحصول على محرك التوفر بعد تحديثه من قاعدة البيانات
+
+    Args:
+        db: جلسة قاعدة البيانات (لتحديث الفهارس)
+        force_refresh: جلب التعديلات فوراً بدون انتظار AVAILABILITY_REFRESH_SECONDS
+    """
+    if db is not None:
+        try:
+            availability_engine.refresh(db, force=force_refresh)
+        except Exception as e:
+            logger.warning(f"Failed to refresh availability index: {str(e)}")
+            try:
+                db.rollback()
+            except:
+                pass
+    return availability_engine
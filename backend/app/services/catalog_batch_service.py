@@ -0,0 +1,276 @@
+"""
+عمليات مجمّعة على الكتالوج (الأطباء، الخدمات، الفروع)
+
+- طلب واحد يحتوي على قوائم create / update / delete تُطبق في transaction واحدة
+- الكتابة set-based: INSERT متعدد الصفوف، UPDATE بـ executemany (مجموعة لكل شكل تعديل)،
+  و DELETE ... WHERE id IN (...)
+- التحقق مسبقاً باستعلامات مجمّعة: وجود المعرفات، تعارض الأعمدة الفريدة (الاسم، رقم الترخيص)،
+  والسجلات المرتبطة التي تمنع الحذف (كل المفاتيح الأجنبية: المواعيد، العلاجات، العروض، الموظفين)
+- النتيجة لكل عنصر (created / updated / deleted / not_found / conflict / blocked،
+  و skipped للعناصر الصالحة في دفعة atomic ملغاة)
+- atomic=True: أي عنصر فاشل يلغي الدفعة كاملة؛ وإلا تُطبق العناصر الصالحة فقط
+- إصدار الكتالوج يُرفع مرة واحدة للدفعة
+"""
+import logging
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from sqlalchemy import bindparam, delete, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.config import get_settings
+from app.core.catalog import bump_catalog_version
+from app.db.models import Appointment, Branch, Doctor, Employee, Offer, Service, Treatment
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+@dataclass
+class BatchSpec:
+    """وصف الجدول للعمليات المجمّعة"""
+    model: Any
+    label: str
+    # (عمود المفتاح الأجنبي، رسالة المنع بعدد السجلات المرتبطة)
+    delete_blockers: List[Tuple[Any, str]] = field(default_factory=list)
+
+    @property
+    def table(self):
+        return self.model.__table__
+
+    @property
+    def unique_columns(self) -> List[str]:
+        return [column.name for column in self.table.columns if column.unique and not column.primary_key]
+
+
+DOCTOR_BATCH = BatchSpec(Doctor, "الطبيب", [
+    (Appointment.doctor_id, "لا يمكن حذف الطبيب لأنه لديه {count} موعد. يرجى حذف المواعيد أولاً."),
+    (Treatment.doctor_id, "لا يمكن حذف الطبيب لأنه مرتبط بـ {count} علاج في سجلات المرضى."),
+])
+SERVICE_BATCH = BatchSpec(Service, "الخدمة", [
+    (Appointment.service_id, "لا يمكن حذف الخدمة لأنها مرتبطة بـ {count} موعد. يرجى حذف المواعيد أولاً."),
+    (Offer.related_service_id, "لا يمكن حذف الخدمة لأنها مرتبطة بـ {count} عرض. يرجى حذف العروض أو تعديلها أولاً."),
+])
+BRANCH_BATCH = BatchSpec(Branch, "الفرع", [
+    (Doctor.branch_id, "لا يمكن حذف الفرع لأنه يحتوي على {count} طبيب. يرجى حذف الأطباء أولاً أو نقلهم إلى فرع آخر."),
+    (Appointment.branch_id, "لا يمكن حذف الفرع لأنه مرتبط بـ {count} موعد. يرجى حذف المواعيد أولاً."),
+    (Employee.branch_id, "لا يمكن حذف الفرع لأنه يحتوي على {count} موظف. يرجى نقل الموظفين إلى فرع آخر أولاً."),
+])
+
+
+def _values(spec: BatchSpec, data: Dict[str, Any]) -> Dict[str, Any]:
+    """أعمدة الجدول فقط (الحقول غير الموجودة في الجدول تُتجاهل) مع تحويل Decimal"""
+    columns = spec.table.columns
+    return {
+        name: float(value) if isinstance(value, Decimal) else value
+        for name, value in data.items()
+        if name in columns and name != "id"
+    }
+
+
+def _taken(db: Session, spec: BatchSpec, column: str, values: Sequence[Any]) -> Dict[Any, Any]:
+    """القيم المستخدمة مسبقاً في عمود فريد → معرف الصف"""
+    values = [value for value in set(values) if value is not None]
+    if not values:
+        return {}
+    col = spec.table.c[column]
+    rows = db.execute(select(col, spec.table.c.id).where(col.in_(values))).all()
+    return {row[0]: row[1] for row in rows}
+
+
+def _unique_conflict(
+    spec: BatchSpec,
+    values: Dict[str, Any],
+    taken: Dict[str, Dict[Any, Any]],
+    claimed: Dict[str, Dict[Any, Any]],
+    row_id: Any
+) -> Optional[str]:
+    """تعارض الأعمدة الفريدة مع قاعدة البيانات أو مع عنصر سابق في نفس الدفعة"""
+    for column in spec.unique_columns:
+        value = values.get(column)
+        if value is None:
+            continue
+        owner = claimed[column].get(value, taken[column].get(value))
+        if owner is not None and owner != row_id:
+            return f"{column} مستخدم مسبقاً: {value}"
+    return None
+
+
+def _claim(spec: BatchSpec, values: Dict[str, Any], claimed: Dict[str, Dict[Any, Any]], row_id: Any):
+    for column in spec.unique_columns:
+        if values.get(column) is not None:
+            claimed[column][values[column]] = row_id
+
+
+def apply_batch(
+    db: Session,
+    spec: BatchSpec,
+    creates: Sequence[Dict[str, Any]],
+    updates: Sequence[Dict[str, Any]],
+    deletes: Sequence[Any],
+    atomic: bool = False
+) -> Dict[str, Any]:
+    """
+    تطبيق دفعة عمليات على جدول من الكتالوج
+
+    Args:
+        db: جلسة قاعدة البيانات
+        spec: وصف الجدول (DOCTOR_BATCH, SERVICE_BATCH, BRANCH_BATCH)
+        creates: بيانات الصفوف الجديدة
+        updates: تعديلات (كل عنصر يحتوي على id والحقول المعدلة فقط)
+        deletes: معرفات الصفوف المحذوفة
+        atomic: إلغاء الدفعة كاملة إذا فشل أي عنصر
+
+    Returns:
+        {"success", "applied": {...}, "results": {"create": [...], "update": [...], "delete": [...]}}
+    """
+    table = spec.table
+    now = datetime.now()
+    results: Dict[str, List[Dict[str, Any]]] = {"create": [], "update": [], "delete": []}
+
+    # ==================== التحقق (استعلامات مجمّعة) ====================
+    update_ids = [item["id"] for item in updates]
+    existing_ids = set()
+    if update_ids or deletes:
+        existing_ids = set(db.execute(
+            select(table.c.id).where(table.c.id.in_(set(update_ids) | set(deletes)))
+        ).scalars())
+
+    # الحذف: المعرفات الموجودة وغير المرتبطة بسجلات أخرى
+    blocked: Dict[Any, str] = {}
+    deletable = [row_id for row_id in dict.fromkeys(deletes) if row_id in existing_ids]
+    for foreign_key, message in spec.delete_blockers:
+        if not deletable:
+            break
+        counts = db.execute(
+            select(foreign_key, func.count()).where(foreign_key.in_(deletable)).group_by(foreign_key)
+        ).all()
+        for row_id, count in counts:
+            blocked.setdefault(row_id, message.format(count=count))
+    delete_ok = [row_id for row_id in deletable if row_id not in blocked]
+    deleted = set(delete_ok)
+    for index, row_id in enumerate(deletes):
+        if row_id not in existing_ids:
+            results["delete"].append({"index": index, "id": str(row_id), "status": "not_found", "detail": f"لم يتم العثور على {spec.label}"})
+        elif row_id in blocked:
+            results["delete"].append({"index": index, "id": str(row_id), "status": "blocked", "detail": blocked[row_id]})
+        else:
+            results["delete"].append({"index": index, "id": str(row_id), "status": "deleted"})
+
+    # الأعمدة الفريدة: القيم المستخدمة في قاعدة البيانات (الصفوف المحذوفة في نفس الدفعة لا تُحسب)
+    create_values = [_values(spec, item) for item in creates]
+    update_values = [_values(spec, item) for item in updates]
+    taken = {}
+    for column in spec.unique_columns:
+        candidates = [values.get(column) for values in create_values + update_values]
+        taken[column] = {
+            value: owner for value, owner in _taken(db, spec, column, candidates).items() if owner not in deleted
+        }
+    claimed: Dict[str, Dict[Any, Any]] = {column: {} for column in spec.unique_columns}
+
+    # التعديل: مجموعة لكل شكل (نفس الحقول) → UPDATE واحد بـ executemany
+    update_groups: Dict[Tuple[str, ...], List[Dict[str, Any]]] = {}
+    for index, (item, values) in enumerate(zip(updates, update_values)):
+        row_id = item["id"]
+        result = {"index": index, "id": str(row_id)}
+        conflict = _unique_conflict(spec, values, taken, claimed, row_id)
+        if row_id not in existing_ids or row_id in deleted:
+            result.update(status="not_found", detail=f"لم يتم العثور على {spec.label}")
+        elif conflict:
+            result.update(status="conflict", detail=conflict)
+        else:
+            _claim(spec, values, claimed, row_id)
+            values["updated_at"] = now
+            update_groups.setdefault(tuple(sorted(values)), []).append({"_id": row_id, **values})
+            result["status"] = "updated"
+        results["update"].append(result)
+
+    # الإنشاء: INSERT متعدد الصفوف بمعرفات مولّدة مسبقاً
+    insert_rows = []
+    for index, values in enumerate(create_values):
+        row_id = uuid.uuid4()
+        conflict = _unique_conflict(spec, values, taken, claimed, row_id)
+        if conflict:
+            results["create"].append({"index": index, "id": None, "status": "conflict", "detail": conflict})
+            continue
+        _claim(spec, values, claimed, row_id)
+        insert_rows.append({"id": row_id, **values, "created_at": now, "updated_at": now})
+        results["create"].append({"index": index, "id": str(row_id), "status": "created"})
+
+    failed = sum(
+        1 for items in results.values() for item in items
+        if item["status"] not in ("created", "updated", "deleted")
+    )
+    applied = {
+        "created": len(insert_rows),
+        "updated": sum(len(rows) for rows in update_groups.values()),
+        "deleted": len(delete_ok)
+    }
+    if atomic and failed:
+        # العناصر الصالحة لم تُطبق أيضاً
+        for operation, items in results.items():
+            for item in items:
+                if item["status"] in ("created", "updated", "deleted"):
+                    item.update(status="skipped", detail="أُلغيت الدفعة بسبب عناصر غير صالحة")
+                    if operation == "create":
+                        item["id"] = None
+        return {"success": False, "applied": {name: 0 for name in applied}, "failed": failed, "results": results}
+
+    # ==================== الكتابة (transaction واحدة) ====================
+    try:
+        if delete_ok:
+            db.execute(delete(table).where(table.c.id.in_(delete_ok)))
+        for rows in update_groups.values():
+            # executemany: الأعمدة في SET من مفاتيح الصفوف (نفسها في كل المجموعة)
+            db.execute(update(table).where(table.c.id == bindparam("_id")), rows)
+        # INSERT متعدد الصفوف يحتاج نفس الأعمدة لكل صف
+        insert_groups: Dict[Tuple[str, ...], List[Dict[str, Any]]] = {}
+        for row in insert_rows:
+            insert_groups.setdefault(tuple(sorted(row)), []).append(row)
+        for rows in insert_groups.values():
+            db.execute(insert(table).values(rows))
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        logger.warning(f"Catalog batch on {table.name} rejected: {str(e)}")
+        raise
+
+    if any(applied.values()):
+        bump_catalog_version()
+    logger.info(f"📦 Catalog batch on {table.name}: {applied} ({failed} failed)")
+    return {"success": failed == 0, "applied": applied, "failed": failed, "results": results}
+
+
+def batch_response(db: Session, spec: BatchSpec, batch, atomic: bool):
+    """
+    تنفيذ دفعة من نموذج الطلب (create / update / delete) وتحويل النتيجة إلى استجابة HTTP
+
+    - أكثر من CATALOG_BATCH_MAX_ITEMS عنصر: 400
+    - atomic وفشل عنصر، أو رفض قاعدة البيانات للدفعة (تعارض متزامن): 409 مع نتائج العناصر
+    """
+    total = len(batch.create) + len(batch.update) + len(batch.delete)
+    if total == 0:
+        raise HTTPException(status_code=400, detail="الدفعة فارغة")
+    if total > settings.CATALOG_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"عدد العناصر ({total}) أكبر من الحد الأقصى ({settings.CATALOG_BATCH_MAX_ITEMS})"
+        )
+
+    creates = [item.model_dump() for item in batch.create]
+    updates = [item.model_dump(exclude_unset=True) for item in batch.update]
+    try:
+        result = apply_batch(db, spec, creates, updates, list(batch.delete), atomic=atomic)
+    except IntegrityError as e:
+        raise HTTPException(status_code=409, detail=f"رفضت قاعدة البيانات الدفعة (لم يُطبق شيء): {str(e.orig)[:200]}")
+
+    if atomic and not result["success"]:
+        return JSONResponse(status_code=409, content={
+            "detail": "لم تُطبق الدفعة: بعض العناصر غير صالحة",
+            **result
+        })
+    return result
@@ -0,0 +1,341 @@
+"""
+خدمة استيراد الكتالوج (الفروع، الأطباء، الخدمات) من ملفات CSV
+
+- الملف يُقرأ صفاً بصف (csv.DictReader على الملف نفسه) بدون تحميله كاملاً في الذاكرة كنص
+- المفاتيح الموجودة تُقرأ مرة واحدة لكل جدول (استعلام واحد) بدلاً من استعلام لكل صف
+- الكتابة على دفعات بحجم IMPORT_BATCH_SIZE بـ INSERT ... ON CONFLICT (PostgreSQL / SQLite):
+  - mode="skip": الصفوف الموجودة تُتجاهل (السلوك السابق)
+  - mode="update": الصفوف الموجودة تُحدّث (upsert)
+- الاستيراد كاملاً في transaction واحدة، وإصدار الكتالوج يُرفع مرة واحدة في النهاية
+- التقرير يحتوي على عدد الصفوف وزمن كل مرحلة (prefetch, parse, write) لكل جدول، وأخطاء الصفوف
+  (أول IMPORT_MAX_ERRORS)
+"""
+import csv
+import io
+import logging
+import re
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from sqlalchemy import inspect as sqlalchemy_inspect, select
+from sqlalchemy.orm import Session
+from app.config import get_settings
+from app.core.catalog import bump_catalog_version
+from app.db.models import Branch, Doctor, Service
+from app.db.session import engine
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# ترتيب الاستيراد مهم: الأطباء يُربطون بالفروع
+ENTITIES = ("branches", "doctors", "services")
+IMPORT_MODES = ("skip", "update")
+
+# أعمدة لا تُحدّث في mode="update"
+_KEEP_ON_UPDATE = {"id", "created_at", "license_number"}
+
+ProgressCallback = Callable[[str, int], None]
+RowIssues = List[str]
+
+
+def parse_working_hours(work_hours_str: str) -> Dict[str, Any]:
+    """
+    تحليل ساعات العمل من النص العربي إلى JSON
+    مثال: "من 8ص حتى 1ص والجمعة من 1م-1ص"
+    """
+    # افتراضي: من 8 صباحاً حتى 1 صباحاً
+    default_hours = {
+        "sunday": {"from": "08:00", "to": "01:00"},
+        "monday": {"from": "08:00", "to": "01:00"},
+        "tuesday": {"from": "08:00", "to": "01:00"},
+        "wednesday": {"from": "08:00", "to": "01:00"},
+        "thursday": {"from": "08:00", "to": "01:00"},
+        "friday": {"from": "13:00", "to": "01:00"},  # الجمعة من 1 ظهراً
+        "saturday": {"from": "08:00", "to": "01:00"}
+    }
+    if not work_hours_str or work_hours_str.strip() == "":
+        return default_hours
+
+    # تحليل بسيط - يمكن تحسينه لاحقاً
+    work_hours_str = work_hours_str.strip()
+
+    # إذا كان النص يحتوي على "الجمعة"
+    if "الجمعة" in work_hours_str:
+        if "1م" in work_hours_str or "1 ظهراً" in work_hours_str:
+            default_hours["friday"] = {"from": "13:00", "to": "01:00"}
+
+    return default_hours
+
+
+def missing_tables() -> List[str]:
+    """جداول الكتالوج غير الموجودة في قاعدة البيانات (بمحرك التطبيق نفسه)"""
+    existing_tables = sqlalchemy_inspect(engine).get_table_names()
+    return [table for table in ENTITIES if table not in existing_tables]
+
+
+def iter_csv_rows(binary_file) -> Iterator[Dict[str, str]]:
+    """قراءة ملف CSV ثنائي (UploadFile.file أو ملف مفتوح بـ "rb") صفاً بصف مع دعم BOM"""
+    text = io.TextIOWrapper(binary_file, encoding="utf-8-sig", newline="")
+    try:
+        yield from csv.DictReader(text)
+    finally:
+        # فصل الغلاف حتى لا يُغلق الملف الأصلي (يغلقه مالكه)
+        text.detach()
+
+
+def _value(row: Dict[str, str], *names: str) -> str:
+    """أول قيمة غير فارغة من الأعمدة المحددة"""
+    for name in names:
+        value = (row.get(name) or "").strip()
+        if value:
+            return value
+    return ""
+
+
+# ==================== تحويل الصفوف ====================
+
+def _branch_record(row: Dict[str, str], now: datetime, issues: RowIssues) -> Optional[Dict[str, Any]]:
+    name = _value(row, "name_ar")
+    if not name:
+        issues.append("اسم الفرع مفقود (name_ar)")
+        return None
+    return {
+        "name": name,
+        "city": _value(row, "district_ar") or "الرياض",
+        "address": _value(row, "address_ar", "district_ar"),
+        "phone": _value(row, "phone"),
+        "location_url": _value(row, "map_url"),
+        "working_hours": parse_working_hours(row.get("work_hours_ar", "")),
+        "is_active": True,
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+def _doctor_record(row: Dict[str, str], now: datetime, issues: RowIssues) -> Optional[Dict[str, Any]]:
+    name = _value(row, "doctor_name_ar")
+    if not name:
+        issues.append("اسم الطبيب مفقود (doctor_name_ar)")
+        return None
+    # استخراج سنوات الخبرة (أول رقم)
+    numbers = re.findall(r"\d+", _value(row, "experience_years", "experience_ar"))
+    return {
+        "name": name,
+        "specialty": _value(row, "specialty_ar", "department_ar"),
+        "license_number": f"LIC-{uuid.uuid4().hex[:8].upper()}",
+        "working_hours": parse_working_hours(row.get("work_hours_ar", "")),
+        "experience_years": str(int(numbers[0])) if numbers else None,
+        "bio": _value(row, "cases_ar", "notes_ar"),
+        "is_active": _value(row, "status_ar") == "على رأس العمل",
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+def _service_record(row: Dict[str, str], now: datetime, issues: RowIssues) -> Optional[Dict[str, Any]]:
+    name = _value(row, "name_ar")
+    if not name:
+        issues.append("اسم الخدمة مفقود (name_ar)")
+        return None
+    base_price = None
+    price = _value(row, "price_sar")
+    if price:
+        try:
+            base_price = float(price)
+        except ValueError:
+            # الخدمة تُستورد بدون سعر
+            issues.append(f"سعر غير صالح: {price}")
+    description = _value(row, "description_ar", "notes")
+    if not description and _value(row, "category_ar"):
+        description = f"({_value(row, 'category_ar')})"
+    return {
+        "name": name,
+        "description": description,
+        "base_price": base_price,
+        "is_active": True,
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+class _BranchResolver:
+    """ربط branch_code بالفرع من قائمة الفروع المقروءة مرة واحدة"""
+
+    def __init__(self, db: Session):
+        self.branches = db.execute(select(Branch.id, Branch.name).order_by(Branch.created_at)).all()
+        self.cache: Dict[str, Any] = {}
+
+    def resolve(self, code: str):
+        if not code:
+            return None
+        if code not in self.cache:
+            match = next((branch.id for branch in self.branches if code in branch.name), None)
+            if match is None and code == "north_hazm":
+                match = next((branch.id for branch in self.branches if "شمال" in branch.name), None)
+            self.cache[code] = match
+        return self.cache[code]
+
+
+# ==================== الكتابة ====================
+
+def _upsert(db: Session, model, records: List[Dict[str, Any]], conflict_on: List[str], mode: str):
+    """INSERT ... ON CONFLICT متعدد الصفوف في استعلام واحد"""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise RuntimeError(f"الاستيراد بالدفعات غير مدعوم لـ {dialect}")
+
+    statement = insert(model).values(records)
+    if mode == "update":
+        columns = [name for name in records[0] if name not in _KEEP_ON_UPDATE and name not in conflict_on]
+        statement = statement.on_conflict_do_update(
+            index_elements=conflict_on,
+            set_={name: statement.excluded[name] for name in columns}
+        )
+    else:
+        statement = statement.on_conflict_do_nothing(index_elements=conflict_on)
+    db.execute(statement)
+
+
+def _import_entity(
+    db: Session,
+    entity: str,
+    rows: Iterable[Dict[str, str]],
+    mode: str,
+    now: datetime,
+    progress: Optional[ProgressCallback],
+    errors: List[Dict[str, Any]]
+) -> Tuple[Dict[str, int], Dict[str, float]]:
+    """
+    استيراد جدول واحد
+
+    Returns:
+        (الأعداد: rows/inserted/updated/skipped/errors، الأزمنة بالمللي ثانية: prefetch/parse/write)
+    """
+    started = time.perf_counter()
+    resolver = None
+    if entity == "branches":
+        model, to_record, conflict_on = Branch, _branch_record, ["name"]
+        existing = {row.name: row.id for row in db.execute(select(Branch.id, Branch.name))}
+    elif entity == "services":
+        model, to_record, conflict_on = Service, _service_record, ["name"]
+        existing = {row.name: row.id for row in db.execute(select(Service.id, Service.name))}
+    else:
+        # الأطباء بدون مفتاح فريد في الجدول: المفتاح (الاسم، الفرع) والتعارض على id المقروء مسبقاً
+        model, to_record, conflict_on = Doctor, _doctor_record, ["id"]
+        existing = {(row.name, row.branch_id): row.id for row in db.execute(select(Doctor.id, Doctor.name, Doctor.branch_id))}
+        resolver = _BranchResolver(db)
+    timings = {"prefetch": (time.perf_counter() - started) * 1000, "parse": 0.0, "write": 0.0}
+
+    counts = {"rows": 0, "inserted": 0, "updated": 0, "skipped": 0, "errors": 0}
+    seen = set()
+    batch: Dict[Any, Dict[str, Any]] = {}
+
+    def flush():
+        if not batch:
+            return
+        write_started = time.perf_counter()
+        _upsert(db, model, list(batch.values()), conflict_on, mode)
+        timings["write"] += (time.perf_counter() - write_started) * 1000
+        batch.clear()
+
+    loop_started = time.perf_counter()
+    for row in rows:
+        counts["rows"] += 1
+        if progress and counts["rows"] % settings.IMPORT_BATCH_SIZE == 0:
+            progress(entity, counts["rows"])
+        issues: RowIssues = []
+        record = to_record(row, now, issues)
+        if issues:
+            counts["errors"] += len(issues)
+            for issue in issues:
+                if len(errors) < settings.IMPORT_MAX_ERRORS:
+                    # رقم السطر في الملف (السطر الأول للعناوين)
+                    errors.append({"entity": entity, "line": counts["rows"] + 1, "error": issue})
+        if record is None:
+            counts["skipped"] += 1
+            continue
+        if resolver is not None:
+            record["branch_id"] = resolver.resolve(_value(row, "branch_code"))
+            key = (record["name"], record["branch_id"])
+        else:
+            key = record["name"]
+
+        if key in seen:
+            # مكرر في نفس الملف: أول صف هو المعتمد في skip وآخر صف في update
+            counts["skipped"] += 1
+            if mode == "skip":
+                continue
+            record["id"] = existing[key]
+        elif key in existing:
+            if mode == "skip":
+                counts["skipped"] += 1
+                continue
+            record["id"] = existing[key]
+            counts["updated"] += 1
+        else:
+            record["id"] = existing[key] = uuid.uuid4()
+            counts["inserted"] += 1
+        seen.add(key)
+        batch[key] = record
+        if len(batch) >= settings.IMPORT_BATCH_SIZE:
+            flush()
+    flush()
+    if progress:
+        progress(entity, counts["rows"])
+
+    timings["parse"] = (time.perf_counter() - loop_started) * 1000 - timings["write"]
+    return counts, {phase: round(value, 1) for phase, value in timings.items()}
+
+
+def import_catalog(
+    db: Session,
+    sources: Dict[str, Iterable[Dict[str, str]]],
+    mode: str = "skip",
+    progress: Optional[ProgressCallback] = None,
+    errors: Optional[List[Dict[str, Any]]] = None
+) -> Dict[str, Any]:
+    """
+    استيراد الكتالوج من مصادر صفوف CSV
+
+    Args:
+        db: جلسة قاعدة البيانات
+        sources: {"branches" | "doctors" | "services": صفوف CSV (مثل iter_csv_rows)}
+        mode: "skip" أو "update"
+        progress: دالة تُستدعى كل IMPORT_BATCH_SIZE صف (الجدول، عدد الصفوف المقروءة في الجدول)
+        errors: قائمة تُضاف إليها أخطاء الصفوف أثناء الاستيراد (لمتابعتها من الخارج)
+
+    Returns:
+        {"counts": {...}, "timings_ms": {...}, "errors": [...]}
+    """
+    if mode not in IMPORT_MODES:
+        raise ValueError(f"mode غير صالح: {mode}")
+    errors = [] if errors is None else errors
+
+    now = datetime.now()
+    counts: Dict[str, Dict[str, int]] = {}
+    timings: Dict[str, Dict[str, float]] = {}
+    try:
+        for entity in ENTITIES:
+            rows = sources.get(entity)
+            if rows is None:
+                continue
+            counts[entity], timings[entity] = _import_entity(db, entity, rows, mode, now, progress, errors)
+            logger.info(
+                f"✅ {entity}: {counts[entity]['inserted']} جديد، {counts[entity]['updated']} محدّث، "
+                f"{counts[entity]['skipped']} متجاهل ({timings[entity]})"
+            )
+        commit_started = time.perf_counter()
+        db.commit()
+        timings["commit"] = {"write": round((time.perf_counter() - commit_started) * 1000, 1)}
+    except Exception:
+        db.rollback()
+        raise
+
+    if any(entity_counts["inserted"] or entity_counts["updated"] for entity_counts in counts.values()):
+        bump_catalog_version()
+    return {"counts": counts, "timings_ms": timings, "errors": errors}
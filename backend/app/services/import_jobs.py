@@ -0,0 +1,252 @@
+"""
+مهام استيراد CSV في الخلفية - جدول import_jobs
+
+- الطلب ينسخ الملفات المرفوعة إلى ملفات مؤقتة وينشئ مهمة ويرد فوراً (202) بمعرفها
+  (بدون انتظار الاستيراد: لا timeout من الـ proxy ولا حجز للـ event loop)
+- التحليل والتحقق والكتابة في thread pool (IMPORT_WORKERS) بجلسة قاعدة بيانات خاصة بالمهمة
+- التقدم (الصفوف، الحجم المقروء، الأخطاء) يُكتب في import_jobs مرة كل IMPORT_PROGRESS_SECONDS
+  بجلسة منفصلة (الاستيراد نفسه transaction واحدة لا تظهر إلا عند انتهائها)؛
+  في SQLite (كاتب واحد فقط) لا يُكتب التقدم أثناء الاستيراد، فقط النتيجة النهائية
+- حالة المهمة (السرعة والوقت المتبقي) تُحسب من الصف المحفوظ، فالاستعلام عنها رخيص ويعمل من أي worker
+- مهمة بدون تحديث لمدة IMPORT_JOB_STALE_SECONDS وليست قيد التنفيذ في هذه العملية تُعلّم failed
+  (توقف الخادم أثناء التنفيذ)
+"""
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, BinaryIO, Dict, List, Optional, Set
+from sqlalchemy.orm import Session
+from app.config import get_settings
+from app.db.session import engine, SessionLocal
+from app.db.models import ImportJob
+from app.services.csv_import_service import ENTITIES, import_catalog, iter_csv_rows
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+class ImportJobRunner:
+    """تنفيذ مهام الاستيراد في thread pool"""
+
+    def __init__(self):
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        # المهام المسجلة في هذه العملية (في الانتظار أو قيد التنفيذ)
+        self._active: Set[uuid.UUID] = set()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=max(1, settings.IMPORT_WORKERS),
+                    thread_name_prefix="csv-import"
+                )
+            return self._executor
+
+    def stage_upload(self, entity: str, source: BinaryIO) -> str:
+        """نسخ ملف مرفوع إلى ملف مؤقت (الملف المرفوع يُحذف بعد انتهاء الطلب)"""
+        handle, path = tempfile.mkstemp(prefix="import-", suffix=f"-{entity}.csv", dir=settings.IMPORT_JOBS_DIR)
+        with os.fdopen(handle, "wb") as target:
+            shutil.copyfileobj(source, target, 1024 * 1024)
+        return path
+
+    def submit(
+        self,
+        db: Session,
+        paths: Dict[str, str],
+        names: Dict[str, str],
+        mode: str,
+        cleanup: bool = True
+    ) -> ImportJob:
+        """
+        إنشاء مهمة وإضافتها للتنفيذ
+
+        Args:
+            db: جلسة قاعدة البيانات
+            paths: {الجدول: مسار ملف CSV}
+            names: {الجدول: اسم الملف الأصلي}
+            mode: "skip" أو "update"
+            cleanup: حذف الملفات بعد انتهاء المهمة (الملفات المؤقتة للرفع)
+        """
+        job = ImportJob(
+            id=uuid.uuid4(),
+            status="queued",
+            mode=mode,
+            files=names,
+            total_bytes=sum(os.path.getsize(path) for path in paths.values()),
+            errors=[]
+        )
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+
+        with self._lock:
+            self._active.add(job.id)
+        self._get_executor().submit(self._run, job.id, paths, mode, cleanup)
+        logger.info(f"📥 Import job {job.id} queued ({', '.join(paths)})")
+        return job
+
+    def _update(self, job_id: uuid.UUID, values: Dict[str, Any]):
+        """تحديث صف المهمة بجلسة مستقلة (يظهر فوراً لمن يستعلم عن الحالة)"""
+        db = SessionLocal()
+        try:
+            db.query(ImportJob).filter(ImportJob.id == job_id).update(values, synchronize_session=False)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"Failed to update import job {job_id}: {str(e)}")
+        finally:
+            db.close()
+
+    def _run(self, job_id: uuid.UUID, paths: Dict[str, str], mode: str, cleanup: bool):
+        """تنفيذ المهمة (في thread من الـ pool)"""
+        self._update(job_id, {"status": "running", "started_at": datetime.now()})
+        handles: Dict[str, BinaryIO] = {}
+        errors: List[Dict[str, Any]] = []
+        entity_rows: Dict[str, int] = {}
+        last_write = [0.0]
+
+        def processed_bytes() -> int:
+            # موضع القراءة في كل ملف (TextIOWrapper يقرأ مسبقاً بقطع صغيرة - تقريب كافٍ للـ ETA)
+            total = 0
+            for handle in handles.values():
+                try:
+                    total += handle.tell()
+                except ValueError:
+                    pass
+            return total
+
+        def progress(entity: str, rows: int):
+            entity_rows[entity] = rows
+            if engine.dialect.name == "sqlite":
+                # الكتابة ستنتظر انتهاء transaction الاستيراد
+                return
+            now = time.monotonic()
+            if now - last_write[0] < settings.IMPORT_PROGRESS_SECONDS:
+                return
+            last_write[0] = now
+            self._update(job_id, {
+                "current_entity": entity,
+                "rows_processed": sum(entity_rows.values()),
+                "processed_bytes": processed_bytes(),
+                "error_count": len(errors),
+                "errors": list(errors)
+            })
+
+        db = SessionLocal()
+        try:
+            for entity in ENTITIES:
+                if entity in paths:
+                    handles[entity] = open(paths[entity], "rb")
+            sources = {entity: iter_csv_rows(handle) for entity, handle in handles.items()}
+            report = import_catalog(db, sources, mode, progress=progress, errors=errors)
+            counts = report["counts"]
+            self._update(job_id, {
+                "status": "completed",
+                "current_entity": None,
+                "rows_processed": sum(entity_counts["rows"] for entity_counts in counts.values()),
+                "processed_bytes": processed_bytes(),
+                "error_count": sum(entity_counts["errors"] for entity_counts in counts.values()),
+                "errors": report["errors"],
+                "result": {"counts": counts, "timings_ms": report["timings_ms"]},
+                "finished_at": datetime.now()
+            })
+            logger.info(f"✅ Import job {job_id} completed: {counts}")
+        except Exception as e:
+            logger.error(f"❌ Import job {job_id} failed: {str(e)}", exc_info=True)
+            self._update(job_id, {
+                "status": "failed",
+                "error": str(e)[:1000],
+                "error_count": len(errors),
+                "errors": list(errors),
+                "finished_at": datetime.now()
+            })
+        finally:
+            db.close()
+            for handle in handles.values():
+                handle.close()
+            if cleanup:
+                for path in paths.values():
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+            with self._lock:
+                self._active.discard(job_id)
+
+    def refresh_stale(self, db: Session, job: ImportJob) -> ImportJob:
+        """تعليم المهمة failed إذا توقفت (لا تحديث منذ مدة وليست قيد التنفيذ هنا)"""
+        if job.status not in ACTIVE_STATUSES:
+            return job
+        with self._lock:
+            if job.id in self._active:
+                return job
+        heartbeat = job.updated_at or job.created_at
+        if heartbeat and datetime.now() - heartbeat > timedelta(seconds=settings.IMPORT_JOB_STALE_SECONDS):
+            job.status = "failed"
+            job.error = "توقفت المهمة قبل انتهائها (إعادة تشغيل الخادم؟) - أعد رفع الملفات"
+            job.finished_at = datetime.now()
+            db.commit()
+        return job
+
+    def shutdown(self):
+        """إيقاف الـ pool (المهام في الانتظار تُلغى وتُعلّم failed لاحقاً كمهام متوقفة)"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def job_status(job: ImportJob) -> Dict[str, Any]:
+    """حالة المهمة مع السرعة والوقت المتبقي المقدّر"""
+    now = datetime.now()
+    elapsed = None
+    if job.started_at:
+        elapsed = max(((job.finished_at or now) - job.started_at).total_seconds(), 0.001)
+
+    rows_per_second = round(job.rows_processed / elapsed, 1) if elapsed else None
+    fraction = None
+    if job.status == "completed":
+        fraction = 1.0
+    elif job.total_bytes:
+        fraction = min(job.processed_bytes / job.total_bytes, 1.0)
+
+    eta_seconds = None
+    if job.status == "running" and elapsed and fraction:
+        eta_seconds = round(elapsed * (1 - fraction) / fraction, 1)
+
+    return {
+        "id": str(job.id),
+        "status": job.status,
+        "mode": job.mode,
+        "files": job.files or {},
+        "current_entity": job.current_entity,
+        "rows_processed": job.rows_processed,
+        "rows_per_second": rows_per_second,
+        "progress": round(fraction * 100, 1) if fraction is not None else None,
+        "eta_seconds": eta_seconds,
+        "error_count": job.error_count,
+        "errors": job.errors or [],
+        "result": job.result,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None
+    }
+
+
+# Global instance
+import_job_runner = ImportJobRunner()
+
+
+def get_import_job_runner() -> ImportJobRunner:
+    """الحصول على منفذ مهام الاستيراد"""
+    return import_job_runner
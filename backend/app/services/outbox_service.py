@@ -0,0 +1,364 @@
+"""
+Outbox - إرسال التغييرات إلى n8n (push) بدلاً من الاستعلام الدوري (polling)
+
+- كل تعديل على المواعيد والمحادثات والتحويلات والفواتير يُكتب معه حدث في outbox_events
+  داخل نفس الـ transaction (لا يُفقد حدث ولا يُرسل حدث لتعديل لم يُحفظ):
+  * تعديلات الـ ORM: مستمع before_flush (install_outbox_listener)
+  * الكتابة المجمّعة للمحادثات (conversation_buffer): outbox_rows() مع نفس الـ INSERT
+- الـ dispatcher (مهمة في الـ scheduler) يرسل الأحداث دفعات بالترتيب (حسب الرقم التسلسلي)
+  إلى N8N_WEBHOOK_URLS، مع توقيع HMAC اختياري (N8N_WEBHOOK_SECRET)
+- عند الفشل: إعادة المحاولة لنفس الدفعة مع exponential backoff (أو Retry-After)، والدفعة الأولى
+  تمنع ما بعدها حتى تُرسل (الترتيب محفوظ)، وبعد OUTBOX_MAX_ATTEMPTS تُعلّم الأحداث failed
+- الضغط الخلفي (backpressure): دفعة واحدة فقط قيد الإرسال، وحجم الدفعة يُنصّف عند كل فشل
+  (يعزل الحدث الذي يرفضه المستقبل) ويتضاعف عند النجاح حتى OUTBOX_BATCH_SIZE
+- التسليم "مرة واحدة على الأقل": قد يُعاد إرسال حدث، والمستقبل يتجاهل المكرر حسب id
+
+ملاحظة: عمليات query().delete() / update() المجمّعة لا تمر بالـ ORM فلا تُنتج أحداثاً
+"""
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import uuid
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional
+import httpx
+from sqlalchemy import event, func, inspect, text
+from sqlalchemy.orm import Session
+from app.config import get_settings
+from app.db.session import engine, SessionLocal
+from app.db.models import Appointment, Conversation, PendingHandoff, Invoice, OutboxEvent
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# النموذج → اسم الكيان في الأحداث
+_AGGREGATES = {
+    Appointment: "appointment",
+    Conversation: "conversation",
+    PendingHandoff: "handoff",
+    Invoice: "invoice",
+}
+_TABLE_AGGREGATES = {model.__tablename__: name for model, name in _AGGREGATES.items()}
+
+# مفتاح advisory lock في PostgreSQL (dispatcher واحد فقط بين جميع الـ workers)
+_DISPATCH_LOCK_KEY = 7_310_038
+
+
+def webhook_urls() -> List[str]:
+    """عناوين webhooks المستقبلة (مفصولة بفواصل في N8N_WEBHOOK_URLS)"""
+    return [url.strip() for url in (settings.N8N_WEBHOOK_URLS or "").split(",") if url.strip()]
+
+
+def outbox_enabled() -> bool:
+    """الأحداث تُسجل فقط إذا كان هناك مستقبل"""
+    return bool(webhook_urls())
+
+
+def _plain(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return value
+
+
+def _event_row(aggregate: str, action: str, values: Dict[str, Any], changed: Optional[List[str]] = None) -> Dict[str, Any]:
+    payload = {key: _plain(value) for key, value in values.items()}
+    if changed is not None:
+        payload["_changed"] = changed
+    return {
+        "event_type": f"{aggregate}.{action}",
+        "aggregate_type": aggregate,
+        "aggregate_id": _plain(values.get("id")),
+        "payload": payload,
+        "status": "pending",
+        "attempts": 0,
+        "created_at": datetime.now(),
+    }
+
+
+def outbox_rows(batch: Dict[str, List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """
+    أحداث "created" لصفوف تُكتب بـ INSERT مباشر (Core) - تُدرج في نفس الـ transaction
+
+    Args:
+        batch: {table_name: [row, ...]}
+    """
+    if not outbox_enabled():
+        return []
+    rows = []
+    for table_name, table_rows in batch.items():
+        aggregate = _TABLE_AGGREGATES.get(table_name)
+        if aggregate:
+            rows.extend(_event_row(aggregate, "created", row) for row in table_rows)
+    return rows
+
+
+def _column_values(obj) -> Dict[str, Any]:
+    """قيم الأعمدة المحملة فقط (بدون تحميل أثناء الـ flush)"""
+    state = inspect(obj)
+    return {
+        attr.key: state.dict[attr.key]
+        for attr in state.mapper.column_attrs
+        if attr.key in state.dict
+    }
+
+
+def _capture_changes(session: Session, flush_context, instances):
+    """before_flush: إضافة حدث لكل كيان جديد أو معدل أو محذوف"""
+    if not outbox_enabled():
+        return
+    events = []
+    for obj in session.new:
+        aggregate = _AGGREGATES.get(type(obj))
+        if aggregate:
+            # المعرف يُولد عادة عند الـ INSERT - نحتاجه الآن للحدث
+            if obj.id is None:
+                obj.id = uuid.uuid4()
+            events.append(_event_row(aggregate, "created", _column_values(obj)))
+    for obj in session.dirty:
+        aggregate = _AGGREGATES.get(type(obj))
+        if aggregate and session.is_modified(obj, include_collections=False):
+            state = inspect(obj)
+            changed = [
+                attr.key for attr in state.mapper.column_attrs
+                if state.attrs[attr.key].history.has_changes()
+            ]
+            events.append(_event_row(aggregate, "updated", _column_values(obj), changed))
+    for obj in session.deleted:
+        aggregate = _AGGREGATES.get(type(obj))
+        if aggregate:
+            events.append(_event_row(aggregate, "deleted", {"id": obj.id}))
+    if events:
+        session.add_all([OutboxEvent(**row) for row in events])
+
+
+def install_outbox_listener():
+    """تسجيل مستمع before_flush لجميع الجلسات (مرة واحدة عند بدء التشغيل)"""
+    if not event.contains(Session, "before_flush", _capture_changes):
+        event.listen(Session, "before_flush", _capture_changes)
+
+
+class DeliveryError(Exception):
+    """فشل إرسال دفعة (retry_after من المستقبل إن وُجد)"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class OutboxDispatcher:
+    """إرسال أحداث الـ outbox إلى webhooks بالترتيب على دفعات"""
+
+    def __init__(self, batch_size: Optional[int] = None):
+        self.max_batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+        self.batch_size = self.max_batch_size
+        self._client: Optional[httpx.AsyncClient] = None
+        self.delivered_events = 0
+        self.failed_batches = 0
+        self.dead_events = 0
+
+    # ------------------------------------------------------------------
+    # قاعدة البيانات (تُنفذ في thread منفصل)
+    # ------------------------------------------------------------------
+
+    def _try_lock(self):
+        """advisory lock على اتصال خاص (PostgreSQL فقط) - None إذا كان dispatcher آخر يعمل"""
+        if engine.dialect.name != "postgresql":
+            return False
+        connection = engine.connect()
+        if connection.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": _DISPATCH_LOCK_KEY}).scalar():
+            return connection
+        connection.close()
+        return None
+
+    def _unlock(self, connection):
+        if connection:
+            connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": _DISPATCH_LOCK_KEY})
+            connection.close()
+
+    def _claim(self) -> List[Dict[str, Any]]:
+        """أول الأحداث المعلقة بالترتيب - فارغة إذا كان أولها ينتظر إعادة المحاولة"""
+        db = SessionLocal()
+        try:
+            events = db.query(OutboxEvent).filter(OutboxEvent.status == "pending")\
+                .order_by(OutboxEvent.id).limit(self.batch_size).all()
+            if not events:
+                return []
+            if events[0].next_attempt_at and events[0].next_attempt_at > datetime.now():
+                return []
+            return [
+                {
+                    "id": e.id,
+                    "type": e.event_type,
+                    "aggregate_type": e.aggregate_type,
+                    "aggregate_id": e.aggregate_id,
+                    "occurred_at": _plain(e.created_at),
+                    "attempt": e.attempts + 1,
+                    "data": e.payload,
+                }
+                for e in events
+            ]
+        finally:
+            db.close()
+
+    def _mark_delivered(self, ids: List[int]):
+        db = SessionLocal()
+        try:
+            db.query(OutboxEvent).filter(OutboxEvent.id.in_(ids)).update(
+                {"status": "delivered", "delivered_at": datetime.now(), "last_error": None},
+                synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def _mark_failed(self, ids: List[int], error: str, retry_after: Optional[float]):
+        db = SessionLocal()
+        try:
+            now = datetime.now()
+            for outbox_event in db.query(OutboxEvent).filter(OutboxEvent.id.in_(ids)).all():
+                outbox_event.attempts += 1
+                outbox_event.last_error = error[:1000]
+                if outbox_event.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+                    outbox_event.status = "failed"
+                    self.dead_events += 1
+                    logger.error(f"Outbox event {outbox_event.id} ({outbox_event.event_type}) failed permanently: {error}")
+                    continue
+                backoff = min(
+                    settings.OUTBOX_RETRY_BASE_SECONDS * 2 ** (outbox_event.attempts - 1),
+                    settings.OUTBOX_RETRY_MAX_SECONDS
+                )
+                outbox_event.next_attempt_at = now + timedelta(seconds=max(backoff, retry_after or 0))
+            db.commit()
+        finally:
+            db.close()
+
+    def purge_delivered(self) -> int:
+        """حذف الأحداث المرسلة الأقدم من OUTBOX_RETENTION_HOURS"""
+        db = SessionLocal()
+        try:
+            cutoff = datetime.now() - timedelta(hours=settings.OUTBOX_RETENTION_HOURS)
+            deleted = db.query(OutboxEvent).filter(
+                OutboxEvent.status == "delivered",
+                OutboxEvent.delivered_at < cutoff
+            ).delete(synchronize_session=False)
+            db.commit()
+            return deleted
+        finally:
+            db.close()
+
+    # ------------------------------------------------------------------
+    # الإرسال
+    # ------------------------------------------------------------------
+
+    def _headers(self, body: bytes, events: List[Dict[str, Any]]) -> Dict[str, str]:
+        headers = {
+            "Content-Type": "application/json",
+            "X-Outbox-First-Id": str(events[0]["id"]),
+            "X-Outbox-Last-Id": str(events[-1]["id"]),
+        }
+        if settings.N8N_WEBHOOK_SECRET:
+            signature = hmac.new(settings.N8N_WEBHOOK_SECRET.encode("utf-8"), body, hashlib.sha256).hexdigest()
+            headers["X-Signature-256"] = f"sha256={signature}"
+        return headers
+
+    async def _send(self, events: List[Dict[str, Any]]):
+        """إرسال الدفعة لكل المستقبلين (DeliveryError إذا فشل أحدهم)"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=settings.OUTBOX_HTTP_TIMEOUT_SECONDS)
+        body = json.dumps({"events": events}, ensure_ascii=False, default=str).encode("utf-8")
+        headers = self._headers(body, events)
+        for url in webhook_urls():
+            try:
+                response = await self._client.post(url, content=body, headers=headers)
+            except httpx.HTTPError as e:
+                raise DeliveryError(f"{url}: {type(e).__name__}: {str(e)}")
+            if response.is_success:
+                continue
+            retry_after = None
+            if response.status_code in (429, 503):
+                try:
+                    retry_after = float(response.headers.get("Retry-After", ""))
+                except ValueError:
+                    pass
+            raise DeliveryError(f"{url}: HTTP {response.status_code}", retry_after)
+
+    async def dispatch(self) -> int:
+        """
+        إرسال الأحداث المعلقة (حتى OUTBOX_MAX_BATCHES_PER_RUN دفعة)
+
+        Returns:
+            عدد الأحداث المرسلة
+        """
+        if not outbox_enabled():
+            return 0
+        lock = await asyncio.to_thread(self._try_lock)
+        if lock is None:
+            return 0
+
+        delivered = 0
+        try:
+            for _ in range(settings.OUTBOX_MAX_BATCHES_PER_RUN):
+                events = await asyncio.to_thread(self._claim)
+                if not events:
+                    break
+                ids = [e["id"] for e in events]
+                try:
+                    await self._send(events)
+                except DeliveryError as e:
+                    self.failed_batches += 1
+                    logger.warning(f"Outbox delivery failed for {len(ids)} events (#{ids[0]}-#{ids[-1]}): {str(e)}")
+                    await asyncio.to_thread(self._mark_failed, ids, str(e), e.retry_after)
+                    self.batch_size = max(1, self.batch_size // 2)
+                    break
+
+                await asyncio.to_thread(self._mark_delivered, ids)
+                delivered += len(ids)
+                self.delivered_events += len(ids)
+                full = len(ids) >= self.batch_size
+                self.batch_size = min(self.max_batch_size, self.batch_size * 2)
+                if not full:
+                    break
+        finally:
+            await asyncio.to_thread(self._unlock, lock)
+
+        if delivered:
+            logger.debug(f"Outbox delivered {delivered} events")
+        return delivered
+
+    def stats(self) -> Dict[str, Any]:
+        """إحصائيات الـ outbox"""
+        db = SessionLocal()
+        try:
+            by_status = dict(db.query(OutboxEvent.status, func.count()).group_by(OutboxEvent.status).all())
+            oldest_pending = db.query(func.min(OutboxEvent.created_at))\
+                .filter(OutboxEvent.status == "pending").scalar()
+        finally:
+            db.close()
+        return {
+            "enabled": outbox_enabled(),
+            "receivers": len(webhook_urls()),
+            "by_status": by_status,
+            "oldest_pending": _plain(oldest_pending),
+            "batch_size": self.batch_size,
+            "delivered_events": self.delivered_events,
+            "failed_batches": self.failed_batches,
+            "dead_events": self.dead_events,
+        }
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+# Global dispatcher instance
+outbox_dispatcher = OutboxDispatcher()
+
+
+def get_outbox_dispatcher() -> OutboxDispatcher:
+    """الحصول على dispatcher الـ outbox"""
+    return outbox_dispatcher
@@ -0,0 +1,272 @@
+"""
+تقسيم جدول conversations شهرياً (PostgreSQL range partitioning) - اختياري
+
+- التحويل مرة واحدة بـ scripts/partition_conversations.py convert: جدول أب مقسم حسب created_at
+  وقسم لكل شهر (conversations_pYYYYMM) وقسم افتراضي (conversations_default) للتواريخ خارج الأقسام
+- المفتاح الأساسي يصبح (id, created_at) لأن PostgreSQL يشترط عمود التقسيم في كل قيد فريد، لذلك
+  تُحذف الـ foreign keys من unanswered_questions و pending_handoffs (المعرف يبقى كمرجع)
+- الاستعلامات التي تفلتر بـ created_at (السجل، التحليلات، التصدير) تقرأ الأقسام المطابقة فقط
+  (partition pruning) بدون أي تعديل في الكود
+- الأقسام المنتهية (كل صفوفها أقدم من مدة الاحتفاظ) تُؤرشف ثم تُفصل (DETACH) وتُحذف: الحذف O(1)
+  بدلاً من DELETE لكل صف؛ الصفوف المتبقية في شهر الحد تُحذف بالدفعات العادية (retention_service)
+- الأقسام القادمة تُنشأ مسبقاً (CONVERSATION_PARTITION_MONTHS_AHEAD) بمهمة يومية في الـ scheduler
+
+بدون التحويل (أو على SQLite) كل الدوال لا تفعل شيئاً ويبقى الحذف بالدفعات
+"""
+import logging
+import re
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from sqlalchemy import column, func, select, table as table_clause, text
+from sqlalchemy.engine import Connection
+from app.config import get_settings
+from app.db.session import engine
+from app.db.models import Conversation
+from app.services.archive_service import ArchiveWriter
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+PARTITIONED_TABLE = Conversation.__tablename__
+DEFAULT_PARTITION = f"{PARTITIONED_TABLE}_default"
+_PARTITION_NAME = re.compile(rf"^{PARTITIONED_TABLE}_p(\d{{4}})(\d{{2}})$")
+
+
+def _month_start(value: date) -> date:
+    return date(value.year, value.month, 1)
+
+
+def _next_month(month: date) -> date:
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARTITIONED_TABLE}_p{month.year:04d}{month.month:02d}"
+
+
+def _create_partition(connection: Connection, month: date):
+    connection.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF {PARTITIONED_TABLE} "
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_next_month(month).isoformat()}')"
+    ))
+
+
+def is_partitioned(connection: Optional[Connection] = None) -> bool:
+    """هل جدول conversations مقسم؟ (دائماً False خارج PostgreSQL)"""
+    if engine.dialect.name != "postgresql":
+        return False
+    query = text(
+        "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+        "WHERE c.relname = :name AND pg_table_is_visible(c.oid)"
+    )
+    if connection is not None:
+        return connection.execute(query, {"name": PARTITIONED_TABLE}).first() is not None
+    with engine.connect() as own:
+        return own.execute(query, {"name": PARTITIONED_TABLE}).first() is not None
+
+
+def list_partitions(connection: Connection) -> List[Dict[str, Any]]:
+    """الأقسام الشهرية مرتبة بالتاريخ (مع عدد الصفوف التقريبي من الإحصائيات)"""
+    rows = connection.execute(text(
+        "SELECT c.relname, c.reltuples FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = :name"
+    ), {"name": PARTITIONED_TABLE}).all()
+    partitions = []
+    for name, estimated_rows in rows:
+        match = _PARTITION_NAME.match(name)
+        if not match:
+            continue
+        start = date(int(match.group(1)), int(match.group(2)), 1)
+        partitions.append({
+            "name": name,
+            "start": start,
+            "end": _next_month(start),
+            "estimated_rows": max(int(estimated_rows), 0),
+        })
+    return sorted(partitions, key=lambda partition: partition["start"])
+
+
+def ensure_partitions(months_ahead: Optional[int] = None) -> List[str]:
+    """إنشاء أقسام الشهر الحالي والأشهر القادمة إذا لم تكن موجودة - أسماء الأقسام الجديدة"""
+    if not is_partitioned():
+        return []
+    months_ahead = settings.CONVERSATION_PARTITION_MONTHS_AHEAD if months_ahead is None else months_ahead
+    created = []
+    with engine.begin() as connection:
+        existing = {partition["name"] for partition in list_partitions(connection)}
+        month = _month_start(date.today())
+        for _ in range(months_ahead + 1):
+            if partition_name(month) not in existing:
+                # يفشل إذا كان القسم الافتراضي يحتوي صفوفاً من هذا الشهر (تُنقل يدوياً)
+                _create_partition(connection, month)
+                created.append(partition_name(month))
+            month = _next_month(month)
+    if created:
+        logger.info(f"📅 Created conversation partitions: {', '.join(created)}")
+    return created
+
+
+def convert_to_partitioned(drop_legacy: bool = False) -> Dict[str, Any]:
+    """
+    تحويل conversations إلى جدول مقسم شهرياً (transaction واحدة، الجدول مقفل طوال النسخ)
+
+    Args:
+        drop_legacy: حذف الجدول القديم بعد النسخ (وإلا يبقى باسم conversations_legacy)
+
+    Returns:
+        {"partitions", "rows", "dropped_foreign_keys", "legacy_table"}
+    """
+    if engine.dialect.name != "postgresql":
+        raise RuntimeError("تقسيم الجداول متاح في PostgreSQL فقط")
+    if is_partitioned():
+        raise RuntimeError(f"جدول {PARTITIONED_TABLE} مقسم مسبقاً")
+
+    legacy = f"{PARTITIONED_TABLE}_legacy"
+    with engine.begin() as connection:
+        # الفهارس الحالية (غير الفريدة) تُعاد على الجدول المقسم بنفس الأسماء
+        indexes = connection.execute(text(
+            "SELECT indexname, indexdef FROM pg_indexes "
+            "WHERE tablename = :name AND indexdef NOT LIKE 'CREATE UNIQUE%'"
+        ), {"name": PARTITIONED_TABLE}).all()
+        foreign_keys = connection.execute(text(
+            "SELECT conrelid::regclass::text, conname FROM pg_constraint "
+            "WHERE contype = 'f' AND confrelid = CAST(:name AS regclass)"
+        ), {"name": PARTITIONED_TABLE}).all()
+        primary_key = connection.execute(text(
+            "SELECT conname FROM pg_constraint WHERE contype = 'p' AND conrelid = CAST(:name AS regclass)"
+        ), {"name": PARTITIONED_TABLE}).scalar()
+
+        connection.execute(text(f"LOCK TABLE {PARTITIONED_TABLE} IN ACCESS EXCLUSIVE MODE"))
+        for table_name, constraint in foreign_keys:
+            connection.execute(text(f'ALTER TABLE {table_name} DROP CONSTRAINT "{constraint}"'))
+        connection.execute(text(f"ALTER TABLE {PARTITIONED_TABLE} RENAME TO {legacy}"))
+        for index_name, _ in indexes:
+            connection.execute(text(f'ALTER INDEX "{index_name}" RENAME TO "{index_name}_legacy"'))
+        if primary_key:
+            # اسم المفتاح الأساسي (وفهرسه) يُستخدم للجدول الجديد
+            connection.execute(text(f'ALTER TABLE {legacy} RENAME CONSTRAINT "{primary_key}" TO "{legacy}_pkey"'))
+
+        connection.execute(text(
+            f"CREATE TABLE {PARTITIONED_TABLE} (LIKE {legacy} INCLUDING DEFAULTS INCLUDING COMMENTS) "
+            f"PARTITION BY RANGE (created_at)"
+        ))
+        connection.execute(text(f"ALTER TABLE {PARTITIONED_TABLE} ADD PRIMARY KEY (id, created_at)"))
+        for _, definition in indexes:
+            # التعريف قُرئ قبل إعادة التسمية: ON public.conversations باسم الفهرس الأصلي
+            connection.exec_driver_sql(definition)
+
+        first = connection.execute(text(f"SELECT min(created_at) FROM {legacy}")).scalar()
+        month = _month_start(first.date() if first else date.today())
+        last = _month_start(date.today())
+        for _ in range(settings.CONVERSATION_PARTITION_MONTHS_AHEAD):
+            last = _next_month(last)
+        partitions = []
+        while month <= last:
+            _create_partition(connection, month)
+            partitions.append(partition_name(month))
+            month = _next_month(month)
+        connection.execute(text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {PARTITIONED_TABLE} DEFAULT"))
+
+        rows = connection.execute(text(f"INSERT INTO {PARTITIONED_TABLE} SELECT * FROM {legacy}")).rowcount
+        if drop_legacy:
+            connection.execute(text(f"DROP TABLE {legacy}"))
+
+    logger.info(f"✅ {PARTITIONED_TABLE} partitioned: {rows} rows in {len(partitions)} partitions")
+    return {
+        "partitions": partitions,
+        "rows": rows,
+        "dropped_foreign_keys": [f"{table_name}.{constraint}" for table_name, constraint in foreign_keys],
+        "legacy_table": None if drop_legacy else legacy,
+    }
+
+
+def drop_expired_partitions(
+    cutoff: datetime,
+    dependents: Sequence[Tuple[Any, str]] = (),
+    archived: bool = False,
+    keep_detached: bool = False
+) -> List[Dict[str, Any]]:
+    """
+    أرشفة وفصل وحذف الأقسام التي كل صفوفها أقدم من cutoff
+
+    Args:
+        cutoff: حد الاحتفاظ
+        dependents: (عمود المرجع في الجدول المرتبط، "nullify" أو "delete") - كما في RetentionPolicy
+        archived: كتابة صفوف القسم في ملف أرشيف قبل حذفه
+        keep_detached: فصل القسم بدون حذفه (يبقى جدولاً مستقلاً)
+
+    Returns:
+        قائمة الأقسام المعالجة
+    """
+    if not is_partitioned():
+        return []
+    with engine.connect() as connection:
+        expired = [partition for partition in list_partitions(connection) if partition["end"] <= cutoff.date()]
+
+    done = []
+    source_columns = [column(c.name) for c in Conversation.__table__.columns]
+    for partition in expired:
+        name = partition["name"]
+        rows = partition["estimated_rows"]
+        archive_path = None
+        if archived:
+            # القراءة على دفعات من القسم مباشرة (بدون تحميله في الذاكرة)
+            writer = ArchiveWriter(Conversation.__table__, name=name)
+            partition_table = table_clause(name, *source_columns)
+            try:
+                with engine.connect() as connection:
+                    result = connection.execution_options(yield_per=settings.RETENTION_BATCH_SIZE)\
+                        .execute(select(partition_table))
+                    for chunk in result.partitions():
+                        writer.write(chunk)
+            finally:
+                writer.close()
+            rows = writer.rows
+            archive_path = writer.path if writer.rows else None
+
+        with engine.begin() as connection:
+            # لا تنتظر خلف استعلامات طويلة على الجدول الأب (المحاولة في التشغيل التالي)
+            connection.execute(text("SET LOCAL lock_timeout = '5s'"))
+            for foreign_key, action in dependents:
+                subquery = f"SELECT id FROM {name}"
+                if action == "delete":
+                    connection.execute(text(
+                        f"DELETE FROM {foreign_key.table.name} WHERE {foreign_key.name} IN ({subquery})"
+                    ))
+                else:
+                    connection.execute(text(
+                        f"UPDATE {foreign_key.table.name} SET {foreign_key.name} = NULL "
+                        f"WHERE {foreign_key.name} IN ({subquery})"
+                    ))
+            connection.execute(text(f"ALTER TABLE {PARTITIONED_TABLE} DETACH PARTITION {name}"))
+            if not keep_detached:
+                connection.execute(text(f"DROP TABLE {name}"))
+
+        logger.info(f"🗄️  Conversation partition {name} {'detached' if keep_detached else 'dropped'} ({rows} rows)")
+        done.append({
+            "name": name,
+            "start": partition["start"].isoformat(),
+            "end": partition["end"].isoformat(),
+            "rows": rows,
+            "archive": archive_path,
+            "dropped": not keep_detached,
+        })
+    return done
+
+
+def partition_status() -> Dict[str, Any]:
+    """حالة التقسيم والأقسام الحالية"""
+    if not is_partitioned():
+        return {"partitioned": False, "partitions": []}
+    with engine.connect() as connection:
+        partitions = list_partitions(connection)
+        default_rows = connection.execute(select(func.count()).select_from(table_clause(DEFAULT_PARTITION))).scalar()
+    return {
+        "partitioned": True,
+        "partitions": [
+            {**partition, "start": partition["start"].isoformat(), "end": partition["end"].isoformat()}
+            for partition in partitions
+        ],
+        "default_partition_rows": default_rows,
+    }
@@ -0,0 +1,333 @@
+"""
+مستشار الاستعلامات والفهارس - EXPLAIN على الاستعلامات الساخنة في التطبيق
+
+- HOT_QUERIES: سجل بالاستعلامات المتكررة (سجل المحادثة، قوائم القنوات، التحليلات، مواعيد الطبيب،
+  الكتالوج النشط، الـ outbox...) مع الفهرس المناسب لكل منها (معرّف في النماذج: __table_args__)
+- القيم تؤخذ من بيانات حقيقية في قاعدة البيانات الحالية (أحدث مستخدم، أحدث طبيب...) لتكون الخطة واقعية
+- PostgreSQL: EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) داخل transaction يُلغى بعدها
+  (الاستعلامات كلها SELECT)؛ SQLite: EXPLAIN QUERY PLAN (بدون أزمنة)
+- يُعلّم Seq Scan على جدول أكبر من QUERY_ADVISOR_MIN_ROWS (الجداول الصغيرة يقرأها PostgreSQL
+  كاملة عمداً) ويقترح الفهرس الناقص
+- apply_indexes: إنشاء الفهارس الناقصة من تعريفها في النماذج (CREATE INDEX CONCURRENTLY في
+  PostgreSQL: بدون قفل الكتابة على الجدول)؛ الفهرس INVALID يُعد ناقصاً ويُحذف ثم يُعاد بناؤه
+"""
+import json
+import logging
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Sequence
+from sqlalchemy import func, inspect, select, text
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateIndex
+from app.config import get_settings
+from app.db.base import Base
+from app.db.migrations import invalid_indexes
+from app.db.session import engine
+from app.db.models import Appointment, Branch, Conversation, Doctor, FAQ, Offer, OutboxEvent, Patient, Service
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+@dataclass
+class HotQuery:
+    """استعلام متكرر في التطبيق"""
+    name: str
+    source: str
+    # يبني الاستعلام بقيم من قاعدة البيانات الحالية
+    build: Callable[[Session], Any]
+    # الفهرس المناسب (اسمه في __table_args__ أو index=True للنموذج)
+    index: Optional[str] = None
+
+
+def _latest(db: Session, *columns, default: Sequence[Any] = ()) -> Sequence[Any]:
+    """قيم أحدث صف (أو default إذا كان الجدول فارغاً)"""
+    row = db.execute(select(*columns).order_by(columns[0].table.c.created_at.desc()).limit(1)).first()
+    return tuple(row) if row else tuple(default)
+
+
+def _conversation_history(db: Session):
+    user_id, channel = _latest(db, Conversation.user_id, Conversation.channel, default=("0", "whatsapp"))
+    return select(Conversation).where(
+        Conversation.user_id == user_id, Conversation.channel == channel
+    ).order_by(Conversation.created_at.desc()).limit(10)
+
+
+def _channel_conversations(db: Session):
+    (channel,) = _latest(db, Conversation.channel, default=("whatsapp",))
+    return select(Conversation.id, Conversation.user_id, Conversation.created_at).where(
+        Conversation.channel == channel
+    ).order_by(Conversation.created_at.desc()).limit(50)
+
+
+def _channel_summary(db: Session):
+    since = datetime.now() - timedelta(days=7)
+    return select(Conversation.channel, func.count()).where(
+        Conversation.created_at >= since
+    ).group_by(Conversation.channel)
+
+
+def _doctor_schedule(db: Session):
+    (doctor_id,) = _latest(db, Appointment.doctor_id, default=(None,))
+    start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    return select(Appointment.id, Appointment.datetime, Appointment.status).where(
+        Appointment.doctor_id == doctor_id,
+        Appointment.datetime >= start,
+        Appointment.datetime < start + timedelta(days=7)
+    )
+
+
+def _upcoming_appointments(db: Session):
+    return select(Appointment.id, Appointment.datetime).where(
+        Appointment.datetime >= datetime.now()
+    ).order_by(Appointment.datetime).limit(50)
+
+
+def _active(model):
+    def build(db: Session):
+        return select(model.id).where(model.is_active == True)  # noqa: E712
+    return build
+
+
+def _pending_outbox(db: Session):
+    return select(OutboxEvent.id).where(OutboxEvent.status == "pending").order_by(OutboxEvent.id).limit(100)
+
+
+def _patient_by_phone(db: Session):
+    (phone,) = _latest(db, Patient.phone_number, default=("0500000000",))
+    return select(Patient.id).where(Patient.phone_number == phone)
+
+
+HOT_QUERIES: List[HotQuery] = [
+    HotQuery("conversation_history", "app/core/agent.py: _load_conversation_history",
+             _conversation_history, "idx_conversations_user_channel_created"),
+    HotQuery("channel_conversations", "app/api/n8n/n8n_router.py: /n8n/conversations?channel=",
+             _channel_conversations, "idx_conversations_channel_created"),
+    HotQuery("channel_summary", "app/services/analytics_service.py: conversation metrics",
+             _channel_summary, "idx_conversations_created_at"),
+    HotQuery("doctor_schedule", "app/api/admin/appointments_router.py: ?doctor_id=&from_date=",
+             _doctor_schedule, "idx_appointments_doctor_datetime"),
+    HotQuery("upcoming_appointments", "app/services/availability_service.py",
+             _upcoming_appointments, "ix_appointments_datetime"),
+    HotQuery("active_branches", "app/core/agent.py: catalog context", _active(Branch), "idx_branches_is_active"),
+    HotQuery("active_doctors", "app/core/agent.py: catalog context", _active(Doctor), "idx_doctors_is_active"),
+    HotQuery("active_services", "app/core/agent.py: catalog context", _active(Service), "idx_services_is_active"),
+    HotQuery("active_faqs", "app/core/agent.py: FAQ matching", _active(FAQ), "idx_faqs_is_active"),
+    HotQuery("active_offers", "app/core/agent.py: offers", _active(Offer), "idx_offers_is_active"),
+    HotQuery("pending_outbox", "app/services/outbox_service.py: _claim",
+             _pending_outbox, "idx_outbox_events_status_id"),
+    HotQuery("patient_by_phone", "app/api/n8n/n8n_router.py: patient lookup",
+             _patient_by_phone, "ix_patients_phone_number"),
+]
+
+
+def model_index(name: str):
+    """تعريف الفهرس في النماذج حسب الاسم"""
+    for table in Base.metadata.tables.values():
+        for index in table.indexes:
+            if index.name == name:
+                return index
+    return None
+
+
+def existing_indexes() -> Dict[str, set]:
+    """أسماء الفهارس الصالحة الموجودة في قاعدة البيانات لكل جدول (الفهارس INVALID تُعد ناقصة)"""
+    with engine.connect() as connection:
+        inspector = inspect(connection)
+        invalid = invalid_indexes(connection)
+        existing = {}
+        for table in inspector.get_table_names():
+            existing[table] = {index["name"] for index in inspector.get_indexes(table)} - invalid
+    return existing
+
+
+# ==================== تحليل الخطة ====================
+
+def _walk(plan: Dict[str, Any]):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from _walk(child)
+
+
+def _driver_value(value: Any) -> Any:
+    return str(value) if isinstance(value, uuid.UUID) else value
+
+
+def _explain_postgresql(db: Session, statement) -> Dict[str, Any]:
+    compiled = statement.compile(dialect=engine.dialect)
+    params = {name: _driver_value(value) for name, value in compiled.params.items()}
+    raw = db.connection().exec_driver_sql(
+        "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + str(compiled), params
+    ).scalar()
+    document = (json.loads(raw) if isinstance(raw, str) else raw)[0]
+    plan = document["Plan"]
+    nodes = list(_walk(plan))
+    return {
+        "execution_ms": document.get("Execution Time"),
+        "planning_ms": document.get("Planning Time"),
+        "shared_hit_blocks": plan.get("Shared Hit Blocks"),
+        "shared_read_blocks": plan.get("Shared Read Blocks"),
+        "scans": [
+            {
+                "type": node["Node Type"],
+                "table": node.get("Relation Name"),
+                "index": node.get("Index Name"),
+                "rows": node.get("Actual Rows"),
+                "rows_removed_by_filter": node.get("Rows Removed by Filter"),
+            }
+            for node in nodes if "Relation Name" in node
+        ],
+        "plan": plan,
+    }
+
+
+def _explain_sqlite(db: Session, statement) -> Dict[str, Any]:
+    compiled = statement.compile(dialect=engine.dialect)
+    started = time.perf_counter()
+    rows = db.connection().exec_driver_sql(
+        "EXPLAIN QUERY PLAN " + str(compiled),
+        tuple(_driver_value(compiled.params[name]) for name in compiled.positiontup)
+    ).all()
+    scans = []
+    for row in rows:
+        detail = row[-1]
+        words = detail.split()
+        if words and words[0] in ("SCAN", "SEARCH") and len(words) > 1:
+            using_index = " USING " in detail and "INDEX" in detail
+            index = detail.split("INDEX ", 1)[1].split(" ")[0] if using_index else None
+            scans.append({
+                "type": "Seq Scan" if words[0] == "SCAN" and not using_index else "Index Scan",
+                "table": words[2] if words[1] == "TABLE" else words[1],
+                "index": index,
+                "rows": None,
+                "rows_removed_by_filter": None,
+            })
+    return {
+        "execution_ms": round((time.perf_counter() - started) * 1000, 2),
+        "planning_ms": None,
+        "scans": scans,
+        "plan": [row[-1] for row in rows],
+    }
+
+
+def _table_rows(db: Session, table: str) -> int:
+    """عدد الصفوف (تقديري من الإحصائيات في PostgreSQL)"""
+    if engine.dialect.name == "postgresql":
+        estimate = db.execute(text("SELECT reltuples FROM pg_class WHERE relname = :name"), {"name": table}).scalar()
+        return max(int(estimate or 0), 0)
+    return db.execute(select(func.count()).select_from(Base.metadata.tables[table])).scalar()
+
+
+def explain_hot_queries(db: Session, names: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+    """
+    EXPLAIN لكل استعلام ساخن مع تعليم القراءة الكاملة والفهارس الناقصة
+
+    Returns:
+        {"dialect", "queries": [...], "missing_indexes": [...]}
+    """
+    queries = [query for query in HOT_QUERIES if not names or query.name in names]
+    existing = existing_indexes()
+    explain = _explain_postgresql if engine.dialect.name == "postgresql" else _explain_sqlite
+    table_rows: Dict[str, int] = {}
+    results = []
+    missing = {}
+
+    for query in queries:
+        result: Dict[str, Any] = {"name": query.name, "source": query.source, "index": query.index}
+        try:
+            statement = query.build(db)
+            result["sql"] = str(statement.compile(dialect=engine.dialect))
+            result.update(explain(db, statement))
+        except Exception as e:
+            result["error"] = str(e)[:300]
+            db.rollback()
+            results.append(result)
+            continue
+        finally:
+            # ANALYZE ينفذ الاستعلام فعلاً - لا شيء يبقى من الـ transaction
+            db.rollback()
+
+        flags = []
+        for scan in result["scans"]:
+            table = scan["table"]
+            if scan["type"] != "Seq Scan" or not table:
+                continue
+            if table not in table_rows:
+                table_rows[table] = _table_rows(db, table)
+            if table_rows[table] >= settings.QUERY_ADVISOR_MIN_ROWS:
+                flags.append(f"Seq Scan on {table} ({table_rows[table]} rows)")
+        result["flags"] = flags
+
+        index = model_index(query.index) if query.index else None
+        if index is not None:
+            present = query.index in existing.get(index.table.name, set())
+            result["index_exists"] = present
+            if not present:
+                missing[query.index] = {
+                    "name": query.index,
+                    "table": index.table.name,
+                    "columns": [column.name for column in index.columns],
+                    "ddl": _create_index_sql(index),
+                    "queries": missing.get(query.index, {}).get("queries", []) + [query.name],
+                }
+        results.append(result)
+
+    return {"dialect": engine.dialect.name, "queries": results, "missing_indexes": list(missing.values())}
+
+
+# ==================== إنشاء الفهارس ====================
+
+def _create_index_sql(index) -> str:
+    ddl = str(CreateIndex(index, if_not_exists=True).compile(dialect=engine.dialect)).strip()
+    if engine.dialect.name == "postgresql" and not _partitioned(index.table.name):
+        # بدون قفل الكتابة على الجدول أثناء البناء (لا يعمل داخل transaction)
+        ddl = ddl.replace("CREATE INDEX", "CREATE INDEX CONCURRENTLY", 1)
+    return ddl
+
+
+def _partitioned(table: str) -> bool:
+    # PostgreSQL لا يدعم CONCURRENTLY على الجدول الأب المقسم
+    from app.services.partition_service import PARTITIONED_TABLE, is_partitioned
+    return table == PARTITIONED_TABLE and is_partitioned()
+
+
+def apply_indexes(names: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+    """
+    إنشاء الفهارس الناقصة المعرّفة في النماذج (كلها أو المحددة بالاسم)
+
+    Returns:
+        [{"name", "table", "status": created / exists / failed, "seconds", "error"}]
+    """
+    existing = existing_indexes()
+    results = []
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing:
+            continue
+        for index in sorted(table.indexes, key=lambda item: item.name):
+            if names and index.name not in names:
+                continue
+            if index.name in existing[table.name]:
+                results.append({"name": index.name, "table": table.name, "status": "exists"})
+                continue
+            ddl = _create_index_sql(index)
+            started = time.perf_counter()
+            try:
+                with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+                    # فهرس INVALID متبقٍ (CONCURRENTLY فاشل سابقاً) يُحذف ثم يُعاد بناؤه
+                    if index.name in invalid_indexes(connection):
+                        concurrently = "" if _partitioned(table.name) else " CONCURRENTLY"
+                        connection.exec_driver_sql(f"DROP INDEX{concurrently} IF EXISTS {index.name}")
+                        logger.warning(f"⚠️  Dropped INVALID index {index.name} before rebuilding")
+                    connection.exec_driver_sql(ddl)
+                results.append({
+                    "name": index.name, "table": table.name, "status": "created",
+                    "seconds": round(time.perf_counter() - started, 2)
+                })
+                logger.info(f"📇 Created index {index.name} on {table.name}")
+            except Exception as e:
+                # CONCURRENTLY الفاشل يترك فهرساً INVALID - يُحذف ويُعاد بناؤه في المحاولة التالية
+                results.append({"name": index.name, "table": table.name, "status": "failed", "error": str(e)[:300]})
+                logger.error(f"❌ Failed to create index {index.name}: {str(e)}")
+    return results
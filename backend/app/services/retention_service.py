@@ -0,0 +1,329 @@
+"""
+الاحتفاظ بالبيانات - حذف (أو أرشفة ثم حذف) السجلات القديمة على دفعات صغيرة
+
+- كل جدول له سياسة (RetentionPolicy): عمود التاريخ، مدة الاحتفاظ، شرط إضافي، والجداول المرتبطة
+  به بمفتاح أجنبي (تُفرّغ أو تُحذف قبل حذف الصف الأصلي)
+- المدة وحجم الدفعة قابلة للتعديل لكل جدول (RETENTION_DAYS / RETENTION_BATCH_SIZES)، و 0 يعطّل الجدول
+- كل دفعة transaction قصيرة: اختيار أقدم RETENTION_BATCH_SIZE معرف، تعديل الجداول المرتبطة،
+  ثم DELETE ... WHERE id IN (...)؛ بين الدفعات انتظار RETENTION_PAUSE_SECONDS
+  (الأقفال قصيرة ولا يتضخم الـ WAL ويلحق الـ autovacuum والـ replicas)
+- RETENTION_ARCHIVE_DIR: الجداول في RETENTION_ARCHIVE_TABLES تُكتب صفوفها قبل الحذف في ملف
+  لكل تشغيل (NDJSON مضغوط أو Parquet - راجع app/services/archive_service.py)
+- التقدم (الصفوف، الدفعات، الصفوف في الثانية) محفوظ في الذاكرة ويُعرض عبر /admin/retention
+- تشغيل واحد فقط في نفس الوقت: قفل في العملية + advisory lock في PostgreSQL بين الـ workers
+- التشغيل يتوقف بعد RETENTION_MAX_RUN_SECONDS ويكمل في التشغيل التالي
+- إذا كان conversations مقسماً شهرياً (app/services/partition_service.py) تُحذف الأقسام المنتهية
+  كاملة أولاً، والدفعات تحذف فقط ما تبقى في شهر الحد
+
+ملاحظة: الحذف بـ Core لا يمر بالـ ORM فلا يُنتج أحداث outbox، والتجميعات اليومية (daily_metrics)
+للأيام القديمة لا تُعاد حسابها فتبقى كما هي بعد حذف السجلات
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from sqlalchemy import delete, func, select, text, update
+from sqlalchemy.orm import Session
+from app.config import get_settings
+from app.db.session import engine, SessionLocal
+from app.db.models import Conversation, ImportJob, PendingHandoff, UnansweredQuestion
+from app.services.archive_service import ArchiveWriter
+from app.services.partition_service import PARTITIONED_TABLE, drop_expired_partitions
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# مفتاح advisory lock في PostgreSQL (تشغيل واحد فقط بين جميع الـ workers)
+_RETENTION_LOCK_KEY = 7_310_044
+
+
+@dataclass
+class RetentionPolicy:
+    """سياسة الاحتفاظ لجدول"""
+    model: Any
+    timestamp_column: str = "created_at"
+    default_days: int = 90
+    # شرط إضافي على الصفوف القابلة للحذف (مثال: المهام المنتهية فقط)
+    condition: Optional[Callable[[], Any]] = None
+    # (عمود المفتاح الأجنبي في الجدول المرتبط، "nullify" أو "delete")
+    dependents: List[Tuple[Any, str]] = field(default_factory=list)
+
+    @property
+    def table(self):
+        return self.model.__table__
+
+    @property
+    def name(self) -> str:
+        return self.table.name
+
+    @property
+    def days(self) -> int:
+        return settings.RETENTION_DAYS.get(self.name, self.default_days)
+
+    @property
+    def batch_size(self) -> int:
+        return max(1, settings.RETENTION_BATCH_SIZES.get(self.name, settings.RETENTION_BATCH_SIZE))
+
+    @property
+    def archived(self) -> bool:
+        tables = [name.strip() for name in (settings.RETENTION_ARCHIVE_TABLES or "").split(",")]
+        return bool(settings.RETENTION_ARCHIVE_DIR) and self.name in tables
+
+    def eligible(self, cutoff: datetime) -> List[Any]:
+        """شروط الصفوف القابلة للحذف"""
+        conditions = [self.table.c[self.timestamp_column] < cutoff]
+        if self.condition is not None:
+            conditions.append(self.condition())
+        return conditions
+
+
+POLICIES: Dict[str, RetentionPolicy] = {
+    policy.name: policy for policy in (
+        RetentionPolicy(
+            Conversation,
+            default_days=90,
+            # الأسئلة غير المجابة والتحويلات تبقى (مراجعة الأسئلة وسجل التحويلات) بدون ربط بالمحادثة
+            dependents=[
+                (UnansweredQuestion.conversation_id, "nullify"),
+                (PendingHandoff.conversation_id, "nullify"),
+            ]
+        ),
+        RetentionPolicy(
+            ImportJob,
+            default_days=30,
+            condition=lambda: ImportJob.status.in_(("completed", "failed"))
+        ),
+    )
+}
+
+
+class RetentionEngine:
+    """تنفيذ سياسات الاحتفاظ على دفعات"""
+
+    def __init__(self):
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._running = False
+        # آخر تشغيل لكل جدول (أو التشغيل الحالي)
+        self.runs: Dict[str, Dict[str, Any]] = {}
+
+    # ------------------------------------------------------------------
+    # القفل بين الـ workers
+    # ------------------------------------------------------------------
+
+    def _try_lock(self):
+        """advisory lock على اتصال خاص (PostgreSQL فقط) - None إذا كان worker آخر ينفذ"""
+        if engine.dialect.name != "postgresql":
+            return False
+        connection = engine.connect()
+        if connection.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": _RETENTION_LOCK_KEY}).scalar():
+            return connection
+        connection.close()
+        return None
+
+    def _unlock(self, connection):
+        if connection:
+            connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": _RETENTION_LOCK_KEY})
+            connection.close()
+
+    # ------------------------------------------------------------------
+    # التنفيذ
+    # ------------------------------------------------------------------
+
+    def pending_counts(self, db: Session, tables: Optional[Sequence[str]] = None) -> Dict[str, Dict[str, Any]]:
+        """عدد الصفوف القابلة للحذف الآن لكل جدول (بدون حذف)"""
+        counts = {}
+        for policy in self._policies(tables):
+            if policy.days <= 0:
+                counts[policy.name] = {"days": 0, "eligible": 0}
+                continue
+            cutoff = datetime.now() - timedelta(days=policy.days)
+            eligible = db.execute(
+                select(func.count()).select_from(policy.table).where(*policy.eligible(cutoff))
+            ).scalar()
+            counts[policy.name] = {"days": policy.days, "cutoff": cutoff.isoformat(), "eligible": eligible}
+        return counts
+
+    def _policies(self, tables: Optional[Sequence[str]]) -> List[RetentionPolicy]:
+        if not tables:
+            return list(POLICIES.values())
+        unknown = [name for name in tables if name not in POLICIES]
+        if unknown:
+            raise ValueError(f"لا توجد سياسة احتفاظ للجداول: {', '.join(unknown)}")
+        return [POLICIES[name] for name in tables]
+
+    def _delete_batch(self, db: Session, policy: RetentionPolicy, cutoff: datetime, archive: Optional[ArchiveWriter]) -> int:
+        """دفعة واحدة في transaction قصيرة - عدد الصفوف المحذوفة"""
+        table = policy.table
+        timestamp = table.c[policy.timestamp_column]
+        ids_query = select(table.c.id).where(*policy.eligible(cutoff)).order_by(timestamp).limit(policy.batch_size)
+        if engine.dialect.name == "postgresql":
+            # صفوف مقفلة من طلب آخر تُترك للدفعة التالية بدلاً من الانتظار
+            ids_query = ids_query.with_for_update(skip_locked=True)
+        ids = list(db.execute(ids_query).scalars())
+        if not ids:
+            return 0
+
+        if archive is not None:
+            archive.write(db.execute(select(table).where(table.c.id.in_(ids))).all())
+        for foreign_key, action in policy.dependents:
+            dependent = foreign_key.table
+            if action == "delete":
+                db.execute(delete(dependent).where(foreign_key.in_(ids)))
+            else:
+                db.execute(update(dependent).where(foreign_key.in_(ids)).values({foreign_key.name: None}))
+        deleted = db.execute(delete(table).where(table.c.id.in_(ids))).rowcount
+        db.commit()
+        return deleted
+
+    def _run_policy(self, policy: RetentionPolicy, deadline: float) -> Dict[str, Any]:
+        run: Dict[str, Any] = {
+            "table": policy.name,
+            "status": "running",
+            "days": policy.days,
+            "batch_size": policy.batch_size,
+            "rows_deleted": 0,
+            "batches": 0,
+            "rows_per_second": None,
+            "archive": None,
+            "error": None,
+            "started_at": datetime.now().isoformat(),
+            "finished_at": None,
+        }
+        self.runs[policy.name] = run
+        if policy.days <= 0:
+            run.update(status="disabled", finished_at=datetime.now().isoformat())
+            return run
+
+        cutoff = datetime.now() - timedelta(days=policy.days)
+        run["cutoff"] = cutoff.isoformat()
+        archive = ArchiveWriter(policy.table) if policy.archived else None
+        started = time.monotonic()
+        working = 0.0
+        db = SessionLocal()
+        try:
+            if policy.name == PARTITIONED_TABLE:
+                # الأقسام المنتهية كاملة (DETACH + DROP) قبل الحذف بالدفعات
+                partitions = drop_expired_partitions(cutoff, policy.dependents, archived=policy.archived)
+                run["partitions_dropped"] = partitions
+                run["rows_deleted"] += sum(partition["rows"] for partition in partitions)
+            while True:
+                batch_started = time.monotonic()
+                deleted = self._delete_batch(db, policy, cutoff, archive)
+                working += time.monotonic() - batch_started
+                if deleted:
+                    run["batches"] += 1
+                    run["rows_deleted"] += deleted
+                    # السرعة الفعلية للحذف (بدون فترات الانتظار)
+                    run["rows_per_second"] = round(run["rows_deleted"] / max(working, 0.001), 1)
+                    run["elapsed_seconds"] = round(time.monotonic() - started, 1)
+                if deleted < policy.batch_size:
+                    run["status"] = "completed"
+                    break
+                if self._stop.is_set() or time.monotonic() >= deadline:
+                    # الباقي في التشغيل التالي
+                    run["status"] = "stopped"
+                    break
+                self._stop.wait(settings.RETENTION_PAUSE_SECONDS)
+        except Exception as e:
+            db.rollback()
+            run.update(status="failed", error=str(e)[:1000])
+            logger.error(f"❌ Retention on {policy.name} failed: {str(e)}", exc_info=True)
+        finally:
+            db.close()
+            if archive is not None:
+                archive.close()
+                if run["rows_deleted"]:
+                    run["archive"] = archive.path
+
+        run["elapsed_seconds"] = round(time.monotonic() - started, 1)
+        run["finished_at"] = datetime.now().isoformat()
+        logger.info(
+            f"🧹 Retention {policy.name}: {run['status']}, {run['rows_deleted']} rows in "
+            f"{run['batches']} batches ({run['rows_per_second']} rows/s)"
+        )
+        return run
+
+    def run(self, tables: Optional[Sequence[str]] = None) -> Optional[Dict[str, Dict[str, Any]]]:
+        """
+        تنفيذ السياسات (كل الجداول أو المحددة) - None إذا كان هناك تشغيل آخر
+
+        يُستدعى من thread (الـ scheduler أو start()) لأنه ينتظر بين الدفعات
+        """
+        policies = self._policies(tables)
+        with self._lock:
+            if self._running:
+                return None
+            self._running = True
+        lock = None
+        try:
+            lock = self._try_lock()
+            if lock is None:
+                logger.info("Retention already running in another worker")
+                return None
+            deadline = time.monotonic() + settings.RETENTION_MAX_RUN_SECONDS
+            return {policy.name: self._run_policy(policy, deadline) for policy in policies}
+        finally:
+            self._unlock(lock)
+            with self._lock:
+                self._running = False
+
+    def start(self, tables: Optional[Sequence[str]] = None) -> bool:
+        """تشغيل في الخلفية (False إذا كان هناك تشغيل آخر في هذه العملية)"""
+        self._policies(tables)
+        with self._lock:
+            if self._running:
+                return False
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="retention")
+            executor = self._executor
+        self._stop.clear()
+        executor.submit(self.run, tables)
+        return True
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    def status(self) -> Dict[str, Any]:
+        """السياسات وآخر تشغيل لكل جدول"""
+        return {
+            "running": self._running,
+            "policies": {
+                name: {
+                    "days": policy.days,
+                    "timestamp_column": policy.timestamp_column,
+                    "batch_size": policy.batch_size,
+                    "archived": policy.archived,
+                    "dependents": {
+                        f"{foreign_key.table.name}.{foreign_key.name}": action
+                        for foreign_key, action in policy.dependents
+                    },
+                }
+                for name, policy in POLICIES.items()
+            },
+            "pause_seconds": settings.RETENTION_PAUSE_SECONDS,
+            "max_run_seconds": settings.RETENTION_MAX_RUN_SECONDS,
+            "runs": self.runs,
+        }
+
+    def shutdown(self):
+        """إيقاف التشغيل الحالي بعد الدفعة الجارية"""
+        self._stop.set()
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Global instance
+retention_engine = RetentionEngine()
+
+
+def get_retention_engine() -> RetentionEngine:
+    """الحصول على منفذ سياسات الاحتفاظ"""
+    return retention_engine
@@ -0,0 +1,388 @@
+"""
+خدمة التجميعات اليومية - جدول daily_metrics
+
+- مفتاح التجميع: (اليوم، القناة، الفرع)
+- المحادثات حسب created_at، المواعيد حسب created_at (يوم الحجز)، الفواتير حسب invoice_date
+- التحديث تدريجي: لكل مصدر high-water mark على updated_at (جدول rollup_state)؛ الأيام التي تغيرت
+  فيها صفوف منذ آخر تحديث يُعاد حسابها بالكامل (upsert على مفتاح التجميع وحذف المفاتيح التي اختفت)
+- تحديث واحد فقط في نفس الوقت بين الـ workers (advisory lock في PostgreSQL)؛ الفهارس الفريدة
+  على مفتاح التجميع تمنع تكرار الصفوف حتى بدونه
+- لا تتم معالجة التعديلات الأحدث من ROLLUP_LAG_SECONDS حتى تُكتب السجلات المؤجلة (conversation_buffer)
+- الأيام قبل تاريخ الـ high-water mark مكتملة في daily_metrics؛ ما بعدها يُقرأ من الجداول الأصلية
+"""
+import logging
+from collections import Counter
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+from app.config import get_settings
+from app.db.models import Conversation, Appointment, Invoice, Branch, DailyMetric, RollupState
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+_STATE_PREFIX = "daily_metrics:"
+# مفتاح advisory lock في PostgreSQL (تحديث واحد فقط بين جميع الـ workers)
+_ROLLUP_LOCK_KEY = 7_310_033
+_APPOINTMENT_STATUSES = ("pending", "confirmed", "completed", "cancelled")
+_METRIC_FIELDS = (
+    "conversations", "unrecognized", "handoffs",
+    "appointments_total", "appointments_pending", "appointments_confirmed",
+    "appointments_completed", "appointments_cancelled",
+    "invoices_count", "invoices_paid", "invoices_total_amount",
+)
+
+# المصدر → (النموذج، عمود اليوم)
+SOURCES = {
+    "conversations": (Conversation, Conversation.created_at),
+    "appointments": (Appointment, Appointment.created_at),
+    "invoices": (Invoice, Invoice.invoice_date),
+}
+
+
+def _as_date(value: Any) -> Optional[date]:
+    """func.date() تعيد date في PostgreSQL ونصاً في SQLite"""
+    if value is None or isinstance(value, date) and not isinstance(value, datetime):
+        return value
+    if isinstance(value, datetime):
+        return value.date()
+    return date.fromisoformat(str(value)[:10])
+
+
+def _day_range(first: date, last: date) -> Tuple[datetime, datetime]:
+    """نطاق زمني نصف مفتوح يغطي الأيام من first حتى last"""
+    return datetime.combine(first, datetime.min.time()), datetime.combine(last + timedelta(days=1), datetime.min.time())
+
+
+def _runs(days: Iterable[date]) -> List[Tuple[date, date]]:
+    """تقسيم الأيام إلى فترات متصلة (لاستعلامات نطاق تستخدم الفهارس)"""
+    runs: List[Tuple[date, date]] = []
+    for day in sorted(set(days)):
+        if runs and day == runs[-1][1] + timedelta(days=1):
+            runs[-1] = (runs[-1][0], day)
+        else:
+            runs.append((day, day))
+    return runs
+
+
+def _empty_row(day: date, channel: str, branch_id) -> Dict[str, Any]:
+    row = {"day": day, "channel": channel or "", "branch_id": branch_id, "intents": {}}
+    for field in _METRIC_FIELDS:
+        row[field] = 0
+    row["invoices_total_amount"] = 0.0
+    return row
+
+
+def compute_day_metrics(db: Session, first: date, last: date) -> Dict[Tuple, Dict[str, Any]]:
+    """
+    حساب المقاييس من الجداول الأصلية لفترة متصلة من الأيام (بدون كتابة)
+
+    Returns:
+        قاموس {(day, channel, branch_id): row}
+    """
+    start, end = _day_range(first, last)
+    rows: Dict[Tuple, Dict[str, Any]] = {}
+
+    def row_for(day, channel, branch_id):
+        key = (_as_date(day), channel or "", branch_id)
+        if key not in rows:
+            rows[key] = _empty_row(*key)
+        return rows[key]
+
+    conversation_day = func.date(Conversation.created_at)
+    for day, channel, total, unrecognized, handoffs in db.query(
+        conversation_day,
+        Conversation.channel,
+        func.count(),
+        func.count().filter(Conversation.unrecognized == True),
+        func.count().filter(Conversation.needs_handoff == True)
+    ).filter(Conversation.created_at >= start, Conversation.created_at < end)\
+            .group_by(conversation_day, Conversation.channel).all():
+        row = row_for(day, channel, None)
+        row["conversations"] = total
+        row["unrecognized"] = unrecognized
+        row["handoffs"] = handoffs
+
+    for day, channel, intent, count in db.query(
+        conversation_day, Conversation.channel, Conversation.intent, func.count()
+    ).filter(
+        Conversation.created_at >= start, Conversation.created_at < end, Conversation.intent.isnot(None)
+    ).group_by(conversation_day, Conversation.channel, Conversation.intent).all():
+        row_for(day, channel, None)["intents"][intent] = count
+
+    appointment_day = func.date(Appointment.created_at)
+    for day, channel, branch_id, total, *by_status in db.query(
+        appointment_day,
+        Appointment.channel,
+        Appointment.branch_id,
+        func.count(),
+        *[func.count().filter(Appointment.status == status) for status in _APPOINTMENT_STATUSES]
+    ).filter(Appointment.created_at >= start, Appointment.created_at < end)\
+            .group_by(appointment_day, Appointment.channel, Appointment.branch_id).all():
+        row = row_for(day, channel, branch_id)
+        row["appointments_total"] = total
+        for status, count in zip(_APPOINTMENT_STATUSES, by_status):
+            row[f"appointments_{status}"] = count
+
+    for day, channel, branch_id, total, paid, amount in db.query(
+        Invoice.invoice_date,
+        Appointment.channel,
+        Appointment.branch_id,
+        func.count(Invoice.id),
+        func.count(Invoice.id).filter(Invoice.payment_status == "paid"),
+        func.coalesce(func.sum(Invoice.total_amount), 0.0)
+    ).outerjoin(Appointment, Invoice.appointment_id == Appointment.id)\
+            .filter(Invoice.invoice_date >= first, Invoice.invoice_date <= last)\
+            .group_by(Invoice.invoice_date, Appointment.channel, Appointment.branch_id).all():
+        row = row_for(day, channel, branch_id)
+        row["invoices_count"] = total
+        row["invoices_paid"] = paid
+        row["invoices_total_amount"] = float(amount or 0)
+
+    return rows
+
+
+def _upsert_rows(db: Session, rows: List[Dict[str, Any]]):
+    """
+    INSERT ... ON CONFLICT على مفتاح التجميع
+
+    branch_id قد يكون NULL (والـ NULL لا يتعارض في الفهرس الفريد)، لذلك فهرسان جزئيان:
+    uq_daily_metrics_grain (مع فرع) و uq_daily_metrics_grain_no_branch (بدون فرع)
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise RuntimeError(f"التجميعات اليومية غير مدعومة لـ {dialect}")
+
+    updated = (*_METRIC_FIELDS, "intents", "updated_at")
+    for with_branch in (True, False):
+        group = [row for row in rows if (row["branch_id"] is not None) == with_branch]
+        if not group:
+            continue
+        statement = insert(DailyMetric).values(group)
+        statement = statement.on_conflict_do_update(
+            index_elements=["day", "channel", "branch_id"] if with_branch else ["day", "channel"],
+            index_where=DailyMetric.branch_id.isnot(None) if with_branch else DailyMetric.branch_id.is_(None),
+            set_={name: statement.excluded[name] for name in updated}
+        )
+        db.execute(statement)
+
+
+def recompute_days(db: Session, days: Iterable[date]) -> int:
+    """
+    إعادة حساب أيام محددة وكتابة صفوفها في daily_metrics (بدون commit)
+
+    الصفوف المحسوبة تُكتب بـ upsert بطابع زمني واحد، ثم تُحذف صفوف هذه الأيام التي لم تُكتب
+    (مفاتيح لم يعد لها بيانات)
+
+    Returns:
+        عدد الصفوف المكتوبة
+    """
+    written = 0
+    stamp = datetime.now()
+    for first, last in _runs(days):
+        rows = list(compute_day_metrics(db, first, last).values())
+        for row in rows:
+            row["updated_at"] = stamp
+        if rows:
+            _upsert_rows(db, rows)
+            written += len(rows)
+        db.query(DailyMetric).filter(
+            DailyMetric.day >= first, DailyMetric.day <= last, DailyMetric.updated_at != stamp
+        ).delete(synchronize_session=False)
+    return written
+
+
+def _try_lock(db: Session):
+    """advisory lock على اتصال خاص (PostgreSQL فقط) - None إذا كان worker آخر ينفذ"""
+    bind = db.get_bind()
+    if bind.dialect.name != "postgresql":
+        return False
+    connection = bind.connect()
+    if connection.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": _ROLLUP_LOCK_KEY}).scalar():
+        return connection
+    connection.close()
+    return None
+
+
+def _unlock(connection):
+    if connection:
+        connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": _ROLLUP_LOCK_KEY})
+        connection.close()
+
+
+def refresh_daily_metrics(db: Session, recheck_days: int = 0) -> Dict[str, Any]:
+    """
+    تحديث daily_metrics تدريجياً من الـ high-water mark لكل مصدر
+
+    المهمة المجدولة تعمل في كل worker؛ إذا كان worker آخر ينفذ التحديث الآن يُتخطى هذا التشغيل
+
+    Args:
+        db: جلسة قاعدة البيانات
+        recheck_days: إعادة حساب آخر N يوم أيضاً (لالتقاط السجلات المتأخرة مثل ملف الـ spool)
+
+    Returns:
+        {"days": عدد الأيام المعاد حسابها، "rows": عدد الصفوف، "high_water": ...}
+        أو {"skipped": True, ...} إذا كان التحديث قيد التنفيذ في worker آخر
+    """
+    lock = _try_lock(db)
+    if lock is None:
+        logger.info("Daily metrics refresh skipped (running in another worker)")
+        return {"days": 0, "rows": 0, "high_water": None, "skipped": True}
+    try:
+        return _refresh(db, recheck_days)
+    finally:
+        _unlock(lock)
+
+
+def _refresh(db: Session, recheck_days: int) -> Dict[str, Any]:
+    upper = datetime.now() - timedelta(seconds=settings.ROLLUP_LAG_SECONDS)
+    states = {state.name: state for state in db.query(RollupState).all()}
+    dirty: set = set()
+
+    for source, (model, day_column) in SOURCES.items():
+        name = _STATE_PREFIX + source
+        state = states.get(name)
+        if state is None:
+            state = RollupState(name=name)
+            db.add(state)
+
+        query = db.query(func.date(day_column)).filter(model.updated_at <= upper)
+        if state.high_water is not None:
+            query = query.filter(model.updated_at > state.high_water)
+        dirty.update(_as_date(day) for (day,) in query.distinct().all() if day is not None)
+        state.high_water = upper
+
+    today = date.today()
+    dirty.update(today - timedelta(days=offset) for offset in range(recheck_days))
+
+    try:
+        rows = recompute_days(db, dirty)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    logger.info(f"Daily metrics refreshed: {len(dirty)} days, {rows} rows (high-water {upper.isoformat()})")
+    return {"days": len(dirty), "rows": rows, "high_water": upper.isoformat()}
+
+
+def rollup_covered_until(db: Session, sources: Iterable[str] = SOURCES) -> Optional[date]:
+    """
+    أول يوم غير مكتمل في daily_metrics لمصادر معينة
+
+    Returns:
+        الأيام قبل هذا التاريخ مكتملة في daily_metrics، أو None إذا لم يتم التجميع بعد
+    """
+    names = [_STATE_PREFIX + source for source in sources]
+    marks = [mark for (mark,) in db.query(RollupState.high_water).filter(RollupState.name.in_(names)).all()]
+    if len(marks) < len(names) or any(mark is None for mark in marks):
+        return None
+    return min(marks).date()
+
+
+def sum_daily_metrics(
+    db: Session,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    by: Tuple[str, ...] = ("channel",)
+) -> Dict[Tuple, Dict[str, Any]]:
+    """
+    جمع المقاييس من daily_metrics في استعلام واحد
+
+    Args:
+        by: أعمدة التجميع (channel, branch_id, day)
+
+    Returns:
+        قاموس {(قيم أعمدة التجميع): {field: sum}}
+    """
+    group_columns = [getattr(DailyMetric, column) for column in by]
+    query = db.query(*group_columns, *[func.sum(getattr(DailyMetric, field)) for field in _METRIC_FIELDS])
+    if date_from:
+        query = query.filter(DailyMetric.day >= date_from)
+    if date_to:
+        query = query.filter(DailyMetric.day <= date_to)
+    if group_columns:
+        query = query.group_by(*group_columns)
+
+    result = {}
+    for row in query.all():
+        key = tuple(row[:len(by)])
+        result[key] = {field: (value or 0) for field, value in zip(_METRIC_FIELDS, row[len(by):])}
+    return result
+
+
+def _report_from_rows(rows: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    channels: Counter = Counter()
+    intents: Counter = Counter()
+    branches: Counter = Counter()
+    totals = Counter()
+    for row in rows:
+        for field in _METRIC_FIELDS:
+            totals[field] += row.get(field) or 0
+        if row.get("conversations"):
+            channels[row["channel"] or "unknown"] += row["conversations"]
+        intents.update(row.get("intents") or {})
+        if row.get("branch_id") and row.get("appointments_total"):
+            branches[str(row["branch_id"])] += row["appointments_total"]
+    return {
+        "totals": totals,
+        "channels": dict(channels.most_common()),
+        "top_intents": dict(intents.most_common(10)),
+        "branches": branches,
+    }
+
+
+def daily_report(db: Session, day: date) -> Dict[str, Any]:
+    """
+    التقرير اليومي: من daily_metrics إذا كان اليوم مكتملاً، وإلا من الجداول الأصلية مباشرة
+
+    Returns:
+        total_conversations, total_appointments, channels, top_intents, ...
+    """
+    covered = rollup_covered_until(db)
+    if covered is not None and day < covered:
+        source = "rollup"
+        rows = [
+            {field: getattr(metric, field) for field in ("day", "channel", "branch_id", "intents") + _METRIC_FIELDS}
+            for metric in db.query(DailyMetric).filter(DailyMetric.day == day).all()
+        ]
+    else:
+        source = "live"
+        rows = list(compute_day_metrics(db, day, day).values())
+
+    report = _report_from_rows(rows)
+    totals = report["totals"]
+
+    branch_names = {}
+    if report["branches"]:
+        branch_names = {
+            str(branch_id): name
+            for branch_id, name in db.query(Branch.id, Branch.name).all()
+        }
+
+    return {
+        "date": day.isoformat(),
+        "source": source,
+        "total_conversations": totals["conversations"],
+        "total_appointments": totals["appointments_total"],
+        "unrecognized_count": totals["unrecognized"],
+        "handoffs_count": totals["handoffs"],
+        "channels": report["channels"],
+        "top_intents": report["top_intents"],
+        "appointments_by_status": {
+            status: totals[f"appointments_{status}"] for status in _APPOINTMENT_STATUSES
+        },
+        "appointments_by_branch": {
+            branch_names.get(branch_id, branch_id): count for branch_id, count in report["branches"].most_common()
+        },
+        "invoices": {
+            "count": totals["invoices_count"],
+            "paid": totals["invoices_paid"],
+            "total_amount": round(float(totals["invoices_total_amount"]), 2),
+        },
+    }
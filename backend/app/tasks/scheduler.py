@@ -9,10 +9,11 @@ from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.interval import IntervalTrigger
 from sqlalchemy.orm import Session
+from app.config import get_settings
 from app.db.session import SessionLocal
-from app.db.models import Conversation
 
 logger = logging.getLogger(__name__)
+settings = get_settings()
 
 # Global scheduler instance
 scheduler: Optional[AsyncIOScheduler] = None
@@ -26,47 +27,112 @@ def get_scheduler() -> AsyncIOScheduler:
     return scheduler
 
 
-async def cleanup_old_conversations(days: int = 90):
-    """
-    تنظيف المحادثات القديمة (أقدم من X يوم)
-    
-    Args:
-        days: عدد الأيام (افتراضي: 90)
-    """
+async def run_retention():
+    """حذف السجلات القديمة على دفعات حسب سياسات الاحتفاظ (راجع app/services/retention_service.py)"""
+    from app.services.retention_service import get_retention_engine
+    try:
+        await asyncio.to_thread(get_retention_engine().run)
+    except Exception as e:
+        logger.error(f"Error running retention: {str(e)}", exc_info=True)
+
+
+async def ensure_conversation_partitions():
+    """إنشاء أقسام conversations للأشهر القادمة (لا شيء إذا لم يكن الجدول مقسماً)"""
+    from app.services.partition_service import ensure_partitions
+    try:
+        await asyncio.to_thread(ensure_partitions)
+    except Exception as e:
+        logger.error(f"Error creating conversation partitions: {str(e)}", exc_info=True)
+
+
+async def flush_conversation_buffer():
+    """كتابة سجلات المحادثات المؤجلة (راجع app/core/conversation_buffer.py)"""
+    from app.core.conversation_buffer import get_conversation_buffer
+    try:
+        await asyncio.to_thread(get_conversation_buffer().flush)
+    except Exception as e:
+        logger.error(f"Error flushing conversation buffer: {str(e)}", exc_info=True)
+
+
+def _refresh_daily_metrics(recheck_days: int = 0):
+    from app.services.rollup_service import refresh_daily_metrics
     db: Session = SessionLocal()
     try:
-        cutoff_date = datetime.utcnow() - timedelta(days=days)
-        
-        # حذف المحادثات القديمة
-        deleted_count = db.query(Conversation).filter(
-            Conversation.created_at < cutoff_date
-        ).delete()
-        
-        db.commit()
-        logger.info(f"Cleaned up {deleted_count} old conversations (older than {days} days)")
+        return refresh_daily_metrics(db, recheck_days=recheck_days)
+    finally:
+        db.close()
+
+
+async def update_daily_metrics():
+    """تحديث جدول التجميعات اليومية تدريجياً (راجع app/services/rollup_service.py)"""
+    try:
+        await asyncio.to_thread(_refresh_daily_metrics)
     except Exception as e:
-        logger.error(f"Error cleaning up old conversations: {str(e)}", exc_info=True)
-        db.rollback()
+        logger.error(f"Error updating daily metrics: {str(e)}", exc_info=True)
+
+
+def _daily_report_for(day):
+    from app.services.rollup_service import daily_report
+    db: Session = SessionLocal()
+    try:
+        return daily_report(db, day)
     finally:
         db.close()
 
 
 async def generate_daily_report():
-    """إنشاء تقرير يومي (يمكن إرساله بالبريد الإلكتروني)"""
+    """إنشاء تقرير يومي لليوم السابق (يمكن إرساله بالبريد الإلكتروني)"""
     logger.info("Generating daily report...")
-    # TODO: تنفيذ إنشاء تقرير يومي
-    pass
+    try:
+        # إعادة حساب آخر أيام لالتقاط السجلات المتأخرة قبل قراءة التقرير
+        await asyncio.to_thread(_refresh_daily_metrics, settings.ROLLUP_RECHECK_DAYS)
+        report = await asyncio.to_thread(_daily_report_for, datetime.now().date() - timedelta(days=1))
+        logger.info(
+            f"Daily report {report['date']}: {report['total_conversations']} conversations, "
+            f"{report['total_appointments']} appointments, {report['handoffs_count']} handoffs"
+        )
+    except Exception as e:
+        logger.error(f"Error generating daily report: {str(e)}", exc_info=True)
+
+
+async def dispatch_outbox():
+    """إرسال أحداث الـ outbox إلى n8n (راجع app/services/outbox_service.py)"""
+    from app.services.outbox_service import get_outbox_dispatcher
+    try:
+        await get_outbox_dispatcher().dispatch()
+    except Exception as e:
+        logger.error(f"Error dispatching outbox events: {str(e)}", exc_info=True)
+
+
+async def purge_outbox():
+    """حذف أحداث الـ outbox المرسلة القديمة"""
+    from app.services.outbox_service import get_outbox_dispatcher
+    try:
+        deleted = await asyncio.to_thread(get_outbox_dispatcher().purge_delivered)
+        logger.info(f"Purged {deleted} delivered outbox events")
+    except Exception as e:
+        logger.error(f"Error purging outbox events: {str(e)}", exc_info=True)
 
 
 def start_scheduler():
     """بدء تشغيل scheduler"""
     scheduler_instance = get_scheduler()
     
-    # تنظيف المحادثات القديمة كل أسبوع (الأحد = sun أو 6)
+    # تنظيف السجلات القديمة كل ليلة (دفعات صغيرة، فالتشغيل اليومي أخف من تشغيل أسبوعي كبير)
+    scheduler_instance.add_job(
+        run_retention,
+        trigger=CronTrigger(hour=2, minute=0),
+        id='retention',
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True
+    )
+    
+    # أقسام conversations للأشهر القادمة (إذا كان الجدول مقسماً)
     scheduler_instance.add_job(
-        cleanup_old_conversations,
-        trigger=CronTrigger(day_of_week='sun', hour=2, minute=0),
-        id='cleanup_old_conversations',
+        ensure_conversation_partitions,
+        trigger=CronTrigger(hour=1, minute=30),
+        id='ensure_conversation_partitions',
         replace_existing=True
     )
     
@@ -78,6 +144,42 @@ def start_scheduler():
         replace_existing=True
     )
     
+    # تحديث التجميعات اليومية
+    scheduler_instance.add_job(
+        update_daily_metrics,
+        trigger=IntervalTrigger(minutes=settings.ROLLUP_REFRESH_MINUTES),
+        id='update_daily_metrics',
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True
+    )
+    
+    # كتابة المحادثات المؤجلة كل بضع ثوانٍ
+    scheduler_instance.add_job(
+        flush_conversation_buffer,
+        trigger=IntervalTrigger(seconds=settings.CONVERSATION_BUFFER_FLUSH_SECONDS),
+        id='flush_conversation_buffer',
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True
+    )
+    
+    # إرسال التغييرات إلى n8n
+    scheduler_instance.add_job(
+        dispatch_outbox,
+        trigger=IntervalTrigger(seconds=settings.OUTBOX_DISPATCH_SECONDS),
+        id='dispatch_outbox',
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True
+    )
+    scheduler_instance.add_job(
+        purge_outbox,
+        trigger=CronTrigger(minute=30),
+        id='purge_outbox',
+        replace_existing=True
+    )
+    
     scheduler_instance.start()
     logger.info("Background scheduler started")
 
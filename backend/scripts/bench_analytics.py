@@ -0,0 +1,137 @@
+"""
+قياس أداء استعلامات التحليلات: الطريقة القديمة (4 + 3×عدد القنوات استعلامات) مقابل الاستعلام المجمّع الواحد
+
+الاستخدام:
+    python scripts/bench_analytics.py [--rows 1000000] [--database-url sqlite:///bench_analytics.db] [--repeat 5]
+
+ملاحظة: يُنشئ جدول conversations ويملؤه ببيانات عشوائية في قاعدة البيانات المحددة
+(الافتراضي ملف SQLite محلي) - لا تستخدمه على قاعدة بيانات الإنتاج
+"""
+import sys
+import argparse
+import random
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# إضافة مجلد backend إلى Python path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from sqlalchemy import create_engine, func
+from sqlalchemy.orm import sessionmaker
+from app.db.models import Conversation
+from app.services.analytics_service import compute_conversation_metrics, _date_bounds
+
+CHANNELS = ["whatsapp", "instagram", "tiktok", "google_maps"]
+
+
+def seed(engine, rows: int, batch_size: int = 50000):
+    """ملء جدول conversations ببيانات عشوائية"""
+    Conversation.__table__.drop(engine, checkfirst=True)
+    Conversation.__table__.create(engine)
+    now = datetime.now()
+    rng = random.Random(42)
+    inserted = 0
+    with engine.begin() as connection:
+        while inserted < rows:
+            batch = []
+            for _ in range(min(batch_size, rows - inserted)):
+                created_at = now - timedelta(minutes=rng.randint(0, 60 * 24 * 90))
+                batch.append({
+                    "id": uuid.uuid4(),
+                    "user_id": str(rng.randint(1, 50000)),
+                    "channel": rng.choice(CHANNELS),
+                    "user_message": "رسالة",
+                    "bot_reply": "رد",
+                    "intent": None,
+                    "db_context_used": False,
+                    "unrecognized": rng.random() < 0.05,
+                    "needs_handoff": rng.random() < 0.02,
+                    "created_at": created_at,
+                    "updated_at": created_at,
+                })
+            connection.execute(Conversation.__table__.insert(), batch)
+            inserted += len(batch)
+            print(f"   {inserted}/{rows}", end="\r")
+    print()
+
+
+def legacy_metrics(db, date_from, date_to):
+    """الطريقة السابقة: استعلامات الملخص + DISTINCT ثم ثلاثة COUNT لكل قناة"""
+    start, end = _date_bounds(date_from, date_to)
+
+    def base(query):
+        if start:
+            query = query.filter(Conversation.created_at >= start)
+        if end:
+            query = query.filter(Conversation.created_at < end)
+        return query
+
+    base(db.query(Conversation)).count()
+    base(db.query(Conversation.channel, func.count(Conversation.id))).group_by(Conversation.channel).all()
+    base(db.query(Conversation).filter(Conversation.unrecognized == True)).count()
+    base(db.query(Conversation).filter(Conversation.needs_handoff == True)).count()
+
+    result = {}
+    for (channel,) in base(db.query(Conversation.channel).distinct()).all():
+        query = base(db.query(Conversation).filter(Conversation.channel == channel))
+        result[channel] = {
+            "total_conversations": query.count(),
+            "unrecognized_count": query.filter(Conversation.unrecognized == True).count(),
+            "handoffs_count": query.filter(Conversation.needs_handoff == True).count(),
+        }
+    return result
+
+
+def timed(fn, repeat: int):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return result, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="قياس أداء التحليلات")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--database-url", default="sqlite:///bench_analytics.db")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--days", type=int, default=30, help="طول النطاق الزمني للاستعلام")
+    parser.add_argument("--skip-seed", action="store_true", help="استخدام البيانات الموجودة")
+    args = parser.parse_args()
+
+    engine = create_engine(args.database_url)
+    if not args.skip_seed:
+        print(f"📝 إنشاء {args.rows} محادثة...")
+        seed(engine, args.rows)
+
+    db = sessionmaker(bind=engine)()
+    date_to = datetime.now().date()
+    date_from = date_to - timedelta(days=args.days)
+
+    try:
+        legacy, legacy_times = timed(lambda: legacy_metrics(db, date_from, date_to), args.repeat)
+        single, single_times = timed(lambda: compute_conversation_metrics(db, date_from, date_to), args.repeat)
+    finally:
+        db.close()
+
+    for channel, metrics in legacy.items():
+        assert single[channel]["total_conversations"] == metrics["total_conversations"]
+        assert single[channel]["unrecognized_count"] == metrics["unrecognized_count"]
+        assert single[channel]["handoffs_count"] == metrics["handoffs_count"]
+
+    print(f"\n📊 {args.rows} صف، نطاق {args.days} يوم، {args.repeat} تكرار (median):")
+    print(f"   الطريقة السابقة ({4 + 3 * len(legacy)} استعلام): {statistics.median(legacy_times):.1f} ms")
+    print(f"   الاستعلام المجمّع (استعلام واحد): {statistics.median(single_times):.1f} ms")
+    print(f"   ✅ النتائج متطابقة")
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
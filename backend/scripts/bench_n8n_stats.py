@@ -0,0 +1,212 @@
+"""
+قياس أداء /n8n/stats: الطريقة السابقة (14 استعلام COUNT/SUM مع func.date) مقابل الاستعلامات المجمّعة
+
+الاستخدام:
+    python scripts/bench_n8n_stats.py [--rows 500000] [--database-url sqlite:///bench_n8n_stats.db] [--repeat 5]
+
+ملاحظة: يحذف الجداول ويعيد إنشاءها ويملؤها ببيانات عشوائية في قاعدة البيانات المحددة
+(الافتراضي ملف SQLite محلي) - لا تستخدمه على قاعدة بيانات الإنتاج
+"""
+import sys
+import argparse
+import asyncio
+import random
+import statistics
+import time
+import uuid
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+# إضافة مجلد backend إلى Python path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from sqlalchemy import create_engine, func, text
+from sqlalchemy.orm import sessionmaker
+from app.db.base import Base
+from app.db.models import Appointment, Branch, Conversation, Doctor, Invoice, Patient, Service
+from app.core.cache import cache_manager
+from app.api.n8n import n8n_router
+
+CHANNELS = ["whatsapp", "instagram", "tiktok", "google_maps"]
+STATUSES = ["pending", "confirmed", "completed", "cancelled"]
+
+
+def seed(engine, rows: int, batch_size: int = 50000):
+    """ملء الجداول: rows محادثة، rows/5 موعد، rows/10 فاتورة، rows/20 مريض"""
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    now = datetime.now()
+    rng = random.Random(42)
+
+    def insert(connection, table, count, make):
+        done = 0
+        while done < count:
+            batch = [make(done + i) for i in range(min(batch_size, count - done))]
+            connection.execute(table.insert(), batch)
+            done += len(batch)
+            print(f"   {table.name}: {done}/{count}", end="\r")
+        print()
+
+    def moment():
+        return now - timedelta(minutes=rng.randint(0, 60 * 24 * 365))
+
+    with engine.begin() as connection:
+        branch_id, service_id = uuid.uuid4(), uuid.uuid4()
+        connection.execute(Branch.__table__.insert(), [{"id": branch_id, "name": "فرع", "city": "الرياض", "address": "-"}])
+        connection.execute(Service.__table__.insert(), [{"id": service_id, "name": "خدمة", "base_price": 100}])
+        insert(connection, Doctor.__table__, 50, lambda i: {
+            "id": uuid.uuid4(), "name": f"د. {i}", "is_active": rng.random() < 0.9,
+        })
+        patient_ids = [uuid.uuid4() for _ in range(max(1, rows // 20))]
+        insert(connection, Patient.__table__, len(patient_ids), lambda i: {
+            "id": patient_ids[i], "full_name": f"مريض {i}", "phone_number": f"05{i:08d}",
+            "is_active": rng.random() < 0.95,
+        })
+
+        def appointment(i):
+            created_at = moment()
+            return {
+                "id": uuid.uuid4(), "patient_name": "مريض", "phone": "05", "branch_id": branch_id,
+                "service_id": service_id, "datetime": created_at + timedelta(days=3),
+                "channel": rng.choice(CHANNELS), "status": rng.choice(STATUSES),
+                "created_at": created_at, "updated_at": created_at,
+            }
+        insert(connection, Appointment.__table__, rows // 5, appointment)
+
+        def invoice(i):
+            created_at = moment()
+            return {
+                "id": uuid.uuid4(), "invoice_number": f"INV-{i}", "patient_id": rng.choice(patient_ids),
+                "invoice_date": created_at.date(), "total_amount": rng.randint(100, 2000),
+                "payment_status": rng.choice(["paid", "pending", "unpaid"]),
+                "created_at": created_at, "updated_at": created_at,
+            }
+        insert(connection, Invoice.__table__, rows // 10, invoice)
+
+        def conversation(i):
+            created_at = moment()
+            return {
+                "id": uuid.uuid4(), "user_id": str(rng.randint(1, 50000)), "channel": rng.choice(CHANNELS),
+                "user_message": "رسالة", "bot_reply": "رد", "db_context_used": False,
+                "unrecognized": rng.random() < 0.05, "needs_handoff": rng.random() < 0.02,
+                "created_at": created_at, "updated_at": created_at,
+            }
+        insert(connection, Conversation.__table__, rows, conversation)
+
+        # نفس الفهارس التي يُنشئها /admin/db/init في الإنتاج
+        connection.execute(text("CREATE INDEX IF NOT EXISTS idx_conversations_created_at ON conversations(created_at DESC)"))
+        connection.execute(text("CREATE INDEX IF NOT EXISTS idx_conversations_updated_at_id ON conversations(updated_at, id)"))
+
+
+def legacy_stats(db):
+    """الطريقة السابقة: استعلام منفصل لكل رقم، و"اليوم" عبر func.date (لا يستخدم الفهرس)"""
+    return {
+        "appointments": {
+            "total": db.query(func.count(Appointment.id)).scalar(),
+            "pending": db.query(func.count(Appointment.id)).filter(Appointment.status == "pending").scalar(),
+            "confirmed": db.query(func.count(Appointment.id)).filter(Appointment.status == "confirmed").scalar(),
+            "completed": db.query(func.count(Appointment.id)).filter(Appointment.status == "completed").scalar(),
+        },
+        "patients": {
+            "total": db.query(func.count(Patient.id)).scalar(),
+            "active": db.query(func.count(Patient.id)).filter(Patient.is_active == True).scalar(),
+        },
+        "doctors": {
+            "total": db.query(func.count(Doctor.id)).scalar(),
+            "active": db.query(func.count(Doctor.id)).filter(Doctor.is_active == True).scalar(),
+        },
+        "invoices": {
+            "total": db.query(func.count(Invoice.id)).scalar(),
+            "paid": db.query(func.count(Invoice.id)).filter(Invoice.payment_status == "paid").scalar(),
+            "pending": db.query(func.count(Invoice.id)).filter(Invoice.payment_status == "pending").scalar(),
+            "total_amount": db.query(func.sum(Invoice.total_amount)).scalar() or 0,
+        },
+        "conversations": {
+            "total": db.query(func.count(Conversation.id)).scalar(),
+            "today": db.query(func.count(Conversation.id)).filter(
+                func.date(Conversation.created_at) == date.today()
+            ).scalar(),
+        }
+    }
+
+
+def uncached_stats(db):
+    """الاستعلامات المجمّعة بدون أي cache"""
+    for key in list(_analytics_keys()):
+        cache_manager.delete(key)
+    return n8n_router.compute_stats(db)
+
+
+def _analytics_keys():
+    today = date.today()
+    yield "analytics:conversation_metrics:None:None"
+    yield f"analytics:conversation_metrics:{today}:{today}"
+
+
+def timed(fn, repeat: int):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return result, timings
+
+
+async def concurrent_polls(db, clients: int):
+    """clients طلب متزامن بعد انتهاء صلاحية الـ cache: يجب أن يحسب طلب واحد فقط"""
+    n8n_router._stats_cache["expires_at"] = 0.0
+    calls = 0
+    original = n8n_router.compute_stats
+
+    def counting(session):
+        nonlocal calls
+        calls += 1
+        return original(session)
+
+    n8n_router.compute_stats = counting
+    try:
+        started = time.perf_counter()
+        await asyncio.gather(*[n8n_router.get_stats_n8n(db=db, api_key="") for _ in range(clients)])
+        return calls, (time.perf_counter() - started) * 1000
+    finally:
+        n8n_router.compute_stats = original
+
+
+def main():
+    parser = argparse.ArgumentParser(description="قياس أداء /n8n/stats")
+    parser.add_argument("--rows", type=int, default=500_000, help="عدد المحادثات (باقي الجداول نسبة منها)")
+    parser.add_argument("--database-url", default="sqlite:///bench_n8n_stats.db")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--clients", type=int, default=50, help="عدد الطلبات المتزامنة لاختبار single-flight")
+    parser.add_argument("--skip-seed", action="store_true", help="استخدام البيانات الموجودة")
+    args = parser.parse_args()
+
+    engine = create_engine(args.database_url)
+    if not args.skip_seed:
+        print(f"📝 إنشاء {args.rows} محادثة والجداول المرتبطة...")
+        seed(engine, args.rows)
+
+    db = sessionmaker(bind=engine)()
+    try:
+        legacy, legacy_times = timed(lambda: legacy_stats(db), args.repeat)
+        raw, raw_times = timed(lambda: uncached_stats(db), args.repeat)
+
+        calls, concurrent_ms = asyncio.run(concurrent_polls(db, args.clients))
+    finally:
+        db.close()
+
+    assert raw == legacy, (raw, legacy)
+
+    print(f"\n📊 {args.rows} محادثة، {args.repeat} تكرار (median):")
+    print(f"   الطريقة السابقة (14 استعلام): {statistics.median(legacy_times):.1f} ms")
+    print(f"   استعلام مجمّع لكل جدول: {statistics.median(raw_times):.1f} ms")
+    print(f"   {args.clients} طلب متزامن: {calls} حساب فقط، {concurrent_ms:.1f} ms")
+    print(f"   ✅ النتائج متطابقة")
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,247 @@
+"""
+التحقق من أن قوائم المواعيد والتصدير تنفذ عدداً ثابتاً من الاستعلامات مهما كان عدد المواعيد
+(أسماء الفرع والطبيب والخدمة تُقرأ بـ outerjoin في نفس الاستعلام وليس استعلاماً لكل صف)،
+ومن أن رسالة WhatsApp تُحفظ كوحدة عمل واحدة: المحادثة + السؤال غير المُجاب + التحويل لموظف
+(3 INSERT في transaction واحدة)، والرسالة العادية بدون أي كتابة أثناء الطلب (الـ buffer)
+
+الاستخدام:
+    python scripts/check_query_counts.py [--database-url sqlite:///check_query_counts.db]
+
+ملاحظة: يحذف الجداول ويعيد إنشاءها في قاعدة البيانات المحددة - لا تستخدمه على قاعدة بيانات الإنتاج
+"""
+import os
+import sys
+import argparse
+import asyncio
+import json
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# إضافة مجلد backend إلى Python path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="التحقق من عدد الاستعلامات")
+    parser.add_argument("--database-url", default="sqlite:///check_query_counts.db")
+    return parser.parse_args()
+
+
+args = parse_args()
+# يجب تحديد قاعدة البيانات قبل استيراد التطبيق (app.db.session يُنشئ المحرك عند الاستيراد)
+os.environ["DATABASE_URL"] = args.database_url
+# بدون إرسال فعلي لردود WhatsApp
+os.environ["WHATSAPP_ACCESS_TOKEN"] = ""
+
+from sqlalchemy import event
+from starlette.requests import Request
+from app.db.base import Base
+from app.db.session import engine, SessionLocal
+from app.db.models import Appointment, Branch, Doctor, Service
+from app.core.agent import ChatAgent
+from app.core.catalog import bump_catalog_version
+from app.core.conversation_buffer import get_conversation_buffer
+from app.api.admin import appointments_router, export_router
+from app.api.n8n import n8n_router
+from app.api.webhooks import whatsapp_router
+
+# جداول سجلات الرسالة الواحدة (راجع ChatAgent._save_conversation)
+TURN_TABLES = ("conversations", "unanswered_questions", "pending_handoffs")
+
+
+def seed(count: int):
+    """إنشاء count موعد موزعة على فروع وأطباء وخدمات مختلفة"""
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    db = SessionLocal()
+    try:
+        branches = [Branch(id=uuid.uuid4(), name=f"فرع {i}") for i in range(5)]
+        doctors = [Doctor(id=uuid.uuid4(), name=f"د. {i}") for i in range(5)]
+        services = [Service(id=uuid.uuid4(), name=f"خدمة {i}", base_price=100) for i in range(5)]
+        db.add_all(branches + doctors + services)
+        now = datetime.now()
+        db.add_all([
+            Appointment(
+                patient_name=f"مريض {i}", phone="05", branch_id=branches[i % 5].id,
+                doctor_id=doctors[i % 5].id if i % 3 else None, service_id=services[i % 5].id,
+                datetime=now + timedelta(hours=i), channel="whatsapp"
+            )
+            for i in range(count)
+        ])
+        db.commit()
+        bump_catalog_version()
+    finally:
+        db.close()
+
+
+def count_queries(fn) -> int:
+    """عدد الاستعلامات المنفذة أثناء fn"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        fn()
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    return len(statements)
+
+
+def run(coroutine_fn):
+    """تنفيذ endpoint بجلسة جديدة"""
+    def call():
+        db = SessionLocal()
+        try:
+            result = asyncio.run(coroutine_fn(db))
+            # الاستجابات المتدفقة تُقرأ بالكامل (التصدير)
+            if hasattr(result, "body_iterator"):
+                async def drain():
+                    async for _ in result.body_iterator:
+                        pass
+                asyncio.run(drain())
+            return result
+        finally:
+            db.close()
+    return call
+
+
+def request() -> Request:
+    """طلب فارغ (بدون معاملات أو If-None-Match)"""
+    return Request({"type": "http", "method": "GET", "path": "/", "query_string": b"", "headers": []})
+
+
+ENDPOINTS = {
+    "/admin/appointments": lambda db: appointments_router.list_appointments(
+        request(), status=None, channel=None, branch_id=None, doctor_id=None, service_id=None,
+        from_date=None, to_date=None, page=None, page_size=50, sort=None, q=None, fields=None,
+        db=db, api_key=""
+    ),
+    "/n8n/appointments": lambda db: n8n_router.get_appointments_n8n(
+        status=None, from_date=None, to_date=None, limit=1000,
+        cursor=None, updated_since=None, fields=None, db=db, api_key=""
+    ),
+    "/admin/export/appointments": lambda db: export_router.export_appointments(
+        from_date=None, to_date=None, format="json", gzip=False, api_key=""
+    ),
+}
+
+
+class StaticLLM:
+    """LLM محلي: رد ثابت، أو خطأ (الوكيل يرد برسالة التحويل ويحفظ سؤالاً غير مُجاب وتحويلاً لموظف)"""
+
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+
+    async def chat(self, messages, max_tokens=500):
+        if self.fail:
+            raise RuntimeError("LLM unavailable")
+        return "أهلاً، كيف أقدر أساعدك؟"
+
+
+def whatsapp_request(user_id: str, message: str) -> Request:
+    """طلب webhook من WhatsApp برسالة نصية"""
+    body = json.dumps({
+        "object": "whatsapp_business_account",
+        "entry": [{"changes": [{"value": {"messages": [
+            {"from": user_id, "type": "text", "text": {"body": message}}
+        ]}}]}]
+    }).encode("utf-8")
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    return Request(
+        {"type": "http", "method": "POST", "path": "/webhooks/whatsapp/", "query_string": b"",
+         "headers": [(b"content-type", b"application/json")]},
+        receive
+    )
+
+
+def turn_writes(fn) -> list:
+    """
+    INSERT في جداول الرسالة أثناء fn
+
+    Returns:
+        [(رقم الـ transaction، الجدول)] لكل INSERT
+    """
+    transactions = [0]
+    inserts = []
+
+    def on_begin(conn):
+        transactions[0] += 1
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        words = statement.split()
+        if len(words) > 2 and words[0].upper() == "INSERT" and words[2] in TURN_TABLES:
+            inserts.append((transactions[0], words[2]))
+
+    event.listen(engine, "begin", on_begin)
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        fn()
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+        event.remove(engine, "begin", on_begin)
+    return inserts
+
+
+def webhook(user_id: str, message: str, fail: bool):
+    """POST /webhooks/whatsapp بنفس مسار الطلب الحقيقي (الوكيل يحفظ المحادثة)"""
+    def call():
+        db = SessionLocal()
+        try:
+            agent = ChatAgent(llm_client=StaticLLM(fail=fail), db_session=db)
+            result = asyncio.run(whatsapp_router.handle_webhook(whatsapp_request(user_id, message), db=db, agent=agent))
+            assert result.get("status") == "ok", result
+        finally:
+            db.close()
+    return call
+
+
+def check_turn_writes() -> bool:
+    """سجلات رسالة WhatsApp: وحدة عمل واحدة"""
+    seed(10)
+    buffer = get_conversation_buffer()
+    buffer.flush()
+    ok = True
+    print("\n📝 حفظ رسالة WhatsApp:")
+
+    # تحويل لموظف: كتابة فورية - 3 INSERT في transaction واحدة
+    inserts = turn_writes(webhook("966500000001", "مرحبا", fail=True))
+    tables = sorted(table for _, table in inserts)
+    passed = tables == sorted(TURN_TABLES) and len({transaction for transaction, _ in inserts}) == 1
+    ok = ok and passed
+    print(f"   {'✅' if passed else '❌'} تحويل لموظف: {len(inserts)} INSERT في {len({t for t, _ in inserts})} transaction")
+
+    # رسالة عادية: لا كتابة أثناء الطلب، ثم INSERT واحد عند كتابة الدفعة
+    during = turn_writes(webhook("966500000002", "مرحبا", fail=False))
+    flushed = turn_writes(buffer.flush) if buffer.enabled else during
+    passed = (not buffer.enabled or not during) and [table for _, table in flushed] == ["conversations"]
+    ok = ok and passed
+    print(f"   {'✅' if passed else '❌'} رسالة عادية: {len(during)} INSERT أثناء الطلب، {len(flushed)} عند كتابة الدفعة")
+    return ok
+
+
+def main():
+    counts = {}
+    for size in (10, 200):
+        seed(size)
+        for name, endpoint in ENDPOINTS.items():
+            counts.setdefault(name, []).append(count_queries(run(endpoint)))
+
+    ok = True
+    print("\n📊 عدد الاستعلامات (10 مواعيد → 200 موعد):")
+    for name, (small, large) in counts.items():
+        status = "✅" if small == large else "❌"
+        ok = ok and small == large
+        print(f"   {status} {name}: {small} → {large}")
+    return check_turn_writes() and ok
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
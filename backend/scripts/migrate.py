@@ -0,0 +1,66 @@
+"""
+ترحيلات قاعدة البيانات ذات الإصدارات
+(المنطق في app/db/migrations)
+
+الاستخدام:
+    python scripts/migrate.py status
+    python scripts/migrate.py upgrade [--to 2]
+
+- upgrade بدون --to: تطبيق كل الترحيلات الناقصة (لا شيء إذا كانت قاعدة البيانات محدثة)
+- التطبيق يتم أيضاً عند تشغيل التطبيق (DB_AUTO_MIGRATE) وعبر POST /admin/db/init
+"""
+import sys
+import argparse
+from pathlib import Path
+
+# إضافة مجلد backend إلى Python path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from app.db.migrations import migration_status, upgrade
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="ترحيلات قاعدة البيانات")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("status", help="الإصدار الحالي والترحيلات الناقصة")
+
+    upgrade_parser = subparsers.add_parser("upgrade", help="تطبيق الترحيلات الناقصة")
+    upgrade_parser.add_argument("--to", type=int, default=None, help="الإصدار المطلوب (افتراضياً آخر إصدار)")
+    return parser.parse_args()
+
+
+def main() -> bool:
+    args = parse_args()
+    print("\n" + "=" * 60)
+    print(f"🗃️  database migrations: {args.command}")
+    print("=" * 60 + "\n")
+
+    try:
+        if args.command == "status":
+            status = migration_status()
+            print(f"  الإصدار الحالي: {status['current']} / آخر إصدار: {status['head']}\n")
+            for migration in status["applied"]:
+                print(f"  ✅ {migration['name']} ({migration['applied_at']}, {migration['duration_ms']} ms)")
+            for migration in status["pending"]:
+                print(f"  ⏳ {migration['name']} - {migration['description']}")
+
+        elif args.command == "upgrade":
+            result = upgrade(args.to)
+            if not result["applied"]:
+                print(f"✅ قاعدة البيانات محدثة بالفعل (الإصدار {result['current']})")
+                return True
+            for migration in result["applied"]:
+                print(f"  ✅ {migration['name']} ({migration['duration_ms']} ms)")
+            print(f"\n✅ الإصدار {result['previous']} → {result['current']}")
+
+        return True
+    except Exception as e:
+        print(f"❌ خطأ: {str(e)}")
+        return False
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
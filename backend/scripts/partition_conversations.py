@@ -0,0 +1,96 @@
+"""
+تقسيم جدول conversations شهرياً وأرشفة الأقسام المنتهية (PostgreSQL فقط)
+(المنطق في app/services/partition_service.py)
+
+الاستخدام:
+    python scripts/partition_conversations.py status
+    python scripts/partition_conversations.py convert [--drop-legacy]
+    python scripts/partition_conversations.py ensure [--months-ahead 3]
+    python scripts/partition_conversations.py archive [--days 90] [--keep-detached]
+
+ملاحظة: convert يقفل الجدول طوال نسخ البيانات - نفّذه في وقت صيانة وبعد backup (scripts/backup_db.py)
+"""
+import sys
+import argparse
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# إضافة مجلد backend إلى Python path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from app.services.partition_service import (
+    convert_to_partitioned, drop_expired_partitions, ensure_partitions, partition_status
+)
+from app.services.retention_service import POLICIES
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="تقسيم جدول conversations شهرياً")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("status", help="عرض الأقسام الحالية")
+
+    convert = subparsers.add_parser("convert", help="تحويل الجدول إلى جدول مقسم")
+    convert.add_argument("--drop-legacy", action="store_true", help="حذف الجدول القديم بعد النسخ")
+
+    ensure = subparsers.add_parser("ensure", help="إنشاء أقسام الأشهر القادمة")
+    ensure.add_argument("--months-ahead", type=int, default=None)
+
+    archive = subparsers.add_parser("archive", help="أرشفة وحذف الأقسام المنتهية")
+    archive.add_argument("--days", type=int, default=None, help="مدة الاحتفاظ (افتراضياً RETENTION_DAYS)")
+    archive.add_argument("--keep-detached", action="store_true", help="فصل الأقسام بدون حذفها")
+    return parser.parse_args()
+
+
+def main() -> bool:
+    args = parse_args()
+    print("\n" + "=" * 60)
+    print(f"🗂️  conversations partitions: {args.command}")
+    print("=" * 60 + "\n")
+
+    try:
+        if args.command == "status":
+            status = partition_status()
+            if not status["partitioned"]:
+                print("ℹ️  الجدول غير مقسم")
+                return True
+            for partition in status["partitions"]:
+                print(f"  {partition['name']}: {partition['start']} → {partition['end']} (~{partition['estimated_rows']} صف)")
+            print(f"\n  القسم الافتراضي: {status['default_partition_rows']} صف")
+
+        elif args.command == "convert":
+            result = convert_to_partitioned(drop_legacy=args.drop_legacy)
+            print(f"✅ تم نسخ {result['rows']} صف إلى {len(result['partitions'])} قسم")
+            if result["dropped_foreign_keys"]:
+                print(f"🔗 foreign keys المحذوفة: {', '.join(result['dropped_foreign_keys'])}")
+            if result["legacy_table"]:
+                print(f"ℹ️  الجدول القديم باقٍ باسم {result['legacy_table']} - احذفه بعد التحقق")
+
+        elif args.command == "ensure":
+            created = ensure_partitions(args.months_ahead)
+            print(f"✅ أقسام جديدة: {', '.join(created) if created else 'لا شيء'}")
+
+        elif args.command == "archive":
+            policy = POLICIES["conversations"]
+            days = args.days if args.days is not None else policy.days
+            if days <= 0:
+                print("ℹ️  الاحتفاظ معطل لجدول conversations")
+                return True
+            cutoff = datetime.now() - timedelta(days=days)
+            done = drop_expired_partitions(
+                cutoff, policy.dependents, archived=policy.archived, keep_detached=args.keep_detached
+            )
+            for partition in done:
+                print(f"  🗄️  {partition['name']}: {partition['rows']} صف → {partition['archive'] or 'بدون أرشيف'}")
+            print(f"\n✅ تمت معالجة {len(done)} قسم (أقدم من {cutoff.date()})")
+
+        return True
+    except Exception as e:
+        print(f"❌ خطأ: {str(e)}")
+        return False
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,81 @@
+"""
+خطط تنفيذ الاستعلامات الساخنة والفهارس الناقصة
+(المنطق في app/services/query_advisor.py)
+
+الاستخدام:
+    python scripts/query_advisor.py [--query conversation_history] [--apply] [--verbose]
+
+- بدون --apply: تقرير فقط (EXPLAIN ANALYZE ينفذ الاستعلامات داخل transaction يُلغى بعدها)
+- --apply: إنشاء الفهارس الناقصة (CREATE INDEX CONCURRENTLY في PostgreSQL)
+"""
+import sys
+import json
+import argparse
+from pathlib import Path
+
+# إضافة مجلد backend إلى Python path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from app.db.session import SessionLocal
+from app.services.query_advisor import HOT_QUERIES, apply_indexes, explain_hot_queries
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="مستشار الاستعلامات والفهارس")
+    parser.add_argument("--query", action="append", choices=[query.name for query in HOT_QUERIES],
+                        help="استعلام محدد (يمكن تكراره)")
+    parser.add_argument("--apply", action="store_true", help="إنشاء الفهارس الناقصة")
+    parser.add_argument("--verbose", action="store_true", help="طباعة الخطة كاملة")
+    return parser.parse_args()
+
+
+def main() -> bool:
+    args = parse_args()
+    db = SessionLocal()
+    try:
+        report = explain_hot_queries(db, args.query)
+    finally:
+        db.close()
+
+    print("\n" + "=" * 60)
+    print(f"🔍 خطط الاستعلامات ({report['dialect']})")
+    print("=" * 60 + "\n")
+    for query in report["queries"]:
+        if "error" in query:
+            print(f"❌ {query['name']}: {query['error']}")
+            continue
+        status = "⚠️ " if query["flags"] else "✅"
+        timing = f"{query['execution_ms']} ms" if query.get("execution_ms") is not None else ""
+        print(f"{status} {query['name']} {timing}  ({query['source']})")
+        for scan in query["scans"]:
+            target = f" USING {scan['index']}" if scan["index"] else ""
+            rows = f" rows={scan['rows']}" if scan["rows"] is not None else ""
+            print(f"     {scan['type']} {scan['table']}{target}{rows}")
+        for flag in query["flags"]:
+            print(f"     ⚠️  {flag}")
+        if args.verbose:
+            print(json.dumps(query["plan"], ensure_ascii=False, indent=2, default=str))
+
+    missing = report["missing_indexes"]
+    print(f"\n📇 فهارس ناقصة: {len(missing)}")
+    for index in missing:
+        print(f"   {index['name']} ({', '.join(index['queries'])})")
+        print(f"     {index['ddl']}")
+
+    if not args.apply or not missing:
+        return True
+
+    print("\n🔨 إنشاء الفهارس الناقصة...")
+    results = apply_indexes([index["name"] for index in missing])
+    for result in results:
+        if result["status"] == "created":
+            print(f"   ✅ {result['name']} ({result['seconds']}s)")
+        elif result["status"] == "failed":
+            print(f"   ❌ {result['name']}: {result['error']}")
+    return all(result["status"] != "failed" for result in results)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
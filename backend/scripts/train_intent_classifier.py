@@ -0,0 +1,282 @@
+"""
+تدريب وتقييم وقياس أداء مصنف النوايا المحلي من سجلات جدول conversations
+
+الاستخدام:
+    python scripts/train_intent_classifier.py review [--limit 500] [--output intent_review.csv]
+    python scripts/train_intent_classifier.py label --input intent_review.csv
+    python scripts/train_intent_classifier.py train [--limit 50000] [--output models/intent_classifier.npz]
+    python scripts/train_intent_classifier.py evaluate [--limit 5000]
+    python scripts/train_intent_classifier.py bench [--iterations 5000]
+
+التسميات (labels):
+- نية راجعها موظف (intent_source = human): review يصدّر رسائل حديثة إلى CSV، يُصحح عمود intent،
+  ثم label يحفظها في قاعدة البيانات
+- باقي السجلات: تسميات ضعيفة من الكلمات المفتاحية (keyword_intent) - النية المحفوظة من المصنف نفسه
+  لا تُستخدم للتدريب (تعزز أخطاءه)
+- الأقسام (sections) دائماً من الكلمات المفتاحية
+
+حدود: بدون تسميات بشرية يتعلم النموذج قواعد الكلمات المفتاحية فقط (يعمّمها على صياغات قريبة لكنه
+لا يتجاوزها)؛ لذلك التقييم يفصل بين human_labels (دقة فعلية مقابل مراجعة بشرية) و keyword_agreement
+(التطابق مع القواعد فقط، وليس دقة)
+"""
+import sys
+import argparse
+import csv
+import json
+import uuid
+import random
+import time
+from pathlib import Path
+
+# إضافة مجلد backend إلى Python path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from app.config import get_settings
+from app.db.session import SessionLocal
+from app.db.models import Conversation
+from sqlalchemy import select, update
+from app.core.intent_classifier import IntentClassifier, INTENTS, keyword_intent
+
+settings = get_settings()
+
+# مصدر النية الوحيد الموثوق كتسمية غير الكلمات المفتاحية (راجع label)
+HUMAN_SOURCE = "human"
+
+REVIEW_COLUMNS = ["conversation_id", "user_message", "intent"]
+
+
+def load_samples(limit: int):
+    """
+    تحميل الرسائل من جدول conversations مع تسمياتها
+
+    Returns:
+        (texts, intent_labels, section_labels, human) - human: هل التسمية من مراجعة بشرية
+    """
+    db = SessionLocal()
+    try:
+        rows = db.query(Conversation.user_message, Conversation.intent, Conversation.intent_source)\
+            .filter(Conversation.user_message.isnot(None))\
+            .order_by(Conversation.created_at.desc())\
+            .limit(limit)\
+            .yield_per(1000)
+
+        texts, intents, sections, human = [], [], [], []
+        for user_message, logged_intent, intent_source in rows:
+            if not user_message.strip():
+                continue
+            weak = keyword_intent(user_message)
+            reviewed = intent_source == HUMAN_SOURCE and logged_intent in INTENTS
+            texts.append(user_message)
+            intents.append(logged_intent if reviewed else weak["intent"])
+            sections.append(weak["sections"])
+            human.append(reviewed)
+        return texts, intents, sections, human
+    finally:
+        db.close()
+
+
+def split_samples(samples, holdout: float, seed: int):
+    """تقسيم البيانات (قوائم متوازية) إلى تدريب واختبار"""
+    indices = list(range(len(samples[0])))
+    random.Random(seed).shuffle(indices)
+    cut = int(len(indices) * (1 - holdout))
+
+    def pick(idx):
+        return tuple([column[i] for i in idx] for column in samples)
+
+    return pick(indices[:cut]), pick(indices[cut:])
+
+
+def evaluation_report(classifier: IntentClassifier, texts, intents, sections, human):
+    """
+    التقييم مفصولاً حسب مصدر التسمية
+
+    Returns:
+        {"human_labels": تقرير evaluate أو None, "keyword_agreement": تقرير evaluate (agreement بدل accuracy) أو None}
+    """
+    def subset(flag):
+        idx = [i for i, reviewed in enumerate(human) if reviewed == flag]
+        return [texts[i] for i in idx], [intents[i] for i in idx], [sections[i] for i in idx]
+
+    report = {"human_labels": None, "keyword_agreement": None}
+    reviewed = subset(True)
+    if reviewed[0]:
+        report["human_labels"] = classifier.evaluate(*reviewed)
+    weak = subset(False)
+    if weak[0]:
+        agreement = classifier.evaluate(*weak)
+        agreement["agreement"] = agreement.pop("accuracy")
+        report["keyword_agreement"] = agreement
+    return report
+
+
+def cmd_review(args):
+    """تصدير رسائل حديثة (غير مراجعة) إلى CSV للمراجعة: يُصحح عمود intent ثم يُستورد بـ label"""
+    db = SessionLocal()
+    try:
+        rows = db.query(Conversation.id, Conversation.user_message, Conversation.intent)\
+            .filter(Conversation.user_message.isnot(None))\
+            .filter((Conversation.intent_source.is_(None)) | (Conversation.intent_source != HUMAN_SOURCE))\
+            .order_by(Conversation.created_at.desc())\
+            .limit(args.limit)\
+            .all()
+    finally:
+        db.close()
+
+    # utf-8-sig: يفتحه Excel بالعربية مباشرة
+    with open(args.output, "w", encoding="utf-8-sig", newline="") as review_file:
+        writer = csv.writer(review_file)
+        writer.writerow(REVIEW_COLUMNS)
+        for conversation_id, user_message, intent in rows:
+            writer.writerow([str(conversation_id), user_message, intent or keyword_intent(user_message)["intent"]])
+    print(f"📝 تم تصدير {len(rows)} رسالة إلى {args.output}")
+    print(f"   النوايا المسموحة: {', '.join(INTENTS)}")
+    return True
+
+
+def cmd_label(args):
+    """حفظ النوايا المراجعة من CSV (intent_source = human)"""
+    labels, invalid = {}, 0
+    with open(args.input, "r", encoding="utf-8-sig", newline="") as review_file:
+        for row in csv.DictReader(review_file):
+            intent = (row.get("intent") or "").strip()
+            try:
+                conversation_id = uuid.UUID(row.get("conversation_id") or "")
+            except ValueError:
+                invalid += 1
+                continue
+            if intent not in INTENTS:
+                invalid += 1
+                continue
+            labels[conversation_id] = intent
+
+    db = SessionLocal()
+    try:
+        existing = set()
+        ids = list(labels)
+        for start in range(0, len(ids), 1000):
+            existing.update(db.scalars(select(Conversation.id).where(Conversation.id.in_(ids[start:start + 1000]))))
+        updates = [
+            {"id": conversation_id, "intent": intent, "intent_source": HUMAN_SOURCE}
+            for conversation_id, intent in labels.items() if conversation_id in existing
+        ]
+        if updates:
+            db.execute(update(Conversation), updates)
+        db.commit()
+    finally:
+        db.close()
+
+    print(f"✅ تم حفظ {len(updates)} تسمية مراجعة")
+    if invalid:
+        print(f"⚠️  {invalid} سطر بنية أو معرف غير صالح (تم تجاهلها)")
+    if len(labels) > len(updates):
+        print(f"⚠️  {len(labels) - len(updates)} محادثة غير موجودة (تم تجاهلها)")
+    return True
+
+
+def cmd_train(args):
+    print("\n" + "="*60)
+    print("🧠 تدريب مصنف النوايا...")
+    print("="*60 + "\n")
+
+    samples = load_samples(args.limit)
+    texts, human = samples[0], samples[3]
+    if len(texts) < 50:
+        print(f"❌ عدد السجلات غير كافٍ للتدريب ({len(texts)})")
+        return False
+    print(f"📋 تم تحميل {len(texts)} رسالة ({sum(human)} بتسمية مراجعة بشرية)")
+    if not any(human):
+        print("⚠️  بدون تسميات بشرية: النموذج يتعلم قواعد الكلمات المفتاحية فقط (راجع review و label)")
+
+    train, test = split_samples(samples, args.holdout, args.seed)
+    classifier = IntentClassifier(n_features=2 ** args.hash_bits)
+    stats = classifier.fit(*train[:3], epochs=args.epochs, learning_rate=args.learning_rate, seed=args.seed)
+    print(f"✅ انتهى التدريب في {stats['duration_seconds']} ثانية")
+
+    report = evaluation_report(classifier, *test)
+    classifier.metadata["holdout_report"] = report
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+    classifier.save(args.output)
+    print(f"\n💾 تم حفظ النموذج في: {args.output}")
+    return True
+
+
+def cmd_evaluate(args):
+    classifier = IntentClassifier.load(args.model)
+    report = evaluation_report(classifier, *load_samples(args.limit))
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return True
+
+
+def cmd_bench(args):
+    classifier = IntentClassifier.load(args.model)
+    texts = load_samples(min(args.iterations, 10000))[0]
+    if not texts:
+        texts = ["ابي احجز موعد بكرة عند دكتور الاسنان", "وين موقع فرعكم؟", "كم سعر تنظيف الاسنان"]
+
+    # إحماء
+    for text in texts[:100]:
+        classifier.predict(text)
+
+    timings = []
+    for i in range(args.iterations):
+        text = texts[i % len(texts)]
+        started = time.perf_counter()
+        classifier.predict(text)
+        timings.append((time.perf_counter() - started) * 1e6)
+
+    timings.sort()
+
+    def percentile(p):
+        return timings[min(len(timings) - 1, int(len(timings) * p))]
+
+    print(f"📊 {args.iterations} تنبؤ:")
+    print(f"   p50: {percentile(0.50):.1f} µs")
+    print(f"   p95: {percentile(0.95):.1f} µs")
+    print(f"   p99: {percentile(0.99):.1f} µs")
+    print(f"   max: {timings[-1]:.1f} µs")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="مصنف النوايا المحلي")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    review_parser = subparsers.add_parser("review", help="تصدير رسائل للمراجعة اليدوية (CSV)")
+    review_parser.add_argument("--limit", type=int, default=500)
+    review_parser.add_argument("--output", default="intent_review.csv")
+    review_parser.set_defaults(func=cmd_review)
+
+    label_parser = subparsers.add_parser("label", help="حفظ النوايا المراجعة من CSV")
+    label_parser.add_argument("--input", required=True)
+    label_parser.set_defaults(func=cmd_label)
+
+    train_parser = subparsers.add_parser("train", help="تدريب النموذج من سجلات المحادثات")
+    train_parser.add_argument("--limit", type=int, default=50000)
+    train_parser.add_argument("--output", default=settings.INTENT_MODEL_PATH)
+    train_parser.add_argument("--epochs", type=int, default=10)
+    train_parser.add_argument("--learning-rate", type=float, default=2.0)
+    train_parser.add_argument("--hash-bits", type=int, default=15)
+    train_parser.add_argument("--holdout", type=float, default=0.2)
+    train_parser.add_argument("--seed", type=int, default=42)
+    train_parser.set_defaults(func=cmd_train)
+
+    eval_parser = subparsers.add_parser("evaluate", help="تقييم نموذج محفوظ")
+    eval_parser.add_argument("--model", default=settings.INTENT_MODEL_PATH)
+    eval_parser.add_argument("--limit", type=int, default=5000)
+    eval_parser.set_defaults(func=cmd_evaluate)
+
+    bench_parser = subparsers.add_parser("bench", help="قياس زمن التنبؤ")
+    bench_parser.add_argument("--model", default=settings.INTENT_MODEL_PATH)
+    bench_parser.add_argument("--iterations", type=int, default=5000)
+    bench_parser.set_defaults(func=cmd_bench)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
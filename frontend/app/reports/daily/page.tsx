@@ -1,6 +1,7 @@
 "use client"
 
 import { useState, useEffect } from 'react'
+import { getDailyReport } from '../../../lib/api-client'
 
 interface DailyStats {
   total_conversations: number
@@ -20,11 +21,8 @@ export default function DailyReportsPage() {
 
   const fetchStats = async () => {
     try {
-      const res = await fetch('http://localhost:8000/admin/analytics/summary', {
-        headers: { 'X-API-Key': 'clinic-admin-secure-key-2024' }
-      })
-      if (!res.ok) throw new Error('فشل في جلب الإحصائيات')
-      const data = await res.json()
+      const today = new Date().toISOString().slice(0, 10)
+      const data = await getDailyReport(today)
       setStats(data)
     } catch (err: any) {
       setError(err.message)
@@ -59,6 +59,21 @@ async function fetchAPI(endpoint: string, options?: RequestInit, requiresAuth: b
   }
 }
 
+// معاملات قوائم الـ admin (page, page_size, sort, q, fields والفلاتر) - بدون page تُرجع كل النتائج
+export type ListParams = Record<string, string | number | boolean | undefined | null>
+
+function withQuery(endpoint: string, params?: ListParams) {
+  if (!params) return endpoint
+  const query = new URLSearchParams()
+  Object.entries(params).forEach(([key, value]) => {
+    if (value !== undefined && value !== null && value !== '') {
+      query.append(key, String(value))
+    }
+  })
+  const text = query.toString()
+  return text ? `${endpoint}?${text}` : endpoint
+}
+
 // Analytics
 export async function getAnalyticsSummary(from: string, to: string) {
   return fetchAPI(`/admin/analytics/summary?from=${from}&to=${to}`, {}, true)
@@ -73,7 +88,7 @@ export async function getAnalyticsByChannel(from: string, to: string, channel?:
 
 // Reports
 export async function getDailyReport(date: string) {
-  return fetchAPI(`/reports/daily/?date=${date}`)
+  return fetchAPI(`/reports/daily/?date=${date}`, undefined, true)
 }
 
 // RAG
@@ -118,8 +133,8 @@ export async function ingestRagSourceFile(sourceId: string, file: File) {
 
 
 // Branches
-export async function getBranches() {
-  return fetchAPI('/admin/branches', {}, true)
+export async function getBranches(params?: ListParams) {
+  return fetchAPI(withQuery('/admin/branches', params), {}, true)
 }
 
 export async function createBranch(data: any) {
@@ -143,8 +158,8 @@ export async function deleteBranch(branchId: string) {
 }
 
 // Doctors
-export async function getDoctors() {
-  return fetchAPI('/admin/doctors', {}, true)
+export async function getDoctors(params?: ListParams) {
+  return fetchAPI(withQuery('/admin/doctors', params), {}, true)
 }
 
 export async function createDoctor(data: any) {
@@ -168,8 +183,8 @@ export async function deleteDoctor(doctorId: string) {
 }
 
 // Services
-export async function getServices() {
-  return fetchAPI('/admin/services', {}, true)
+export async function getServices(params?: ListParams) {
+  return fetchAPI(withQuery('/admin/services', params), {}, true)
 }
 
 export async function createService(data: any) {
@@ -193,8 +208,8 @@ export async function deleteService(serviceId: string) {
 }
 
 // Offers
-export async function getOffers() {
-  return fetchAPI('/admin/offers', {}, true)
+export async function getOffers(params?: ListParams) {
+  return fetchAPI(withQuery('/admin/offers', params), {}, true)
 }
 
 export async function createOffer(data: any) {
@@ -205,8 +220,8 @@ export async function createOffer(data: any) {
 }
 
 // FAQs
-export async function getFaqs() {
-  return fetchAPI('/admin/faqs', {}, true)
+export async function getFaqs(params?: ListParams) {
+  return fetchAPI(withQuery('/admin/faqs', params), {}, true)
 }
 
 export async function createFaq(data: any) {
@@ -217,8 +232,8 @@ export async function createFaq(data: any) {
 }
 
 // Appointments
-export async function getAppointments() {
-  return fetchAPI('/admin/appointments', {}, true)
+export async function getAppointments(params?: ListParams) {
+  return fetchAPI(withQuery('/admin/appointments', params), {}, true)
 }
 
 export async function createAppointment(data: any) {
@@ -285,13 +300,38 @@ export async function addCustomData(data: any) {
   }, true)
 }
 
-export async function importLocalCSV() {
-  return fetchAPI('/admin/csv-import/import-local-csv', {
+// استيراد CSV يتم كمهمة في الخلفية: إرسال الملفات ثم متابعة الحالة حتى تنتهي
+export async function getImportJob(jobId: string) {
+  return fetchAPI(`/admin/csv-import/jobs/${jobId}`, {}, true)
+}
+
+async function waitForImportJob(jobId: string, onProgress?: (job: any) => void) {
+  while (true) {
+    const job = await getImportJob(jobId)
+    onProgress?.(job)
+    if (job.status === 'completed') {
+      return job
+    }
+    if (job.status === 'failed') {
+      throw new Error(job.error || 'فشل استيراد البيانات')
+    }
+    await new Promise((resolve) => setTimeout(resolve, 1000))
+  }
+}
+
+export async function importLocalCSV(onProgress?: (job: any) => void) {
+  const job = await fetchAPI('/admin/csv-import/jobs/local', {
     method: 'POST',
   }, true)
+  return waitForImportJob(job.job_id, onProgress)
 }
 
-export async function importFromCSV(branchesFile?: File, doctorsFile?: File, servicesFile?: File) {
+export async function importFromCSV(
+  branchesFile?: File,
+  doctorsFile?: File,
+  servicesFile?: File,
+  onProgress?: (job: any) => void
+) {
   const formData = new FormData()
   
   if (branchesFile) {
@@ -309,7 +349,7 @@ export async function importFromCSV(branchesFile?: File, doctorsFile?: File, ser
     headers['X-API-Key'] = API_KEY
   }
 
-  const response = await fetch(`${API_BASE}/admin/csv-import/import-from-csv`, {
+  const response = await fetch(`${API_BASE}/admin/csv-import/jobs`, {
     method: 'POST',
     headers,
     body: formData,
@@ -320,7 +360,8 @@ export async function importFromCSV(branchesFile?: File, doctorsFile?: File, ser
     throw new Error(error.detail || error.message || 'حدث خطأ غير متوقع')
   }
 
-  return await response.json()
+  const job = await response.json()
+  return waitForImportJob(job.job_id, onProgress)
 }
 
 